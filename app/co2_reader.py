@@ -1,21 +1,19 @@
 '''
 Fichier pour lire et enregistrer les données CO₂ par capteur
 '''
-import random
+import json
+import threading
 import time
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from pathlib import Path
 
-# Add site directory to path for database imports
+# Add site directory to path for database imports (site modules are imported
+# where they are used, so gateway mode does not load the server-side analytics)
 sys.path.insert(0, str(Path(__file__).parent.parent / 'site'))
 
-def fake_read_co2():
-    """
-    Simule une valeur de CO₂ entre 400 et 2000 ppm.
-    """
-    return random.randint(400, 2000)
-
 
 def get_air_quality(ppm):
     """
@@ -37,124 +35,413 @@ def alert_needed(ppm, threshold=1200):
     return ppm > threshold
 
 
-def read_all_sensors_and_log():
+DEFAULT_POLL_INTERVAL = 10  # secondes, surchargeable par capteur via config["interval"]
+
+
+def _load_scd30_registry():
+    try:
+        from sensors.scd30 import get_scd30
+    except ImportError:
+        from app.sensors.scd30 import get_scd30
+    return get_scd30
+
+
+def _utc_timestamp():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+HEALTHY = "healthy"
+DEGRADED = "degraded"
+FAILED = "failed"
+
+
+class SensorHealth:
     """
-    Read all active sensors and log their data to database
+    Per-sensor health state machine.
+
+    healthy --read failure--> degraded --fail_threshold consecutive failures--> failed
+
+    A failed sensor is only retried after an exponential backoff (base_backoff,
+    doubled per extra failure, capped at max_backoff); any successful read
+    brings it back to healthy.
     """
-    try:
-        from database import (get_db, get_active_sensors, 
-                             log_sensor_reading, update_sensor_availability)
-        from app.sensors.scd30 import SCD30
-        
-        # Get all active sensors for all users
+
+    def __init__(self, fail_threshold=3, base_backoff=30.0, max_backoff=900.0):
+        self.fail_threshold = fail_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = HEALTHY
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+
+    def can_attempt(self, now):
+        return self.state != FAILED or now >= self.retry_at
+
+    def record_success(self):
+        """Returns the previous state"""
+        previous = self.state
+        self.state = HEALTHY
+        self.failures = 0
+        self.retry_at = 0.0
+        self.last_error = None
+        return previous
+
+    def record_failure(self, error, now):
+        """Returns the previous state"""
+        previous = self.state
+        self.failures += 1
+        self.last_error = str(error)
+        if self.failures >= self.fail_threshold:
+            self.state = FAILED
+            delay = self.base_backoff * (2 ** (self.failures - self.fail_threshold))
+            self.retry_at = now + min(delay, self.max_backoff)
+        else:
+            self.state = DEGRADED
+        return previous
+
+    def snapshot(self, now):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'retry_in': round(max(0.0, self.retry_at - now), 1) if self.state == FAILED else 0.0,
+        }
+
+
+class SensorPoller:
+    """
+    Polling service for all active sensors on this host.
+
+    - driver handles come from the SCD30 registry (one per (bus, address))
+    - each sensor runs on its own interval (config["interval"], in seconds)
+    - due sensors are read concurrently; the driver serializes reads per bus
+    - each sensor has a SensorHealth; failed sensors are skipped until their
+      backoff expires and failed reads never produce a stored value
+    - each cycle's readings and availability changes are written in one transaction
+    - gateway mode (edge_buffer given): readings are queued in the local
+      store-and-forward buffer and uploaded to the server instead
+    """
+
+    def __init__(self, max_workers=16, refresh_seconds=60, verbose=False, edge_buffer=None, uploader=None):
+        self.refresh_seconds = refresh_seconds
+        self.verbose = verbose
+        self.edge_buffer = edge_buffer
+        self.uploader = uploader
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sensor-poll")
+        self._sensors = {}      # sensor_id -> sensor spec
+        self._next_due = {}     # sensor_id -> time.monotonic() deadline
+        self._health = {}       # sensor_id -> SensorHealth
+        self._get_scd30 = _load_scd30_registry()
+        self._last_refresh = None
+
+    # ------------------------------------------------------------------ sensors
+
+    @staticmethod
+    def _parse_sensor(row):
+        from utils.compression import compression_settings
+
+        config = row['config']
+        if isinstance(config, str):
+            try:
+                config = json.loads(config)
+            except ValueError:
+                config = {}
+        config = config or {}
+
+        bus = int(config.get('bus', 1))
+        address = config.get('address', '0x61')
+        if isinstance(address, str):
+            address = int(address, 16)
+        try:
+            interval = max(1.0, float(config.get('interval', DEFAULT_POLL_INTERVAL)))
+        except (TypeError, ValueError):
+            interval = DEFAULT_POLL_INTERVAL
+
+        try:
+            compression = compression_settings(config)
+        except ValueError as e:
+            print(f"  ! Ignoring compression settings of sensor {row['id']}: {e}")
+            compression = None
+
+        return {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'name': row['name'],
+            'type': row['type'],
+            'bus': bus,
+            'address': address,
+            'interval': interval,
+            'compression': compression,
+        }
+
+    def refresh_sensors(self, now=None):
+        """Reload the list of active sensors, keeping schedules of known ones"""
+        from database import get_db
+
         db = get_db()
-        sensors = db.execute("""
-            SELECT id, user_id, name, type, interface, config, active
-            FROM user_sensors 
+        rows = db.execute("""
+            SELECT id, user_id, name, type, interface, config
+            FROM user_sensors
             WHERE active = 1
         """).fetchall()
         db.close()
-        
-        for sensor_row in sensors:
+
+        now = time.monotonic() if now is None else now
+        sensors = {}
+        for row in rows:
             try:
-                sensor_id = sensor_row['id']
-                sensor_type = sensor_row['type']
-                config_str = sensor_row['config']
-                
-                # Parse config
-                import json
-                config = json.loads(config_str) if isinstance(config_str, str) else config_str
-                
-                ppm = None
-                temperature = None
-                humidity = None
-                available = False
-                
-                # Read based on sensor type
-                if sensor_type == 'scd30':
-                    try:
-                        bus = config.get('bus', 1)
-                        address = config.get('address', '0x61')
-                        if isinstance(address, str):
-                            address = int(address, 16)
-                        
-                        scd30 = SCD30(bus=int(bus), address=address)
-                        reading = scd30.read()
-                        
-                        if reading and 'co2' in reading:
-                            ppm = int(reading['co2'])
-                            temperature = reading.get('temperature')
-                            humidity = reading.get('humidity')
-                            available = True
-                    except Exception as e:
-                        print(f"  ✗ SCD30 read error: {e}")
-                        available = False
-                
-                elif sensor_type == 'mhz19':
-                    # MH-Z19 reading would go here
-                    ppm = fake_read_co2()
-                    available = True
-                
-                elif sensor_type == 'senseair':
-                    # Senseair reading would go here
-                    ppm = fake_read_co2()
-                    available = True
-                
+                sensors[row['id']] = self._parse_sensor(row)
+            except Exception as e:
+                print(f"  ✗ Invalid config for sensor {row['id']}: {e}")
+        for sensor_id in sensors:
+            self._next_due.setdefault(sensor_id, now)
+            self._health.setdefault(sensor_id, SensorHealth())
+        for sensor_id in list(self._next_due):
+            if sensor_id not in sensors:
+                del self._next_due[sensor_id]
+                self._health.pop(sensor_id, None)
+
+        self._sensors = sensors
+        self._last_refresh = now
+
+    # ------------------------------------------------------------------ reads
+
+    def _read_sensor(self, sensor):
+        """Read one sensor; never raises and never substitutes simulated values"""
+        result = {
+            'sensor': sensor,
+            'ppm': None,
+            'temperature': None,
+            'humidity': None,
+            'available': False,
+            'error': None,
+            'timestamp': _utc_timestamp(),
+        }
+        try:
+            if sensor['type'] != 'scd30':
+                # MH-Z19 / Senseair / unknown types: no driver yet
+                raise RuntimeError(f"no driver for sensor type '{sensor['type']}'")
+            handle = self._get_scd30(sensor['bus'], sensor['address'])
+            if handle.simulated:
+                raise RuntimeError("no SCD30 driver installed")
+            reading = handle.read()
+            if not reading or 'co2' not in reading:
+                raise RuntimeError("no measurement available")
+            result.update(
+                ppm=int(reading['co2']),
+                temperature=reading.get('temperature'),
+                humidity=reading.get('humidity'),
+                available=True,
+            )
+        except Exception as e:
+            result['error'] = str(e)
+        return result
+
+    # ------------------------------------------------------------------ cycles
+
+    def run_cycle(self, force=False):
+        """Read every due sensor (all of them with force=True) and store the results"""
+        now = time.monotonic()
+        if self._last_refresh is None or now - self._last_refresh >= self.refresh_seconds:
+            self.refresh_sensors(now)
+
+        due = [sensor for sensor_id, sensor in self._sensors.items()
+               if (force or self._next_due[sensor_id] <= now) and self._health[sensor_id].can_attempt(now)]
+        if not due:
+            return []
+
+        results = list(self._executor.map(self._read_sensor, due))
+
+        for sensor in due:
+            next_due = self._next_due[sensor['id']] + sensor['interval']
+            self._next_due[sensor['id']] = next_due if next_due > now else now + sensor['interval']
+
+        readings = []
+        availability = []
+        for r in results:
+            sensor = r['sensor']
+            health = self._health[sensor['id']]
+            if r['available']:
+                previous = health.record_success()
+                readings.append((sensor['id'], r['ppm'], r['temperature'], r['humidity'], r['timestamp']))
+                availability.append((sensor['id'], True))
+                if previous != HEALTHY:
+                    print(f"  ✓ [{sensor['name']}] {previous} -> {HEALTHY}")
+            else:
+                previous = health.record_failure(r['error'], now)
+                if health.state == FAILED and previous != FAILED:
+                    availability.append((sensor['id'], False))
+                if health.state != previous:
+                    print(f"  ✗ [{sensor['name']}] {previous} -> {health.state}: {r['error']}")
+
+        self._store(readings, availability)
+
+        if self.verbose:
+            for r in results:
+                if r['available']:
+                    extra = f"| T:{r['temperature']:.1f}°C | RH:{r['humidity']:.0f}%" if r['temperature'] else ""
+                    print(f"  ✓ [{r['sensor']['name']}] {r['ppm']}ppm ({get_air_quality(r['ppm'])}) {extra}")
                 else:
-                    # Unknown type - use fake
-                    ppm = fake_read_co2()
-                    available = True
-                
-                # Use fake if no real reading
-                if ppm is None:
-                    ppm = fake_read_co2()
-                    available = False
-                
-                # Log the reading
-                log_sensor_reading(sensor_id, ppm, temperature, humidity)
-                update_sensor_availability(sensor_id, available)
-                
-                quality = get_air_quality(ppm)
-                status = "✓" if available else "~"
-                extra = f"| T:{temperature:.1f}°C | RH:{humidity:.0f}%" if temperature else ""
-                print(f"  {status} [{sensor_row['name']}] {ppm}ppm ({quality}) {extra}")
-                
+                    print(f"  ~ [{r['sensor']['name']}] {r['error']}")
+        return results
+
+    def _compress(self, readings):
+        """Drop readings the sensors' ingest compressors do not need to store"""
+        from utils.compression import compressors
+
+        by_sensor = {}
+        for reading in readings:
+            by_sensor.setdefault(reading[0], []).append(reading)
+        stored = []
+        for sensor_id, rows in by_sensor.items():
+            sensor = self._sensors.get(sensor_id) or {}
+            points = [(datetime.strptime(row[4], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp(),
+                       row[1], row) for row in rows]
+            stored.extend(compressors.compress(sensor_id, sensor.get('compression'), points))
+        return stored
+
+    @staticmethod
+    def _group(readings):
+        by_sensor = {}
+        for sensor_id, ppm, _, _, timestamp in readings:
+            ts = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            by_sensor.setdefault(sensor_id, []).append({'ts': ts, 'ppm': ppm, 'timestamp': timestamp})
+        return by_sensor
+
+    def _analyze(self, db, readings):
+        """Score the polled readings and fold them into the chart rollups and exposure counters on db (the caller commits)"""
+        from utils.anomaly_stream import anomaly_detector
+        from utils.exposure import exposure_counters
+        from utils.online_stats import series_key
+        from utils.rollups import tile_pyramid
+
+        for sensor_id, rows in self._group(readings).items():
+            timestamps, values = [r['ts'].timestamp() for r in rows], [r['ppm'] for r in rows]
+            try:
+                sensor = self._sensors.get(sensor_id) or {}
+                anomaly_detector.record(db, sensor.get('user_id'), sensor_id, rows)
+                tile_pyramid.record(db, [series_key(sensor_id=sensor_id)], timestamps, values)
+                exposure_counters.record(db, None, sensor_id, timestamps, values)
+            except Exception as e:
+                print(f"  ! Analysis failed for sensor {sensor_id}: {e}")
+
+    def _observe(self, readings):
+        """Feed the polled readings to the per-sensor statistics"""
+        from utils.online_stats import series_key, series_stats
+
+        for sensor_id, rows in self._group(readings).items():
+            try:
+                series_stats.observe(series_key(sensor_id=sensor_id),
+                                     [r['ts'].timestamp() for r in rows], [r['ppm'] for r in rows])
+            except Exception as e:
+                print(f"  ! Statistics update failed for sensor {sensor_id}: {e}")
+
+    def _store(self, readings, availability):
+        if self.edge_buffer is None:
+            from database import record_sensor_poll_results
+            record_sensor_poll_results(self._compress(readings), availability,
+                                       analyze=lambda db: self._analyze(db, readings))
+            self._observe(readings)
+            return
+        # Gateway mode: the server compresses and marks sensors available when readings arrive
+        self.edge_buffer.append_many([
+            {'sensor_id': sensor_id, 'ppm': ppm, 'temperature': temperature,
+             'humidity': humidity, 'timestamp': timestamp}
+            for sensor_id, ppm, temperature, humidity, timestamp in readings
+        ])
+        if self.uploader is not None and readings:
+            self.uploader.notify()
+
+    def health(self):
+        """Health snapshot per sensor id"""
+        now = time.monotonic()
+        return {sensor_id: health.snapshot(now) for sensor_id, health in self._health.items()}
+
+    def seconds_until_next_due(self):
+        if not self._next_due:
+            return self.refresh_seconds
+        now = time.monotonic()
+        deadlines = [
+            max(due, self._health[sensor_id].retry_at) if self._health[sensor_id].state == FAILED else due
+            for sensor_id, due in self._next_due.items()
+        ]
+        return max(0.0, min(deadlines) - now)
+
+    def run_forever(self, stop_event=None):
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            try:
+                results = self.run_cycle()
+                if results:
+                    ok = sum(1 for r in results if r['available'])
+                    print(f"[{time.strftime('%H:%M:%S')}] {len(results)} capteur(s) lus ({ok} ✓, {len(results) - ok} ~)")
             except Exception as e:
-                print(f"  ✗ Error processing sensor {sensor_row['id']}: {e}")
-                try:
-                    update_sensor_availability(sensor_row['id'], False)
-                except:
-                    pass
-        
+                print(f"  ! Error in sensor polling cycle: {e}")
+            stop_event.wait(min(self.seconds_until_next_due(), self.refresh_seconds))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+_default_poller = None
+
+
+def read_all_sensors_and_log():
+    """
+    Read all active sensors once and log their data to database
+    """
+    global _default_poller
+    try:
+        if _default_poller is None:
+            _default_poller = SensorPoller(verbose=True)
+        _default_poller.refresh_sensors()
+        _default_poller.run_cycle(force=True)
     except ImportError:
         print("  ! Database module not available - skipping sensor logging")
     except Exception as e:
         print(f"  ! Error in sensor reading loop: {e}")
 
 
-if __name__ == "__main__":
-    import time
-    # Try to use an attached SCD30 sensor when available. Set environment
-    # variable USE_SCD30=0 to force the fake reader.
+def _start_gateway_forwarding():
+    """Edge buffer + uploader when AERIUM_SERVER_URL and AERIUM_DEVICE_TOKEN are set"""
+    server_url = os.environ.get("AERIUM_SERVER_URL")
+    token = os.environ.get("AERIUM_DEVICE_TOKEN")
+    if not server_url or not token:
+        return None, None
     try:
-        from app.sensors.scd30 import SCD30
-        _scd30 = SCD30()
-    except Exception:
-        _scd30 = None
+        from edge_buffer import EdgeBuffer, EdgeUploader
+    except ImportError:
+        from app.edge_buffer import EdgeBuffer, EdgeUploader
+    buffer = EdgeBuffer(
+        os.environ.get("AERIUM_EDGE_BUFFER", "edge_buffer.sqlite"),
+        max_rows=int(os.environ.get("AERIUM_EDGE_BUFFER_MAX_ROWS", "100000")),
+    )
+    uploader = EdgeUploader(buffer, server_url, token)
+    uploader.start()
+    return buffer, uploader
+
+
+if __name__ == "__main__":
+    edge_buffer, uploader = _start_gateway_forwarding()
+    poller = SensorPoller(
+        max_workers=int(os.environ.get("SENSOR_POLL_WORKERS", "16")),
+        verbose=os.environ.get("SENSOR_POLL_VERBOSE", "0") == "1",
+        edge_buffer=edge_buffer,
+        uploader=uploader,
+    )
 
-    use_scd = os.environ.get("USE_SCD30", "1")
-    
     print("CO₂ Sensor Reader - Per-Sensor Logging Mode")
+    if edge_buffer is not None:
+        print(f"Gateway mode: forwarding to {os.environ['AERIUM_SERVER_URL']} "
+              f"({len(edge_buffer)} reading(s) buffered)")
     print("=" * 50)
-    
-    while True:
-        try:
-            print(f"[{time.strftime('%H:%M:%S')}] Reading sensors...")
-            read_all_sensors_and_log()
-        except KeyboardInterrupt:
-            print("\nShutdown requested")
-            break
-        except Exception as e:
-            print(f"Error: {e}")
-        
-        time.sleep(10)  # Read every 10 seconds
+
+    try:
+        poller.run_forever()
+    except KeyboardInterrupt:
+        print("\nShutdown requested")
+    finally:
+        poller.shutdown()
+        if uploader is not None:
+            uploader.stop()
@@ -0,0 +1,267 @@
+"""
+Store-and-forward buffer for gateways with an intermittent link to the server.
+
+Readings are appended to a small local SQLite file (bounded: the oldest rows
+are dropped once ``max_rows`` is reached) and an uploader thread drains it to
+``POST /api/devices/ingest`` in gzip-compressed batches. Every row has a
+monotonically increasing offset; the server acknowledges a batch by echoing
+the offset of its last row, which is persisted so a restarted gateway resumes
+right after the last acknowledged reading. Readings carry a unique id, so a
+batch re-sent after a lost ack is deduplicated by the server.
+
+Only transient failures are retried. A batch the server refuses as malformed
+(HTTP 400/422, or 413 for a single reading) is moved to the ``parked`` table
+for inspection so the rest of the buffer keeps flowing; a rejected token
+(HTTP 401/403) stops the uploader, keeping every reading buffered for a
+restart with a valid token.
+
+Usage:
+    buffer = EdgeBuffer("edge_buffer.sqlite")
+    uploader = EdgeUploader(buffer, "http://server:5000", token)
+    uploader.start()
+    buffer.append_many([{"sensor_id": 3, "ppm": 612, "timestamp": "..."}])
+"""
+import gzip
+import json
+import random
+import sqlite3
+import threading
+import urllib.error
+import urllib.request
+import uuid
+
+# Statuses that reject the batch itself: it is parked instead of retried
+PARKED_STATUSES = (400, 422)
+# Statuses that reject the device token: uploading stops
+AUTH_STATUSES = (401, 403)
+
+
+class EdgeBuffer:
+    """Durable, bounded FIFO of readings waiting for upload"""
+
+    def __init__(self, path="edge_buffer.sqlite", max_rows=100_000):
+        self.max_rows = max_rows
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS parked (
+                seq INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                reason TEXT
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        self._conn.commit()
+        # Rows in the outbox, kept up to date by append/ack instead of COUNT(*) per append
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def append_many(self, readings):
+        """Queue readings (dicts); drops the oldest rows beyond max_rows.
+
+        Each reading gets a unique ``id`` (unless it already has one) so the
+        server can drop re-sent copies when an ack was lost.
+        """
+        rows = [(json.dumps({"id": uuid.uuid4().hex, **r}, separators=(",", ":")),) for r in readings]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT INTO outbox (payload) VALUES (?)", rows)
+            rows_after = self._rows + len(rows)
+            dropped = 0
+            if rows_after > self.max_rows:
+                dropped = self._conn.execute("""
+                    DELETE FROM outbox WHERE seq IN (
+                        SELECT seq FROM outbox ORDER BY seq LIMIT ?
+                    )
+                """, (rows_after - self.max_rows,)).rowcount
+            self._conn.commit()
+            self._rows = rows_after - dropped
+            self.dropped += dropped
+
+    def append(self, reading):
+        self.append_many([reading])
+
+    def pending(self, limit=500):
+        """Oldest unacknowledged readings as (last_offset, [readings])"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, payload FROM outbox WHERE seq > ? ORDER BY seq LIMIT ?",
+                (self._acked_offset(), limit)
+            ).fetchall()
+        if not rows:
+            return None, []
+        return rows[-1][0], [json.loads(payload) for _, payload in rows]
+
+    def ack(self, offset):
+        """Mark everything up to ``offset`` as delivered"""
+        with self._lock:
+            self._advance(offset)
+            self._conn.commit()
+
+    def park(self, offset, reason=None):
+        """Move everything up to ``offset`` to the ``parked`` table (rejected by the server)"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parked (seq, payload, reason) "
+                "SELECT seq, payload, ? FROM outbox WHERE seq <= ?",
+                (reason, offset)
+            )
+            self._advance(offset)
+            self._conn.commit()
+
+    def parked(self):
+        """Number of parked readings"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM parked").fetchone()[0]
+
+    def _advance(self, offset):
+        self._conn.execute(
+            "INSERT INTO state (key, value) VALUES ('acked_offset', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)",
+            (offset,)
+        )
+        self._rows -= self._conn.execute("DELETE FROM outbox WHERE seq <= ?", (offset,)).rowcount
+
+    def acked_offset(self):
+        with self._lock:
+            return self._acked_offset()
+
+    def _acked_offset(self):
+        row = self._conn.execute("SELECT value FROM state WHERE key = 'acked_offset'").fetchone()
+        return row[0] if row else 0
+
+    def __len__(self):
+        with self._lock:
+            return self._rows
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class EdgeUploader:
+    """Drains an EdgeBuffer to the server with exponential backoff
+
+    A batch rejected as too large (HTTP 413) halves ``batch_size``; it doubles
+    back, up to the configured size, after ``grow_after`` batches in a row are
+    accepted. Malformed batches are parked and a rejected token stops the
+    uploader (see the module docstring).
+    """
+
+    def __init__(self, buffer, server_url, token, batch_size=500,
+                 base_backoff=1.0, max_backoff=300.0, timeout=15.0, grow_after=10):
+        self.buffer = buffer
+        self.url = server_url.rstrip("/") + "/api/devices/ingest"
+        self.token = token
+        self.batch_size = batch_size
+        self.max_batch_size = batch_size
+        self.grow_after = grow_after
+        self._accepted_in_a_row = 0
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._failures = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def _post(self, last_offset, readings):
+        body = gzip.compress(json.dumps({"seq": last_offset, "readings": readings}).encode("utf-8"))
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            raise UploadError(f"HTTP {e.code}", status=e.code) from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise UploadError(str(e)) from e
+
+    def upload_once(self):
+        """Upload one batch; returns the number of readings acknowledged or parked"""
+        last_offset, readings = self.buffer.pending(self.batch_size)
+        if not readings:
+            return 0
+        try:
+            result = self._post(last_offset, readings)
+        except UploadError as e:
+            if e.status == 413 and len(readings) > 1:
+                self.batch_size = max(1, len(readings) // 2)
+                self._accepted_in_a_row = 0
+            elif e.status in PARKED_STATUSES or e.status == 413:
+                # A malformed batch, or a single reading too large to ever be accepted
+                self.buffer.park(last_offset, str(e))
+                print(f"  ! Batch of {len(readings)} reading(s) rejected ({e}); parked")
+                return len(readings)
+            raise
+        if not result.get("ok") or result.get("seq") != last_offset:
+            raise UploadError(f"unexpected ack: {result}")
+        self.buffer.ack(last_offset)
+        self._accepted_in_a_row += 1
+        if self.batch_size < self.max_batch_size and self._accepted_in_a_row >= self.grow_after:
+            self.batch_size = min(self.max_batch_size, self.batch_size * 2)
+            self._accepted_in_a_row = 0
+        return len(readings)
+
+    def _backoff_delay(self):
+        delay = min(self.base_backoff * (2 ** (self._failures - 1)), self.max_backoff)
+        return delay * random.uniform(0.5, 1.0)
+
+    def run_forever(self, idle_wait=5.0):
+        while not self._stop.is_set():
+            try:
+                sent = self.upload_once()
+                self._failures = 0
+            except UploadError as e:
+                if e.status in AUTH_STATUSES:
+                    print(f"  ! Device token rejected ({e}); uploads stopped, "
+                          f"{len(self.buffer)} reading(s) kept in the buffer")
+                    self._stop.set()
+                    break
+                self._failures += 1
+                delay = self._backoff_delay()
+                print(f"  ! Upload failed ({e}); {len(self.buffer)} reading(s) buffered, retry in {delay:.0f}s")
+                self._stop.wait(delay)
+                continue
+            if not sent:
+                # Buffer empty: sleep until new readings are queued (notify) or idle_wait
+                self._wake.wait(idle_wait)
+                self._wake.clear()
+
+    def notify(self):
+        """Wake the uploader after new readings were queued"""
+        self._wake.set()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="edge-uploader", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+
+__all__ = ["EdgeBuffer", "EdgeUploader", "UploadError"]
@@ -2,19 +2,35 @@
 Light wrapper for SCD30 sensor support.
 
 This module will try to use an installed SCD30 driver if available.
-If no hardware driver is present it falls back to a simulator so the
-rest of the application can run without raising import errors.
+If no driver package is installed it falls back to a simulator so the
+rest of the application can run without raising import errors (handles
+then report ``simulated = True``). When a driver is installed, hardware
+failures raise ``SCD30Error`` instead of producing simulated values.
 
 Usage:
-    from app.sensors.scd30 import SCD30
-    s = SCD30()
+    from app.sensors.scd30 import get_scd30
+    s = get_scd30(bus=1, address=0x61)
     reading = s.read()  # -> {"co2": ppm, "temperature": C, "humidity": %}
 
+`get_scd30` keeps one initialized handle per (bus, address): the driver is
+constructed and periodic measurement started only once, access to each I2C
+bus is serialized, and between two sensor updates (the SCD30 measures every
+2 s by default) `read()` returns the cached last measurement without touching
+the bus. A sensor whose initialization failed is retried after a backoff
+(`INIT_RETRY_SECONDS`, doubled per failure up to `MAX_INIT_RETRY_SECONDS`)
+instead of on every call.
+
+The bus locks are per process: they serialize the threads of one poller but
+not two processes sharing a bus. Run a single sensor reader per host
+(`co2_reader.py`).
+
 Note: For real hardware you should install an appropriate driver such as
 `smbus2` plus a community SCD30 package (package names vary by OS).
 """
 from typing import Optional, Dict
 import random
+import threading
+import time
 
 _HAS_DRIVER = False
 _Driver = None
@@ -34,48 +50,185 @@ except Exception:
     except Exception:
         _HAS_DRIVER = False
 
+# SCD30 default continuous measurement interval (seconds)
+MEASUREMENT_INTERVAL = 2.0
+
+# Backoff before re-initializing a sensor that failed to initialize (seconds)
+INIT_RETRY_SECONDS = 5.0
+MAX_INIT_RETRY_SECONDS = 300.0
+
+
+class SCD30Error(IOError):
+    """The sensor could not be initialized or read."""
+
+
+_bus_locks: Dict[int, threading.Lock] = {}
+_bus_locks_lock = threading.Lock()
+_registry: Dict[tuple, "SCD30"] = {}
+# (bus, address) -> (handle that failed to initialize, retry at (monotonic), failures)
+_failed: Dict[tuple, tuple] = {}
+# (bus, address) -> lock held while that sensor's handle is built
+_init_locks: Dict[tuple, threading.Lock] = {}
+_registry_lock = threading.Lock()
+
+
+def bus_lock(bus: int) -> threading.Lock:
+    """Lock serializing all transactions on one I2C bus (within this process)."""
+    with _bus_locks_lock:
+        lock = _bus_locks.get(bus)
+        if lock is None:
+            lock = _bus_locks[bus] = threading.Lock()
+        return lock
+
 
 class SCD30:
-    def __init__(self, bus: int = 1, address: int = 0x61):
+    def __init__(self, bus: int = 1, address: int = 0x61, measurement_interval: float = MEASUREMENT_INTERVAL):
+        self.bus = bus
+        self.address = address
+        self.measurement_interval = measurement_interval
         self._hw = None
+        self._last: Optional[Dict[str, float]] = None
+        self._last_check = 0.0
+        self.last_updated: Optional[float] = None
+
         if _HAS_DRIVER and _Driver is not None:
-            try:
-                # Many drivers accept bus/address or nothing; try to be flexible
+            with bus_lock(bus):
                 try:
-                    self._hw = _Driver(bus=bus, address=address)
-                except TypeError:
-                    self._hw = _Driver()
-                # Some drivers require starting periodic measurement
-                if hasattr(self._hw, "start_periodic_measurement"):
+                    # Many drivers accept bus/address or nothing; try to be flexible
                     try:
-                        self._hw.start_periodic_measurement()
-                    except Exception:
-                        pass
-            except Exception:
-                self._hw = None
+                        self._hw = _Driver(bus=bus, address=address)
+                    except TypeError:
+                        self._hw = _Driver()
+                    # Some drivers require starting periodic measurement
+                    if hasattr(self._hw, "start_periodic_measurement"):
+                        try:
+                            self._hw.start_periodic_measurement()
+                        except Exception:
+                            pass
+                except Exception:
+                    self._hw = None
+
+    @property
+    def has_hardware(self) -> bool:
+        return self._hw is not None
+
+    @property
+    def simulated(self) -> bool:
+        """True when no driver package is installed and values are simulated."""
+        return not _HAS_DRIVER
+
+    def _data_ready(self) -> bool:
+        """Ask the sensor whether a new measurement is available."""
+        for name in ("get_data_ready", "data_ready", "data_available"):
+            attr = getattr(self._hw, name, None)
+            if attr is None:
+                continue
+            return bool(attr() if callable(attr) else attr)
+        # Driver can't tell us; read directly
+        return True
+
+    def _read_hw(self) -> Optional[Dict[str, float]]:
+        # Try driver-specific read patterns
+        if hasattr(self._hw, "read_measurement"):
+            vals = self._hw.read_measurement()
+            if vals:
+                # common ordering: (co2, temp, rh)
+                return {"co2": float(vals[0]), "temperature": float(vals[1]), "humidity": float(vals[2])}
+        if hasattr(self._hw, "get_measurement"):
+            vals = self._hw.get_measurement()
+            return {"co2": float(vals[0]), "temperature": float(vals[1]), "humidity": float(vals[2])}
+        if hasattr(self._hw, "CO2"):
+            return {"co2": float(self._hw.CO2), "temperature": float(self._hw.temperature),
+                    "humidity": float(self._hw.relative_humidity)}
+        return None
 
     def read(self) -> Optional[Dict[str, float]]:
-        """Return latest measurement or a simulated value.
+        """Return latest measurement (simulated when no driver is installed).
 
-        Real driver: returns {'co2': ppm, 'temperature': C, 'humidity': %}
+        Real driver: returns {'co2': ppm, 'temperature': C, 'humidity': %},
+        or None when the sensor has not produced a first measurement yet.
+        Within one measurement interval of the previous check the cached
+        measurement is returned without a bus transaction; otherwise the
+        data-ready flag is polled and the measurement is only read when new.
+
+        Raises:
+            SCD30Error: the driver is installed but the sensor is missing or failing.
         """
-        if self._hw is not None:
-            try:
-                # Try driver-specific read patterns
-                if hasattr(self._hw, "read_measurement"):
-                    vals = self._hw.read_measurement()
-                    if vals:
-                        # common ordering: (co2, temp, rh)
-                        return {"co2": float(vals[0]), "temperature": float(vals[1]), "humidity": float(vals[2])}
-                if hasattr(self._hw, "get_measurement"):
-                    vals = self._hw.get_measurement()
-                    return {"co2": float(vals[0]), "temperature": float(vals[1]), "humidity": float(vals[2])}
-            except Exception:
-                # on any hardware read error, fall through to simulator
-                pass
-
-        # Simulator fallback
-        return {"co2": float(random.randint(400, 1000)), "temperature": 22.0 + random.random(), "humidity": 40.0 + random.random() * 10.0}
-
-
-__all__ = ["SCD30"]
+        now = time.monotonic()
+        if self._last is not None and now - self._last_check < self.measurement_interval:
+            return dict(self._last)
+
+        if _HAS_DRIVER:
+            if self._hw is None:
+                raise SCD30Error(f"SCD30 not initialized on bus {self.bus} at {hex(self.address)}")
+            with bus_lock(self.bus):
+                self._last_check = time.monotonic()
+                try:
+                    if not self._data_ready():
+                        return dict(self._last) if self._last is not None else None
+                    vals = self._read_hw()
+                except Exception as e:
+                    raise SCD30Error(f"SCD30 read failed on bus {self.bus}: {e}") from e
+                if not vals:
+                    raise SCD30Error(f"SCD30 returned no measurement on bus {self.bus}")
+                self._store(vals)
+                return dict(vals)
+
+        # Simulator fallback (no driver package installed)
+        self._last_check = now
+        vals = {"co2": float(random.randint(400, 1000)), "temperature": 22.0 + random.random(), "humidity": 40.0 + random.random() * 10.0}
+        self._store(vals)
+        return dict(vals)
+
+    def _store(self, vals: Dict[str, float]) -> None:
+        self._last = vals
+        self.last_updated = time.time()
+
+
+def get_scd30(bus: int = 1, address: int = 0x61) -> SCD30:
+    """Shared, initialized handle for the SCD30 at (bus, address).
+
+    The handle is built under a per-(bus, address) lock, so concurrent first
+    calls initialize the sensor once while a slow init does not block the
+    other sensors. A handle whose hardware failed to initialize is returned
+    as-is (its reads raise SCD30Error) until its retry backoff expires, so a
+    sensor plugged in later is still picked up.
+    """
+    key = (int(bus), int(address))
+    with _registry_lock:
+        handle = _registry.get(key)
+        if handle is not None:
+            return handle
+        init_lock = _init_locks.setdefault(key, threading.Lock())
+
+    with init_lock:
+        with _registry_lock:
+            handle = _registry.get(key)
+            if handle is not None:
+                return handle
+            failed = _failed.get(key)
+            if failed is not None and time.monotonic() < failed[1]:
+                return failed[0]
+
+        handle = SCD30(bus=key[0], address=key[1])
+        with _registry_lock:
+            if _HAS_DRIVER and not handle.has_hardware:
+                failures = failed[2] + 1 if failed else 1
+                delay = min(INIT_RETRY_SECONDS * 2 ** (failures - 1), MAX_INIT_RETRY_SECONDS)
+                _failed[key] = (handle, time.monotonic() + delay, failures)
+                return handle
+            _failed.pop(key, None)
+            _registry[key] = handle
+            return handle
+
+
+def reset_scd30(bus: Optional[int] = None, address: Optional[int] = None) -> None:
+    """Drop cached handles and init backoffs (all, one bus, or one (bus, address))."""
+    with _registry_lock:
+        for cache in (_registry, _failed):
+            for key in list(cache):
+                if (bus is None or key[0] == bus) and (address is None or key[1] == address):
+                    del cache[key]
+
+
+__all__ = ["SCD30", "SCD30Error", "get_scd30", "reset_scd30", "bus_lock"]
@@ -0,0 +1,194 @@
+"""
+Tests for the per-sensor polling service (co2_reader.SensorPoller) with fake sensors
+"""
+
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from co2_reader import DEGRADED, FAILED, HEALTHY, SensorHealth, SensorPoller
+
+import database
+
+USER_ID = 987059
+
+
+class FakeSCD30:
+    """Handle that counts concurrent reads and returns a fixed measurement"""
+
+    active = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def __init__(self, ppm=600, delay=0.0, error=None):
+        self.ppm = ppm
+        self.delay = delay
+        self.error = error
+        self.simulated = False
+        self.reads = 0
+
+    def read(self):
+        with FakeSCD30.lock:
+            FakeSCD30.active += 1
+            FakeSCD30.peak = max(FakeSCD30.peak, FakeSCD30.active)
+        try:
+            time.sleep(self.delay)
+            self.reads += 1
+            if self.error:
+                raise IOError(self.error)
+            return {'co2': self.ppm, 'temperature': 21.5, 'humidity': 45.0}
+        finally:
+            with FakeSCD30.lock:
+                FakeSCD30.active -= 1
+
+
+class PollerTestCase(unittest.TestCase):
+    """Base case: a temporary database with one user's sensors, one fake handle per bus"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_path = database.DB_PATH
+        database.DB_PATH = Path(cls.tmp.name) / "aerium.sqlite"
+        database.init_db()
+
+    @classmethod
+    def tearDownClass(cls):
+        from utils.online_stats import series_stats
+        series_stats.flush()
+        while not database._db_pool.empty():
+            database._db_pool.get_nowait().close()
+        database.DB_PATH = cls.db_path
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        FakeSCD30.peak = 0
+        self.handles = {}
+        db = database.get_db()
+        db.execute("DELETE FROM user_sensors")
+        db.execute("DELETE FROM sensor_readings")
+        db.commit()
+        db.close()
+
+    def add_sensor(self, bus, interval=10, **fake):
+        sensor_id = database.create_sensor(USER_ID, f'Capteur {bus}', 'scd30', 'i2c',
+                                           {'bus': bus, 'address': '0x61', 'interval': interval})
+        self.handles[(bus, 0x61)] = FakeSCD30(**fake)
+        return sensor_id
+
+    def poller(self):
+        poller = SensorPoller(max_workers=8)
+        poller._get_scd30 = lambda bus, address: self.handles[(bus, address)]
+        return poller
+
+    def stored(self):
+        db = database.get_db()
+        rows = db.execute("SELECT sensor_id, co2 FROM sensor_readings ORDER BY sensor_id").fetchall()
+        db.close()
+        return [tuple(row) for row in rows]
+
+
+class SchedulingTestCase(PollerTestCase):
+    """Test concurrent reads, per-sensor intervals and one write per cycle"""
+
+    def test_due_sensors_are_read_concurrently(self):
+        sensors = [self.add_sensor(bus, delay=0.2) for bus in range(1, 5)]
+        poller = self.poller()
+        started = time.monotonic()
+        results = poller.run_cycle()
+        elapsed = time.monotonic() - started
+        poller.shutdown()
+
+        self.assertEqual(sorted(r['sensor']['id'] for r in results), sensors)
+        self.assertEqual(FakeSCD30.peak, 4)
+        self.assertLess(elapsed, 0.6)
+
+    def test_each_sensor_runs_on_its_own_interval(self):
+        fast, slow = self.add_sensor(1, interval=10), self.add_sensor(2, interval=60)
+        poller = self.poller()
+        poller.run_cycle()
+        self.assertEqual(poller.run_cycle(), [])
+        self.assertEqual(poller._next_due[slow] - poller._next_due[fast], 50)
+
+        poller._next_due[fast] = time.monotonic() - 1
+        self.assertEqual([r['sensor']['id'] for r in poller.run_cycle()], [fast])
+        self.assertEqual(self.handles[(2, 0x61)].reads, 1)
+        poller.shutdown()
+
+    def test_cycle_is_written_in_one_batch(self):
+        ok = self.add_sensor(1, ppm=820)
+        broken = self.add_sensor(2, error='bus error')
+        poller = self.poller()
+        with mock.patch.object(database, 'record_sensor_poll_results',
+                               wraps=database.record_sensor_poll_results) as record:
+            poller.run_cycle()
+        poller.shutdown()
+
+        record.assert_called_once()
+        readings, availability = record.call_args[0]
+        self.assertEqual([(r[0], r[1]) for r in readings], [(ok, 820)])
+        self.assertEqual(availability, [(ok, True)])
+        self.assertEqual(self.stored(), [(ok, 820)])
+        self.assertEqual(poller.health()[ok]['state'], HEALTHY)
+        self.assertNotEqual(poller.health()[broken]['state'], FAILED)
+
+
+class SensorHealthTestCase(unittest.TestCase):
+    """Test the healthy -> degraded -> failed state machine and its backoff"""
+
+    def test_failures_degrade_then_fail_with_backoff(self):
+        health = SensorHealth(fail_threshold=3, base_backoff=30, max_backoff=100)
+        self.assertEqual(health.record_failure('timeout', now=0), HEALTHY)
+        self.assertEqual(health.state, DEGRADED)
+        self.assertTrue(health.can_attempt(0))
+        health.record_failure('timeout', now=0)
+        self.assertEqual(health.record_failure('timeout', now=0), DEGRADED)
+        self.assertEqual((health.state, health.retry_at), (FAILED, 30))
+        self.assertFalse(health.can_attempt(29))
+        self.assertTrue(health.can_attempt(30))
+
+        health.record_failure('timeout', now=30)
+        self.assertEqual(health.retry_at, 90)
+        health.record_failure('timeout', now=90)
+        self.assertEqual(health.retry_at, 190)
+        self.assertEqual(health.snapshot(100)['retry_in'], 90)
+
+    def test_success_resets(self):
+        health = SensorHealth(fail_threshold=1)
+        health.record_failure('timeout', now=0)
+        self.assertEqual(health.record_success(), FAILED)
+        self.assertEqual(health.snapshot(0), {'state': HEALTHY, 'failures': 0, 'last_error': None, 'retry_in': 0.0})
+
+
+class PollerHealthTestCase(PollerTestCase):
+    """Test that failed sensors are skipped until their backoff expires"""
+
+    def test_failed_sensor_is_skipped_and_marked_unavailable(self):
+        broken = self.add_sensor(1, error='bus error')
+        poller = self.poller()
+        poller._health[broken] = SensorHealth(fail_threshold=2, base_backoff=60)
+        with mock.patch.object(database, 'record_sensor_poll_results',
+                               wraps=database.record_sensor_poll_results) as record:
+            poller.run_cycle(force=True)
+            self.assertEqual(poller.health()[broken]['state'], DEGRADED)
+            poller.run_cycle(force=True)
+            self.assertEqual(poller.health()[broken]['state'], FAILED)
+            self.assertEqual(poller.run_cycle(force=True), [])
+        poller.shutdown()
+
+        self.assertEqual([call[0][1] for call in record.call_args_list], [[], [(broken, False)]])
+        self.assertEqual(self.handles[(1, 0x61)].reads, 2)
+        self.assertEqual(self.stored(), [])
+        db = database.get_db()
+        self.assertEqual(db.execute("SELECT available FROM user_sensors WHERE id = ?", (broken,)).fetchone()[0], 0)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests for the gateway store-and-forward buffer (edge_buffer)
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from edge_buffer import EdgeBuffer, EdgeUploader, UploadError
+
+
+class EdgeBufferTestCase(unittest.TestCase):
+    """Test outbox bounds and durable acks"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = str(Path(self.tmp.name) / "edge.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_oldest_rows_are_dropped_beyond_max_rows(self):
+        buffer = EdgeBuffer(self.path, max_rows=5)
+        buffer.append_many([{"ppm": 600 + i} for i in range(4)])
+        buffer.append_many([{"ppm": 700 + i} for i in range(3)])
+        self.assertEqual((len(buffer), buffer.dropped), (5, 2))
+        _, readings = buffer.pending()
+        self.assertEqual([r["ppm"] for r in readings], [602, 603, 700, 701, 702])
+        buffer.close()
+
+    def test_acked_offset_survives_a_restart(self):
+        buffer = EdgeBuffer(self.path)
+        buffer.append_many([{"ppm": 600 + i} for i in range(5)])
+        offset, readings = buffer.pending(limit=3)
+        self.assertEqual(len(readings), 3)
+        ids = [r["id"] for r in readings]
+        buffer.ack(offset)
+        buffer.close()
+
+        reopened = EdgeBuffer(self.path)
+        self.assertEqual((len(reopened), reopened.acked_offset()), (2, offset))
+        _, readings = reopened.pending()
+        self.assertEqual([r["ppm"] for r in readings], [603, 604])
+        self.assertFalse(set(ids) & {r["id"] for r in readings})
+        reopened.close()
+
+
+class _ScriptedUploader(EdgeUploader):
+    """Uploader answering from a list of statuses instead of HTTP"""
+
+    def __init__(self, buffer, statuses, **kwargs):
+        super().__init__(buffer, "http://gateway.test", "token", **kwargs)
+        self.statuses = list(statuses)
+        self.sizes = []
+
+    def _post(self, last_offset, readings):
+        self.sizes.append(len(readings))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status != 200:
+            raise UploadError(f"HTTP {status}", status=status)
+        return {"ok": True, "seq": last_offset}
+
+
+class EdgeUploaderTestCase(unittest.TestCase):
+    """Test batch size adaptation and permanent rejections"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.buffer = EdgeBuffer(str(Path(self.tmp.name) / "edge.sqlite"))
+        self.buffer.append_many([{"ppm": 600 + i % 50} for i in range(200)])
+
+    def tearDown(self):
+        self.buffer.close()
+        self.tmp.cleanup()
+
+    def test_too_large_batches_halve_then_recover(self):
+        uploader = _ScriptedUploader(self.buffer, [413, 413], batch_size=40, grow_after=2)
+        for _ in range(2):
+            with self.assertRaises(UploadError):
+                uploader.upload_once()
+        self.assertEqual(uploader.batch_size, 10)
+        self.assertEqual(uploader.upload_once(), 10)
+        self.assertEqual(uploader.upload_once(), 10)
+        self.assertEqual(uploader.batch_size, 20)
+        uploader.upload_once()
+        uploader.upload_once()
+        self.assertEqual(uploader.batch_size, 40)
+        self.assertEqual(uploader.sizes, [40, 20, 10, 10, 20, 20])
+        self.assertEqual(len(self.buffer), 140)
+
+    def test_rejected_batches_are_parked(self):
+        uploader = _ScriptedUploader(self.buffer, [400], batch_size=50)
+        self.assertEqual(uploader.upload_once(), 50)
+        self.assertEqual((self.buffer.parked(), len(self.buffer)), (50, 150))
+        self.assertEqual(uploader.upload_once(), 50)
+        self.assertEqual(self.buffer.parked(), 50)
+
+    def test_rejected_token_stops_uploads(self):
+        uploader = _ScriptedUploader(self.buffer, [401], batch_size=50)
+        uploader.run_forever(idle_wait=0)
+        self.assertEqual(uploader.sizes, [50])
+        self.assertEqual((len(self.buffer), self.buffer.parked()), (200, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+"""
+Tests for the shared SCD30 handles (sensors.scd30) with a fake driver
+"""
+
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sensors import scd30
+
+
+class FakeDriver:
+    """Driver double: counts constructions and bus reads, fails or stalls on demand"""
+
+    created = []
+    fail = False
+    init_delay = {}
+
+    def __init__(self, bus=1, address=0x61):
+        time.sleep(FakeDriver.init_delay.get(bus, 0))
+        FakeDriver.created.append((bus, address))
+        if FakeDriver.fail:
+            raise OSError("no device")
+        self.ready = True
+        self.reads = 0
+
+    def get_data_ready(self):
+        return self.ready
+
+    def read_measurement(self):
+        self.reads += 1
+        return (600.0 + self.reads, 21.0, 45.0)
+
+
+class RegistryTestCase(unittest.TestCase):
+    """Test handle sharing, data-ready reuse and the failed-init backoff"""
+
+    def setUp(self):
+        FakeDriver.created, FakeDriver.fail, FakeDriver.init_delay = [], False, {}
+        scd30.reset_scd30()
+        patches = [mock.patch.object(scd30, '_HAS_DRIVER', True), mock.patch.object(scd30, '_Driver', FakeDriver)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(scd30.reset_scd30)
+
+    def test_one_handle_per_bus_and_address(self):
+        handle = scd30.get_scd30(1, 0x61)
+        self.assertIs(scd30.get_scd30(1, 0x61), handle)
+        self.assertIsNot(scd30.get_scd30(2, 0x61), handle)
+        self.assertEqual(FakeDriver.created, [(1, 0x61), (2, 0x61)])
+
+    def test_reads_reuse_the_last_measurement(self):
+        handle = scd30.get_scd30(1, 0x61)
+        self.assertEqual(handle.read()['co2'], 601.0)
+        # Within the measurement interval: no bus transaction
+        self.assertEqual(handle.read()['co2'], 601.0)
+        self.assertEqual(handle._hw.reads, 1)
+
+        # Interval elapsed but no new data: the cached measurement is returned
+        handle._last_check -= scd30.MEASUREMENT_INTERVAL
+        handle._hw.ready = False
+        self.assertEqual(handle.read()['co2'], 601.0)
+        self.assertEqual(handle._hw.reads, 1)
+
+        handle._last_check -= scd30.MEASUREMENT_INTERVAL
+        handle._hw.ready = True
+        self.assertEqual(handle.read()['co2'], 602.0)
+
+    def test_failed_init_is_retried_after_backoff(self):
+        FakeDriver.fail = True
+        handle = scd30.get_scd30(1, 0x61)
+        self.assertFalse(handle.has_hardware)
+        with self.assertRaises(scd30.SCD30Error):
+            handle.read()
+        self.assertIs(scd30.get_scd30(1, 0x61), handle)
+        self.assertEqual(len(FakeDriver.created), 1)
+
+        now = time.monotonic()
+        with mock.patch.object(scd30.time, 'monotonic', return_value=now + scd30.INIT_RETRY_SECONDS):
+            scd30.get_scd30(1, 0x61)
+        self.assertEqual(len(FakeDriver.created), 2)
+        _, retry_at, failures = scd30._failed[(1, 0x61)]
+        self.assertEqual((failures, retry_at), (2, now + 3 * scd30.INIT_RETRY_SECONDS))
+
+        FakeDriver.fail = False
+        with mock.patch.object(scd30.time, 'monotonic', return_value=retry_at):
+            self.assertTrue(scd30.get_scd30(1, 0x61).has_hardware)
+        self.assertNotIn((1, 0x61), scd30._failed)
+
+    def test_slow_init_does_not_block_other_buses(self):
+        FakeDriver.init_delay = {1: 0.5}
+        slow = threading.Thread(target=scd30.get_scd30, args=(1, 0x61))
+        slow.start()
+        time.sleep(0.05)
+        started = time.monotonic()
+        scd30.get_scd30(2, 0x61)
+        self.assertLess(time.monotonic() - started, 0.3)
+        slow.join()
+        self.assertEqual(sorted(FakeDriver.created), [(1, 0x61), (2, 0x61)])
+
+
+if __name__ == '__main__':
+    unittest.main()
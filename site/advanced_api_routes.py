@@ -7,26 +7,53 @@ from flask import Blueprint, request, jsonify, send_file, session
 from functools import wraps
 from datetime import datetime
 import io
+import threading
 
 from export_manager import DataExporter, ScheduledExporter
 from tenant_manager import TenantManager
-from ml_analytics import MLAnalytics
+from ml_analytics import MLAnalytics, ModelNotReady
 from collaboration import CollaborationManager
 from ai_recommender import AIRecommender
+from database import get_sensor_by_id
 from performance_optimizer import optimizer, rate_limiter
+from utils.task_pool import PoolBusy, TaskTimeout, task_pool
 
 # Create blueprint
 advanced_api = Blueprint('advanced_api', __name__, url_prefix='/api/advanced')
 
-# Initialize managers
-data_exporter = DataExporter()
-tenant_mgr = TenantManager()
-ml_analytics = MLAnalytics()
-collab_mgr = CollaborationManager()
-recommender = AIRecommender()
 
-# Initialize performance optimization
-optimizer.initialize()
+def _lazy(factory):
+    """Getter of a process-wide instance built by ``factory`` on first use.
+
+    Construction runs once even when the first requests arrive on several
+    threads at the same time. The services hold no database connection (each
+    operation borrows one from the pool and returns it), so the shared
+    instances serve concurrent requests in parallel.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+    return get
+
+
+def _initialized_optimizer():
+    optimizer.initialize()
+    return optimizer
+
+
+# Managers, created on first use
+get_data_exporter = _lazy(DataExporter)
+get_tenant_manager = _lazy(TenantManager)
+get_ml_analytics = _lazy(MLAnalytics)
+get_collab_manager = _lazy(CollaborationManager)
+get_recommender = _lazy(AIRecommender)
+get_optimizer = _lazy(_initialized_optimizer)
 
 
 def require_login(f):
@@ -39,6 +66,20 @@ def require_login(f):
     return decorated_function
 
 
+def require_sensor_owner(f):
+    """Require the ``sensor_id`` of the route to belong to the logged-in user
+
+    Checked before any model lookup, so another user's sensor never gets a
+    model trained or served.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not get_sensor_by_id(kwargs['sensor_id'], session['user_id']):
+            return jsonify({'error': 'Sensor not found'}), 404
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 # ============================================================================
 # EXPORT FEATURES (Feature 3)
 # ============================================================================
@@ -63,7 +104,7 @@ def export_csv():
         ''', (sensor_id, f'-{days}'))
         
         data = cursor.fetchall()
-        csv_data = data_exporter.export_to_csv(data)
+        csv_data = get_data_exporter().export_to_csv(data)
         
         if csv_data:
             return send_file(
@@ -103,7 +144,8 @@ def export_excel():
                 for r in readings]
         
         charts_data = {'ppm': [r['ppm'] for r in data]} if include_charts else None
-        excel_data = data_exporter.export_to_excel(data, charts_data=charts_data)
+        excel_data = task_pool.run(get_data_exporter().export_to_excel, data, charts_data=charts_data,
+                                   kind='export_excel')
         
         if excel_data:
             return send_file(
@@ -114,6 +156,10 @@ def export_excel():
             )
         return jsonify({'error': 'openpyxl not installed'}), 500
     
+    except PoolBusy:
+        return jsonify({'error': 'Too many exports are running, try again shortly'}), 503
+    except TaskTimeout:
+        return jsonify({'error': 'Export timed out'}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -145,7 +191,8 @@ def export_pdf():
         cursor.execute('SELECT name FROM sensors WHERE id = ?', (sensor_id,))
         sensor_name = cursor.fetchone()[0] if cursor.fetchone() else 'Sensor'
         
-        pdf_data = data_exporter.export_to_pdf(data, title=f'{sensor_name} Report')
+        pdf_data = task_pool.run(get_data_exporter().export_to_pdf, data, title=f'{sensor_name} Report',
+                                 kind='export_pdf')
         
         if pdf_data:
             return send_file(
@@ -156,6 +203,10 @@ def export_pdf():
             )
         return jsonify({'error': 'WeasyPrint not installed'}), 500
     
+    except PoolBusy:
+        return jsonify({'error': 'Too many exports are running, try again shortly'}), 503
+    except TaskTimeout:
+        return jsonify({'error': 'Export timed out'}), 504
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -194,9 +245,9 @@ def schedule_export():
 def create_tenant():
     """Create new organization"""
     try:
-        tenant_mgr.init_tenant_schema()
+        get_tenant_manager().init_tenant_schema()
         
-        tenant_id = tenant_mgr.create_tenant(
+        tenant_id = get_tenant_manager().create_tenant(
             name=request.json.get('name'),
             owner_user_id=session['user_id'],
             subscription_tier=request.json.get('tier', 'free')
@@ -217,7 +268,7 @@ def create_tenant():
 def add_tenant_member(tenant_id):
     """Add member to organization"""
     try:
-        success = tenant_mgr.add_tenant_member(
+        success = get_tenant_manager().add_tenant_member(
             tenant_id,
             request.json.get('user_id'),
             request.json.get('role', 'member'),
@@ -237,7 +288,7 @@ def add_tenant_member(tenant_id):
 def create_location(tenant_id):
     """Create location within organization"""
     try:
-        location_id = tenant_mgr.create_location(
+        location_id = get_tenant_manager().create_location(
             tenant_id,
             request.json.get('name'),
             request.json.get('address'),
@@ -260,7 +311,7 @@ def create_location(tenant_id):
 def get_tenant_stats(tenant_id):
     """Get organization statistics"""
     try:
-        stats = tenant_mgr.get_tenant_statistics(tenant_id)
+        stats = get_tenant_manager().get_tenant_statistics(tenant_id)
         return jsonify(stats)
     
     except Exception as e:
@@ -273,11 +324,12 @@ def get_tenant_stats(tenant_id):
 
 @advanced_api.route('/analytics/predict/<int:sensor_id>', methods=['GET'])
 @require_login
+@require_sensor_owner
 def predict_co2(sensor_id):
     """Get CO₂ predictions"""
     try:
         hours = request.args.get('hours', 24, type=int)
-        predictions = ml_analytics.predict_co2_levels(sensor_id, hours)
+        predictions = get_ml_analytics().predict_co2_levels(sensor_id, hours)
         
         if predictions:
             return jsonify({
@@ -287,25 +339,28 @@ def predict_co2(sensor_id):
             })
         return jsonify({'error': 'sklearn not available'}), 500
     
+    except ModelNotReady as e:
+        return jsonify({'status': 'training', 'error': str(e)}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @advanced_api.route('/analytics/anomalies/<int:sensor_id>', methods=['GET'])
 @require_login
+@require_sensor_owner
 def detect_anomalies(sensor_id):
     """Detect anomalies in CO₂ readings"""
     try:
         threshold = request.args.get('threshold', 0.95, type=float)
-        anomalies = ml_analytics.detect_anomalies(sensor_id, threshold)
+        anomalies = get_ml_analytics().detect_anomalies(sensor_id, threshold, user_id=session.get('user_id'))
         
         if anomalies is not None:
             return jsonify({
                 'anomalies': anomalies,
                 'count': len(anomalies),
-                'model': 'isolation-forest'
+                'model': 'streaming'
             })
-        return jsonify({'error': 'sklearn not available'}), 500
+        return jsonify({'error': 'Anomaly lookup failed'}), 500
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -313,11 +368,12 @@ def detect_anomalies(sensor_id):
 
 @advanced_api.route('/analytics/trends/<int:sensor_id>', methods=['GET'])
 @require_login
+@require_sensor_owner
 def get_trends(sensor_id):
     """Get trend analysis"""
     try:
         days = request.args.get('days', 30, type=int)
-        trends = ml_analytics.analyze_trends(sensor_id, days)
+        trends = get_ml_analytics().analyze_trends(sensor_id, days)
         return jsonify(trends)
     
     except Exception as e:
@@ -326,11 +382,12 @@ def get_trends(sensor_id):
 
 @advanced_api.route('/analytics/insights/<int:sensor_id>', methods=['GET'])
 @require_login
+@require_sensor_owner
 def get_insights(sensor_id):
     """Get AI insights"""
     try:
-        insights = ml_analytics.get_insights(sensor_id)
-        correlations = ml_analytics.get_correlation_analysis(sensor_id)
+        insights = get_ml_analytics().get_insights(sensor_id)
+        correlations = get_ml_analytics().get_correlation_analysis(sensor_id)
         
         return jsonify({
             'insights': insights,
@@ -350,7 +407,7 @@ def get_insights(sensor_id):
 def create_share():
     """Share sensor dashboard with team"""
     try:
-        share_id = collab_mgr.create_team_share(
+        share_id = get_collab_manager().create_team_share(
             session['user_id'],
             request.json.get('sensor_id'),
             request.json.get('team_members', []),
@@ -372,7 +429,7 @@ def create_share():
 def create_shared_alert():
     """Create alert that notifies team"""
     try:
-        alert_id = collab_mgr.create_shared_alert(
+        alert_id = get_collab_manager().create_shared_alert(
             request.json.get('team_share_id'),
             request.json.get('alert_name'),
             request.json.get('condition'),
@@ -395,7 +452,7 @@ def create_shared_alert():
 def add_comment(reading_id):
     """Add comment to reading"""
     try:
-        comment_id = collab_mgr.add_comment(
+        comment_id = get_collab_manager().add_comment(
             reading_id,
             session['user_id'],
             request.json.get('comment')
@@ -415,7 +472,7 @@ def add_comment(reading_id):
 def get_comments(reading_id):
     """Get comments on reading"""
     try:
-        comments = collab_mgr.get_reading_comments(reading_id)
+        comments = get_collab_manager().get_reading_comments(reading_id)
         return jsonify({'comments': comments})
     
     except Exception as e:
@@ -428,7 +485,7 @@ def get_activity(team_share_id):
     """Get team activity feed"""
     try:
         limit = request.args.get('limit', 50, type=int)
-        activities = collab_mgr.get_team_activity_feed(team_share_id, limit)
+        activities = get_collab_manager().get_team_activity_feed(team_share_id, limit)
         return jsonify({'activities': activities})
     
     except Exception as e:
@@ -441,13 +498,14 @@ def get_activity(team_share_id):
 
 @advanced_api.route('/recommendations/<int:sensor_id>', methods=['GET'])
 @require_login
+@require_sensor_owner
 def get_recommendations(sensor_id):
     """Get AI recommendations"""
     try:
         building_type = request.args.get('building_type', 'office')
         occupancy = request.args.get('occupancy', 10, type=int)
         
-        recommendations = recommender.get_recommendations(
+        recommendations = get_recommender().get_recommendations(
             sensor_id, building_type, occupancy
         )
         
@@ -466,7 +524,7 @@ def get_recommendations(sensor_id):
 def track_effectiveness():
     """Track recommendation effectiveness"""
     try:
-        effectiveness = recommender.track_recommendation_effectiveness(
+        effectiveness = get_recommender().track_recommendation_effectiveness(
             request.json.get('sensor_id'),
             request.json.get('recommendation_id'),
             request.json.get('action'),
@@ -489,7 +547,7 @@ def track_effectiveness():
 def get_performance_report():
     """Get performance metrics"""
     try:
-        report = optimizer.get_performance_report()
+        report = get_optimizer().get_performance_report()
         return jsonify(report)
     
     except Exception as e:
@@ -502,7 +560,7 @@ def invalidate_cache():
     """Invalidate cache"""
     try:
         pattern = request.json.get('pattern')
-        optimizer.invalidate_cache(pattern)
+        get_optimizer().invalidate_cache(pattern)
         return jsonify({'success': True, 'message': 'Cache invalidated'})
     
     except Exception as e:
@@ -515,6 +573,6 @@ def health():
     """Health check with performance data"""
     return jsonify({
         'status': 'healthy',
-        'cache_size': optimizer.cache.stats()['size'],
+        'cache_size': get_optimizer().cache.stats()['size'],
         'timestamp': datetime.now().isoformat()
     })
@@ -13,14 +13,15 @@ Date: 2026-01-03
 
 import numpy as np
 from datetime import datetime, timedelta, UTC
-from sklearn.linear_model import LinearRegression
 from sklearn.preprocessing import StandardScaler
 import json
-import statistics
 from typing import Dict, List, Tuple, Optional
 
 from sklearn.ensemble import IsolationForest
 
+from utils.model_registry import isolation_features
+from utils.series import as_columns
+
 
 # ================================================================================
 #                    ANALYTICS & INSIGHTS ENGINE
@@ -30,18 +31,19 @@ class AdvancedAnalytics:
     """Advanced analytics with ML-based insights"""
     
     @staticmethod
-    def predict_co2_level(readings: List[Dict], hours_ahead: int = 1) -> Dict:
+    def predict_co2_level(readings, hours_ahead: int = 1) -> Dict:
         """
         Predict CO₂ levels using linear regression
         
         Args:
-            readings: List of reading dicts with 'timestamp' and 'ppm'
+            readings: ReadingColumns (or list of reading dicts with 'timestamp' and 'ppm')
             hours_ahead: Hours to predict ahead (1-24)
         
         Returns:
             Dict with predicted_ppm, confidence, trend
         """
-        if len(readings) < 5:
+        columns = as_columns(readings)
+        if len(columns) < 5:
             return {
                 'error': 'Insufficient data for prediction',
                 'predicted_ppm': None,
@@ -49,28 +51,23 @@ class AdvancedAnalytics:
             }
         
         try:
-            # Prepare data
-            X = np.array([[i] for i in range(len(readings))])
-            y = np.array([r.get('ppm', 0) for r in readings])
-            
-            # Train model
-            model = LinearRegression()
-            model.fit(X, y)
+            # Least-squares line over the reading index
+            y = columns.ppm.astype(np.float64)
+            x = np.arange(len(y), dtype=np.float64)
+            slope, intercept = np.polyfit(x, y, 1)
             
             # Predict
-            future_point = np.array([[len(readings) + (hours_ahead / 4)]])
-            prediction = float(model.predict(future_point)[0])
+            prediction = float(slope * (len(y) + hours_ahead / 4) + intercept)
             
             # Calculate confidence (R² score)
-            confidence = float(model.score(X, y))
+            ss_res = float(np.sum((y - (slope * x + intercept)) ** 2))
+            ss_tot = float(np.sum((y - y.mean()) ** 2))
+            confidence = 1 - ss_res / ss_tot if ss_tot > 0 else 0.0
             
             # Calculate trend
-            if len(readings) >= 2:
-                recent_avg = np.mean(y[-5:])
-                older_avg = np.mean(y[:5])
-                trend = "rising" if recent_avg > older_avg else "falling"
-            else:
-                trend = "stable"
+            recent_avg = y[-5:].mean()
+            older_avg = y[:5].mean()
+            trend = "rising" if recent_avg > older_avg else "falling"
             
             return {
                 'predicted_ppm': max(0, prediction),
@@ -86,44 +83,44 @@ class AdvancedAnalytics:
             }
     
     @staticmethod
-    def detect_anomalies(readings: List[Dict], threshold_std: float = 2.0, method: str = "stddev") -> Dict:
+    def detect_anomalies(readings, threshold_std: float = 2.0, method: str = "stddev") -> Dict:
         """
         Detect anomalous readings using the requested algorithm.
+        readings: ReadingColumns (or list of reading dicts).
         method: "stddev" (default) or "isolation_forest".
         """
-        if len(readings) < 3:
+        columns = as_columns(readings)
+        if len(columns) < 3:
             return {'anomalies': [], 'statistics': {}}
 
         method = (method or "stddev").lower()
         if method == "isolation_forest":
-            return AdvancedAnalytics.detect_anomalies_isolation_forest(readings)
+            return AdvancedAnalytics.detect_anomalies_isolation_forest(columns)
 
         try:
-            ppm_values = [r.get('ppm', 0) for r in readings]
-            mean_ppm = statistics.mean(ppm_values)
-            stdev = statistics.stdev(ppm_values) if len(ppm_values) > 1 else 0
-
-            anomalies = []
-            for i, reading in enumerate(readings):
-                ppm = reading.get('ppm', 0)
-                z_score = abs((ppm - mean_ppm) / stdev) if stdev > 0 else 0
-
-                if z_score > threshold_std:
-                    anomalies.append({
-                        'index': i,
-                        'ppm': ppm,
-                        'z_score': z_score,
-                        'severity': 'high' if z_score > 3 else 'medium',
-                        'timestamp': reading.get('timestamp', '')
-                    })
+            ppm_values = columns.ppm.astype(np.float64)
+            mean_ppm = float(ppm_values.mean())
+            stdev = float(ppm_values.std(ddof=1))
+
+            z_scores = np.abs(ppm_values - mean_ppm) / stdev if stdev > 0 else np.zeros_like(ppm_values)
+            indices = np.flatnonzero(z_scores > threshold_std)
+            timestamps = columns.timestamps(indices)
+
+            anomalies = [{
+                'index': int(i),
+                'ppm': float(ppm_values[i]),
+                'z_score': float(z_scores[i]),
+                'severity': 'high' if z_scores[i] > 3 else 'medium',
+                'timestamp': ts
+            } for i, ts in zip(indices, timestamps)]
 
             return {
                 'anomalies': anomalies,
                 'statistics': {
                     'mean': mean_ppm,
                     'stdev': stdev,
-                    'min': min(ppm_values),
-                    'max': max(ppm_values)
+                    'min': float(ppm_values.min()),
+                    'max': float(ppm_values.max())
                 },
                 'anomaly_count': len(anomalies)
             }
@@ -131,35 +128,46 @@ class AdvancedAnalytics:
             return {'error': str(e), 'anomalies': []}
 
     @staticmethod
-    def detect_anomalies_isolation_forest(readings: List[Dict], contamination: float = 0.05) -> Dict:
-        """Detect anomalies using Isolation Forest for non-linear patterns."""
-        if len(readings) < 5:
+    def detect_anomalies_isolation_forest(readings, contamination: float = 0.05, model=None) -> Dict:
+        """Detect anomalies using Isolation Forest for non-linear patterns.
+
+        With ``model`` (a fitted ``isolation_forest`` model from
+        utils.model_registry) readings are only scored; otherwise a forest is
+        fitted on ``readings`` themselves.
+        """
+        columns = as_columns(readings)
+        if len(columns) < 5:
             return {'anomalies': [], 'statistics': {}, 'anomaly_count': 0}
 
         try:
-            ppm_values = np.array([[r.get('ppm', 0)] for r in readings])
-            model = IsolationForest(contamination=min(max(contamination, 0.001), 0.2), random_state=42)
-            scores = model.decision_function(ppm_values)
-            labels = model.predict(ppm_values)
-
-            anomalies = []
-            for idx, (reading, label, score) in enumerate(zip(readings, labels, scores)):
-                if label == -1:
-                    ppm = reading.get('ppm', 0)
-                    anomalies.append({
-                        'index': idx,
-                        'ppm': ppm,
-                        'score': float(score),
-                        'severity': 'high' if ppm > np.percentile(ppm_values, 90) else 'medium',
-                        'timestamp': reading.get('timestamp', ''),
-                        'method': 'isolation_forest'
-                    })
+            ppm_values = columns.ppm.astype(np.float64).reshape(-1, 1)
+            if model is not None:
+                features = isolation_features(columns)
+                labels = model.predict(features)
+                scores = model.decision_function(features)
+            else:
+                model = IsolationForest(contamination=min(max(contamination, 0.001), 0.2), random_state=42)
+                labels = model.fit_predict(ppm_values)
+                scores = model.decision_function(ppm_values)
+
+            p25, p75, p90 = np.percentile(ppm_values, [25, 75, 90])
+            indices = np.flatnonzero(labels == -1)
+            timestamps = columns.timestamps(indices)
+
+            anomalies = [{
+                'index': int(i),
+                'ppm': float(ppm_values[i, 0]),
+                'score': float(scores[i]),
+                'severity': 'high' if ppm_values[i, 0] > p90 else 'medium',
+                'timestamp': ts,
+                'method': 'isolation_forest'
+            } for i, ts in zip(indices, timestamps)]
 
             return {
                 'anomalies': anomalies,
                 'statistics': {
                     'median': float(np.median(ppm_values)),
-                    'iqr': float(np.percentile(ppm_values, 75) - np.percentile(ppm_values, 25)),
+                    'iqr': float(p75 - p25),
                     'min': float(np.min(ppm_values)),
                     'max': float(np.max(ppm_values)),
                 },
@@ -167,7 +175,7 @@ class AdvancedAnalytics:
                 'model': 'IsolationForest',
             }
         except Exception as exc:  # fallback to stddev on failure
-            return AdvancedAnalytics.detect_anomalies(readings, threshold_std=2.0, method="stddev") | {'error': str(exc)}
+            return AdvancedAnalytics.detect_anomalies(columns, threshold_std=2.0, method="stddev") | {'error': str(exc)}
     
     @staticmethod
     def generate_insights(readings: List[Dict], user_id: str) -> Dict:
@@ -216,7 +224,7 @@ class AdvancedAnalytics:
                     })
             
             # Insight 2: Air quality assessment
-            avg_ppm = statistics.mean(ppm_values)
+            avg_ppm = float(np.mean(ppm_values))
             if avg_ppm > 1200:
                 insights.append({
                     'type': 'air_quality',
@@ -241,8 +249,8 @@ class AdvancedAnalytics:
             
             # Insight 3: Trend analysis
             if len(ppm_values) >= 2:
-                recent_avg = statistics.mean(ppm_values[-5:])
-                older_avg = statistics.mean(ppm_values[:5])
+                recent_avg = float(np.mean(ppm_values[-5:]))
+                older_avg = float(np.mean(ppm_values[:5]))
                 trend_pct = ((recent_avg - older_avg) / older_avg * 100) if older_avg > 0 else 0
                 
                 if trend_pct > 10:
@@ -286,7 +294,7 @@ class AdvancedAnalytics:
         
         try:
             ppm_values = [r.get('ppm', 0) for r in readings]
-            avg_ppm = statistics.mean(ppm_values)
+            avg_ppm = float(np.mean(ppm_values))
             max_ppm = max(ppm_values)
             
             # CO₂ levels and health impacts
@@ -571,61 +579,47 @@ class VisualizationEngine:
     """Enhanced data visualization components"""
     
     @staticmethod
-    def generate_heatmap_data(readings: List[Dict]) -> Dict:
+    def generate_heatmap_data(readings) -> Dict:
         """
         Generate heatmap data for time-of-day patterns
         
         Args:
-            readings: List of reading dicts with timestamp and ppm
+            readings: ReadingColumns (or list of reading dicts with timestamp and ppm)
         
         Returns:
             Dict with heatmap matrix and metadata
         """
         try:
-            # Create 7x24 matrix (days x hours)
-            heatmap = [[0 for _ in range(24)] for _ in range(7)]
-            counts = [[0 for _ in range(24)] for _ in range(7)]
-            
-            for reading in readings:
-                try:
-                    dt = datetime.fromisoformat(reading.get('timestamp', ''))
-                    day_of_week = dt.weekday()
-                    hour = dt.hour
-                    ppm = reading.get('ppm', 0)
-                    
-                    if 0 <= day_of_week < 7 and 0 <= hour < 24:
-                        heatmap[day_of_week][hour] += ppm
-                        counts[day_of_week][hour] += 1
-                except:
-                    pass
+            columns = as_columns(readings)
             
-            # Calculate averages
-            for day in range(7):
-                for hour in range(24):
-                    if counts[day][hour] > 0:
-                        heatmap[day][hour] /= counts[day][hour]
+            # 7x24 matrix (days x hours); 1970-01-01 was a Thursday (weekday 3)
+            days_since_epoch = columns.ts // 86400
+            bucket = ((days_since_epoch + 3) % 7) * 24 + (columns.ts // 3600) % 24
+            sums = np.bincount(bucket, weights=columns.ppm.astype(np.float64), minlength=7 * 24).reshape(7, 24)
+            counts = np.bincount(bucket, minlength=7 * 24).reshape(7, 24)
+            heatmap = np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
             
             day_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
             
             return {
-                'heatmap': heatmap,
+                'heatmap': heatmap.tolist(),
                 'days': day_names,
                 'hours': list(range(24)),
-                'min_value': min(min(row) for row in heatmap if row),
-                'max_value': max(max(row) for row in heatmap if row),
-                'data_points': sum(sum(row) for row in counts)
+                'min_value': float(heatmap.min()),
+                'max_value': float(heatmap.max()),
+                'data_points': int(counts.sum())
             }
         except Exception as e:
             return {'error': str(e), 'heatmap': []}
     
     @staticmethod
-    def generate_correlation_data(readings: List[Dict], 
+    def generate_correlation_data(readings, 
                                   variables: List[str] = None) -> Dict:
         """
         Generate correlation data between variables
         
         Args:
-            readings: List of reading dicts
+            readings: ReadingColumns (or list of reading dicts)
             variables: Variables to correlate (ppm, temperature, humidity)
         
         Returns:
@@ -634,36 +628,26 @@ class VisualizationEngine:
         variables = variables or ['ppm']
         
         try:
-            # Extract data for each variable
-            data_matrix = {var: [] for var in variables}
-            
-            for reading in readings:
-                for var in variables:
-                    value = reading.get(var, 0)
-                    data_matrix[var].append(value)
+            columns = as_columns(readings)
             
-            # Calculate correlations
+            # Calculate correlations over rows where both values are present
             correlations = []
             for i, var1 in enumerate(variables):
                 for var2 in variables[i+1:]:
-                    if data_matrix[var1] and data_matrix[var2]:
-                        # Pearson correlation
-                        correlation = np.corrcoef(
-                            data_matrix[var1],
-                            data_matrix[var2]
-                        )[0, 1]
-                        
-                        correlations.append({
-                            'var1': var1,
-                            'var2': var2,
-                            'correlation': float(correlation),
-                            'strength': 'strong' if abs(correlation) > 0.7 else 'moderate'
-                        })
+                    correlation = pearson(columns.column(var1), columns.column(var2))
+                    if correlation is None:
+                        continue
+                    correlations.append({
+                        'var1': var1,
+                        'var2': var2,
+                        'correlation': correlation,
+                        'strength': 'strong' if abs(correlation) > 0.7 else 'moderate'
+                    })
             
             return {
                 'correlations': correlations,
                 'variables': variables,
-                'data_points': len(readings)
+                'data_points': len(columns)
             }
         except Exception as e:
             return {'error': str(e), 'correlations': []}
@@ -756,25 +740,41 @@ class VisualizationEngine:
 #                    UTILITY FUNCTIONS
 # ================================================================================
 
-def calculate_percentiles(data: List[float], percentiles: List[int] = None) -> Dict:
-    """Calculate percentiles for a dataset"""
+def pearson(a: np.ndarray, b: np.ndarray, min_points: int = 3) -> Optional[float]:
+    """Pearson correlation over rows where both arrays are finite (None if undefined)"""
+    mask = np.isfinite(a) & np.isfinite(b)
+    if mask.sum() < min_points:
+        return None
+    a = a[mask].astype(np.float64)
+    b = b[mask].astype(np.float64)
+    if a.std() == 0 or b.std() == 0:
+        return None
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+def calculate_percentiles(data, percentiles: List[int] = None) -> Dict:
+    """Calculate percentiles for a dataset (nearest-rank, linear-time selection)
+
+    For stored series use utils.online_stats.series_stats.summarize(), which
+    merges precomputed sketches instead of scanning readings.
+    """
     percentiles = percentiles or [25, 50, 75, 90, 95, 99]
-    sorted_data = sorted(data)
-    
-    result = {}
-    for p in percentiles:
-        idx = int(len(sorted_data) * p / 100)
-        result[f'p{p}'] = sorted_data[min(idx, len(sorted_data) - 1)]
-    
-    return result
+    values = np.asarray(data, dtype=np.float64)
+    if not len(values):
+        return {f'p{p}': None for p in percentiles}
+
+    ranks = np.minimum((len(values) * np.asarray(percentiles) / 100).astype(np.int64), len(values) - 1)
+    selected = np.partition(values, np.unique(ranks))
+    return {f'p{p}': float(selected[rank]) for p, rank in zip(percentiles, ranks)}
 
 
-def calculate_moving_average(data: List[float], window: int = 5) -> List[float]:
-    """Calculate moving average"""
+def calculate_moving_average(data, window: int = 5) -> List[float]:
+    """Calculate moving average (running sums, O(n))"""
     if len(data) < window:
         return data
     
-    return [statistics.mean(data[i:i+window]) for i in range(len(data) - window + 1)]
+    sums = np.cumsum(np.concatenate([[0.0], np.asarray(data, dtype=np.float64)]))
+    return ((sums[window:] - sums[:-window]) / window).tolist()
 
 
 def detect_patterns(readings: List[Dict]) -> Dict:
@@ -801,6 +801,7 @@ __all__ = [
     'CollaborationManager',
     'PerformanceOptimizer',
     'VisualizationEngine',
+    'pearson',
     'calculate_percentiles',
     'calculate_moving_average',
     'detect_patterns'
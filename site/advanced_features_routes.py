@@ -10,11 +10,20 @@ These routes are registered when register_advanced_features() is called
 
 from flask import jsonify, request, session, render_template
 from advanced_features import (AdvancedAnalytics, CollaborationManager,
-                               PerformanceOptimizer, VisualizationEngine)
-from utils.ai_recommender import AIRecommender
-from database import get_db, is_admin
+                               PerformanceOptimizer, VisualizationEngine, pearson)
+from utils.ai_recommender import ai_recommender
+from database import get_anomalies, get_db, get_sensor_by_id, is_admin
 from utils.logger import configure_logging
+from utils.exposure import exposure_counters, score_status
+from utils.forecast import get_forecast, trend as forecast_trend
+from utils import fulltext
+from utils.heatmap import heatmap_engine
+from utils.model_registry import ModelNotReady, model_registry
+from utils.online_stats import series_key, series_stats
+from utils.search_index import search_service
+from utils.series import fetch_reading_columns
 import json
+import numpy as np
 from datetime import datetime, timedelta
 import random
 import time
@@ -23,6 +32,9 @@ import secrets
 # Configure logger
 logger = configure_logging()
 
+# Sensors per /api/recommendations request
+MAX_RECOMMENDATION_SENSORS = 200
+
 # Helper functions
 def is_logged_in():
     """Check if user is logged in"""
@@ -61,6 +73,15 @@ def get_user_readings(user_id, hours=None, days=None):
     return readings
 
 
+def requested_series(user_id):
+    """Series of the ``sensor_id`` query parameter (None if not owned), else the user's readings"""
+    sensor_id = request.args.get('sensor_id', type=int)
+    if sensor_id is None:
+        return series_key(user_id=user_id)
+    if not get_sensor_by_id(sensor_id, user_id):
+        return None
+    return series_key(sensor_id=sensor_id)
+
 
 # ================================================================================
 #                    ANALYTICS & INSIGHTS ROUTES
@@ -72,7 +93,7 @@ def setup_analytics_routes(app, limiter):
     @app.route("/api/analytics/predict/<int:hours>")
     @limiter.limit("30 per hour")
     def predict_co2(hours):
-        """Predict CO₂ levels for next N hours"""
+        """Predict CO₂ levels for next N hours (from the stored seasonal forecast)"""
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
         
@@ -80,121 +101,143 @@ def setup_analytics_routes(app, limiter):
             return jsonify({'success': False, 'error': 'Hours must be between 1 and 24'}), 400
         
         try:
-            db = get_db()
-            
-            # Get recent hourly data (last 7 days)
-            readings = db.execute("""
-                SELECT 
-                    strftime('%Y-%m-%d %H:00', timestamp) as hour,
-                    AVG(ppm) as avg_ppm,
-                    COUNT(*) as readings
-                FROM co2_readings
-                WHERE timestamp >= datetime('now', '-7 days')
-                GROUP BY hour
-                ORDER BY hour DESC
-                LIMIT 48
-            """).fetchall()
+            series = requested_series(session.get('user_id'))
+            if series is None:
+                return jsonify({'success': False, 'error': 'Sensor not found'}), 404
             
-            db.close()
-            
-            if not readings:
-                # No data available, return default predictions
-                return jsonify({
-                    'success': True,
-                    'predictions': [600 + random.randint(-20, 20) for _ in range(hours)]
-                })
-            
-            readings_list = [dict(r) for r in readings]
-            
-            # Calculate trend from recent data
-            current_avg = readings_list[0]['avg_ppm'] if readings_list else 600
-            older_avg = readings_list[-1]['avg_ppm'] if len(readings_list) > 1 else 600
-            
-            # Calculate trend (ppm per hour)
-            trend = (current_avg - older_avg) / max(1, len(readings_list) - 1)
-            
-            # Get current hour pattern (what hour of day is it?)
-            from datetime import datetime as dt
-            now = dt.now()
-            hour_of_day = now.hour
-            
-            # Find similar hours in historical data to predict pattern
-            similar_hours_data = [r for r in readings_list if r['hour'] is not None]
-            
-            # Generate predictions based on trend and current level
-            predictions = []
-            for i in range(hours):
-                # Apply trend and add slight variation based on historical pattern
-                predicted_ppm = current_avg + (trend * i) + random.randint(-15, 15)
-                # Keep within reasonable bounds
-                predicted_ppm = max(400, min(2000, predicted_ppm))
-                predictions.append(predicted_ppm)
+            points = get_forecast(series, hours)
+            if not points:
+                # Not enough hourly history yet, or the forecast job has not run
+                return jsonify({'success': True, 'status': 'pending', 'predictions': [], 'intervals': []})
             
             return jsonify({
                 'success': True,
-                'predictions': predictions,
-                'trend': 'rising' if trend > 5 else 'falling' if trend < -5 else 'stable',
-                'current_avg': round(current_avg, 1)
+                'predictions': [p['predicted'] for p in points],
+                'intervals': [{'timestamp': p['timestamp'], 'lower': p['lower'], 'upper': p['upper']}
+                              for p in points],
+                'avg_confidence': round(sum(p['confidence'] for p in points) / len(points), 1),
+                'trend': forecast_trend(points),
+                'generated_at': points[0]['generated_at']
             })
         except Exception as e:
             logger.exception(f"Prediction failed: {e}")
             return jsonify({'success': False, 'error': str(e)}), 500
     
     @app.route("/api/analytics/anomalies")
-    @limiter.limit("20 per hour")
+    @limiter.limit("300 per hour")
     def detect_anomalies():
-        """Detect anomalies in readings using Isolation Forest by default."""
+        """Anomalies flagged at ingest by the streaming detector (indexed read).
+
+        ``method=isolation_forest`` scores the window with the pre-trained
+        Isolation Forest of the user or sensor instead.
+        """
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
 
         try:
-            days = request.args.get('days', 7, type=int)
-            method = request.args.get('method', 'isolation_forest')
+            user_id = session.get('user_id')
+            days = max(1, min(request.args.get('days', 7, type=int), 365))
+            limit = max(1, min(request.args.get('limit', 500, type=int), 5000))
+            sensor_id = request.args.get('sensor_id', type=int)
+            if sensor_id is not None and not get_sensor_by_id(sensor_id, user_id):
+                return jsonify({'success': False, 'error': 'Sensor not found'}), 404
 
-            db = get_db()
-            try:
-                readings = db.execute(
-                    """
-                    SELECT timestamp, ppm
-                    FROM co2_readings
-                    WHERE timestamp >= datetime('now', ?)
-                    ORDER BY timestamp DESC
-                    """,
-                    (f'-{days} days',),
-                ).fetchall()
-                readings_list = [dict(r) for r in readings]
-            finally:
-                db.close()
+            if request.args.get('method') == 'isolation_forest':
+                # Score the window with the registry's pre-trained forest (no fitting here)
+                model, meta = model_registry.get(series_key(user_id=user_id, sensor_id=sensor_id),
+                                                 'isolation_forest')
+                columns = fetch_reading_columns(user_id=user_id if sensor_id is None else None,
+                                                sensor_id=sensor_id, days=days)
+                result = AdvancedAnalytics.detect_anomalies_isolation_forest(columns, model=model)
+                return jsonify({'success': True, **result, 'model_version': meta['version']})
 
-            result = AdvancedAnalytics.detect_anomalies(readings_list, method=method)
-            return jsonify({'success': True, **result})
+            anomalies = get_anomalies(user_id=user_id, sensor_id=sensor_id, days=days, limit=limit)
+            now = time.time()
+            summary = series_stats.summarize(series_key(user_id=user_id, sensor_id=sensor_id),
+                                             now - days * 86400, now, percentiles=[])
+            return jsonify({
+                'success': True,
+                'anomalies': anomalies,
+                'anomaly_count': len(anomalies),
+                'statistics': {
+                    'mean': summary['mean'],
+                    'stdev': summary['stddev'],
+                    'min': summary['min'],
+                    'max': summary['max'],
+                },
+                'model': 'streaming',
+            })
+        except ModelNotReady as e:
+            return jsonify({'success': False, 'status': 'training', 'error': str(e)}), 202
         except Exception as e:
-            from utils.logger import configure_logging
-            logger_temp = configure_logging()
-            logger_temp.exception(f"Anomaly detection failed: {e}")
+            logger.exception(f"Anomaly lookup failed: {e}")
             return jsonify({'success': False, 'error': str(e)}), 500
 
     @app.route("/api/recommendations/<int:sensor_id>")
     @limiter.limit("20 per hour")
     def recommendations(sensor_id: int):
-        """Expose AI recommendations for a given sensor."""
+        """Expose AI recommendations for one of the user's sensors."""
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        if not get_sensor_by_id(sensor_id, session.get('user_id')):
+            return jsonify({'success': False, 'error': 'Sensor not found'}), 404
 
         building_type = request.args.get('building_type', 'office')
         occupancy = request.args.get('occupancy', 10, type=int)
 
         try:
-            recommender = AIRecommender()
-            recs = recommender.get_recommendations(sensor_id=sensor_id, building_type=building_type, occupancy_count=occupancy)
+            recs = ai_recommender.get_recommendations(sensor_id=sensor_id, building_type=building_type, occupancy_count=occupancy)
             return jsonify({'success': True, 'recommendations': recs, 'count': len(recs)})
         except Exception as exc:
             return jsonify({'success': False, 'error': str(exc)}), 500
+
+    @app.route("/api/recommendations")
+    @limiter.limit("60 per hour")
+    def batch_recommendations():
+        """AI recommendations for several sensors in one round trip.
+
+        ``sensor_ids`` is a comma-separated list (default: all of the user's sensors).
+        """
+        if not is_logged_in():
+            return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+
+        user_id = session.get('user_id')
+        building_type = request.args.get('building_type', 'office')
+        occupancy = request.args.get('occupancy', 10, type=int)
+        try:
+            requested = [int(part) for part in request.args.get('sensor_ids', '').split(',') if part.strip()]
+        except ValueError:
+            return jsonify({'success': False, 'error': 'sensor_ids must be a comma-separated list of ids'}), 400
+        if len(requested) > MAX_RECOMMENDATION_SENSORS:
+            return jsonify({'success': False,
+                            'error': f'At most {MAX_RECOMMENDATION_SENSORS} sensors per request'}), 400
+
+        db = get_db()
+        try:
+            owned = [row['id'] for row in db.execute(
+                "SELECT id FROM user_sensors WHERE user_id = ? ORDER BY id", (user_id,)
+            ).fetchall()]
         finally:
-            try:
-                recommender.close()
-            except:
-                pass
+            db.close()
+        if requested:
+            if set(requested) - set(owned):
+                return jsonify({'success': False, 'error': 'Sensor not found'}), 404
+            sensor_ids = list(dict.fromkeys(requested))
+        else:
+            sensor_ids = owned[:MAX_RECOMMENDATION_SENSORS]
+
+        try:
+            recs = ai_recommender.get_batch_recommendations(sensor_ids, building_type, occupancy)
+            return jsonify({
+                'success': True,
+                'sensors': {str(sensor_id): {'recommendations': recs[sensor_id], 'count': len(recs[sensor_id])}
+                            for sensor_id in sensor_ids},
+                'building_type': building_type,
+                'occupancy': occupancy
+            })
+        except Exception as exc:
+            logger.exception(f"Batch recommendations failed: {exc}")
+            return jsonify({'success': False, 'error': str(exc)}), 500
 
     @app.route("/api/insights")
     def get_insights():
@@ -513,6 +556,7 @@ def setup_sharing_routes(app, limiter):
             ''', (team_name, user_id, description, datetime.now().isoformat(), datetime.now().isoformat()))
             db.commit()
             team_id = cursor.lastrowid
+            search_service.refresh('team', team_id)
             
             return jsonify({
                 'success': True,
@@ -548,11 +592,16 @@ def setup_sharing_routes(app, limiter):
             if not result or result[0] != user_id:
                 return jsonify({'success': False, 'error': 'Unauthorized'}), 403
             
+            cursor.execute('SELECT user_id FROM team_members WHERE team_id = ?', (team_id,))
+            members = [row[0] for row in cursor.fetchall()]
             # Delete team members first
             cursor.execute('DELETE FROM team_members WHERE team_id = ?', (team_id,))
             # Delete team
             cursor.execute('DELETE FROM teams WHERE id = ?', (team_id,))
             db.commit()
+            # The team and its comments disappear from the search of every member
+            for member in [user_id, *members]:
+                search_service.forget(member)
             
             return jsonify({'success': True, 'message': 'Team deleted'})
         except Exception as e:
@@ -603,6 +652,7 @@ def setup_sharing_routes(app, limiter):
                     UPDATE team_members SET role = ? WHERE team_id = ? AND user_id = ?
                 ''', (role, team_id, member_user_id))
                 db.commit()
+            search_service.forget(member_user_id)
             
             return jsonify({
                 'success': True,
@@ -645,9 +695,13 @@ def setup_sharing_routes(app, limiter):
             if not team_result or team_result[0] != user_id:
                 return jsonify({'success': False, 'error': 'Unauthorized'}), 403
             
+            cursor.execute('SELECT user_id FROM team_members WHERE id = ?', (member_id,))
+            member = cursor.fetchone()
             # Remove member
             cursor.execute('DELETE FROM team_members WHERE id = ?', (member_id,))
             db.commit()
+            if member:
+                search_service.forget(member[0])
             
             return jsonify({'success': True, 'message': 'Member removed'})
         except Exception as e:
@@ -664,56 +718,45 @@ def setup_visualization_routes(app, limiter):
     @app.route("/api/visualization/heatmap")
     @limiter.limit("30 per hour")
     def get_heatmap_data():
-        """Get heatmap data for time-of-day patterns"""
+        """Get heatmap data for time-of-day patterns
+
+        Query: ``days`` (default 30), ``sensor_id`` (one of the user's sensors;
+        default: the user's readings) and ``tz`` (IANA timezone, default UTC).
+        """
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
         
         try:
             user_id = session.get('user_id')
             days = request.args.get('days', 30, type=int)
+            sensor_id = request.args.get('sensor_id', type=int)
+            tz = request.args.get('tz', 'UTC')
             
-            db = get_db()
-            
-            # Fetch CO2 readings from the last N days
-            readings = db.execute(f"""
-                SELECT timestamp, ppm, temperature, humidity
-                FROM co2_readings
-                WHERE timestamp >= datetime('now', '-{days} days')
-                ORDER BY timestamp DESC
-            """).fetchall()
+            if sensor_id is not None and not get_sensor_by_id(sensor_id, user_id):
+                return jsonify({'success': False, 'error': 'Sensor not found'}), 404
             
-            db.close()
-            
-            # Convert to list of dicts
-            readings_list = [dict(r) for r in readings]
+            try:
+                heatmap_data = heatmap_engine.compute(user_id=user_id, sensor_id=sensor_id, days=days, tz=tz)
+            except ValueError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
             
-            # Use VisualizationEngine to generate heatmap
-            if readings_list:
-                heatmap_data = VisualizationEngine.generate_heatmap_data(readings_list)
-                
-                # The VisualizationEngine returns heatmap[day][hour]
-                # but the JavaScript expects heatmap[hour][day]
-                # So we need to transpose it
-                original_heatmap = heatmap_data.get('heatmap', [])
-                
-                # Transpose: convert [day][hour] to [hour][day]
-                transposed_heatmap = [[0 for _ in range(7)] for _ in range(24)]
-                for day in range(7):
-                    if day < len(original_heatmap):
-                        for hour in range(24):
-                            if hour < len(original_heatmap[day]):
-                                transposed_heatmap[hour][day] = original_heatmap[day][hour]
-                
-                return jsonify({
-                    'success': True,
-                    'heatmap': transposed_heatmap
-                })
-            else:
+            if not heatmap_data['data_points']:
                 # No data available
                 return jsonify({
                     'success': True,
                     'heatmap': [[500 for _ in range(7)] for _ in range(24)]
                 })
+            
+            # The engine returns heatmap[day][hour]
+            # but the JavaScript expects heatmap[hour][day]
+            return jsonify({
+                'success': True,
+                'heatmap': [list(row) for row in zip(*heatmap_data['heatmap'])],
+                'counts': [list(row) for row in zip(*heatmap_data['counts'])],
+                'data_points': heatmap_data['data_points'],
+                'timezone': heatmap_data['timezone'],
+                'version': heatmap_data['version']
+            })
         except Exception as e:
             logger.exception(f"Heatmap generation failed: {e}")
             return jsonify({'success': False, 'error': str(e)}), 500
@@ -729,51 +772,18 @@ def setup_visualization_routes(app, limiter):
             user_id = session.get('user_id')
             days = request.args.get('days', 30, type=int)
             
-            db = get_db()
-            
             # Fetch CO2 readings from the last N days
-            readings = db.execute(f"""
-                SELECT timestamp, ppm, temperature, humidity
-                FROM co2_readings
-                WHERE timestamp >= datetime('now', '-{days} days')
-                ORDER BY timestamp
-            """).fetchall()
-            
-            db.close()
+            columns = fetch_reading_columns(user_id=user_id, days=days)
             
-            # Convert to list of dicts
-            readings_list = [dict(r) for r in readings]
-            
-            if readings_list:
-                # Calculate correlations manually
+            if len(columns):
+                # Correlate ppm with each variable over rows where both are present
                 correlations = []
                 
                 try:
-                    import numpy as np
-                    
-                    # Filter readings that have both ppm and temperature data
-                    ppm_temp_readings = [r for r in readings_list if r.get('ppm') is not None and r.get('temperature') is not None]
-                    if len(ppm_temp_readings) > 2:
-                        ppm_data = np.array([r.get('ppm', 0) for r in ppm_temp_readings])
-                        temp_data = np.array([r.get('temperature', 0) for r in ppm_temp_readings])
-                        
-                        # Only calculate if both arrays have variation
-                        if np.std(ppm_data) > 0 and np.std(temp_data) > 0:
-                            corr = np.corrcoef(ppm_data, temp_data)[0, 1]
-                            if not np.isnan(corr):
-                                correlations.append({'name': 'Température', 'value': float(corr)})
-                    
-                    # Filter readings that have both ppm and humidity data
-                    ppm_humidity_readings = [r for r in readings_list if r.get('ppm') is not None and r.get('humidity') is not None]
-                    if len(ppm_humidity_readings) > 2:
-                        ppm_data = np.array([r.get('ppm', 0) for r in ppm_humidity_readings])
-                        humidity_data = np.array([r.get('humidity', 0) for r in ppm_humidity_readings])
-                        
-                        # Only calculate if both arrays have variation
-                        if np.std(ppm_data) > 0 and np.std(humidity_data) > 0:
-                            corr = np.corrcoef(ppm_data, humidity_data)[0, 1]
-                            if not np.isnan(corr):
-                                correlations.append({'name': 'Humidité', 'value': float(corr)})
+                    for name, values in (('Température', columns.temperature), ('Humidité', columns.humidity)):
+                        corr = pearson(columns.ppm, values)
+                        if corr is not None and not np.isnan(corr):
+                            correlations.append({'name': name, 'value': corr})
                 except Exception as e:
                     # If numpy calculation fails, provide default correlations
                     logger.warning(f"Correlation calculation failed: {e}")
@@ -1443,8 +1453,13 @@ def setup_admin_tools_routes(app, limiter):
         action = request.args.get('action')
         days = request.args.get('days', 30, type=int)
         limit = request.args.get('limit', 100, type=int)
+        cursor = request.args.get('cursor')
+        try:
+            fulltext.decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid cursor'}), 400
         
-        result = log_analytics.search_logs(query=query, action=action, days=days, limit=limit)
+        result = log_analytics.search_logs(query=query, action=action, days=days, limit=limit, cursor=cursor)
         
         return jsonify(result)
     
@@ -1590,30 +1605,53 @@ def register_advanced_features(app, limiter):
     @app.route("/api/health/score")
     @limiter.limit("30 per hour")
     def get_health_score():
-        """Get CO2 health score"""
+        """Get CO2 health score (time-weighted exposure of today, UTC)"""
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        series = requested_series(session.get('user_id'))
+        if series is None:
+            return jsonify({'success': False, 'error': 'Sensor not found'}), 404
+        
+        yesterday, today = exposure_counters.days(series, 2)
+        score = today['exposure']['score'] if today['exposure'] else None
+        previous = yesterday['exposure']['score'] if yesterday['exposure'] else None
+        if score is None or previous is None or abs(score - previous) < 5:
+            trend = 'stable'
+        else:
+            trend = 'improving' if score > previous else 'declining'
         
         return jsonify({
             'success': True,
-            'score': random.randint(70, 95),
-            'status': 'Bon',
-            'trend': 'stable'
+            'score': score,
+            'status': score_status(score),
+            'trend': trend,
+            'co2_level': today['exposure']['avg_ppm'] if today['exposure'] else None,
+            'exposure': today['exposure'],
+            'date': today['date']
         })
     
     @app.route("/api/health/trends")
     @limiter.limit("30 per hour")
     def get_health_trends():
-        """Get health trends for period"""
+        """Get daily health scores for period"""
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
+        series = requested_series(session.get('user_id'))
+        if series is None:
+            return jsonify({'success': False, 'error': 'Sensor not found'}), 404
         
         period = request.args.get('period', 'week')
-        days = 7 if period == 'week' else 30
+        days = {'week': 7, 'month': 30, 'year': 365}.get(period, 7)
+        daily = exposure_counters.days(series, days)
+        scores = [day['exposure']['score'] if day['exposure'] else None for day in daily]
+        known = [score for score in scores if score is not None]
         
         return jsonify({
             'success': True,
-            'trend_data': [random.randint(70, 95) for _ in range(days)],
+            'trend_data': scores,
+            'days': daily,
+            'average_score': round(sum(known) / len(known)) if known else None,
+            'max_score': max(known) if known else None,
             'period': period
         })
     
@@ -1748,27 +1786,35 @@ def register_advanced_features(app, limiter):
     @app.route("/api/analytics/predictions")
     @limiter.limit("30 per hour")
     def get_predictions():
-        """Get CO2 predictions"""
+        """Get CO2 predictions (from the stored seasonal forecast)"""
         if not is_logged_in():
             return jsonify({'success': False, 'error': 'Unauthorized'}), 401
         
         hours = request.args.get('hours', 2, type=int)
         hours = min(max(hours, 1), 24)
         
-        predictions = []
-        current_hour = datetime.now()
-        for i in range(hours):
-            predictions.append({
+        try:
+            series = requested_series(session.get('user_id'))
+            if series is None:
+                return jsonify({'success': False, 'error': 'Sensor not found'}), 404
+            
+            predictions = [{
                 'hour': i,
-                'predicted_co2': 800 + random.randint(-50, 150),
-                'confidence': random.randint(75, 95)
+                'timestamp': p['timestamp'],
+                'predicted_co2': p['predicted'],
+                'lower': p['lower'],
+                'upper': p['upper'],
+                'confidence': p['confidence']
+            } for i, p in enumerate(get_forecast(series, hours))]
+            
+            return jsonify({
+                'success': True,
+                'predictions': predictions,
+                'hours': hours
             })
-        
-        return jsonify({
-            'success': True,
-            'predictions': predictions,
-            'hours': hours
-        })
+        except Exception as e:
+            logger.exception(f"Prediction lookup failed: {e}")
+            return jsonify({'success': False, 'error': str(e)}), 500
     
     # Collaboration Endpoints
     @app.route("/api/teams", methods=['GET'])
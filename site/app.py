@@ -1,4 +1,4 @@
-from flask import Flask, jsonify, render_template, request, make_response, session, redirect, url_for, flash
+from flask import Flask, jsonify, render_template, request, make_response, session, redirect, url_for, flash, Response
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -60,6 +60,17 @@ from advanced_features import (AdvancedAnalytics, CollaborationManager,
                                PerformanceOptimizer, VisualizationEngine)
 from advanced_features_routes import register_advanced_features
 from utils.source_helpers import resolve_source_param, build_source_filter
+from utils.live_feed import live_feed
+from utils.model_registry import model_registry
+from utils.forecast import run_forecasts
+from utils.export_manager import render_pdf
+from utils.task_pool import PoolBusy, TaskTimeout, task_pool
+from utils.downsample import downsample_rows, parse_max_points, rollup_rows
+from utils.rollups import tile_pyramid
+from utils.exposure import exposure_counters, summarize_readings
+from utils.online_stats import series_key
+from utils.ingest import ingest_readings, parse_timestamp
+from utils.search_index import search_service
 
 
 
@@ -109,6 +120,9 @@ socketio = SocketIO(
 
 init_db()
 
+# Fork the analytics/report workers before the background threads start
+task_pool.start()
+
 # ================================================================================
 #                    BACKGROUND SCHEDULER SETUP
 # ================================================================================
@@ -126,11 +140,32 @@ if SCHEDULER_AVAILABLE:
             cleanup_old_login_history(days_to_keep=30)
             cleanup_expired_tokens()
             cleanup_expired_reset_tokens()
+            tile_pyramid.prune()
         except Exception as e:
             logger.error(f"Cleanup task failed: {e}")
     
+    def scheduled_model_retraining():
+        """Refit registered ML models that have enough new readings"""
+        try:
+            retrained = model_registry.retrain_due()
+            if retrained:
+                logger.info(f"Retrained {retrained} ML model(s)")
+        except Exception as e:
+            logger.error(f"Model retraining failed: {e}")
+    
+    def scheduled_forecasts():
+        """Refresh the stored CO2 forecasts of all active series"""
+        try:
+            run_forecasts()
+        except Exception as e:
+            logger.error(f"Forecast job failed: {e}")
+    
     # Schedule cleanup to run daily at 2 AM
     scheduler.add_job(scheduled_cleanup, 'cron', hour=2, minute=0, id='cleanup_task')
+    scheduler.add_job(scheduled_model_retraining, 'interval',
+                      minutes=app.config['MODEL_RETRAIN_INTERVAL_MINUTES'], id='model_retrain_task')
+    scheduler.add_job(scheduled_forecasts, 'interval',
+                      minutes=app.config['FORECAST_INTERVAL_MINUTES'], id='forecast_task')
     scheduler.start()
     logger.info("✓ Background scheduler started - daily cleanup at 2:00 AM")
 else:
@@ -237,6 +272,7 @@ from blueprints.admin_routes import admin_bp
 from blueprints.sensors import sensors_bp
 from blueprints.data_io import create_data_io_blueprint
 from blueprints.collaboration import collab_bp, register_collab_sockets
+from blueprints.devices import devices_bp, register_device_sockets
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(main_bp)
@@ -248,6 +284,7 @@ app.register_blueprint(admin_bp)
 app.register_blueprint(sensors_bp)
 app.register_blueprint(create_data_io_blueprint(limiter))
 app.register_blueprint(collab_bp)
+app.register_blueprint(devices_bp)
 
 # Initialize database tables for new features
 try:
@@ -259,6 +296,9 @@ except Exception as e:
 # Register real-time collaboration WebSocket handlers
 register_collab_sockets(socketio)
 
+# Register device ingestion namespace (token-authenticated gateways)
+register_device_sockets(socketio)
+
 # Main routes moved to main blueprint
 
 @app.route("/performance")
@@ -451,103 +491,88 @@ def handle_tour():
 #                        GLOBAL SEARCH
 # ================================================================================
 
-@app.route("/api/search")
-@login_required
-def global_search():
-    """Global search across pages, sensors, users, and content"""
-    query = request.args.get('q', '').strip().lower()
-    if not query or len(query) < 2:
-        return jsonify({'results': []})
-    
-    results = []
-    user_id = session.get('user_id')
-    user_is_admin = is_admin(user_id)
-    
-    # Search pages/features
+def search_catalog():
+    """Pages, help keywords and per-kind result URLs of the global search (needs a request context)"""
     pages = [
-        {'name': 'Tableau de bord', 'url': url_for('main.dashboard'), 'category': 'page', 'icon': '📊'},
-        {'name': 'Surveillance en direct', 'url': url_for('main.live_page'), 'category': 'page', 'icon': '📡'},
-        {'name': 'Paramètres', 'url': url_for('main.settings_page'), 'category': 'page', 'icon': '⚙️'},
-        {'name': 'Capteurs', 'url': url_for('main.sensors_page'), 'category': 'page', 'icon': '🎛️'},
-        {'name': 'Visualisation', 'url': url_for('main.visualization_page'), 'category': 'page', 'icon': '📈'},
-        {'name': 'Export de données', 'url': url_for('main.data_export_page'), 'category': 'page', 'icon': '💾'},
-        {'name': 'Import de données', 'url': url_for('main.data_import_page'), 'category': 'page', 'icon': '📥'},
-        {'name': 'Profil utilisateur', 'url': url_for('auth.profile'), 'category': 'page', 'icon': '👤'},
-        {'name': 'Historique de connexion', 'url': url_for('auth.login_history'), 'category': 'page', 'icon': '📋'},
+        {'name': 'Tableau de bord', 'url': url_for('main.dashboard'), 'icon': '📊'},
+        {'name': 'Surveillance en direct', 'url': url_for('main.live_page'), 'icon': '📡'},
+        {'name': 'Paramètres', 'url': url_for('main.settings_page'), 'icon': '⚙️'},
+        {'name': 'Capteurs', 'url': url_for('main.sensors_page'), 'icon': '🎛️'},
+        {'name': 'Visualisation', 'url': url_for('main.visualization'), 'icon': '📈'},
+        {'name': 'Export de données', 'url': url_for('main.export_manager'), 'icon': '💾'},
+        {'name': 'Import de données', 'url': url_for('main.visualization'), 'icon': '📥'},
+        {'name': 'Profil utilisateur', 'url': url_for('auth.profile'), 'icon': '👤'},
+        {'name': 'Historique de connexion', 'url': url_for('auth.profile'), 'icon': '📋'},
+        {'name': 'Administration', 'url': url_for('admin_routes.admin_dashboard'), 'icon': '👨‍💼', 'admin': True},
+        {'name': 'Gestion des utilisateurs', 'url': url_for('admin_routes.admin_dashboard'), 'icon': '👥', 'admin': True},
+        {'name': 'Journal d\'audit', 'url': url_for('admin_routes.admin_dashboard'), 'icon': '📜', 'admin': True},
+        {'name': 'Informations système', 'url': url_for('main.performance_monitoring'), 'icon': 'ℹ️', 'admin': True},
+        {'name': 'Simulateur', 'url': url_for('main.simulator_page'), 'icon': '🎮', 'admin': True},
     ]
     
-    if user_is_admin:
-        pages.extend([
-            {'name': 'Administration', 'url': url_for('main.admin'), 'category': 'page', 'icon': '👨‍💼'},
-            {'name': 'Gestion des utilisateurs', 'url': url_for('main.user_management'), 'category': 'page', 'icon': '👥'},
-            {'name': 'Journal d\'audit', 'url': url_for('main.audit_log'), 'category': 'page', 'icon': '📜'},
-            {'name': 'Informations système', 'url': url_for('main.system_info'), 'category': 'page', 'icon': 'ℹ️'},
-            {'name': 'Simulateur', 'url': url_for('main.simulator'), 'category': 'page', 'icon': '🎮'},
-        ])
-    
-    for page in pages:
-        if query in page['name'].lower():
-            results.append({
-                'title': page['name'],
-                'url': page['url'],
-                'category': page['category'],
-                'icon': page['icon'],
-                'match': 'name'
-            })
-    
-    # Search user sensors
-    try:
-        sensors = get_user_sensors(user_id)
-        for sensor in sensors:
-            if query in sensor['name'].lower() or query in sensor.get('location', '').lower():
-                results.append({
-                    'title': sensor['name'],
-                    'url': url_for('main.sensors_page'),
-                    'category': 'sensor',
-                    'icon': '🎛️',
-                    'description': f"Capteur: {sensor.get('location', 'Sans emplacement')}",
-                    'match': 'sensor'
-                })
-    except Exception:
-        pass
-    
-    # Search keywords/terms for quick help
+    # Keywords/terms for quick help
     keywords = {
         'co2': {'title': 'Niveau de CO₂', 'url': url_for('main.live_page'), 'desc': 'Voir les mesures en temps réel'},
         'ppm': {'title': 'Parties par million', 'url': url_for('main.live_page'), 'desc': 'Unité de mesure CO₂'},
-        'export': {'title': 'Exporter les données', 'url': url_for('main.data_export_page'), 'desc': 'CSV, JSON, Excel, PDF'},
-        'import': {'title': 'Importer les données', 'url': url_for('main.data_import_page'), 'desc': 'Charger des données CSV'},
+        'export': {'title': 'Exporter les données', 'url': url_for('main.export_manager'), 'desc': 'CSV, JSON, Excel, PDF'},
+        'import': {'title': 'Importer les données', 'url': url_for('main.visualization'), 'desc': 'Charger des données CSV'},
         'seuil': {'title': 'Seuils d\'alerte', 'url': url_for('main.settings_page'), 'desc': 'Configurer les alertes'},
-        'historique': {'title': 'Historique des données', 'url': url_for('main.visualization_page'), 'desc': 'Visualiser l\'historique'},
-        'connexion': {'title': 'Historique de connexion', 'url': url_for('auth.login_history'), 'desc': 'Voir vos connexions'},
+        'historique': {'title': 'Historique des données', 'url': url_for('main.visualization'), 'desc': 'Visualiser l\'historique'},
+        'connexion': {'title': 'Historique de connexion', 'url': url_for('auth.profile'), 'desc': 'Voir vos connexions'},
         'mot de passe': {'title': 'Changer le mot de passe', 'url': url_for('auth.change_password'), 'desc': 'Mettre à jour votre mot de passe'},
         'theme': {'title': 'Thème sombre/clair', 'url': url_for('main.settings_page'), 'desc': 'Changer l\'apparence'},
     }
     
-    for keyword, data in keywords.items():
-        if query in keyword:
-            results.append({
-                'title': data['title'],
-                'url': data['url'],
-                'category': 'help',
-                'icon': '❓',
-                'description': data['desc'],
-                'match': 'keyword'
-            })
-    
-    # Limit to top 10 results
-    return jsonify({'results': results[:10]})
+    urls = {
+        'sensor': url_for('main.sensors_page'),
+        'dashboard': url_for('main.collaboration_feature'),
+        'dashboard_comment': url_for('main.collaboration_feature'),
+        'team': url_for('main.team_collaboration'),
+        'team_comment': url_for('main.team_collaboration'),
+        'reading_comment': url_for('main.visualization'),
+    }
+    return pages, keywords, urls
+
+
+with app.test_request_context():
+    search_service.build_static(*search_catalog())
+
+
+@app.route("/api/search")
+@login_required
+def global_search():
+    """Global search across pages, help, sensors, dashboards, teams and comments (utils.search_index)"""
+    user_id = session.get('user_id')
+    results = search_service.search(user_id, request.args.get('q', ''), include_admin=is_admin(user_id))
+    return jsonify({'results': results})
 
 # Sensor and threshold routes moved to blueprints/sensors.py
 
 # Analytics routes moved to blueprints/analytics.py
 
+def downsampled_response(rows, max_points):
+    """JSON list of reading rows, reduced to ``max_points`` (X-Downsampled-From: original count)."""
+    kept = downsample_rows(rows, max_points)
+    resp = jsonify([dict(r) for r in kept])
+    if len(kept) < len(rows):
+        resp.headers["X-Downsampled-From"] = str(len(rows))
+    return resp
+
 @app.route("/api/history/<range>")
 @login_required
 def history_range(range):
+    """Readings of a range (today, 7d, 30d); ``max_points`` downsamples them with LTTB.
+
+    The range mixes every source (simulated and imported readings are not
+    rolled up), so it is always reduced from raw rows.
+    """
     user_id = session.get("user_id")
     if not user_id:
         return jsonify({"error": "Unauthorized"}), 401
+    try:
+        max_points = parse_max_points(request.args.get("max_points"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     db = get_db()
 
@@ -580,7 +605,7 @@ def history_range(range):
         return jsonify({"error": "Invalid range"}), 400
 
     db.close()
-    return jsonify([dict(r) for r in rows])
+    return downsampled_response(rows, max_points)
 
 # 3. API ROUTES
 def get_latest_real_reading(max_age_minutes: int = 1):
@@ -589,6 +614,20 @@ def get_latest_real_reading(max_age_minutes: int = 1):
     if not user_id:
         return None
 
+    # Fast path: readings published by the ingest path of this process. A missing
+    # or stale event falls through to SQL, which sees readings stored by other
+    # processes (line-protocol listener, other workers).
+    event = live_feed.latest(user_id)
+    if event and datetime.fromisoformat(event["timestamp"]) >= datetime.now(UTC) - timedelta(minutes=max_age_minutes):
+        return {
+            "ppm": event["ppm"],
+            "temperature": event["temperature"],
+            "humidity": event["humidity"],
+            "timestamp": event["timestamp"],
+            "source": event["source"],
+            "seq": event["seq"],
+        }
+
     db = get_db()
     row = db.execute(
         """
@@ -609,6 +648,8 @@ def get_latest_real_reading(max_age_minutes: int = 1):
     if ts_raw:
         try:
             ts_dt = datetime.fromisoformat(ts_raw.replace("Z", "+00:00"))
+            if ts_dt.tzinfo is None:
+                ts_dt = ts_dt.replace(tzinfo=UTC)  # stored timestamps are UTC
             if ts_dt < datetime.now(UTC) - timedelta(minutes=max_age_minutes):
                 return None
         except Exception:
@@ -665,7 +706,8 @@ def build_live_payload(settings=None):
         "ppm": latest.get("ppm"),
         "temp": latest.get("temperature"),
         "humidity": latest.get("humidity"),
-        "timestamp": latest.get("timestamp", datetime.now(UTC).isoformat())
+        "timestamp": latest.get("timestamp", datetime.now(UTC).isoformat()),
+        "seq": latest.get("seq")
     }
 
 
@@ -673,12 +715,86 @@ def build_live_payload(settings=None):
 @limiter.exempt
 @login_required
 def api_live_latest():
-    _, payload = build_live_payload()
+    """Latest live reading; ``?after=<seq>&wait=<s>`` turns it into a long-poll.
+
+    With ``after``, the request is held until a reading newer than that sequence
+    number is published (or found in ``co2_readings`` when stored by another
+    process) or ``wait`` seconds elapse. The returned
+    ``seq`` is the value to pass as ``after`` on the next call.
+    """
+    after = request.args.get("after", type=int)
+    settings = load_settings()
+    if after is not None and settings.get("analysis_running", True) and not settings.get("simulate_live", False):
+        max_wait = app.config.get("LIVE_LONG_POLL_MAX_WAIT_SECONDS", 30)
+        wait = request.args.get("wait", default=max_wait, type=float)
+        wait = max(0.0, min(wait, max_wait))
+        live_feed.wait_or_poll(session.get("user_id"), after, timeout=wait)
+
+    _, payload = build_live_payload(settings)
+    if payload.get("seq") is None:
+        payload["seq"] = live_feed.seq
     resp = make_response(jsonify(payload))
     resp.headers["Cache-Control"] = "no-store"
     return resp
 
 
+def live_event_payload(event):
+    """Shape a live-feed event like the payload of build_live_payload()."""
+    return {
+        "analysis_running": True,
+        "ppm": event["ppm"],
+        "temp": event["temperature"],
+        "humidity": event["humidity"],
+        "timestamp": event["timestamp"],
+        "seq": event["seq"],
+    }
+
+
+@app.route("/api/live/stream")
+@limiter.exempt
+@login_required
+def api_live_stream():
+    """Server-Sent Events stream of live readings, served from the in-memory feed.
+
+    Reconnecting clients send ``Last-Event-ID`` (or ``?last_event_id=``) to replay
+    readings they missed; ``?heartbeat=<seconds>`` overrides the keep-alive interval.
+    """
+    user_id = session.get("user_id")
+    heartbeat = request.args.get("heartbeat", type=float) or app.config.get("LIVE_STREAM_HEARTBEAT_SECONDS", 15)
+    heartbeat = max(1.0, min(float(heartbeat), 300.0))
+    retry_ms = app.config.get("LIVE_STREAM_RETRY_MS", 3000)
+
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    try:
+        last_seq = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_seq = None
+
+    def generate():
+        yield f"retry: {retry_ms}\n\n"
+        live_feed.poll_database(user_id)
+        if last_seq is None:
+            cursor = live_feed.seq
+            latest = live_feed.latest(user_id)
+            events = [latest] if latest else []
+        else:
+            cursor = last_seq
+            events = live_feed.since(user_id, last_seq)
+
+        while True:
+            for event in events:
+                cursor = event["seq"]
+                yield f"id: {cursor}\nevent: reading\ndata: {json.dumps(live_event_payload(event))}\n\n"
+            events = live_feed.wait_or_poll(user_id, cursor, timeout=heartbeat)
+            if not events:
+                yield ": keepalive\n\n"
+
+    resp = Response(generate(), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-store"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
 @app.route("/api/readings", methods=["POST", "GET"])
 @limiter.exempt
 @login_required
@@ -686,11 +802,23 @@ def api_readings_ingest():
     """Ingest real sensor readings (POST) or fetch recent readings (GET)."""
     if request.method == "GET":
         days = request.args.get("days", default=1, type=int)
+        try:
+            max_points = parse_max_points(request.args.get("max_points"))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         db_source = resolve_source_param(allow_sim=True, allow_import=True)
         source_clause, source_params = build_source_filter(db_source)
         user_id = session.get("user_id")
         if not user_id:
             return jsonify({"error": "Unauthorized"}), 401
+        if db_source == "live":
+            # Real readings are rolled up at ingest: serve bucket mean/min/max when points are >= 1 min apart
+            now = time.time()
+            buckets = rollup_rows(series_key(user_id=user_id), now - days * 86400, now, max_points)
+            if buckets is not None:
+                resp = jsonify(buckets[::-1])
+                resp.headers["X-Rollup-Resolution"] = str(buckets[0]["resolution"])
+                return resp
         db = get_db()
         rows = db.execute(
             f"""
@@ -704,24 +832,29 @@ def api_readings_ingest():
             (f"-{days} days", *source_params, user_id)
         ).fetchall()
         db.close()
-        return jsonify([dict(r) for r in rows])
+        return downsampled_response(rows, max_points)
 
-    data = request.get_json(silent=True) or {}
-    ppm = data.get("ppm")
-    if ppm is None:
-        return jsonify({"error": "ppm is required"}), 400
+    # POST accepts a single reading or a batch: [{...}, ...] / {"readings": [...]}
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {}
+    user_id = session.get("user_id")
 
-    temp = data.get("temp", data.get("temperature"))
-    humidity = data.get("humidity")
+    if isinstance(data, dict) and "readings" not in data:
+        result = ingest_readings(user_id, [data], source="sensor")
+        if result["rejected"]:
+            return jsonify({"error": result["rejected"][0]["error"]}), 400
+        return jsonify({"success": True, "seq": result["seq"], "duplicate": bool(result["duplicates"])})
 
-    try:
-        ppm_int = int(ppm)
-    except Exception:
-        return jsonify({"error": "ppm must be numeric"}), 400
+    batch = data.get("readings") if isinstance(data, dict) else data
+    if not isinstance(batch, list):
+        return jsonify({"error": "readings must be a list"}), 400
+    max_batch = app.config.get("INGEST_MAX_BATCH_SIZE", 1000)
+    if len(batch) > max_batch:
+        return jsonify({"error": f"batch too large (max {max_batch})"}), 413
 
-    user_id = session.get("user_id")
-    save_reading(ppm_int, temp, humidity, source="sensor", persist=True, user_id=user_id)
-    return jsonify({"success": True})
+    result = ingest_readings(user_id, batch, source="sensor")
+    return jsonify({"success": not result["rejected"], **result})
 
 
 @app.route("/api/latest")
@@ -992,17 +1125,19 @@ def api_thresholds():
     return jsonify({"error": "Method not allowed"}), 405
 
 def generate_pdf(html):
-    pdf_io = io.BytesIO()
-
-    HTML(
-        string=html,
-        base_url=os.path.abspath(".")
-    ).write_pdf(
-        target=pdf_io,
-        presentational_hints=True
-    )
+    if not WEASYPRINT_AVAILABLE:
+        return "PDF export not available (WeasyPrint is not installed)", 501
+
+    # Rendering holds the GIL for seconds; keep it off the request thread
+    try:
+        pdf_bytes = task_pool.run(render_pdf, html, base_url=os.path.abspath("."),
+                                  presentational_hints=True, kind="daily_report")
+    except PoolBusy:
+        return "Too many reports are being generated, try again shortly", 503
+    except TaskTimeout:
+        return "Report generation timed out", 504
 
-    pdf_io.seek(0)
+    pdf_io = io.BytesIO(pdf_bytes)
 
     return send_file(
         pdf_io,
@@ -1017,33 +1152,32 @@ def generate_pdf(html):
 def export_daily_pdf():
     db_source = resolve_source_param(allow_sim=True, allow_import=True)
     user_id = session.get("user_id")
-    data = get_today_history(db_source, user_id)
-    settings = load_settings()
-
-    if not data:
-        return "No data", 400
+    thresholds = get_user_thresholds(user_id)
 
-    values = [d["ppm"] for d in data]
+    if db_source == "live":
+        # Live readings are accounted for at ingest (utils.exposure)
+        exposure = exposure_counters.day(series_key(user_id=user_id))
+    else:
+        data = get_today_history(db_source, user_id)
+        exposure = summarize_readings(
+            [parse_timestamp(d["timestamp"]).timestamp() for d in data], [d["ppm"] for d in data],
+            sorted((thresholds["good_level"], thresholds["warning_level"], thresholds["critical_level"]))
+        )
 
-    avg = round(sum(values) / len(values))
-    max_ppm = max(values)
-    min_ppm = min(values)
+    if not exposure:
+        return "No data", 400
 
-    # ⏱ minutes above bad threshold
-    bad_minutes = sum(1 for v in values if v >= settings["bad_threshold"])
+    avg = round(exposure["avg_ppm"])
+    max_ppm = exposure["max_ppm"]
+    min_ppm = exposure["min_ppm"]
 
-    # ✅ EXPOSURE BREAKDOWN (THIS IS YOUR QUESTION)
-    good = sum(1 for v in values if v < settings["good_threshold"])
-    medium = sum(
-        1 for v in values
-        if settings["good_threshold"] <= v < settings["bad_threshold"]
-    )
-    bad = sum(1 for v in values if v >= settings["bad_threshold"])
-    total = len(values)
+    # ⏱ time-weighted minutes above the critical level
+    bad_minutes = round(exposure["band_seconds"]["critical"] / 60)
 
-    good_pct = round(good / total * 100)
-    medium_pct = round(medium / total * 100)
-    bad_pct = round(bad / total * 100)
+    # ✅ EXPOSURE BREAKDOWN (share of the time spent in each band)
+    good_pct = round(exposure["band_percent"]["good"])
+    bad_pct = round(exposure["band_percent"]["critical"])
+    medium_pct = 100 - good_pct - bad_pct if exposure["seconds"] else 0
 
     with open("static/css/report.css", "r", encoding="utf-8") as f:
         report_css = f.read()
@@ -1058,8 +1192,8 @@ def export_daily_pdf():
         good_pct=good_pct,
         medium_pct=medium_pct,
         bad_pct=bad_pct,
-        good_threshold=settings["good_threshold"],
-        bad_threshold=settings["bad_threshold"],
+        good_threshold=thresholds["good_level"],
+        bad_threshold=thresholds["critical_level"],
         generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         report_css=report_css
     )
@@ -3,16 +3,37 @@ Analytics Blueprint
 Handles all CO₂ analytics, reporting, and trend analysis routes
 """
 
+import hashlib
+import json
+import time
+
 from flask import Blueprint, request, jsonify, session, current_app
-from datetime import datetime, date, timedelta
-from database import get_db
+from datetime import datetime, date, timedelta, timezone
+from database import get_db, get_sensor_by_id
 from utils.auth_decorators import login_required
 from utils.cache import TTLCache
+from utils.downsample import downsample_rows, parse_max_points, rollup_rows
+from utils.export_manager import render_pdf
+from utils.ingest import parse_timestamp
+from utils.online_stats import DEFAULT_PERCENTILES, series_key, series_stats
+from utils.period_compare import (compare_readings, compare_rollups, percent_change, period_windows,
+                                  split_windows)
+from utils.rollups import tile_pyramid
 from utils.source_helpers import resolve_source_param, build_source_filter
+from utils.task_pool import PoolBusy, TaskTimeout, task_pool
 
 analytics_bp = Blueprint('analytics', __name__, url_prefix='/api/analytics')
 
 
+def _query_time(value):
+    """Epoch seconds from an ISO-8601 or epoch query value (None: now)"""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        pass
+    return parse_timestamp(value).timestamp()
+
+
 # ==================== ROUTE HANDLERS ====================
 
 @analytics_bp.route('/weekcompare', methods=['GET'])
@@ -32,31 +53,18 @@ def week_compare():
     
     def load_data():
         db = get_db()
-        
-        current_week = db.execute(f"""
-            SELECT DATE(timestamp) as date, AVG(ppm) as avg_ppm, MAX(ppm) as max_ppm, MIN(ppm) as min_ppm, COUNT(*) as count
-            FROM co2_readings
-            WHERE timestamp >= datetime('now', '-7 days')
-            AND {source_clause}
-            AND user_id = ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (*source_params, user_id)).fetchall()
-        
-        prev_week = db.execute(f"""
-            SELECT DATE(timestamp) as date, AVG(ppm) as avg_ppm, MAX(ppm) as max_ppm, MIN(ppm) as min_ppm, COUNT(*) as count
-            FROM co2_readings
-            WHERE timestamp >= datetime('now', '-14 days') AND timestamp < datetime('now', '-7 days')
-            AND {source_clause}
-            AND user_id = ?
-            GROUP BY DATE(timestamp)
-            ORDER BY date
-        """, (*source_params, user_id)).fetchall()
-        
+        current_week, prev_week = compare_readings(
+            db, period_windows('week', 2), f"{source_clause} AND user_id = ?", (*source_params, user_id),
+            by_day=True)
         db.close()
+
+        def day_rows(period):
+            return [{'date': day['date'], 'avg_ppm': day['avg'], 'max_ppm': day['max'],
+                     'min_ppm': day['min'], 'count': day['count']} for day in period['days']]
+
         return {
-            'current_week': [dict(row) for row in current_week],
-            'previous_week': [dict(row) for row in prev_week]
+            'current_week': day_rows(current_week),
+            'previous_week': day_rows(prev_week)
         }
     
     key = f"weekcompare:{db_source}:{user_id}"
@@ -159,9 +167,17 @@ def analytics_trend():
 @analytics_bp.route('/custom', methods=['GET'])
 @login_required
 def analytics_custom_range():
-    """Get data for custom date range"""
+    """Get data for custom date range (``max_points`` downsamples the readings with LTTB)
+
+    For real readings with ``max_points`` at least a minute apart, the readings
+    are bucket means (with min/max) read from the chart rollups instead.
+    """
     end_date = request.args.get('end', date.today().isoformat())
     start_date = request.args.get('start', (date.today() - timedelta(days=30)).isoformat())
+    try:
+        max_points = parse_max_points(request.args.get('max_points'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     db_source = resolve_source_param(allow_sim=True, allow_import=True)
     source_clause, source_params = build_source_filter(db_source)
@@ -169,15 +185,26 @@ def analytics_custom_range():
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
     
+    buckets = None
+    if db_source == 'live':
+        try:
+            start = datetime.fromisoformat(start_date).replace(tzinfo=timezone.utc).timestamp()
+            end = (datetime.fromisoformat(end_date) + timedelta(days=1)).replace(tzinfo=timezone.utc).timestamp()
+            buckets = rollup_rows(series_key(user_id=user_id), start, end, max_points)
+        except ValueError:
+            buckets = None
+    
     db = get_db()
     
-    readings = db.execute(f"""
-        SELECT timestamp, ppm FROM co2_readings
-        WHERE DATE(timestamp) >= ? AND DATE(timestamp) <= ?
-        AND {source_clause}
-        AND user_id = ?
-        ORDER BY timestamp
-    """, (start_date, end_date, *source_params, user_id)).fetchall()
+    readings = []
+    if buckets is None:
+        readings = db.execute(f"""
+            SELECT timestamp, ppm FROM co2_readings
+            WHERE DATE(timestamp) >= ? AND DATE(timestamp) <= ?
+            AND {source_clause}
+            AND user_id = ?
+            ORDER BY timestamp
+        """, (start_date, end_date, *source_params, user_id)).fetchall()
     
     stats = db.execute(f"""
         SELECT 
@@ -193,110 +220,199 @@ def analytics_custom_range():
     
     db.close()
     
+    if buckets is not None:
+        kept, total = buckets, stats['count'] if stats else 0
+    else:
+        kept, total = [dict(r) for r in downsample_rows(readings, max_points)], len(readings)
+    
     return jsonify({
-        'readings': [dict(r) for r in readings],
+        'readings': kept,
+        'downsampled_from': total if len(kept) < total else None,
         'stats': dict(stats) if stats else {'count': 0, 'avg': 0, 'min': 0, 'max': 0}
     })
 
 
+@analytics_bp.route('/stats', methods=['GET'])
+@login_required
+def series_statistics():
+    """Mean, stddev and percentiles of a user's or sensor's readings over a window
+
+    Answered from the online per-series summaries (utils.online_stats) without
+    scanning readings. Query: sensor_id (optional), start/end (ISO-8601 or
+    epoch) or hours/days (default 24 hours), percentiles (e.g. 50,90,99).
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    sensor_id = request.args.get('sensor_id', type=int)
+    if sensor_id is not None and not get_sensor_by_id(sensor_id, user_id):
+        return jsonify({'error': 'Sensor not found'}), 404
+
+    try:
+        end = _query_time(request.args.get('end'))
+        if request.args.get('start'):
+            start = _query_time(request.args['start'])
+        else:
+            hours = float(request.args.get('hours', 0)) or float(request.args.get('days', 1)) * 24
+            start = end - hours * 3600
+        percentiles = [float(p) for p in request.args.get('percentiles', '').split(',') if p.strip()]
+    except (TypeError, ValueError, OverflowError, OSError):
+        return jsonify({'error': 'Invalid start, end, hours, days or percentiles'}), 400
+    if start >= end:
+        return jsonify({'error': 'start must be before end'}), 400
+    if any(not 0 <= p <= 100 for p in percentiles):
+        return jsonify({'error': 'percentiles must be between 0 and 100'}), 400
+
+    result = series_stats.summarize(series_key(user_id=user_id, sensor_id=sensor_id), start, end,
+                                    percentiles or DEFAULT_PERCENTILES)
+    return jsonify(result)
+
+
+def _tile_series(series, user_id):
+    """Series name of a tile request ('user' or 'sensor:<id>'), None unless it belongs to the user"""
+    if series in ('user', series_key(user_id=user_id)):
+        return series_key(user_id=user_id)
+    kind, _, ident = series.partition(':')
+    if kind == 'sensor' and ident.isdigit() and get_sensor_by_id(int(ident), user_id):
+        return series_key(sensor_id=int(ident))
+    return None
+
+
+@analytics_bp.route('/tiles', methods=['GET'])
+@login_required
+def tile_levels():
+    """Levels (bucket seconds) of the chart tile pyramid and the time span of one tile"""
+    return jsonify({
+        'levels': [{'level': level, 'tile_span': tile_pyramid.tile_span(level)} for level in tile_pyramid.levels],
+        'tile_buckets': tile_pyramid.tile_buckets
+    })
+
+
+@analytics_bp.route('/tiles/<series>/<int:level>/<int:tile>', methods=['GET'])
+@login_required
+def series_tile(series, level, tile):
+    """One tile of min/max/avg buckets for zoomable charts
+
+    Tile ``tile`` of ``level`` covers [tile * tile_span, (tile + 1) * tile_span)
+    in epoch seconds. Responses carry a strong ETag (304 on If-None-Match);
+    tiles still receiving readings must be revalidated.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    name = _tile_series(series, user_id)
+    if name is None:
+        return jsonify({'error': 'Series not found'}), 404
+    try:
+        body = tile_pyramid.tile(name, level, tile)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = current_app.response_class(json.dumps(body, separators=(',', ':')),
+                                          mimetype='application/json')
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest())
+    if body['end'] + level < time.time():
+        response.headers['Cache-Control'] = 'private, max-age=300'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
 @analytics_bp.route('/compare-periods', methods=['GET'])
 @login_required
 def compare_periods():
-    """Compare CO₂ data between two time periods"""
+    """Compare CO₂ data between the current and previous week, month or year"""
     period_type = request.args.get('type', 'week')
     db_source = resolve_source_param(allow_sim=True, allow_import=True)
     source_clause, source_params = build_source_filter(db_source)
     user_id = session.get('user_id')
     if not user_id:
         return jsonify({'error': 'Unauthorized'}), 401
+    if period_type not in ('week', 'month', 'year'):
+        return jsonify({'error': 'Invalid period_type'}), 400
     
+    where = f"{source_clause} AND user_id = ?"
+    params = (*source_params, user_id)
     db = get_db()
     
-    if period_type == 'week':
-        if db_source == 'import':
-            date_range = db.execute(f"""
-                SELECT MIN(timestamp) as min_date, MAX(timestamp) as max_date
-                FROM co2_readings WHERE {source_clause} AND user_id = ?
-            """, (*source_params, user_id)).fetchone()
-            
-            if date_range and date_range['min_date'] and date_range['max_date']:
-                current_data = db.execute(f"""
-                    SELECT AVG(ppm) as avg, MIN(ppm) as min, MAX(ppm) as max, COUNT(*) as count
-                    FROM co2_readings
-                    WHERE {source_clause} AND user_id = ? AND timestamp >= (
-                        SELECT datetime((julianday(MIN(timestamp)) + julianday(MAX(timestamp))) / 2)
-                        FROM co2_readings WHERE {source_clause} AND user_id = ?
-                    )
-                """, (*source_params, user_id, *source_params, user_id)).fetchone()
-                
-                previous_data = db.execute(f"""
-                    SELECT AVG(ppm) as avg, MIN(ppm) as min, MAX(ppm) as max, COUNT(*) as count
-                    FROM co2_readings
-                    WHERE {source_clause} AND user_id = ? AND timestamp < (
-                        SELECT datetime((julianday(MIN(timestamp)) + julianday(MAX(timestamp))) / 2)
-                        FROM co2_readings WHERE {source_clause} AND user_id = ?
-                    )
-                """, (*source_params, user_id, *source_params, user_id)).fetchone()
-            else:
-                current_data = {'avg': 0, 'min': 0, 'max': 0, 'count': 0}
-                previous_data = {'avg': 0, 'min': 0, 'max': 0, 'count': 0}
+    if period_type == 'week' and db_source == 'import':
+        # Imported data is historical: split its own time range in two halves
+        date_range = db.execute(f"""
+            SELECT MIN(timestamp) as min_date, MAX(timestamp) as max_date
+            FROM co2_readings WHERE {where}
+        """, params).fetchone()
+        if date_range and date_range['min_date'] and date_range['max_date']:
+            windows = split_windows(parse_timestamp(date_range['min_date']).replace(tzinfo=None),
+                                    parse_timestamp(date_range['max_date']).replace(tzinfo=None))
         else:
-            current_data = db.execute(f"""
-                SELECT AVG(ppm) as avg, MIN(ppm) as min, MAX(ppm) as max, COUNT(*) as count
-                FROM co2_readings
-                WHERE timestamp >= datetime('now', '-7 days')
-                AND {source_clause}
-                AND user_id = ?
-            """, (*source_params, user_id)).fetchone()
-            
-            previous_data = db.execute(f"""
-                SELECT AVG(ppm) as avg, MIN(ppm) as min, MAX(ppm) as max, COUNT(*) as count
-                FROM co2_readings
-                WHERE timestamp >= datetime('now', '-14 days') AND timestamp < datetime('now', '-7 days')
-                AND {source_clause}
-                AND user_id = ?
-            """, (*source_params, user_id)).fetchone()
-    
-    elif period_type == 'month':
-        current_data = db.execute(f"""
-            SELECT AVG(ppm) as avg, MIN(ppm) as min, MAX(ppm) as max, COUNT(*) as count
-            FROM co2_readings
-            WHERE timestamp >= datetime('now', 'start of month')
-            AND {source_clause}
-            AND user_id = ?
-        """, (*source_params, user_id)).fetchone()
-        
-        previous_data = db.execute(f"""
-            SELECT AVG(ppm) as avg, MIN(ppm) as min, MAX(ppm) as max, COUNT(*) as count
-            FROM co2_readings
-            WHERE timestamp >= datetime('now', '-1 month', 'start of month')
-            AND timestamp < datetime('now', 'start of month')
-            AND {source_clause}
-            AND user_id = ?
-        """, (*source_params, user_id)).fetchone()
+            windows = None
     else:
-        db.close()
-        return jsonify({'error': 'Invalid period_type'}), 400
+        windows = period_windows(period_type, 2)
     
+    if windows:
+        current_data, previous_data = compare_readings(db, windows, where, params)
+    else:
+        current_data = previous_data = {'avg': 0, 'min': 0, 'max': 0, 'count': 0}
     db.close()
     
-    def calc_diff(current, previous, field):
-        if previous[field] is None or previous[field] == 0:
-            return 0
-        return round(((current[field] - previous[field]) / previous[field]) * 100, 1)
-    
     return jsonify({
         'period': period_type,
-        'current': dict(current_data) if current_data else {},
-        'previous': dict(previous_data) if previous_data else {},
+        'current': current_data,
+        'previous': previous_data,
         'differences': {
-            'avg_percent': calc_diff(current_data, previous_data, 'avg'),
-            'min_percent': calc_diff(current_data, previous_data, 'min'),
-            'max_percent': calc_diff(current_data, previous_data, 'max'),
+            field + '_percent': percent_change(current_data[field], previous_data[field])
+            for field in ('avg', 'min', 'max')
         }
     })
 
 
+@analytics_bp.route('/compare', methods=['GET'])
+@login_required
+def compare_n_periods():
+    """Compare the last N days, weeks, months or years (one scan for all periods)
+
+    ``?unit=week&periods=4`` compares the last 4 weeks of the user's readings
+    (``source`` filtered); with ``sensor_id`` the sensor's rollups are used.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        windows = period_windows(request.args.get('unit', 'week'),
+                                 int(request.args.get('periods', 2)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    sensor_id = request.args.get('sensor_id', type=int)
+    if sensor_id is not None:
+        sensor = get_sensor_by_id(sensor_id, user_id)
+        if not sensor:
+            return jsonify({'error': 'Sensor not found'}), 404
+    
+    db = get_db()
+    try:
+        if sensor_id is not None:
+            periods = compare_rollups(db, series_key(sensor_id=sensor_id), windows)
+        else:
+            source_clause, source_params = build_source_filter(
+                resolve_source_param(allow_sim=True, allow_import=True))
+            periods = compare_readings(db, windows, f"{source_clause} AND user_id = ?",
+                                       (*source_params, user_id))
+    finally:
+        db.close()
+    
+    for period, older in zip(periods, periods[1:] + [None]):
+        period['avg_change_percent'] = percent_change(period['avg'], older['avg']) if older else None
+    
+    return jsonify({
+        'unit': request.args.get('unit', 'week'),
+        'sensor_id': sensor_id,
+        'periods': periods
+    })
+
+
 @analytics_bp.route('/daily-comparison', methods=['GET'])
 @login_required
 def daily_comparison():
@@ -459,12 +575,16 @@ def generate_pdf_report():
     """
     
     try:
-        from weasyprint import HTML
-        pdf = HTML(string=html_content).write_pdf()
-        from flask import make_response
-        response = make_response(pdf)
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = 'attachment; filename=report.pdf'
-        return response
+        pdf = task_pool.run(render_pdf, html_content, kind='analytics_report', owner=user_id)
+    except PoolBusy:
+        return jsonify({'error': 'Too many reports are being generated, try again shortly'}), 503
+    except TaskTimeout:
+        return jsonify({'error': 'PDF generation timed out'}), 504
     except Exception as e:
         return jsonify({'error': 'PDF generation failed', 'details': str(e)}), 500
+
+    from flask import make_response
+    response = make_response(pdf)
+    response.headers['Content-Type'] = 'application/pdf'
+    response.headers['Content-Disposition'] = 'attachment; filename=report.pdf'
+    return response
@@ -7,6 +7,7 @@ from flask import Blueprint, render_template, request, jsonify, session
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from database import get_db, is_admin
 from utils.auth_decorators import login_required
+from utils import fulltext
 from utils.collaboration import CollaborationManager
 from datetime import datetime
 
@@ -198,6 +199,60 @@ def get_activity(dashboard_id):
     activity = CollaborationManager.get_collaboration_activity(dashboard_id, limit)
     return jsonify({'activity': activity})
 
+# Full-text search scopes: (columns, visibility filter on rows "t" for the user id)
+SEARCH_SCOPES = {
+    'dashboard_comments': (
+        't.id, t.dashboard_id, t.user_id, t.comment_text, t.data_point, t.created_at',
+        """t.dashboard_id IN (
+               SELECT id FROM shared_dashboards WHERE owner_id = :user OR is_public = 1
+               UNION SELECT dashboard_id FROM shared_dashboard_collaborators WHERE user_id = :user)"""
+    ),
+    'team_activity': (
+        't.id, t.team_id, t.user_id, t.action, t.description, t.created_at',
+        """t.team_id IN (
+               SELECT id FROM teams WHERE owner_id = :user
+               UNION SELECT team_id FROM team_members WHERE user_id = :user)"""
+    ),
+    'reading_comments': (
+        't.id, t.reading_id, t.user_id, t.comment_text, t.created_at',
+        """(t.user_id = :user OR t.reading_id IN (
+               SELECT r.id FROM sensor_readings r JOIN user_sensors s ON s.id = r.sensor_id
+               WHERE s.user_id = :user))"""
+    ),
+}
+
+@collab_bp.route('/search', methods=['GET'])
+@login_required
+def search():
+    """Full-text search of comments and team activity visible to the current user"""
+    user_id = session.get('user_id')
+    query = request.args.get('q', '')
+    scope = request.args.get('type', 'dashboard_comments')
+    limit = request.args.get('limit', 50, type=int)
+
+    if scope not in SEARCH_SCOPES:
+        return jsonify({'error': f"type must be one of: {', '.join(SEARCH_SCOPES)}"}), 400
+    if not fulltext.match_query(query):
+        return jsonify({'error': 'Search query required'}), 400
+
+    columns, visible = SEARCH_SCOPES[scope]
+    db = get_db()
+    try:
+        rows, next_cursor = fulltext.search(
+            db, scope, query, columns=columns, where=visible.replace(':user', '?'),
+            params=[user_id] * visible.count(':user'), limit=limit, cursor=request.args.get('cursor')
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+    finally:
+        db.close()
+
+    return jsonify({
+        'type': scope,
+        'results': [fulltext.row_dict(row) for row in rows],
+        'next_cursor': next_cursor
+    })
+
 # WebSocket handlers for real-time collaboration
 def register_collab_sockets(socketio):
     """Register WebSocket event handlers for collaboration"""
@@ -2,9 +2,10 @@
 Data Export Blueprint
 Provides data export functionality via CSV, Excel, and PDF
 """
-from flask import Blueprint, request, jsonify, send_file, render_template
+from flask import Blueprint, request, jsonify, send_file, render_template, session, url_for
 from utils.auth_decorators import login_required
 from utils.logger import configure_logging
+from utils.task_pool import PoolBusy, TaskTimeout, task_pool
 from database import get_db
 from datetime import datetime, timedelta
 import io
@@ -39,6 +40,14 @@ except (ImportError, OSError) as e:
 logger = configure_logging()
 export_bp = Blueprint('export', __name__, url_prefix='/export')
 
+# Rendered in task_pool workers: format -> (mimetype, extension, unavailable message)
+RENDERED_FORMATS = {
+    'excel': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx',
+              'Excel export not available (openpyxl not installed)'),
+    'pdf': ('application/pdf', 'pdf',
+            'PDF export not available on this system (WeasyPrint requires GTK support)'),
+}
+
 
 def initialize_export_tables():
     """Initialize export-related database tables"""
@@ -108,31 +117,38 @@ def export_data():
                 as_attachment=True,
                 download_name=f"{filename}.csv"
             )
-        elif format_type == 'excel':
-            output = exporter.export_to_excel(data_list, title='Aerium CO₂ Report')
-            if output is None:
-                logger.warning("Excel export attempted but openpyxl not available")
-                return jsonify({'error': 'Excel export not available (openpyxl not installed)'}), 501
-            return send_file(
-                output,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                as_attachment=True,
-                download_name=f"{filename}.xlsx"
-            )
-        elif format_type == 'pdf':
-            output = exporter.export_to_pdf(data_list, title='Aerium CO₂ Report')
-            if output is None:
-                logger.warning("PDF export attempted but WeasyPrint not available")
-                return jsonify({
-                    'error': 'PDF export not available on this system (WeasyPrint requires GTK support)',
-                    'alternatives': ['csv', 'excel']
-                }), 501
-            return send_file(
-                output,
-                mimetype='application/pdf',
-                as_attachment=True,
-                download_name=f"{filename}.pdf"
-            )
+        
+        mimetype, extension, unavailable = RENDERED_FORMATS[format_type]
+        render = exporter.export_to_excel if format_type == 'excel' else exporter.export_to_pdf
+        
+        if data.get('async'):
+            job = task_pool.submit(render, data_list, title='Aerium CO₂ Report',
+                                   kind=f'export_{format_type}', owner=session.get('user_id'),
+                                   meta={'filename': f"{filename}.{extension}", 'mimetype': mimetype,
+                                         'unavailable': unavailable})
+            return jsonify({
+                'job_id': job.id,
+                'state': job.state,
+                'status_url': url_for('export.job_status', job_id=job.id)
+            }), 202
+        
+        output = task_pool.run(render, data_list, title='Aerium CO₂ Report', kind=f'export_{format_type}')
+        if output is None:
+            logger.warning(f"{format_type} export attempted but its renderer is not available")
+            body = {'error': unavailable}
+            if format_type == 'pdf':
+                body['alternatives'] = ['csv', 'excel']
+            return jsonify(body), 501
+        return send_file(
+            output,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f"{filename}.{extension}"
+        )
+    except PoolBusy:
+        return jsonify({'error': 'Too many exports are running, try again shortly'}), 503
+    except TaskTimeout:
+        return jsonify({'error': 'Export timed out'}), 504
     except Exception as e:
         logger.error(f"Export failed: {e}")
         return jsonify({'error': f'Export failed: {str(e)}'}), 500
@@ -158,3 +174,49 @@ def get_available_formats():
     }
     
     return jsonify(formats)
+
+
+@export_bp.route('/api/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """Status of an asynchronous export"""
+    job = task_pool.get(job_id, owner=session.get('user_id'))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    status = job.to_dict()
+    if status['state'] == 'done':
+        status['download_url'] = url_for('export.job_download', job_id=job.id)
+    return jsonify(status)
+
+
+@export_bp.route('/api/jobs/<job_id>/download', methods=['GET'])
+@login_required
+def job_download(job_id):
+    """Download the file of a finished asynchronous export"""
+    job = task_pool.get(job_id, owner=session.get('user_id'))
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    state = job.state
+    if state != 'done':
+        return jsonify({'error': f'Job is {state}', 'state': state}), 409
+    
+    output = job.result()
+    if output is None:
+        return jsonify({'error': job.meta['unavailable']}), 501
+    return send_file(
+        io.BytesIO(output.getvalue()),
+        mimetype=job.meta['mimetype'],
+        as_attachment=True,
+        download_name=job.meta['filename']
+    )
+
+
+@export_bp.route('/api/jobs/<job_id>', methods=['DELETE'])
+@login_required
+def cancel_job(job_id):
+    """Cancel an asynchronous export"""
+    if task_pool.get(job_id, owner=session.get('user_id')) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'cancelled': task_pool.cancel(job_id)})
@@ -0,0 +1,277 @@
+"""
+Device Ingestion Routes
+Token management for hardware gateways and the persistent /device Socket.IO namespace
+"""
+
+import json
+import threading
+import zlib
+
+from flask import Blueprint, current_app, jsonify, request, session
+from flask_socketio import disconnect, emit
+
+from database import (
+    create_device_token,
+    get_db,
+    get_device_by_token,
+    get_sensor_by_id,
+    get_user_device_tokens,
+    is_device_token_active,
+    log_audit,
+    revoke_device_token,
+)
+from utils.auth_decorators import login_required
+from utils.ingest import ingest_readings
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+devices_bp = Blueprint('devices', __name__, url_prefix='/api/devices')
+
+DEVICE_NAMESPACE = '/device'
+
+# Authenticated device per socket id
+_device_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+@devices_bp.route('/tokens', methods=['GET'])
+@login_required
+def list_tokens():
+    """List the current user's device tokens"""
+    return jsonify(get_user_device_tokens(session.get('user_id')))
+
+
+@devices_bp.route('/tokens', methods=['POST'])
+@login_required
+def create_token():
+    """Create a device token; the raw token is only returned once"""
+    user_id = session.get('user_id')
+    data = request.get_json(silent=True) or {}
+
+    name = (data.get('name') or '').strip()
+    if not name:
+        return jsonify({'error': 'Device name required'}), 400
+
+    sensor_id = data.get('sensor_id')
+    if sensor_id is not None:
+        try:
+            sensor_id = int(sensor_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sensor_id must be an integer'}), 400
+    if sensor_id is not None and not get_sensor_by_id(sensor_id, user_id):
+        return jsonify({'error': 'Sensor not found'}), 404
+
+    token_id, token = create_device_token(user_id, name, sensor_id)
+    try:
+        log_audit(user_id, 'DEVICE_TOKEN_CREATED', 'device_token', token_id, None, name, request.remote_addr)
+    except Exception as e:
+        logger.warning(f"Audit logging failed for DEVICE_TOKEN_CREATED (user {user_id}): {e}")
+
+    return jsonify({'success': True, 'id': token_id, 'token': token, 'sensor_id': sensor_id}), 201
+
+
+@devices_bp.route('/tokens/<int:token_id>', methods=['DELETE'])
+@login_required
+def delete_token(token_id):
+    """Revoke a device token"""
+    user_id = session.get('user_id')
+    if not revoke_device_token(token_id, user_id):
+        return jsonify({'error': 'Token not found'}), 404
+    return jsonify({'success': True})
+
+
+def _bearer_token():
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[7:].strip()
+    return None
+
+
+def _ingest_for_device(device, batch):
+    """Run a device batch through the ingest pipeline.
+
+    Sensor-bound tokens log everything to their sensor. User-level tokens
+    (gateways) may tag each reading with one of the user's ``sensor_id``s
+    (integers or numeric strings). Rejection and duplicate indexes refer to
+    positions in ``batch``; bare ``seq`` reading keys are scoped to the token.
+    """
+    device_key = f"token{device['id']}"
+    if device['sensor_id'] is not None:
+        return ingest_readings(device['user_id'], batch, source='sensor',
+                               sensor_id=device['sensor_id'], device_key=device_key)
+
+    groups, rejected = {}, []
+    for index, reading in enumerate(batch):
+        sensor_id = reading.get('sensor_id') if isinstance(reading, dict) else None
+        if sensor_id is not None:
+            try:
+                sensor_id = int(sensor_id)
+            except (TypeError, ValueError):
+                rejected.append({'index': index, 'error': 'invalid sensor_id'})
+                continue
+        groups.setdefault(sensor_id, []).append((index, reading))
+
+    owned = set()
+    if any(sensor_id is not None for sensor_id in groups):
+        db = get_db()
+        owned = {row['id'] for row in db.execute(
+            "SELECT id FROM user_sensors WHERE user_id = ?", (device['user_id'],)
+        ).fetchall()}
+        db.close()
+
+    accepted, duplicates, seq = 0, [], None
+    for sensor_id, items in groups.items():
+        if sensor_id is not None and sensor_id not in owned:
+            rejected.extend({'index': index, 'error': 'unknown sensor_id'} for index, _ in items)
+            continue
+        result = ingest_readings(device['user_id'], [r for _, r in items], source='sensor',
+                                 sensor_id=sensor_id, device_key=device_key)
+        accepted += result['accepted']
+        duplicates.extend(items[i][0] for i in result['duplicates'])
+        rejected.extend({'index': items[r['index']][0], 'error': r['error']} for r in result['rejected'])
+        seq = result['seq'] if result['seq'] is not None else seq
+
+    rejected.sort(key=lambda r: r['index'])
+    return {'accepted': accepted, 'duplicates': sorted(duplicates), 'rejected': rejected, 'seq': seq}
+
+
+def _request_json_body(max_bytes):
+    """Decode the (optionally gzip/deflate-compressed) JSON body with a size cap"""
+    # Refuse oversized bodies from the declared length, and never buffer more
+    # than the cap from a body sent without one (chunked)
+    if request.content_length is not None and request.content_length > max_bytes:
+        raise OverflowError('body too large')
+    raw = request.stream.read(max_bytes + 1)
+    if len(raw) > max_bytes:
+        raise OverflowError('body too large')
+    encoding = (request.headers.get('Content-Encoding') or '').lower()
+    if encoding in ('gzip', 'deflate'):
+        wbits = 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS
+        decompressor = zlib.decompressobj(wbits)
+        raw = decompressor.decompress(raw, max_bytes)
+        if decompressor.unconsumed_tail:
+            raise OverflowError('body too large')
+    elif encoding not in ('', 'identity'):
+        raise ValueError(f'unsupported Content-Encoding: {encoding}')
+    if len(raw) > max_bytes:
+        raise OverflowError('body too large')
+    return json.loads(raw.decode('utf-8'))
+
+
+@devices_bp.route('/ingest', methods=['POST'])
+def device_ingest():
+    """Batch upload for gateways (store-and-forward), authenticated by device token.
+
+    Body: ``{"seq": <last buffer offset>, "readings": [...]}``, optionally
+    gzip-compressed. The response echoes ``seq`` so the gateway can drop
+    everything up to it; rejected readings are acknowledged too.
+    """
+    device = get_device_by_token(_bearer_token())
+    if not device:
+        return jsonify({'error': 'Invalid device token'}), 401
+
+    try:
+        data = _request_json_body(current_app.config.get('INGEST_MAX_BODY_BYTES', 10 * 1024 * 1024))
+    except OverflowError:
+        return jsonify({'error': 'Body too large'}), 413
+    except (ValueError, UnicodeDecodeError, zlib.error) as e:
+        return jsonify({'error': f'Invalid body: {e}'}), 400
+
+    batch = data.get('readings') if isinstance(data, dict) else None
+    if not isinstance(batch, list):
+        return jsonify({'error': 'readings must be a list'}), 400
+    max_batch = current_app.config.get('INGEST_MAX_BATCH_SIZE', 1000)
+    if len(batch) > max_batch:
+        return jsonify({'error': f'batch too large (max {max_batch})'}), 413
+
+    result = _ingest_for_device(device, batch)
+    return jsonify({
+        'ok': True,
+        'seq': data.get('seq'),
+        'accepted': result['accepted'],
+        'duplicates': result['duplicates'],
+        'rejected': result['rejected'],
+    })
+
+
+def _handshake_token(auth):
+    """Token from the Socket.IO auth payload, a Bearer header or ?token="""
+    if isinstance(auth, dict) and auth.get('token'):
+        return auth['token']
+    return _bearer_token() or request.args.get('token')
+
+
+def register_device_sockets(socketio):
+    """Register the token-authenticated device ingestion namespace.
+
+    Devices connect to ``/device`` with ``auth={'token': ...}`` and emit
+    ``reading`` events carrying ``{'seq': <batch seq>, 'readings': [...]}``.
+    The event's ack echoes ``seq`` so the device can drop acknowledged batches.
+    The token is re-checked on every event: a socket whose token was revoked
+    (by any worker) is disconnected instead of ingesting.
+    """
+
+    @socketio.on('connect', namespace=DEVICE_NAMESPACE)
+    def handle_device_connect(auth=None):
+        device = get_device_by_token(_handshake_token(auth))
+        if not device:
+            raise ConnectionRefusedError('invalid device token')
+
+        with _sessions_lock:
+            _device_sessions[request.sid] = device
+        logger.info(f"Device connected: {device['name']} (token {device['id']}, user {device['user_id']})")
+        emit('ready', {
+            'device_id': device['id'],
+            'sensor_id': device['sensor_id'],
+            'max_batch': current_app.config.get('INGEST_MAX_BATCH_SIZE', 1000),
+        })
+
+    @socketio.on('disconnect', namespace=DEVICE_NAMESPACE)
+    def handle_device_disconnect(*args):
+        with _sessions_lock:
+            device = _device_sessions.pop(request.sid, None)
+        if device:
+            logger.info(f"Device disconnected: {device['name']} (token {device['id']})")
+
+    @socketio.on('reading', namespace=DEVICE_NAMESPACE)
+    def handle_device_reading(data):
+        """Ingest a batch and return the ack payload"""
+        with _sessions_lock:
+            device = _device_sessions.get(request.sid)
+        if not device:
+            return {'ok': False, 'error': 'unauthorized'}
+        if not is_device_token_active(device['id']):
+            with _sessions_lock:
+                _device_sessions.pop(request.sid, None)
+            logger.info(f"Disconnecting device {device['name']}: token {device['id']} revoked")
+            disconnect()
+            return {'ok': False, 'error': 'token revoked'}
+
+        if isinstance(data, dict):
+            seq = data.get('seq')
+            batch = data['readings'] if 'readings' in data else [data]
+        else:
+            seq = None
+            batch = data
+        if not isinstance(batch, list):
+            return {'ok': False, 'seq': seq, 'error': 'readings must be a list'}
+
+        max_batch = current_app.config.get('INGEST_MAX_BATCH_SIZE', 1000)
+        if len(batch) > max_batch:
+            return {'ok': False, 'seq': seq, 'error': f'batch too large (max {max_batch})'}
+
+        try:
+            result = _ingest_for_device(device, batch)
+        except Exception as e:
+            logger.error(f"Device ingest failed for token {device['id']}: {e}")
+            return {'ok': False, 'seq': seq, 'error': 'ingest failed'}
+
+        return {
+            'ok': True,
+            'seq': seq,
+            'accepted': result['accepted'],
+            'duplicates': result['duplicates'],
+            'rejected': result['rejected'],
+            'live_seq': result['seq'],
+        }
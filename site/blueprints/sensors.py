@@ -1,7 +1,12 @@
 import os
 import time
+from datetime import datetime, timezone
 from flask import Blueprint, jsonify, request, session
 from utils.auth_decorators import login_required
+from utils.compression import compression_settings, interpolate
+from utils.downsample import downsample_rows, parse_max_points, rollup_rows
+from utils.online_stats import series_key
+from utils.search_index import search_service
 from database import (
     get_db,
     create_sensor,
@@ -20,12 +25,26 @@ from database import (
 sensors_bp = Blueprint("sensors", __name__, url_prefix="/api")
 
 _sensor_mode = os.getenv("USE_SCD30", "1")
+
+# Upper bound on points produced by ?resample
+MAX_RESAMPLED_POINTS = 20000
 _sensor_last_read = 0
 
 from utils.logger import configure_logging
 logger = configure_logging()
 
 
+def _scd30_registry():
+    """Shared SCD30 handle registry (one initialized handle per bus/address)"""
+    try:
+        # Try relative import first (when running from site directory)
+        from sensors.scd30 import get_scd30
+    except ImportError:
+        # Fallback to app-relative import
+        from app.sensors.scd30 import get_scd30
+    return get_scd30
+
+
 def _safe_audit(user_id, action, entity_type, entity_id, field, value, ip_address):
     """Audit logging with proper error handling instead of silent failures"""
     try:
@@ -44,16 +63,9 @@ def sensor_status():
     driver_name = "None"
     
     try:
-        # Try relative import first (when running from site directory)
-        try:
-            from sensors.scd30 import SCD30
-        except ImportError:
-            # Fallback to app-relative import
-            from app.sensors.scd30 import SCD30
-        
-        scd30 = SCD30()
+        scd30 = _scd30_registry()()
         reading = scd30.read()
-        if reading is not None:
+        if reading is not None and not scd30.simulated:
             available = True
             _sensor_last_read = time.time()
             driver_name = "SCD30"
@@ -129,9 +141,9 @@ def test_sensor():
         address = int(address, 16)
 
     try:
-        from app.sensors.scd30 import SCD30
-
-        scd30 = SCD30(bus=bus, address=address)
+        scd30 = _scd30_registry()(bus=bus, address=address)
+        if scd30.simulated:
+            return jsonify({"success": False, "error": "Pilote SCD30 non installé"}), 400
         reading = scd30.read()
 
         if reading and "co2" in reading:
@@ -172,12 +184,17 @@ def create_new_sensor():
 
     if not name:
         return jsonify({"error": "Sensor name is required"}), 400
+    try:
+        compression_settings(config)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     sensor_id = create_sensor(user_id, name, sensor_type, interface, config)
     if not sensor_id:
         return jsonify({"error": "Sensor name already exists for this user"}), 400
 
     _safe_audit(user_id, "SENSOR_CREATED", "sensor", sensor_id, None, f"{name} ({sensor_type})", request.remote_addr)
+    search_service.refresh("sensor", sensor_id)
     sensor = get_sensor_by_id(sensor_id, user_id)
     return jsonify(sensor), 201
 
@@ -192,6 +209,10 @@ def update_sensor_config(sensor_id):
     sensor = get_sensor_by_id(sensor_id, user_id)
     if not sensor:
         return jsonify({"error": "Sensor not found or not accessible"}), 404
+    try:
+        compression_settings(data.get("config"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     update_sensor(
         sensor_id,
@@ -204,6 +225,7 @@ def update_sensor_config(sensor_id):
     )
 
     _safe_audit(user_id, "SENSOR_UPDATED", "sensor", sensor_id, None, data.get("name") or sensor["name"], request.remote_addr)
+    search_service.refresh("sensor", sensor_id)
     updated_sensor = get_sensor_by_id(sensor_id, user_id)
     return jsonify(updated_sensor)
 
@@ -219,6 +241,7 @@ def delete_sensor_endpoint(sensor_id):
 
     delete_sensor(sensor_id, user_id)
     _safe_audit(user_id, "SENSOR_DELETED", "sensor", sensor_id, sensor["name"], None, request.remote_addr)
+    search_service.refresh("sensor", sensor_id)
     return jsonify({"success": True, "message": "Sensor deleted"})
 
 
@@ -233,13 +256,13 @@ def test_sensor_connection():
 
     if sensor_type == "scd30" and interface == "i2c":
         try:
-            from app.sensors.scd30 import SCD30
-
             bus = config.get("bus", 1)
             address = config.get("address", "0x61")
             if isinstance(address, str):
                 address = int(address, 16)
-            scd30 = SCD30(bus=int(bus), address=address)
+            scd30 = _scd30_registry()(bus=int(bus), address=address)
+            if scd30.simulated:
+                return jsonify({"success": False, "error": "Pilote SCD30 non installé"})
             reading = scd30.read()
             if reading and "co2" in reading:
                 return jsonify(
@@ -264,18 +287,82 @@ def test_sensor_connection():
 @sensors_bp.route("/sensor/<int:sensor_id>/readings")
 @login_required
 def get_sensor_readings_endpoint(sensor_id):
-    """Get readings for a specific sensor (last 24 hours)"""
+    """Get readings for a specific sensor (last 24 hours)
+
+    ``?resample=<seconds>`` returns a regular series interpolated between the
+    stored points (sensors with ingest compression only store changes).
+    ``?max_points=<n>`` downsamples the (resampled) readings with LTTB; without
+    ``resample`` and with points at least a minute apart, the readings are
+    bucket means (with min/max) read from the sensor's chart rollups instead.
+    """
     user_id = session.get("user_id")
     hours = request.args.get("hours", 24, type=int)
+    resample = request.args.get("resample", type=int)
+    try:
+        max_points = parse_max_points(request.args.get("max_points"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
     sensor = get_sensor_by_id(sensor_id, user_id)
     if not sensor:
         return jsonify({"error": "Sensor not found"}), 404
 
-    readings = get_sensor_readings(sensor_id, hours)
     latest = get_sensor_latest_reading(sensor_id)
+    if resample is None:
+        now = time.time()
+        buckets = rollup_rows(series_key(sensor_id=sensor_id), now - hours * 3600, now, max_points,
+                              value_key="co2")
+        if buckets is not None:
+            return jsonify({"sensor_id": sensor_id, "sensor_name": sensor["name"], "readings": buckets[::-1],
+                            "latest": latest, "count": len(buckets), "downsampled_from": None,
+                            "resolution": buckets[0]["resolution"]})
+
+    readings = get_sensor_readings(sensor_id, hours)
+
+    if resample is not None:
+        if resample < 1:
+            return jsonify({"error": "resample must be a positive number of seconds"}), 400
+        try:
+            readings = _resample_readings(readings, resample)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
 
-    return jsonify({"sensor_id": sensor_id, "sensor_name": sensor["name"], "readings": readings, "latest": latest, "count": len(readings)})
+    total = len(readings)
+    readings = downsample_rows(readings, max_points, value_key="co2")
+
+    return jsonify({"sensor_id": sensor_id, "sensor_name": sensor["name"], "readings": readings, "latest": latest,
+                    "count": len(readings), "downsampled_from": total if len(readings) < total else None})
+
+
+def _resample_readings(readings, step):
+    """Interpolate stored sensor rows (newest first) onto a regular grid, newest first
+
+    Raises:
+        ValueError: the grid would exceed MAX_RESAMPLED_POINTS.
+    """
+    points = []
+    for r in reversed(readings):
+        try:
+            t = datetime.strptime(r["timestamp"][:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc).timestamp()
+        except (TypeError, ValueError):
+            continue
+        points.append((t, {"co2": r["co2"], "temperature": r["temperature"], "humidity": r["humidity"]}))
+    points.sort(key=lambda p: p[0])
+    if points and (points[-1][0] - points[0][0]) / step >= MAX_RESAMPLED_POINTS:
+        raise ValueError(f"resample too fine (max {MAX_RESAMPLED_POINTS} points)")
+
+    resampled = []
+    for t, values in interpolate(points, step):
+        resampled.append({
+            "sensor_id": readings[0]["sensor_id"],
+            "timestamp": datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            "co2": round(values["co2"], 1) if values["co2"] is not None else None,
+            "temperature": values["temperature"],
+            "humidity": values["humidity"],
+            "interpolated": True,
+        })
+    resampled.reverse()
+    return resampled
 
 
 @sensors_bp.route("/sensor/<int:sensor_id>/thresholds", methods=["GET"])
@@ -17,6 +17,37 @@ class BaseConfig:
     RATE_LIMITS_DAY = os.getenv('RATE_LIMITS_DAY', '500 per day')
     RATE_LIMITS_HOUR = os.getenv('RATE_LIMITS_HOUR', '150 per hour')
 
+    # Live stream (SSE) tuning
+    LIVE_STREAM_HEARTBEAT_SECONDS = int(os.getenv('LIVE_STREAM_HEARTBEAT_SECONDS', '15'))
+    LIVE_STREAM_RETRY_MS = int(os.getenv('LIVE_STREAM_RETRY_MS', '3000'))
+    LIVE_LONG_POLL_MAX_WAIT_SECONDS = int(os.getenv('LIVE_LONG_POLL_MAX_WAIT_SECONDS', '30'))
+
+    # Sensor ingestion (HTTP batches and the /device Socket.IO namespace)
+    INGEST_MAX_BATCH_SIZE = int(os.getenv('INGEST_MAX_BATCH_SIZE', '1000'))
+    INGEST_MAX_BODY_BYTES = int(os.getenv('INGEST_MAX_BODY_BYTES', str(10 * 1024 * 1024)))
+
+    # Line-protocol listener (ingest_listener.py); a port of 0 disables that transport
+    INGEST_LISTENER_HOST = os.getenv('INGEST_LISTENER_HOST', '0.0.0.0')
+    INGEST_LISTENER_UDP_PORT = int(os.getenv('INGEST_LISTENER_UDP_PORT', '8094'))
+    INGEST_LISTENER_TCP_PORT = int(os.getenv('INGEST_LISTENER_TCP_PORT', '8094'))
+    INGEST_LISTENER_FLUSH_SIZE = int(os.getenv('INGEST_LISTENER_FLUSH_SIZE', '5000'))
+    INGEST_LISTENER_FLUSH_INTERVAL_MS = int(os.getenv('INGEST_LISTENER_FLUSH_INTERVAL_MS', '500'))
+    INGEST_LISTENER_TOKEN_TTL_SECONDS = int(os.getenv('INGEST_LISTENER_TOKEN_TTL_SECONDS', '60'))
+    # Readings queued but not yet written; beyond this new readings are dropped
+    INGEST_LISTENER_MAX_PENDING = int(os.getenv('INGEST_LISTENER_MAX_PENDING', '200000'))
+
+    # Fitted ML models (utils.model_registry); empty directory means data/models
+    MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', '')
+    MODEL_CACHE_SIZE = int(os.getenv('MODEL_CACHE_SIZE', '32'))
+    MODEL_RETRAIN_MIN_READINGS = int(os.getenv('MODEL_RETRAIN_MIN_READINGS', '500'))
+    MODEL_RETRAIN_INTERVAL_MINUTES = int(os.getenv('MODEL_RETRAIN_INTERVAL_MINUTES', '30'))
+    FORECAST_INTERVAL_MINUTES = int(os.getenv('FORECAST_INTERVAL_MINUTES', '30'))
+
+    # Worker processes for CPU-bound analytics and report rendering (utils.task_pool)
+    TASK_POOL_WORKERS = int(os.getenv('TASK_POOL_WORKERS', '2'))
+    TASK_POOL_MAX_QUEUE = int(os.getenv('TASK_POOL_MAX_QUEUE', '8'))
+    TASK_POOL_TIMEOUT_SECONDS = int(os.getenv('TASK_POOL_TIMEOUT_SECONDS', '120'))
+
 class DevelopmentConfig(BaseConfig):
     DEBUG = True
 
@@ -1,4 +1,6 @@
+import hashlib
 import os
+import secrets
 import sqlite3
 import threading
 from queue import Queue, Empty, Full
@@ -84,7 +86,8 @@ def init_db():
         ("temperature", "REAL"),
         ("humidity", "REAL"),
         ("source", "TEXT DEFAULT 'live'"),
-        ("user_id", "INTEGER")
+        ("user_id", "INTEGER"),
+        ("reading_uid", "TEXT")
     ]:
         try:
             cur.execute(f"ALTER TABLE co2_readings ADD COLUMN {column_def[0]} {column_def[1]}")
@@ -110,6 +113,198 @@ def init_db():
         ON co2_readings(user_id)
     """)
 
+    # Per-user time range scans (period comparisons aggregate a whole range in one pass)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_co2_user_time 
+        ON co2_readings(user_id, timestamp)
+    """)
+
+    # Idempotent ingestion: client reading ids are unique per user
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_co2_reading_uid 
+        ON co2_readings(user_id, reading_uid) WHERE reading_uid IS NOT NULL
+    """)
+
+    # Keys of keyed readings dropped by ingest compression: they have no
+    # co2_readings row, so retries are deduplicated against this table too
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_keys (
+            user_id INTEGER,
+            reading_uid TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            PRIMARY KEY (user_id, reading_uid)
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_ingest_keys_time ON ingest_keys(timestamp)")
+
+    # Daily ingest counters (e.g. duplicate readings dropped at ingest)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingest_counters (
+            day TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, name)
+        )
+    """)
+
+    # Online per-series summaries (utils.online_stats): Welford moments and a
+    # t-digest per hourly/daily bucket, plus the live EWMA of each series
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS series_stats (
+            series TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            mean REAL,
+            m2 REAL,
+            min REAL,
+            max REAL,
+            digest TEXT,
+            PRIMARY KEY (series, resolution, bucket)
+        )
+    """)
+
+    # Live EWMA of each series, one row per writing process (utils.online_stats)
+    ewma_columns = [row[1] for row in cur.execute("PRAGMA table_info(series_ewma)")]
+    if ewma_columns and "writer" not in ewma_columns:
+        cur.execute("ALTER TABLE series_ewma RENAME TO series_ewma_old")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS series_ewma (
+            series TEXT NOT NULL,
+            writer TEXT NOT NULL DEFAULT '',
+            value REAL,
+            variance REAL,
+            count INTEGER NOT NULL DEFAULT 0,
+            last_ts REAL,
+            PRIMARY KEY (series, writer)
+        )
+    """)
+    if ewma_columns and "writer" not in ewma_columns:
+        cur.execute("""
+            INSERT INTO series_ewma (series, value, variance, count, last_ts)
+            SELECT series, value, variance, count, last_ts FROM series_ewma_old
+        """)
+        cur.execute("DROP TABLE series_ewma_old")
+
+    # Anomalies flagged by the streaming detector (utils.anomaly_stream)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS anomalies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            sensor_id INTEGER,
+            timestamp DATETIME NOT NULL,
+            ppm REAL NOT NULL,
+            kind TEXT NOT NULL,
+            checks TEXT,
+            score REAL NOT NULL,
+            severity TEXT NOT NULL,
+            baseline REAL,
+            detected_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_anomalies_user_time
+        ON anomalies(user_id, timestamp)
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_anomalies_sensor_time
+        ON anomalies(sensor_id, timestamp)
+    """)
+
+    # Fitted ML model versions (utils.model_registry); files live under data/models
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ml_models (
+            scope TEXT NOT NULL,
+            model_type TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            trained_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            window_start DATETIME,
+            window_end DATETIME,
+            samples INTEGER NOT NULL DEFAULT 0,
+            metrics TEXT,
+            PRIMARY KEY (scope, model_type, version)
+        )
+    """)
+
+    # Hourly CO2 forecasts per series, replaced by the forecast job (utils.forecast)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS forecasts (
+            series TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            predicted REAL NOT NULL,
+            lower REAL NOT NULL,
+            upper REAL NOT NULL,
+            generated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (series, ts)
+        )
+    """)
+
+    # Tile pyramid of count/sum/min/max per series, resolution and bucket (utils.rollups)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS series_rollups (
+            series TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            PRIMARY KEY (series, resolution, bucket)
+        ) WITHOUT ROWID
+    """)
+
+    # Epoch from which a series' rollups hold all of its readings (utils.rollups backfill)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS series_rollup_coverage (
+            series TEXT PRIMARY KEY,
+            since INTEGER NOT NULL
+        )
+    """)
+
+    # Time-weighted exposure counters per series and UTC day (utils.exposure)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS exposure_daily (
+            series TEXT NOT NULL,
+            day TEXT NOT NULL,
+            readings INTEGER NOT NULL,
+            ppm_sum REAL NOT NULL,
+            min REAL NOT NULL,
+            max REAL NOT NULL,
+            seconds_good REAL NOT NULL,
+            seconds_moderate REAL NOT NULL,
+            seconds_high REAL NOT NULL,
+            seconds_critical REAL NOT NULL,
+            ppm_seconds REAL NOT NULL,
+            critical_ppm_hours REAL NOT NULL,
+            PRIMARY KEY (series, day)
+        ) WITHOUT ROWID
+    """)
+
+    # Reporting sensors (0: no sensor) per exposure series and day, to turn summed time into wall-clock time
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS exposure_day_sensors (
+            series TEXT NOT NULL,
+            day TEXT NOT NULL,
+            sensor_id INTEGER NOT NULL,
+            PRIMARY KEY (series, day, sensor_id)
+        ) WITHOUT ROWID
+    """)
+
+    # Clock of the last counted reading per series and reporting sensor (0: no sensor)
+    if "sensor_id" not in [row[1] for row in cur.execute("PRAGMA table_info(exposure_state)")]:
+        cur.execute("DROP TABLE IF EXISTS exposure_state")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS exposure_state (
+            series TEXT NOT NULL,
+            sensor_id INTEGER NOT NULL,
+            last_ts REAL NOT NULL,
+            PRIMARY KEY (series, sensor_id)
+        )
+    """)
+
     # Settings persistence
     cur.execute("""
         CREATE TABLE IF NOT EXISTS settings (
@@ -474,6 +669,17 @@ def init_db():
         ON sensor_readings(sensor_id, timestamp DESC)
     """)
 
+    try:
+        cur.execute("ALTER TABLE sensor_readings ADD COLUMN reading_uid TEXT")
+    except Exception:
+        # Column already exists
+        pass
+
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_sensor_readings_uid 
+        ON sensor_readings(sensor_id, reading_uid) WHERE reading_uid IS NOT NULL
+    """)
+
     # Teams and collaboration tables
     cur.execute("""
         CREATE TABLE IF NOT EXISTS teams (
@@ -695,9 +901,107 @@ def init_db():
         ON collaboration_activity(created_at DESC)
     """)
 
+    # Device ingestion tokens (gateways and always-connected sensors)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS device_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            sensor_id INTEGER,
+            name TEXT NOT NULL,
+            token_hash TEXT UNIQUE NOT NULL,
+            revoked BOOLEAN DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_used DATETIME,
+            FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+            FOREIGN KEY(sensor_id) REFERENCES user_sensors(id) ON DELETE CASCADE
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_device_tokens_user_id 
+        ON device_tokens(user_id)
+    """)
+
+    # Comments on individual sensor readings (also created by CollaborationManager)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reading_comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reading_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            comment_text TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP,
+            FOREIGN KEY (reading_id) REFERENCES sensor_readings(id),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reading_comments_reading_id 
+        ON reading_comments(reading_id)
+    """)
+
+    _create_fulltext_indexes(cur)
+
     db.commit()
     db.close()
 
+
+# Full-text indexes: {table: indexed columns}. Each table gets an external-content
+# FTS5 table "<table>_fts" (rowid = id) kept in sync by triggers.
+FULLTEXT_TABLES = {
+    'audit_logs': ('username', 'action', 'entity_type', 'details'),
+    'dashboard_comments': ('comment_text',),
+    'team_activity': ('action', 'description'),
+    'reading_comments': ('comment_text',),
+}
+
+
+def _create_fulltext_indexes(cur):
+    """Create the FTS5 tables and their sync triggers, indexing existing rows once.
+
+    Skipped when SQLite is built without FTS5 (searches then fall back to LIKE).
+    """
+    for table, columns in FULLTEXT_TABLES.items():
+        fts = f"{table}_fts"
+        names = ', '.join(columns)
+        new = ', '.join(f"new.{column}" for column in columns)
+        old = ', '.join(f"old.{column}" for column in columns)
+        exists = cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts,)).fetchone()
+        try:
+            cur.execute(f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {names}, content='{table}', content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """)
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new});
+                END
+            """)
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old});
+                END
+            """)
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} BEGIN
+                    INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', old.id, {old});
+                    INSERT INTO {fts} (rowid, {names}) VALUES (new.id, {new});
+                END
+            """)
+            if not exists:
+                cur.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(f"[init_db] Full-text index {fts} unavailable: {e}")
+            for statement in (f"DROP TRIGGER IF EXISTS {fts}_insert", f"DROP TRIGGER IF EXISTS {fts}_delete",
+                              f"DROP TRIGGER IF EXISTS {fts}_update", f"DROP TABLE IF EXISTS {fts}"):
+                try:
+                    cur.execute(statement)
+                except sqlite3.OperationalError:
+                    pass
+
 def cleanup_old_data(days_to_keep=90):
     """Remove CO₂ readings older than specified days (default 90 days)"""
     db = get_db()
@@ -709,6 +1013,10 @@ def cleanup_old_data(days_to_keep=90):
     """, (days_to_keep,))
     
     deleted_count = cur.rowcount
+    cur.execute("""
+        DELETE FROM ingest_keys
+        WHERE timestamp < datetime('now', '-' || ? || ' days')
+    """, (days_to_keep,))
     db.commit()
     db.close()
     
@@ -1925,6 +2233,41 @@ def log_sensor_reading(sensor_id, co2, temperature=None, humidity=None):
     db.commit()
     db.close()
 
+def record_sensor_poll_results(readings, availability, analyze=None):
+    """Write one polling cycle in a single transaction
+
+    Args:
+        readings: iterable of (sensor_id, co2, temperature, humidity, timestamp)
+        availability: iterable of (sensor_id, available): True for each sensor read
+            successfully (also refreshes last_read), False for a sensor entering the
+            failed state; failing reads before that leave the row untouched
+        analyze: optional callable(db) run on the same connection before the commit
+            (anomalies, rollups and exposure counters of the cycle)
+    """
+    readings = list(readings)
+    availability = list(availability)
+    db = get_db()
+    try:
+        if readings:
+            db.executemany(
+                """INSERT INTO sensor_readings (sensor_id, co2, temperature, humidity, timestamp)
+                   VALUES (?, ?, ?, ?, ?)""",
+                readings
+            )
+        if availability:
+            db.executemany(
+                """UPDATE user_sensors
+                   SET available = ?,
+                       last_read = CASE WHEN ? THEN CURRENT_TIMESTAMP ELSE last_read END
+                   WHERE id = ?""",
+                [(bool(available), bool(available), sensor_id) for sensor_id, available in availability]
+            )
+        if analyze is not None:
+            analyze(db)
+        db.commit()
+    finally:
+        db.close()
+
 def get_sensor_readings(sensor_id, hours=24):
     """Get sensor readings from last N hours"""
     db = get_db()
@@ -1968,6 +2311,119 @@ def cleanup_old_sensor_readings(days_to_keep=90):
     db.close()
     return deleted
 
+# ================================================================================
+#                      DEVICE INGESTION TOKENS
+# ================================================================================
+
+def _hash_device_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def create_device_token(user_id, name, sensor_id=None):
+    """Create an ingestion token for a device; returns (token_id, raw_token).
+
+    Only the SHA-256 of the token is stored, so the raw value is shown once.
+    """
+    token = secrets.token_urlsafe(32)
+    db = get_db()
+    cur = db.execute(
+        """INSERT INTO device_tokens (user_id, sensor_id, name, token_hash)
+           VALUES (?, ?, ?, ?)""",
+        (user_id, sensor_id, name, _hash_device_token(token))
+    )
+    token_id = cur.lastrowid
+    db.commit()
+    db.close()
+    return token_id, token
+
+# Minimum age of a device token's last_used before it is rewritten
+DEVICE_LAST_USED_INTERVAL_SECONDS = int(os.getenv("DEVICE_LAST_USED_INTERVAL_SECONDS", "60"))
+
+def get_device_by_token(token):
+    """Resolve a raw device token to its (non-revoked) device record.
+
+    ``last_used`` is only rewritten once it is older than
+    DEVICE_LAST_USED_INTERVAL_SECONDS, so authenticating every batch does not
+    take the write lock.
+    """
+    if not token:
+        return None
+    db = get_db()
+    row = db.execute(
+        """SELECT id, user_id, sensor_id, name,
+                  last_used IS NULL OR last_used < datetime('now', ?) AS stale
+           FROM device_tokens
+           WHERE token_hash = ? AND revoked = 0""",
+        (f"-{DEVICE_LAST_USED_INTERVAL_SECONDS} seconds", _hash_device_token(token))
+    ).fetchone()
+    if row and row["stale"]:
+        db.execute("UPDATE device_tokens SET last_used = CURRENT_TIMESTAMP WHERE id = ?", (row["id"],))
+        db.commit()
+    db.close()
+    if not row:
+        return None
+    return {key: row[key] for key in ("id", "user_id", "sensor_id", "name")}
+
+def get_user_device_tokens(user_id):
+    """List a user's device tokens (without secrets)"""
+    db = get_db()
+    rows = db.execute(
+        """SELECT id, sensor_id, name, revoked, created_at, last_used
+           FROM device_tokens WHERE user_id = ? ORDER BY created_at DESC""",
+        (user_id,)
+    ).fetchall()
+    db.close()
+    return [dict(r) for r in rows]
+
+def revoke_device_token(token_id, user_id):
+    """Revoke a device token owned by user_id"""
+    db = get_db()
+    cur = db.execute(
+        "UPDATE device_tokens SET revoked = 1 WHERE id = ? AND user_id = ?",
+        (token_id, user_id)
+    )
+    db.commit()
+    db.close()
+    return cur.rowcount > 0
+
+def is_device_token_active(token_id):
+    """Whether a device token still exists and is not revoked"""
+    db = get_db()
+    row = db.execute("SELECT 1 FROM device_tokens WHERE id = ? AND revoked = 0", (token_id,)).fetchone()
+    db.close()
+    return row is not None
+
+# ================================================================================
+#                      ANOMALIES
+# ================================================================================
+
+def get_anomalies(user_id=None, sensor_id=None, days=7, limit=1000, min_score=0):
+    """Anomalies recorded by the streaming detector, newest first
+
+    Args:
+        user_id: owner filter (None: any user)
+        sensor_id: restrict to one sensor (None: all of the user's readings)
+        days: look-back window
+        limit: maximum rows returned
+        min_score: minimum score (1.0 = at the detection limit)
+    """
+    clauses, params = ["timestamp >= datetime('now', ?)", "score >= ?"], [f"-{int(days)} days", min_score]
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if sensor_id is not None:
+        clauses.append("sensor_id = ?")
+        params.append(sensor_id)
+    db = get_db()
+    rows = db.execute(f"""
+        SELECT id, sensor_id, timestamp, ppm, kind, checks, score, severity, baseline
+        FROM anomalies
+        WHERE {' AND '.join(clauses)}
+        ORDER BY timestamp DESC
+        LIMIT ?
+    """, (*params, int(limit))).fetchall()
+    db.close()
+    return [dict(row) for row in rows]
+
 # ================================================================================
 #                      SENSOR THRESHOLD MANAGEMENT
 # ================================================================================
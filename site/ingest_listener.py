@@ -0,0 +1,322 @@
+"""
+Line-protocol ingestion listener (UDP + TCP) for bulk sensor fleets.
+
+Runs next to app.py and writes through the same pipeline as /api/readings
+(utils.ingest), without going through Flask:
+
+    python ingest_listener.py [--host 0.0.0.0] [--udp-port 8094] [--tcp-port 8094]
+
+Protocol (UTF-8, one reading per line, fields separated by whitespace):
+
+    AUTH <device token>
+    <sensor_id> <ts> <ppm> [<temperature> [<humidity>]]
+
+``ts`` is epoch seconds/milliseconds or ISO-8601 UTC; ``-`` leaves a field
+empty (``-`` as ts means "now"). Blank lines and lines starting with ``#`` are
+ignored.
+
+- TCP: the first line of a connection must be ``AUTH``; the server answers
+  ``OK`` or ``ERR unauthorized`` (and closes). Invalid lines are answered with
+  ``ERR <line number> <reason>``; valid lines get no reply.
+- UDP: every datagram starts with an ``AUTH`` line followed by readings.
+  Nothing is sent back.
+
+Tokens are the device tokens managed under /api/devices/tokens. A token bound to
+a sensor may only write that sensor; a user-level token may write any of the
+user's sensors. Token lookups are cached for INGEST_LISTENER_TOKEN_TTL_SECONDS,
+so revocation takes effect within that delay; unknown tokens are cached for a
+few seconds only, in a bounded LRU. Cache misses are looked up in a worker
+thread so a slow database never stalls the event loop. Readings are coalesced
+by an IngestBatcher and stored in large transactions; when more than
+INGEST_LISTENER_MAX_PENDING readings are waiting, new ones are dropped and
+counted in the ingest stats.
+"""
+
+import argparse
+import asyncio
+import signal
+import time
+from collections import OrderedDict
+
+from config import get_config
+from database import get_db, get_device_by_token, init_db
+from utils.ingest import IngestBatcher
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+STATS_INTERVAL_SECONDS = 60
+READ_SIZE = 64 * 1024
+MAX_LINE_BYTES = 4096
+
+
+class TokenCache:
+    """Device token -> (device, writable sensor ids), cached for ``ttl`` seconds
+
+    Unknown tokens are cached for ``negative_ttl`` seconds so a client retrying
+    a bad token does not hit the database on every datagram; at most
+    ``max_entries`` tokens are kept (least recently used first out).
+    """
+
+    def __init__(self, ttl=60, negative_ttl=5, max_entries=10000):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, token):
+        """Cached (device, sensors) for ``token``, or None when it must be looked up"""
+        entry = self._entries.get(token)
+        if entry and entry[2] > time.monotonic():
+            self._entries.move_to_end(token)
+            return entry[0], entry[1]
+        return None
+
+    async def resolve(self, token):
+        """(device, sensors) for ``token``; cache misses query SQLite in the default executor"""
+        cached = self.get(token)
+        if cached is not None:
+            return cached
+        device, sensors = await asyncio.get_running_loop().run_in_executor(None, self._lookup, token)
+        self._entries[token] = (device, sensors,
+                                time.monotonic() + (self.ttl if device else self.negative_ttl))
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return device, sensors
+
+    @staticmethod
+    def _lookup(token):
+        device = get_device_by_token(token)
+        sensors = frozenset()
+        if device:
+            if device['sensor_id'] is not None:
+                sensors = frozenset([device['sensor_id']])
+            else:
+                db = get_db()
+                try:
+                    sensors = frozenset(row['id'] for row in db.execute(
+                        "SELECT id FROM user_sensors WHERE user_id = ?", (device['user_id'],)
+                    ).fetchall())
+                finally:
+                    db.close()
+        return device, sensors
+
+
+def parse_line(line):
+    """Parse ``<sensor_id> <ts> <ppm> [<temperature> [<humidity>]]``.
+
+    Returns (sensor_id, reading dict for utils.ingest).
+
+    Raises:
+        ValueError: malformed line.
+    """
+    fields = line.split()
+    if not 3 <= len(fields) <= 5:
+        raise ValueError("expected: sensor_id ts ppm [temperature [humidity]]")
+    try:
+        sensor_id = int(fields[0])
+    except ValueError:
+        raise ValueError("sensor_id must be an integer")
+
+    ts = fields[1]
+    if ts == '-':
+        ts = None
+    else:
+        try:
+            ts = float(ts)
+        except ValueError:
+            pass  # ISO-8601, validated by the ingest pipeline
+
+    reading = {'ppm': fields[2], 'ts': ts}
+    if len(fields) > 3 and fields[3] != '-':
+        reading['temperature'] = fields[3]
+    if len(fields) > 4 and fields[4] != '-':
+        reading['humidity'] = fields[4]
+    return sensor_id, reading
+
+
+class LineProtocolListener:
+    """Parses line-protocol traffic and queues readings on an IngestBatcher"""
+
+    def __init__(self, batcher, tokens):
+        self.batcher = batcher
+        self.tokens = tokens
+        self.stats = {'lines': 0, 'invalid': 0, 'unauthorized': 0}
+        self._lookups = set()  # datagrams waiting for a token lookup
+
+    @staticmethod
+    def parse_auth(line):
+        parts = line.split(None, 1)
+        if len(parts) == 2 and parts[0].upper() == 'AUTH':
+            return parts[1].strip()
+        return None
+
+    def handle_lines(self, device, sensors, lines, first_line_no=1):
+        """Queue readings from ``lines``; returns [(line number, error)] for invalid ones"""
+        errors = []
+        by_sensor = {}
+        for line_no, line in enumerate(lines, first_line_no):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            self.stats['lines'] += 1
+            try:
+                sensor_id, reading = parse_line(line)
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+                continue
+            if sensor_id not in sensors:
+                errors.append((line_no, 'unknown sensor_id'))
+                continue
+            by_sensor.setdefault(sensor_id, []).append(reading)
+
+        device_key = f"token{device['id']}"
+        for sensor_id, readings in by_sensor.items():
+            self.batcher.submit(device['user_id'], readings, sensor_id=sensor_id, device_key=device_key)
+        self.stats['invalid'] += len(errors)
+        return errors
+
+    # ------------------------------------------------------------------ UDP
+
+    def datagram_received(self, data):
+        """Handle a datagram; returns a task when its token has to be looked up first"""
+        lines = data.decode('utf-8', errors='replace').splitlines()
+        token = self.parse_auth(lines[0]) if lines else None
+        if not token:
+            self.stats['unauthorized'] += 1
+            return None
+        cached = self.tokens.get(token)
+        if cached is not None:
+            self._handle_datagram(cached, lines)
+            return None
+        task = asyncio.get_running_loop().create_task(self._resolve_datagram(token, lines))
+        self._lookups.add(task)
+        task.add_done_callback(self._lookups.discard)
+        return task
+
+    async def _resolve_datagram(self, token, lines):
+        try:
+            resolved = await self.tokens.resolve(token)
+        except Exception as e:
+            logger.error(f"Device token lookup failed, datagram dropped: {e}")
+            return
+        self._handle_datagram(resolved, lines)
+
+    def _handle_datagram(self, resolved, lines):
+        device, sensors = resolved
+        if not device:
+            self.stats['unauthorized'] += 1
+            return
+        self.handle_lines(device, sensors, lines[1:], first_line_no=2)
+
+    # ------------------------------------------------------------------ TCP
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        try:
+            first = await reader.readline()
+            token = self.parse_auth(first.decode('utf-8', errors='replace'))
+            device, sensors = await self.tokens.resolve(token) if token else (None, None)
+            if not device:
+                self.stats['unauthorized'] += 1
+                writer.write(b'ERR unauthorized\n')
+                await writer.drain()
+                return
+            writer.write(b'OK\n')
+            logger.info(f"Line-protocol client {peer} authenticated as device {device['id']}")
+
+            line_no = 1
+            tail = b''
+            while True:
+                chunk = await reader.read(READ_SIZE)
+                if not chunk:
+                    complete, tail = tail, b''
+                else:
+                    # Only complete lines are parsed; the tail waits for the next read
+                    complete, _, tail = (tail + chunk).rpartition(b'\n')
+                    if len(tail) > MAX_LINE_BYTES:
+                        writer.write(b'ERR line too long\n')
+                        await writer.drain()
+                        return
+                if complete:
+                    lines = complete.decode('utf-8', errors='replace').split('\n')
+                    errors = self.handle_lines(device, sensors, lines, first_line_no=line_no + 1)
+                    line_no += len(lines)
+                    if errors:
+                        writer.write(''.join(f"ERR {n} {msg}\n" for n, msg in errors).encode('utf-8'))
+                        await writer.drain()
+                if not chunk:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class _UDPProtocol(asyncio.DatagramProtocol):
+    def __init__(self, listener):
+        self.listener = listener
+
+    def datagram_received(self, data, addr):
+        self.listener.datagram_received(data)
+
+
+async def serve(host, udp_port, tcp_port, batcher, tokens):
+    listener = LineProtocolListener(batcher, tokens)
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: rely on KeyboardInterrupt
+
+    transport = server = None
+    if udp_port:
+        transport, _ = await loop.create_datagram_endpoint(lambda: _UDPProtocol(listener), local_addr=(host, udp_port))
+        logger.info(f"Line-protocol UDP listener on {host}:{udp_port}")
+    if tcp_port:
+        server = await asyncio.start_server(listener.handle_connection, host, tcp_port)
+        logger.info(f"Line-protocol TCP listener on {host}:{tcp_port}")
+
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), STATS_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                logger.info(f"Line-protocol listener stats: {listener.stats} ingest={batcher.stats}")
+    finally:
+        if transport is not None:
+            transport.close()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+
+def main(argv=None):
+    config = get_config()
+    parser = argparse.ArgumentParser(description="Aerium line-protocol ingestion listener")
+    parser.add_argument('--host', default=config.INGEST_LISTENER_HOST)
+    parser.add_argument('--udp-port', type=int, default=config.INGEST_LISTENER_UDP_PORT, help="0 disables UDP")
+    parser.add_argument('--tcp-port', type=int, default=config.INGEST_LISTENER_TCP_PORT, help="0 disables TCP")
+    parser.add_argument('--flush-size', type=int, default=config.INGEST_LISTENER_FLUSH_SIZE)
+    parser.add_argument('--flush-interval-ms', type=int, default=config.INGEST_LISTENER_FLUSH_INTERVAL_MS)
+    args = parser.parse_args(argv)
+
+    init_db()
+    batcher = IngestBatcher(flush_size=args.flush_size, flush_interval=args.flush_interval_ms / 1000.0,
+                            max_pending=config.INGEST_LISTENER_MAX_PENDING)
+    batcher.start()
+    try:
+        asyncio.run(serve(args.host, args.udp_port, args.tcp_port, batcher,
+                          TokenCache(config.INGEST_LISTENER_TOKEN_TTL_SECONDS)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        batcher.stop()
+        logger.info(f"Line-protocol listener stopped: {batcher.stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Rebuild the online series statistics (series_stats) and chart rollups
+(series_rollups) from stored readings
+
+Run once after upgrading, or after bulk imports/deletes:
+
+    python scripts/rebuild_series_stats.py [--days 35]
+
+Only real sensor readings are summarised. Series fed by a sensor with
+compression enabled are skipped: their stored rows are the compressed series,
+while the live statistics and rollups were built from every ingested reading.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import get_db, init_db
+from utils.compression import compression_settings
+from utils.online_stats import DAY, series_key, series_stats
+from utils.rollups import tile_pyramid
+from utils.series import fetch_reading_columns
+
+
+def _compressed(config) -> bool:
+    try:
+        return compression_settings(json.loads(config) if isinstance(config, str) else config) is not None
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-series statistics and chart rollups")
+    parser.add_argument('--days', type=int, default=35, help="history to summarise (default: 35)")
+    args = parser.parse_args()
+
+    init_db()
+    since = (int(time.time()) - args.days * DAY) // DAY * DAY
+
+    db = get_db()
+    users = [row[0] for row in db.execute(
+        "SELECT DISTINCT user_id FROM co2_readings WHERE user_id IS NOT NULL").fetchall()]
+    sensors, compressed_users = [], set()
+    for sensor_id, user_id, config in db.execute("SELECT id, user_id, config FROM user_sensors").fetchall():
+        if _compressed(config):
+            compressed_users.add(user_id)
+            print(f"sensor {sensor_id}: skipped (compression enabled)")
+        else:
+            sensors.append(sensor_id)
+    db.close()
+
+    days = (time.time() - since) / DAY
+    for user_id in users:
+        if user_id in compressed_users:
+            print(f"user {user_id}: skipped (a sensor has compression enabled)")
+            continue
+        columns = fetch_reading_columns(user_id=user_id, days=days)
+        count = series_stats.rebuild(series_key(user_id=user_id), columns, since)
+        tile_pyramid.rebuild(series_key(user_id=user_id), columns, since)
+        print(f"user {user_id}: {count} readings")
+    for sensor_id in sensors:
+        columns = fetch_reading_columns(sensor_id=sensor_id, days=days)
+        count = series_stats.rebuild(series_key(sensor_id=sensor_id), columns, since)
+        tile_pyramid.rebuild(series_key(sensor_id=sensor_id), columns, since)
+        print(f"sensor {sensor_id}: {count} readings")
+
+
+if __name__ == '__main__':
+    main()
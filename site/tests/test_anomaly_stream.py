@@ -0,0 +1,82 @@
+"""
+Tests for the streaming anomaly detector (utils.anomaly_stream)
+"""
+
+import sqlite3
+import sys
+import unittest
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.anomaly_stream import MIN_HISTORY, StreamingAnomalyDetector
+
+
+def _readings(values, start=None, step=10):
+    start = start or datetime(2026, 1, 5, 8, 0, tzinfo=UTC)
+    readings = []
+    for i, ppm in enumerate(values):
+        ts = start + timedelta(seconds=i * step)
+        readings.append({'ts': ts, 'ppm': int(ppm), 'timestamp': ts.strftime('%Y-%m-%d %H:%M:%S')})
+    return readings
+
+
+class StreamingAnomalyDetectorTestCase(unittest.TestCase):
+    """Test scoring of spikes, drifts and warm-up from stored readings"""
+
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.execute("CREATE TABLE sensor_readings (sensor_id INTEGER, co2 REAL, timestamp TEXT)")
+        self.db.execute("CREATE TABLE co2_readings (user_id INTEGER, ppm REAL, timestamp TEXT)")
+        self.detector = StreamingAnomalyDetector()
+        self.noise = np.random.default_rng(3).normal(0, 8, 400)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_noisy_steady_series_has_no_anomalies(self):
+        anomalies = self.detector.score(self.db, 1, 7, _readings(650 + self.noise))
+        self.assertEqual(anomalies, [])
+
+    def test_spike_is_flagged_by_every_check(self):
+        values = 650 + self.noise
+        values[200] = 1400
+        anomalies = self.detector.score(self.db, 1, 7, _readings(values))
+        self.assertEqual(len(anomalies), 1)  # the drop back to the baseline is not flagged
+        spike = anomalies[0]
+        self.assertEqual(spike['ppm'], 1400)
+        self.assertEqual(spike['severity'], 'high')
+        self.assertEqual(set(spike['checks'].split(',')), {'robust_z', 'ewma', 'rate_of_change'})
+        self.assertAlmostEqual(spike['baseline'], 650, delta=10)
+
+    def test_batches_match_single_pass(self):
+        values = 650 + self.noise
+        values[150] = 1300
+        readings = _readings(values)
+        whole = StreamingAnomalyDetector().score(self.db, 1, 7, readings)
+        split = []
+        for start in range(0, len(readings), 37):
+            split.extend(self.detector.score(self.db, 1, 7, readings[start:start + 37]))
+        self.assertEqual(whole, split)
+
+    def test_warm_up_requires_history(self):
+        values = 650 + self.noise[:MIN_HISTORY]
+        values[-1] = 5000
+        self.assertEqual([a['kind'] for a in self.detector.score(self.db, 1, 7, _readings(values, step=3600))], [])
+
+    def test_state_is_rebuilt_from_stored_readings(self):
+        readings = _readings(650 + self.noise[:200])
+        self.db.executemany("INSERT INTO sensor_readings VALUES (7, ?, ?)",
+                            [(r['ppm'], r['timestamp']) for r in readings])
+        spike = _readings([1500], start=readings[-1]['ts'] + timedelta(seconds=10))
+        anomalies = self.detector.score(self.db, 1, 7, spike)
+        self.assertEqual(len(anomalies), 1)
+        # Late readings are not scored again
+        self.assertEqual(self.detector.score(self.db, 1, 7, readings[-5:]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+Tests for ingest compression and interpolation (utils.compression)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.compression import SeriesCompressor, compression_settings, interpolate
+
+
+def _feed(compressor, values, step=10):
+    stored = []
+    for i, value in enumerate(values):
+        stored.extend(compressor.offer(i * step, value, (i * step, value)))
+    return stored
+
+
+class CompressionSettingsTestCase(unittest.TestCase):
+    """Test sensor config parsing"""
+
+    def test_disabled_without_block(self):
+        self.assertIsNone(compression_settings({"bus": 1}))
+        self.assertIsNone(compression_settings({"compression": {"mode": "off"}}))
+
+    def test_defaults_and_validation(self):
+        self.assertEqual(compression_settings({"compression": {"mode": "deadband"}}), ("deadband", 10.0, 300.0))
+        with self.assertRaises(ValueError):
+            compression_settings({"compression": {"mode": "gzip"}})
+        with self.assertRaises(ValueError):
+            compression_settings({"compression": {"deviation": -1}})
+
+
+class SeriesCompressorTestCase(unittest.TestCase):
+    """Test deadband and swinging-door filtering"""
+
+    def test_flat_signal_only_stores_heartbeats(self):
+        stored = _feed(SeriesCompressor("swinging_door", 5, heartbeat_seconds=100), [612] * 31)
+        self.assertEqual([t for t, _ in stored], [0, 100, 200, 300])
+
+    def test_deadband_stores_step_edges(self):
+        stored = _feed(SeriesCompressor("deadband", 5, heartbeat_seconds=1000), [600, 601, 602, 650, 651, 650])
+        self.assertEqual(stored, [(0, 600), (20, 602), (30, 650)])
+
+    def test_swinging_door_keeps_ramp_within_deviation(self):
+        values = [600 + 2 * i for i in range(20)] + [638] * 20
+        compressor = SeriesCompressor("swinging_door", 1, heartbeat_seconds=10000)
+        stored = _feed(compressor, values) + compressor.flush()
+        self.assertLess(len(stored), 6)
+        points = [(t, {"ppm": v}) for t, v in stored]
+        for t, values_at in interpolate(points, 10):
+            self.assertAlmostEqual(values_at["ppm"], values[int(t // 10)], delta=2.0001)
+
+    def test_late_points_pass_through(self):
+        compressor = SeriesCompressor("deadband", 5, heartbeat_seconds=1000)
+        _feed(compressor, [600, 600, 600])
+        self.assertEqual(compressor.offer(5, 600, "late"), ["late"])
+
+
+class InterpolateTestCase(unittest.TestCase):
+    """Test query-side resampling"""
+
+    def test_linear_between_points(self):
+        points = [(0, {"co2": 600, "humidity": None}), (100, {"co2": 700, "humidity": 40})]
+        result = interpolate(points, 25)
+        self.assertEqual([t for t, _ in result], [0, 25, 50, 75, 100])
+        self.assertEqual(result[2][1]["co2"], 650)
+        self.assertIsNone(result[2][1]["humidity"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests for device token ingestion (blueprints.devices): HTTP batches and the /device namespace
+"""
+
+import gzip
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import create_device_token, get_db, init_db, revoke_device_token
+
+USER_ID = 987058
+
+
+class DeviceIngestTestCase(unittest.TestCase):
+    """Test token auth, acks and size limits of device uploads"""
+
+    @classmethod
+    def setUpClass(cls):
+        from app import app, socketio
+        init_db()
+        app.config['TESTING'] = True
+        cls.app, cls.socketio = app, socketio
+        cls.client = app.test_client()
+
+    def setUp(self):
+        self._cleanup()
+        self.token_id, self.token = create_device_token(USER_ID, 'Passerelle', None)
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM co2_readings WHERE user_id = ?", (USER_ID,))
+        db.execute("DELETE FROM device_tokens WHERE user_id = ?", (USER_ID,))
+        db.commit()
+        db.close()
+
+    def _post(self, body, token=None, **headers):
+        if token is not False:
+            headers['Authorization'] = f'Bearer {token or self.token}'
+        return self.client.post('/api/devices/ingest', data=body, headers=headers,
+                                content_type='application/json')
+
+    def test_http_batch_requires_a_valid_token(self):
+        body = json.dumps({'seq': 3, 'readings': [{'ppm': 600}]})
+        self.assertEqual(self._post(body, token=False).status_code, 401)
+        self.assertEqual(self._post(body, token='not-a-token').status_code, 401)
+        revoke_device_token(self.token_id, USER_ID)
+        self.assertEqual(self._post(body).status_code, 401)
+
+    def test_http_ack_echoes_seq(self):
+        body = gzip.compress(json.dumps({'seq': 41, 'readings': [
+            {'ppm': 600, 'seq': 1}, {'ppm': -5, 'seq': 2}, {'ppm': 610, 'seq': 1},
+        ]}).encode())
+        response = self._post(body, **{'Content-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        ack = response.get_json()
+        self.assertEqual((ack['seq'], ack['accepted'], ack['duplicates']), (41, 1, [2]))
+        self.assertEqual([r['index'] for r in ack['rejected']], [1])
+
+    def test_oversized_uploads_are_refused(self):
+        previous = self.app.config['INGEST_MAX_BODY_BYTES'], self.app.config['INGEST_MAX_BATCH_SIZE']
+        self.app.config.update(INGEST_MAX_BODY_BYTES=64, INGEST_MAX_BATCH_SIZE=2)
+        try:
+            self.assertEqual(self._post(json.dumps({'readings': [{'ppm': 600}] * 10})).status_code, 413)
+            self.assertEqual(self._post(json.dumps({'readings': [{'ppm': 600}] * 3})).status_code, 413)
+        finally:
+            self.app.config.update(INGEST_MAX_BODY_BYTES=previous[0], INGEST_MAX_BATCH_SIZE=previous[1])
+
+    def test_socket_acks_and_revocation(self):
+        self.assertFalse(self.socketio.test_client(self.app, namespace='/device',
+                                                   auth={'token': 'not-a-token'}).is_connected('/device'))
+
+        device = self.socketio.test_client(self.app, namespace='/device', auth={'token': self.token})
+        self.assertTrue(device.is_connected('/device'))
+        ready = device.get_received('/device')[0]
+        self.assertEqual((ready['name'], ready['args'][0]['device_id']), ('ready', self.token_id))
+
+        ack = device.emit('reading', {'seq': 7, 'readings': [{'ppm': 650, 'seq': 1}]},
+                          namespace='/device', callback=True)
+        self.assertEqual((ack['ok'], ack['seq'], ack['accepted']), (True, 7, 1))
+
+        revoke_device_token(self.token_id, USER_ID)
+        ack = device.emit('reading', {'seq': 8, 'readings': [{'ppm': 660, 'seq': 2}]},
+                          namespace='/device', callback=True)
+        self.assertFalse(ack['ok'])
+        self.assertFalse(device.is_connected('/device'))
+
+        db = get_db()
+        stored = db.execute("SELECT COUNT(*) FROM co2_readings WHERE user_id = ?", (USER_ID,)).fetchone()[0]
+        db.close()
+        self.assertEqual(stored, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
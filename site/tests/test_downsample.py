@@ -0,0 +1,121 @@
+"""
+Tests for LTTB downsampling (utils.downsample)
+"""
+
+import sys
+import time
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.downsample import downsample_rows, lttb_indices, parse_max_points, rollup_rows
+from utils.rollups import TilePyramid
+from utils.series import ReadingColumns
+
+
+def _rows(values, start=datetime(2026, 3, 1), step=60):
+    return [{'timestamp': (start + timedelta(seconds=i * step)).strftime('%Y-%m-%d %H:%M:%S'), 'ppm': v}
+            for i, v in enumerate(values)]
+
+
+class LttbTestCase(unittest.TestCase):
+    """Test point selection"""
+
+    def test_keeps_endpoints_and_bound(self):
+        x = np.arange(10_000, dtype=float)
+        y = np.sin(x / 300) * 200 + 700
+        keep = lttb_indices(x, y, 500)
+        self.assertEqual(len(keep), 500)
+        self.assertEqual((keep[0], keep[-1]), (0, 9_999))
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_preserves_spikes(self):
+        y = np.full(20_000, 600.0)
+        y[7_345] = 2400
+        y[15_002] = 410
+        keep = lttb_indices(np.arange(20_000, dtype=float), y, 100)
+        self.assertIn(7_345, keep)
+        self.assertIn(15_002, keep)
+
+    def test_short_series_untouched(self):
+        self.assertEqual(list(lttb_indices(np.arange(5.0), np.arange(5.0), 10)), [0, 1, 2, 3, 4])
+
+
+class DownsampleRowsTestCase(unittest.TestCase):
+    """Test row selection for the history endpoints"""
+
+    def test_descending_rows_keep_their_order(self):
+        rows = _rows([600 + (i % 50) for i in range(3_000)])[::-1]
+        kept = downsample_rows(rows, 200)
+        self.assertEqual(len(kept), 200)
+        self.assertIs(kept[0], rows[0])
+        self.assertIs(kept[-1], rows[-1])
+        self.assertEqual(kept, sorted(kept, key=lambda r: r['timestamp'], reverse=True))
+
+    def test_rows_without_value_are_dropped(self):
+        rows = _rows([None if i % 10 == 0 else 700 for i in range(1_000)])
+        self.assertTrue(all(r['ppm'] is not None for r in downsample_rows(rows, 50)))
+        self.assertEqual(downsample_rows(rows, None), rows)
+
+    def test_parse_max_points(self):
+        self.assertIsNone(parse_max_points(None))
+        self.assertEqual(parse_max_points('1000'), 1000)
+        for bad in ('2', '100000', 'abc'):
+            with self.assertRaises(ValueError):
+                parse_max_points(bad)
+
+
+class RollupRowsTestCase(unittest.TestCase):
+    """Test chart points read from the rollups"""
+
+    SERIES = "sensor:987043"
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def tearDown(self):
+        db = get_db()
+        db.execute("DELETE FROM series_rollups WHERE series = ?", (self.SERIES,))
+        db.execute("DELETE FROM series_rollup_coverage WHERE series = ?", (self.SERIES,))
+        db.commit()
+        db.close()
+
+    def test_buckets_carry_mean_min_and_max(self):
+        now = time.time() // 3600 * 3600
+        ts = now - 86400 + np.arange(0, 86400, 10)
+        TilePyramid().process([self.SERIES], ts, 600 + (ts // 10 % 2) * 100)
+
+        rows = rollup_rows(self.SERIES, now - 86400, now, 6)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0]['resolution'], 3600)
+        self.assertEqual((rows[0]['ppm'], rows[0]['min'], rows[0]['max'], rows[0]['count']),
+                         (650.0, 600.0, 700.0, 360))
+
+        rows = rollup_rows(self.SERIES, now - 86400, now, 200)
+        self.assertEqual((len(rows), rows[0]['resolution']), (144, 600))
+        # Points under a minute apart, or no rollups for the range: the caller reads raw rows
+        self.assertIsNone(rollup_rows(self.SERIES, now - 3600, now, 1000))
+        self.assertIsNone(rollup_rows(self.SERIES, now - 30 * 86400, now - 20 * 86400, 100))
+
+    def test_partial_history_needs_backfill_horizon(self):
+        now = time.time() // 86400 * 86400
+        ts = now - 86400 + np.arange(0, 86400, 60)
+        TilePyramid().process([self.SERIES], ts, np.full(len(ts), 600.0))
+        # Rollups start a day into the two-day range: older raw rows may be missing from them
+        self.assertIsNone(rollup_rows(self.SERIES, now - 2 * 86400, now, 48))
+
+        nan = np.full(len(ts), np.nan, dtype=np.float32)
+        columns = ReadingColumns(ts.astype(np.int64), np.full(len(ts), 600, dtype=np.float32), nan, nan)
+        TilePyramid().rebuild(self.SERIES, columns, int(now - 7 * 86400))
+        rows = rollup_rows(self.SERIES, now - 2 * 86400, now, 48)
+        self.assertEqual((len(rows), rows[0]['resolution']), (24, 3600))
+
+
+if __name__ == '__main__':
+    unittest.main()
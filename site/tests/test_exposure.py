@@ -0,0 +1,109 @@
+"""
+Tests for time-weighted exposure counters (utils.exposure)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.exposure import MAX_GAP_SECONDS, ExposureCounters, integrate, summarize_readings
+
+USER_ID = 987046
+SERIES = "user:987046"
+SENSOR_ID = 987046
+DAY = 1_780_000_000 // 86400 * 86400  # day-aligned
+
+
+class IntegrateTestCase(unittest.TestCase):
+    """Test band accounting independent of the sampling interval"""
+
+    def test_sampling_interval_does_not_matter(self):
+        # 30 minutes at 1500 ppm then 30 minutes at 700 ppm, sampled every 2 s and every 5 min
+        for step in (2, 300):
+            ts = DAY + np.arange(step, 3600 + step, step)
+            values = np.where(ts <= DAY + 1800, 1500.0, 700.0)
+            day = next(iter(integrate(ts, values, previous_ts=DAY).values()))
+            self.assertEqual(day[4:8], [1800.0, 0.0, 0.0, 1800.0])
+            self.assertAlmostEqual(day[9], 300 * 0.5)
+
+    def test_gaps_are_capped_and_old_readings_get_no_time(self):
+        days = integrate([DAY, DAY + 5000, DAY + 100], [600, 600, 900])
+        counters = days[next(iter(days))]
+        self.assertEqual(counters[0], 3)
+        self.assertEqual(counters[4:6], [MAX_GAP_SECONDS, 100])
+        self.assertEqual((counters[2], counters[3]), (600, 900))
+
+        late = integrate([DAY + 50], [600], previous_ts=DAY + 100)
+        self.assertEqual(sum(next(iter(late.values()))[4:8]), 0)
+
+    def test_summary_of_uncounted_readings(self):
+        summary = summarize_readings(DAY + np.arange(0, 600, 60), [1000.0] * 10)
+        self.assertEqual(summary['band_percent']['moderate'], 100)
+        self.assertEqual(summary['score'], 75)
+        self.assertIsNone(summarize_readings([], []))
+
+
+class ExposureCountersTestCase(unittest.TestCase):
+    """Test incremental accounting across batches"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self.counters = ExposureCounters()
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        for table in ("exposure_daily", "exposure_state", "exposure_day_sensors"):
+            db.executemany(f"DELETE FROM {table} WHERE series = ?", [(SERIES,), (f"sensor:{SENSOR_ID}",)])
+        db.commit()
+        db.close()
+
+    def test_batches_continue_from_the_previous_reading(self):
+        ts = DAY + np.arange(0, 7200, 60)
+        values = np.full(len(ts), 1300.0)
+        self.counters.process(USER_ID, None, ts[:50], values[:50])
+        self.counters.process(USER_ID, None, ts[50:], values[50:])
+
+        day = self.counters.day(SERIES, '2026-05-28')
+        self.assertEqual(day['readings'], 120)
+        self.assertEqual(day['band_seconds']['critical'], 7140)
+        self.assertAlmostEqual(day['critical_ppm_hours'], 100 * 7140 / 3600, places=2)
+        self.assertEqual(day['score'], 0)
+
+        week = self.counters.days(SERIES, 7, end='2026-05-29')
+        self.assertEqual([d['date'] for d in week][-2:], ['2026-05-28', '2026-05-29'])
+        self.assertIsNone(week[-1]['exposure'])
+
+    def test_late_batch_of_another_sensor_keeps_its_time(self):
+        ts = DAY + np.arange(0, 3600, 60)
+        db = get_db()
+        self.counters.record(db, USER_ID, None, ts, np.full(len(ts), 500.0))
+        # A sensor uploading the same hour late is credited with its own gaps
+        self.counters.record(db, USER_ID, SENSOR_ID, ts, np.full(len(ts), 1300.0))
+        db.commit()
+        db.close()
+
+        day = self.counters.day(SERIES, '2026-05-28')
+        self.assertEqual(day['readings'], 120)
+        self.assertEqual(day['band_percent']['good'], 50)
+        self.assertEqual(day['band_percent']['critical'], 50)
+        # Times read as wall-clock time: the hour is reported by two sensors
+        self.assertEqual(day['sensors'], 2)
+        self.assertEqual(day['seconds'], 3540)
+        self.assertEqual(day['band_seconds']['critical'], 1770)
+        self.assertEqual(self.counters.day(f"sensor:{SENSOR_ID}", '2026-05-28')['band_seconds']['critical'], 3540)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Tests for the batched seasonal forecasts (utils.forecast)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.forecast import HORIZON_HOURS, fit_forecasts, get_forecast, run_forecasts
+from utils.online_stats import HOUR, Summary
+
+SERIES = "sensor:987002"
+
+
+def _daily_profile(hours, level=600, amplitude=200):
+    return level + amplitude * np.sin(2 * np.pi * hours / 24)
+
+
+class FitForecastsTestCase(unittest.TestCase):
+    """Test the vectorized harmonic regression"""
+
+    def test_recovers_daily_cycle_per_series(self):
+        hours = np.arange(480000, 480000 + 14 * 24)
+        future = hours[-1] + 1 + np.arange(24)
+        rng = np.random.default_rng(5)
+        values = np.vstack([_daily_profile(hours, level=500 + 100 * s) + rng.normal(0, 10, len(hours))
+                            for s in range(3)])
+        values[1, rng.choice(len(hours), 150, replace=False)] = np.nan  # gaps
+
+        result = fit_forecasts(values, hours, future)
+        for s in range(3):
+            expected = _daily_profile(future, level=500 + 100 * s)
+            self.assertLess(np.abs(result['predicted'][s] - expected).max(), 25)
+            inside = (result['lower'][s] <= expected) & (expected <= result['upper'][s])
+            self.assertGreaterEqual(inside.mean(), 0.9)
+
+    def test_short_horizon_follows_current_level(self):
+        hours = np.arange(480000, 480000 + 7 * 24)
+        values = _daily_profile(hours)[None, :]
+        values[0, -6:] += 300  # room suddenly occupied
+        result = fit_forecasts(values, hours, hours[-1] + 1 + np.arange(24))
+        self.assertGreater(result['phi'][0], 0)
+        self.assertGreater(result['predicted'][0, 0] - _daily_profile(hours[-1] + 1), 100)
+        self.assertGreater(result['upper'][0, -1] - result['lower'][0, -1],
+                           result['upper'][0, 0] - result['lower'][0, 0])
+
+
+class RunForecastsTestCase(unittest.TestCase):
+    """Test the forecast job and the stored lookups"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM series_stats WHERE series = ?", (SERIES,))
+        db.execute("DELETE FROM forecasts WHERE series = ?", (SERIES,))
+        db.commit()
+        db.close()
+
+    def test_forecasts_are_stored_and_read_back(self):
+        now = 480000 * HOUR + 1800
+        hours = np.arange(480000 - 10 * 24 + 1, 480001)
+        rows = []
+        for hour, value in zip(hours, _daily_profile(hours)):
+            summary = Summary()
+            summary.update_many(np.array([value]))
+            rows.append((SERIES, HOUR, int(hour), *summary.to_row()))
+        db = get_db()
+        db.executemany(
+            """INSERT INTO series_stats (series, resolution, bucket, count, mean, m2, min, max, digest)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", rows)
+        db.commit()
+        db.close()
+
+        self.assertGreaterEqual(run_forecasts(now=now), 1)
+        points = get_forecast(SERIES, 6, now=now)
+        self.assertEqual(len(points), 6)
+        expected = _daily_profile(np.arange(480001, 480007))
+        self.assertLess(max(abs(p['predicted'] - e) for p, e in zip(points, expected)), 10)
+        self.assertTrue(all(p['lower'] <= p['predicted'] <= p['upper'] for p in points))
+        self.assertEqual(len(get_forecast(SERIES, 100, now=now)), HORIZON_HOURS)
+        self.assertEqual(len(get_forecast(SERIES, 100, now=now + 2 * HOUR)), HORIZON_HOURS - 1)
+
+        run_forecasts(now=now)
+        db = get_db()
+        stored = db.execute("SELECT COUNT(*) FROM forecasts WHERE series = ?", (SERIES,)).fetchone()[0]
+        db.close()
+        self.assertEqual(stored, HORIZON_HOURS)
+
+
+if __name__ == '__main__':
+    unittest.main()
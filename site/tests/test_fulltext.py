@@ -0,0 +1,97 @@
+"""
+Tests for FTS5 search with keyset pagination (utils.fulltext)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils import fulltext
+
+USER_ID = 987048
+
+
+class MatchQueryTestCase(unittest.TestCase):
+    """Test free text to MATCH expression conversion"""
+
+    def test_terms_are_quoted_prefixes(self):
+        self.assertEqual(fulltext.match_query('seuil "critique" OR'), '"seuil"* "critique"* "OR"*')
+        self.assertIsNone(fulltext.match_query(' *"() '))
+        self.assertIsNone(fulltext.decode_cursor(''))
+        self.assertEqual(fulltext.decode_cursor(fulltext.encode_cursor(-1.5, 42)), (-1.5, 42))
+        with self.assertRaises(ValueError):
+            fulltext.decode_cursor('not-a-cursor')
+
+
+class FullTextSearchTestCase(unittest.TestCase):
+    """Test trigger-maintained indexes, bm25 ranking and pagination"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM audit_logs WHERE user_id = ?", (USER_ID,))
+        db.commit()
+        db.close()
+
+    def _log(self, db, action, details):
+        return db.execute(
+            "INSERT INTO audit_logs (user_id, username, action, details) VALUES (?, 'fts-test', ?, ?)",
+            (USER_ID, action, details)
+        ).lastrowid
+
+    def _search(self, db, text, **kwargs):
+        return fulltext.search(db, 'audit_logs', text, where='t.user_id = ?', params=[USER_ID], **kwargs)
+
+    def test_triggers_keep_index_in_sync(self):
+        db = get_db()
+        self.assertTrue(fulltext.available(db, 'audit_logs'))
+        row_id = self._log(db, 'update_thresholds', 'Seuil modifié')
+        db.commit()
+        self.assertEqual([r['id'] for r in self._search(db, 'seuil modif')[0]], [row_id])
+
+        db.execute("UPDATE audit_logs SET details = 'Capteur renommé' WHERE id = ?", (row_id,))
+        db.commit()
+        self.assertEqual(self._search(db, 'seuil')[0], [])
+        self.assertEqual(len(self._search(db, 'renomme')[0]), 1)
+
+        db.execute("DELETE FROM audit_logs WHERE id = ?", (row_id,))
+        db.commit()
+        self.assertEqual(self._search(db, 'capteur')[0], [])
+        db.close()
+
+    def test_ranked_pages_cover_all_matches_once(self):
+        db = get_db()
+        best = self._log(db, 'alert', 'alerte alerte alerte')
+        others = [self._log(db, 'alert', f'alerte numéro {i} sur le capteur du bureau') for i in range(9)]
+        self._log(db, 'login', 'connexion')
+        db.commit()
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            rows, cursor = self._search(db, 'alerte', limit=4, cursor=cursor)
+            seen.extend(row['id'] for row in rows)
+            pages += 1
+            if not cursor:
+                break
+        db.close()
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(seen[0], best)
+        self.assertEqual(sorted(seen[1:]), sorted(others))
+        self.assertEqual(seen[1:], sorted(others, reverse=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
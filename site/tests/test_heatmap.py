@@ -0,0 +1,111 @@
+"""
+Tests for the weekly heatmap engine (utils.heatmap)
+"""
+
+import sys
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.heatmap import BUCKET_SECONDS, HeatmapEngine, _ScopeCache
+
+SENSORS = (987054, 987055)
+
+
+class _StaticEngine(HeatmapEngine):
+    """Engine serving a prebuilt cache instead of querying SQLite"""
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def _refresh(self, key, user_id, sensor_id):
+        return self.cache
+
+
+def _cache_for(timestamps, values):
+    cache = _ScopeCache()
+    buckets = np.asarray(timestamps, dtype=np.int64) // BUCKET_SECONDS
+    cache.merge(buckets, np.asarray(values, dtype=np.float64), np.ones(len(buckets), np.int64), 0)
+    return cache
+
+
+class HeatmapEngineTestCase(unittest.TestCase):
+    """Test bucketing, timezones and incremental merges"""
+
+    def setUp(self):
+        # Most recent Monday 10:00 UTC
+        now = int(time.time())
+        monday = (now // 86400 - (now // 86400 + 3) % 7) * 86400
+        self.ts = monday + 10 * 3600
+        if self.ts > now:
+            self.ts -= 7 * 86400
+
+    def test_merge_accumulates_same_bucket(self):
+        cache = _cache_for([self.ts, self.ts + 60], [600, 800])
+        cache.merge(np.array([self.ts // BUCKET_SECONDS]), np.array([1000.0]), np.array([1]), 0)
+        self.assertEqual(cache.counts.tolist(), [3])
+        self.assertEqual(cache.sums.tolist(), [2400.0])
+
+    def test_utc_and_local_cells(self):
+        engine = _StaticEngine(_cache_for([self.ts, self.ts + 60], [600, 800]))
+        utc = engine.compute(days=30)
+        self.assertEqual(utc['heatmap'][0][10], 700)
+        self.assertEqual(utc['counts'][0][10], 2)
+        self.assertIsNone(utc['heatmap'][0][11])
+
+        kathmandu = engine.compute(days=30, tz='Asia/Kathmandu')  # UTC+05:45
+        self.assertEqual(kathmandu['heatmap'][0][15], 700)
+
+    def test_unknown_timezone(self):
+        with self.assertRaises(ValueError):
+            _StaticEngine(_ScopeCache()).compute(tz='Mars/Olympus')
+
+
+class ScopeVersionTestCase(unittest.TestCase):
+    """Test that a scope's data version ignores writes to other scopes"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.executemany("DELETE FROM sensor_readings WHERE sensor_id = ?", [(s,) for s in SENSORS])
+        db.commit()
+        db.close()
+
+    def _insert(self, sensor_id, co2):
+        db = get_db()
+        db.execute("INSERT INTO sensor_readings (sensor_id, co2) VALUES (?, ?)", (sensor_id, co2))
+        db.commit()
+        db.close()
+
+    def test_other_scope_writes_keep_version(self):
+        engine = HeatmapEngine()
+        self._insert(SENSORS[0], 700)
+        first = engine.compute(sensor_id=SENSORS[0])
+        self.assertEqual(first['data_points'], 1)
+
+        self._insert(SENSORS[1], 900)
+        self.assertEqual(engine.compute(sensor_id=SENSORS[0])['version'], first['version'])
+
+        self._insert(SENSORS[0], 800)
+        second = engine.compute(sensor_id=SENSORS[0])
+        self.assertGreater(second['version'], first['version'])
+        self.assertEqual(second['data_points'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
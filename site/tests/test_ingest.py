@@ -0,0 +1,153 @@
+"""
+Tests for ingest pipeline validation (utils.ingest)
+"""
+
+import json
+import sys
+import unittest
+from datetime import datetime, UTC
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.compression import compressors
+from utils.ingest import ingest_readings, normalize_reading, parse_timestamp, reading_uid, validate_batch
+
+
+class ParseTimestampTestCase(unittest.TestCase):
+    """Test timestamp normalization"""
+
+    def test_epoch_seconds_and_millis(self):
+        expected = datetime(2026, 1, 1, 10, 0, tzinfo=UTC)
+        self.assertEqual(parse_timestamp(1767261600), expected)
+        self.assertEqual(parse_timestamp(1767261600000), expected)
+
+    def test_iso_with_offset_is_converted_to_utc(self):
+        parsed = parse_timestamp("2026-01-01T11:00:00+01:00")
+        self.assertEqual(parsed, datetime(2026, 1, 1, 10, 0, tzinfo=UTC))
+
+    def test_naive_iso_is_assumed_utc(self):
+        self.assertEqual(parse_timestamp("2026-01-01 10:00:00").tzinfo, UTC)
+
+
+class NormalizeReadingTestCase(unittest.TestCase):
+    """Test single-reading validation"""
+
+    def test_aliases_are_accepted(self):
+        reading = normalize_reading({"co2": "612.4", "temp": 21, "rh": "40.5", "ts": 1767261600})
+        self.assertEqual(reading["ppm"], 612)
+        self.assertEqual(reading["temperature"], 21.0)
+        self.assertEqual(reading["humidity"], 40.5)
+        self.assertEqual(reading["timestamp"], "2026-01-01 10:00:00")
+
+    def test_invalid_readings_raise(self):
+        for raw, message in (
+            ({}, "ppm is required"),
+            ({"ppm": "abc"}, "ppm must be numeric"),
+            ({"ppm": 20000}, "out of range"),
+            ({"ppm": 600, "humidity": "wet"}, "humidity must be numeric"),
+            ({"ppm": 600, "timestamp": "yesterday"}, "timestamp"),
+            ("600", "object"),
+        ):
+            with self.assertRaises(ValueError) as ctx:
+                normalize_reading(raw)
+            self.assertIn(message, str(ctx.exception))
+
+    def test_validate_batch_reports_rejected_indexes(self):
+        valid, rejected = validate_batch([{"ppm": 600}, {"ppm": -1}, {"ppm": 700}])
+        self.assertEqual([r["ppm"] for r in valid], [600, 700])
+        self.assertEqual([r["index"] for r in rejected], [1])
+
+
+class ReadingUidTestCase(unittest.TestCase):
+    """Test deduplication keys"""
+
+    def test_client_id_takes_precedence(self):
+        self.assertEqual(reading_uid({"id": 42, "device": "gw", "seq": 7}), "42")
+        self.assertEqual(reading_uid({"reading_id": "abc"}), "abc")
+
+    def test_device_seq_pair(self):
+        self.assertEqual(reading_uid({"device": "gw", "seq": 7}), "gw:7")
+        self.assertEqual(reading_uid({"seq": 7}, device_key="token3"), "token3:7")
+        self.assertIsNone(reading_uid({"ppm": 600}))
+
+    def test_invalid_keys_are_rejected(self):
+        _, rejected = validate_batch([{"ppm": 600, "seq": 1}, {"ppm": 600, "id": "x" * 200}])
+        self.assertEqual([r["index"] for r in rejected], [0, 1])
+        self.assertIn("device", rejected[0]["error"])
+
+
+class CompressedRetryTestCase(unittest.TestCase):
+    """Test that readings dropped by compression are still deduplicated on retry"""
+
+    USER_ID = 987034
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        db = get_db()
+        cls.sensor_id = db.execute(
+            "INSERT INTO user_sensors (user_id, name, type, interface, config) VALUES (?, ?, 'scd30', 'i2c', ?)",
+            (cls.USER_ID, 'compressed', json.dumps({"compression": {"mode": "deadband", "deviation": 50}}))
+        ).lastrowid
+        db.commit()
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        db = get_db()
+        for table in ("co2_readings", "ingest_keys", "user_sensors"):
+            db.execute(f"DELETE FROM {table} WHERE user_id = ?", (cls.USER_ID,))
+        db.execute("DELETE FROM sensor_readings WHERE sensor_id = ?", (cls.sensor_id,))
+        db.commit()
+        db.close()
+        compressors.clear()
+
+    def test_retried_batch_is_all_duplicates(self):
+        batch = [{"id": f"flat-{i}", "ppm": 600, "timestamp": 1760000000 + 10 * i} for i in range(6)]
+        first = ingest_readings(self.USER_ID, batch, sensor_id=self.sensor_id)
+        self.assertEqual(first["accepted"], 6)
+        self.assertLess(first["stored"], 6)
+
+        retry = ingest_readings(self.USER_ID, batch, sensor_id=self.sensor_id)
+        self.assertEqual(retry["accepted"], 0)
+        self.assertEqual(retry["duplicates"], list(range(6)))
+
+    def test_compressed_counter_ignores_released_points(self):
+        db = get_db()
+        sensor_id = db.execute(
+            "INSERT INTO user_sensors (user_id, name, type, interface, config) VALUES (?, ?, 'scd30', 'i2c', ?)",
+            (self.USER_ID, 'counted', json.dumps({"compression": {"mode": "deadband", "deviation": 50}}))
+        ).lastrowid
+        db.commit()
+        db.close()
+        self.addCleanup(self._delete_sensor_readings, sensor_id)
+
+        before = self._compressed_today()
+        flat = [{"ppm": 600, "timestamp": 1760000000 + 10 * i} for i in range(3)]
+        self.assertEqual(ingest_readings(self.USER_ID, flat, sensor_id=sensor_id)["stored"], 1)
+        self.assertEqual(self._compressed_today() - before, 2)
+
+        # The jump releases the held 600 along with itself: nothing of this batch was dropped
+        jump = [{"ppm": 700, "timestamp": 1760000030}]
+        self.assertEqual(ingest_readings(self.USER_ID, jump, sensor_id=sensor_id)["stored"], 2)
+        self.assertEqual(self._compressed_today() - before, 2)
+
+    def _compressed_today(self):
+        db = get_db()
+        row = db.execute(
+            "SELECT value FROM ingest_counters WHERE day = date('now') AND name = 'compressed'"
+        ).fetchone()
+        db.close()
+        return row[0] if row else 0
+
+    def _delete_sensor_readings(self, sensor_id):
+        db = get_db()
+        db.execute("DELETE FROM sensor_readings WHERE sensor_id = ?", (sensor_id,))
+        db.commit()
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests for the line-protocol ingestion listener
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import init_db
+from ingest_listener import LineProtocolListener, TokenCache, parse_line
+from utils.ingest import IngestBatcher
+
+
+class _RecordingBatcher:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, user_id, readings, sensor_id=None, device_key=None):
+        self.submitted.append((user_id, sensor_id, device_key, readings))
+
+
+class ParseLineTestCase(unittest.TestCase):
+    """Test line parsing"""
+
+    def test_full_and_partial_lines(self):
+        self.assertEqual(parse_line("3 1767261600 612 21.5 40"),
+                         (3, {"ppm": "612", "ts": 1767261600.0, "temperature": "21.5", "humidity": "40"}))
+        self.assertEqual(parse_line("3 - 612 - 40"), (3, {"ppm": "612", "ts": None, "humidity": "40"}))
+        self.assertEqual(parse_line("3 2026-01-01T10:00:00Z 612")[1]["ts"], "2026-01-01T10:00:00Z")
+
+    def test_malformed_lines_raise(self):
+        for line in ("3 1767261600", "x 1767261600 612", "3 1 2 3 4 5"):
+            with self.assertRaises(ValueError):
+                parse_line(line)
+
+
+class ListenerTestCase(unittest.TestCase):
+    """Test line routing to the batcher"""
+
+    def test_lines_are_grouped_and_checked_against_token_sensors(self):
+        batcher = _RecordingBatcher()
+        listener = LineProtocolListener(batcher, tokens=None)
+        device = {"id": 7, "user_id": 1, "sensor_id": None}
+        errors = listener.handle_lines(device, frozenset([3, 4]), [
+            "3 1 600", "# comment", "", "4 2 610", "3 3 620", "9 4 630", "oops",
+        ], first_line_no=2)
+        self.assertEqual(errors, [(7, "unknown sensor_id"), (8, "expected: sensor_id ts ppm [temperature [humidity]]")])
+        self.assertEqual([(s, len(r)) for _, s, _, r in batcher.submitted], [(3, 2), (4, 1)])
+        self.assertEqual(batcher.submitted[0][2], "token7")
+
+
+class TokenLookupTestCase(unittest.TestCase):
+    """Test that token cache misses are resolved off the event loop"""
+
+    def setUp(self):
+        self.lookups = []
+        self.device = {"id": 7, "user_id": 1, "sensor_id": 3}
+
+        def lookup(token):
+            self.lookups.append((token, threading.get_ident()))
+            return (self.device, frozenset([3])) if token == "good" else (None, frozenset())
+
+        self.tokens = TokenCache(ttl=60)
+        self.tokens._lookup = lookup
+
+    def test_misses_run_in_the_executor_and_hits_do_not(self):
+        async def resolve_twice():
+            first = await self.tokens.resolve("good")
+            return first, await self.tokens.resolve("good"), threading.get_ident()
+
+        first, second, loop_thread = asyncio.run(resolve_twice())
+        self.assertEqual(first, second)
+        self.assertEqual(len(self.lookups), 1)
+        self.assertNotEqual(self.lookups[0][1], loop_thread)
+
+    def test_datagrams_wait_for_their_token_lookup(self):
+        batcher = _RecordingBatcher()
+        listener = LineProtocolListener(batcher, self.tokens)
+
+        async def receive():
+            task = listener.datagram_received(b"AUTH good\n3 1 600\n")
+            self.assertEqual(batcher.submitted, [])
+            await task
+            # Now cached: handled synchronously
+            self.assertIsNone(listener.datagram_received(b"AUTH good\n3 2 610\n"))
+            await listener.datagram_received(b"AUTH bad\n3 3 620\n")
+
+        asyncio.run(receive())
+        self.assertEqual([len(r) for _, _, _, r in batcher.submitted], [1, 1])
+        self.assertEqual(listener.stats['unauthorized'], 1)
+        self.assertEqual([token for token, _ in self.lookups], ["good", "bad"])
+
+
+class BackpressureTestCase(unittest.TestCase):
+    """Test the bounded token cache and batcher queue"""
+
+    def test_unknown_tokens_are_cached_briefly_in_a_bounded_lru(self):
+        init_db()
+        tokens = TokenCache(ttl=60, negative_ttl=0, max_entries=2)
+        for token in ("missing-a", "missing-b", "missing-c"):
+            self.assertEqual(asyncio.run(tokens.resolve(token)), (None, frozenset()))
+        self.assertEqual(list(tokens._entries), ["missing-b", "missing-c"])
+        self.assertLessEqual(tokens._entries["missing-c"][2], time.monotonic())
+
+    def test_batcher_drops_beyond_max_pending(self):
+        batcher = IngestBatcher(flush_size=100, max_pending=5)
+        self.assertEqual(batcher.submit(1, [{"ppm": 600}] * 3, sensor_id=3), 3)
+        self.assertEqual(batcher.submit(1, [{"ppm": 600}] * 4, sensor_id=4), 2)
+        self.assertEqual(batcher.submit(1, [{"ppm": 600}], sensor_id=4), 0)
+        self.assertEqual(batcher.stats["dropped"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
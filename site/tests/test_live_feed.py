@@ -0,0 +1,123 @@
+"""
+Tests for the in-memory live reading feed (SSE / long-poll backend)
+"""
+
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.live_feed import LiveFeed, publish_reading, live_feed
+
+
+class LiveFeedTestCase(unittest.TestCase):
+    """Test sequence numbering, replay and wake-ups"""
+
+    def setUp(self):
+        self.feed = LiveFeed(replay_size=3)
+
+    def test_sequence_is_monotonic_across_users(self):
+        first = self.feed.publish(1, 600)
+        second = self.feed.publish(2, 700)
+        self.assertLess(first["seq"], second["seq"])
+        self.assertEqual(self.feed.latest(1)["ppm"], 600)
+        self.assertEqual(self.feed.latest(2)["ppm"], 700)
+
+    def test_since_replays_missed_readings(self):
+        seqs = [self.feed.publish(1, 600 + i)["seq"] for i in range(3)]
+        replay = self.feed.since(1, seqs[0])
+        self.assertEqual([e["seq"] for e in replay], seqs[1:])
+        self.assertEqual(self.feed.since(1, seqs[-1]), [])
+
+    def test_since_resyncs_when_buffer_evicted(self):
+        first = self.feed.publish(1, 600)["seq"]
+        for i in range(4):
+            self.feed.publish(1, 610 + i)
+        replay = self.feed.since(1, first)
+        self.assertEqual(len(replay), 1)
+        self.assertEqual(replay[0]["ppm"], 613)
+
+    def test_since_resyncs_unknown_future_id(self):
+        self.feed.publish(1, 600)
+        replay = self.feed.since(1, 10_000)
+        self.assertEqual([e["ppm"] for e in replay], [600])
+
+    def test_wait_wakes_on_publish(self):
+        cursor = self.feed.seq
+        timer = threading.Timer(0.05, lambda: self.feed.publish(1, 650))
+        timer.start()
+        started = time.monotonic()
+        events = self.feed.wait(1, cursor, timeout=2)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual([e["ppm"] for e in events], [650])
+
+    def test_wait_times_out_without_readings(self):
+        self.assertEqual(self.feed.wait(1, self.feed.seq, timeout=0.05), [])
+
+    def test_publish_reading_ignores_simulated_sources(self):
+        live_feed.clear(99)
+        self.assertIsNone(publish_reading(99, 600, source="sim"))
+        self.assertIsNone(live_feed.latest(99))
+        self.assertIsNotNone(publish_reading(99, 600, source="sensor"))
+        self.assertEqual(live_feed.latest(99)["ppm"], 600)
+        live_feed.clear(99)
+
+
+class DatabasePollTestCase(unittest.TestCase):
+    """Test pick-up of readings stored by other processes"""
+
+    USER_ID = 987027
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def tearDown(self):
+        db = get_db()
+        db.execute("DELETE FROM co2_readings WHERE user_id = ?", (self.USER_ID,))
+        db.commit()
+        db.close()
+
+    def _store(self, ppm, source="sensor", age="0 seconds"):
+        db = get_db()
+        db.execute("INSERT INTO co2_readings (timestamp, ppm, source, user_id) VALUES (datetime('now', ?), ?, ?, ?)",
+                   ('-' + age, ppm, source, self.USER_ID))
+        db.commit()
+        db.close()
+
+    def test_wait_or_poll_finds_rows_from_other_processes(self):
+        feed = LiveFeed()
+        self._store(650, source="sim")
+        self._store(700)
+        events = feed.wait_or_poll(self.USER_ID, 0, timeout=0.05)
+        self.assertEqual([e["ppm"] for e in events], [700])
+        # Rows already in the feed are not published twice
+        self.assertEqual(feed.poll_database(self.USER_ID, force=True), 0)
+
+    def test_backfilled_reading_is_published_once(self):
+        feed = LiveFeed()
+        self._store(700)
+        self.assertEqual(feed.poll_database(self.USER_ID, force=True), 1)
+        # An edge-buffer upload stored after the live reading but stamped an hour earlier
+        self._store(650, age="1 hour")
+        self.assertEqual(feed.poll_database(self.USER_ID, force=True), 1)
+        self.assertEqual(feed.poll_database(self.USER_ID, force=True), 0)
+        self.assertEqual([e["ppm"] for e in feed.since(self.USER_ID, 0)], [700, 650])
+
+    def test_readings_published_in_process_are_skipped(self):
+        feed = LiveFeed()
+        feed.poll_database(self.USER_ID, force=True)
+        self._store(720)
+        db = get_db()
+        stamp = db.execute("SELECT timestamp FROM co2_readings WHERE user_id = ?", (self.USER_ID,)).fetchone()[0]
+        db.close()
+        feed.publish(self.USER_ID, 720, timestamp=stamp.replace(" ", "T") + "+00:00")
+        self.assertEqual(feed.poll_database(self.USER_ID, force=True), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests for the ML model registry (utils.model_registry)
+"""
+
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, UTC
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils import model_registry
+from utils.model_registry import ModelNotReady, ModelRegistry
+
+SENSOR_ID = 987001
+SCOPE = f"sensor:{SENSOR_ID}"
+
+
+def _insert_readings(count, start, step=60):
+    rows = [(SENSOR_ID, 600 + (i % 40), datetime.fromtimestamp(start + i * step, UTC).strftime('%Y-%m-%d %H:%M:%S'))
+            for i in range(count)]
+    db = get_db()
+    db.executemany("INSERT INTO sensor_readings (sensor_id, co2, timestamp) VALUES (?, ?, ?)", rows)
+    db.commit()
+    db.close()
+
+
+class ModelRegistryTestCase(unittest.TestCase):
+    """Test versioning, caching and retraining decisions"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = ModelRegistry(root=self.tmp.name, keep_versions=2, min_new_readings=50)
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+        self.tmp.cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM sensor_readings WHERE sensor_id = ?", (SENSOR_ID,))
+        db.execute("DELETE FROM ml_models WHERE scope = ?", (SCOPE,))
+        db.commit()
+        db.close()
+
+    def test_missing_model_is_not_ready(self):
+        self.registry._skipped[(SCOPE, 'trend_linear')] = time.monotonic()  # no background run
+        with self.assertRaises(ModelNotReady):
+            self.registry.get(SCOPE, 'trend_linear')
+
+    def test_train_versions_and_cache(self):
+        _insert_readings(200, int(time.time()) - 200 * 60)
+        first = self.registry.train(SCOPE, 'trend_linear')
+        self.assertEqual((first['version'], first['samples']), (1, 200))
+
+        model, meta = self.registry.get(SCOPE, 'trend_linear')
+        self.assertIs(self.registry.get(SCOPE, 'trend_linear')[0], model)
+        prediction = model.predict(np.array([[0.0]]))[0]
+        self.assertTrue(590 < prediction < 650)
+
+        self.registry.train(SCOPE, 'trend_linear')
+        self.registry.train(SCOPE, 'trend_linear')
+        db = get_db()
+        versions = [row[0] for row in db.execute(
+            "SELECT version FROM ml_models WHERE scope = ? ORDER BY version", (SCOPE,)).fetchall()]
+        db.close()
+        self.assertEqual(versions, [2, 3])
+        self.assertFalse((Path(self.tmp.name) / first['path']).exists())
+        self.assertEqual(self.registry.get(SCOPE, 'trend_linear')[1]['version'], 3)
+
+    def test_retrain_only_with_new_data(self):
+        start = int(time.time()) - 300 * 60
+        _insert_readings(100, start)
+        self.registry.train(SCOPE, 'isolation_forest')
+        self.assertFalse(self.registry.needs_training(self.registry.latest(SCOPE, 'isolation_forest')))
+
+        _insert_readings(60, start + 100 * 60)
+        self.assertTrue(self.registry.needs_training(self.registry.latest(SCOPE, 'isolation_forest')))
+        self.assertGreaterEqual(self.registry.retrain_due(), 1)
+        self.assertEqual(self.registry.latest(SCOPE, 'isolation_forest')['version'], 2)
+
+    def test_concurrent_training_allocates_distinct_versions(self):
+        _insert_readings(200, int(time.time()) - 200 * 60)
+        fitted = threading.Barrier(2)
+
+        def fit_together(fn, *args, **kwargs):
+            result = fn(*args)
+            fitted.wait(timeout=5)
+            return result
+
+        with mock.patch.object(model_registry.task_pool, 'run', side_effect=fit_together):
+            threads = [threading.Thread(target=self.registry.train, args=(SCOPE, 'trend_linear'))
+                       for _ in range(2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        db = get_db()
+        rows = db.execute("SELECT version, path FROM ml_models WHERE scope = ? ORDER BY version",
+                          (SCOPE,)).fetchall()
+        db.close()
+        self.assertEqual([row['version'] for row in rows], [1, 2])
+        self.assertTrue(all((Path(self.tmp.name) / row['path']).exists() for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
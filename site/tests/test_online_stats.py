@@ -0,0 +1,177 @@
+"""
+Tests for the online per-series statistics (utils.online_stats)
+"""
+
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from advanced_features import calculate_moving_average, calculate_percentiles
+from database import get_db, init_db
+from utils.online_stats import EWMA, OnlineStatsStore, Summary, TDigest, Welford, _bucket_plan
+
+
+class WelfordTestCase(unittest.TestCase):
+    """Test streaming moments and merges"""
+
+    def test_matches_numpy_when_merged(self):
+        values = np.random.default_rng(1).normal(800, 150, 5000)
+        left, right = Welford(), Welford()
+        left.update_many(values[:1234])
+        for v in values[1234:1300]:
+            right.update(v)
+        right.update_many(values[1300:])
+        left.merge(right)
+
+        self.assertEqual(left.count, 5000)
+        self.assertAlmostEqual(left.mean, values.mean(), places=6)
+        self.assertAlmostEqual(left.stddev, values.std(ddof=1), places=6)
+        self.assertEqual((left.min, left.max), (values.min(), values.max()))
+
+    def test_single_value_has_no_variance(self):
+        moments = Welford()
+        moments.update(420)
+        self.assertIsNone(moments.stddev)
+
+
+class TDigestTestCase(unittest.TestCase):
+    """Test quantile accuracy and serialization"""
+
+    def test_quantiles_of_merged_digests(self):
+        values = np.random.default_rng(2).lognormal(6.5, 0.3, 50000)
+        digests = []
+        for chunk in np.array_split(values, 40):
+            digest = TDigest()
+            digest.update_many(chunk)
+            digests.append(TDigest.from_json(digest.to_json()))
+        merged = TDigest()
+        for digest in digests:
+            merged.merge(digest)
+
+        self.assertLess(len(merged.means), 100)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+            exact = np.quantile(values, q)
+            self.assertAlmostEqual(merged.quantile(q), exact, delta=exact * 0.01)
+
+    def test_small_samples_are_exact(self):
+        digest = TDigest()
+        digest.update_many(np.arange(1, 101, dtype=float))
+        self.assertAlmostEqual(digest.quantile(0.5), 50.5)
+        self.assertIsNone(TDigest().quantile(0.5))
+
+
+class SummaryTestCase(unittest.TestCase):
+    """Test bucket summaries and window planning"""
+
+    def test_describe_after_row_roundtrip(self):
+        summary = Summary()
+        summary.update_many(np.array([400, 600, 800, 1000], dtype=float))
+        result = Summary.from_row(*summary.to_row()).describe([50])
+        self.assertEqual(result['count'], 4)
+        self.assertEqual(result['mean'], 700)
+        self.assertEqual(result['min'], 400)
+        self.assertEqual(result['percentiles']['p50'], 700)
+
+    def test_bucket_plan_uses_days_inside_window(self):
+        day = 86400
+        start = 10 * day + 5 * 3600 + 120
+        end = 13 * day + 2 * 3600
+        days, hours, span = _bucket_plan(start, end, hourly_floor=0)
+        self.assertEqual(days, (11, 12))
+        self.assertEqual(hours, [(10 * 24 + 5, 11 * 24 - 1), (13 * 24, 13 * 24 + 1)])
+        self.assertEqual(span, (10 * 24 + 5, 13 * 24 + 2))
+
+    def test_bucket_plan_widens_pruned_hours(self):
+        days, hours, _ = _bucket_plan(10 * 86400 + 3600, 12 * 86400, hourly_floor=11 * 24)
+        self.assertEqual(days, (10, 11))
+        self.assertEqual(hours, [])
+
+    def test_ewma_tracks_level(self):
+        ewma = EWMA(alpha=0.5)
+        ewma.update_many([400, 400, 800, 800, 800, 800])
+        self.assertGreater(ewma.value, 750)
+        self.assertGreater(ewma.stddev, 0)
+
+
+class ListHelpersTestCase(unittest.TestCase):
+    """Test the vectorized percentile and moving-average helpers"""
+
+    def test_percentiles_nearest_rank(self):
+        data = list(range(100, 0, -1))
+        self.assertEqual(calculate_percentiles(data, [0, 50, 99, 100]),
+                         {'p0': 1, 'p50': 51, 'p99': 100, 'p100': 100})
+
+    def test_moving_average(self):
+        self.assertEqual(calculate_moving_average([1, 2, 3, 4, 5], window=2), [1.5, 2.5, 3.5, 4.5])
+        self.assertEqual(calculate_moving_average([1, 2], window=5), [1, 2])
+
+
+class StoreTestCase(unittest.TestCase):
+    """Test background flushes and per-process EWMA rows"""
+
+    SERIES = "sensor:987038"
+    HOUR_START = time.time() // 3600 * 3600 - 3600
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def tearDown(self):
+        db = get_db()
+        db.execute("DELETE FROM series_stats WHERE series = ?", (self.SERIES,))
+        db.execute("DELETE FROM series_ewma WHERE series = ?", (self.SERIES,))
+        db.commit()
+        db.close()
+
+    def test_flush_runs_in_background(self):
+        store = OnlineStatsStore(flush_interval=0.05)
+        store.observe(self.SERIES, [self.HOUR_START + 60], [640.0])
+        deadline = time.monotonic() + 5
+        while store._pending and time.monotonic() < deadline:
+            time.sleep(0.02)
+        store.stop()
+        self.assertEqual(store.summarize(self.SERIES, self.HOUR_START, self.HOUR_START + 3600)['count'], 1)
+
+    def test_processes_keep_their_own_ewma(self):
+        first, second = OnlineStatsStore(flush_interval=3600), OnlineStatsStore(flush_interval=3600)
+        second.writer = "other-host:1"
+        first.observe(self.SERIES, [self.HOUR_START + 60], [500.0])
+        second.observe(self.SERIES, [self.HOUR_START + 120], [900.0])
+        second.stop()
+        first.stop()
+
+        db = get_db()
+        rows = db.execute("SELECT writer, value FROM series_ewma WHERE series = ? ORDER BY last_ts",
+                          (self.SERIES,)).fetchall()
+        db.close()
+        self.assertEqual([tuple(row) for row in rows], [(first.writer, 500.0), ("other-host:1", 900.0)])
+        latest = OnlineStatsStore().summarize(self.SERIES, self.HOUR_START, self.HOUR_START + 3600)
+        self.assertEqual(latest['ewma'], 900.0)
+
+    def test_concurrent_flushes_keep_all_deltas(self):
+        stores = [OnlineStatsStore(flush_interval=float('inf')) for _ in range(2)]
+
+        def ingest(store):
+            for i in range(50):
+                store.observe(self.SERIES, [self.HOUR_START + i], [600.0])
+                store.flush()
+
+        threads = [threading.Thread(target=ingest, args=(store,)) for store in stores]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertFalse(any(store._pending for store in stores))
+        summary = OnlineStatsStore().summarize(self.SERIES, self.HOUR_START, self.HOUR_START + 3600)
+        self.assertEqual(summary['count'], 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Tests for single-pass period comparisons (utils.period_compare)
+"""
+
+import sys
+import unittest
+from datetime import datetime, timedelta, UTC
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.period_compare import (compare_readings, compare_rollups, percent_change, period_windows,
+                                  split_windows)
+from utils.rollups import TilePyramid
+
+USER_ID = 987045
+SERIES = "sensor:987045"
+NOW = datetime(2026, 3, 18, 12, 30)
+
+
+class PeriodWindowsTestCase(unittest.TestCase):
+    """Test window construction"""
+
+    def test_rolling_and_calendar_windows(self):
+        weeks = period_windows('week', 3, now=NOW)
+        self.assertEqual(weeks[0], (NOW - timedelta(days=7), None))
+        self.assertEqual(weeks[2], (NOW - timedelta(days=21), NOW - timedelta(days=14)))
+
+        months = period_windows('month', 3, now=NOW)
+        self.assertEqual([start for start, _ in months],
+                         [datetime(2026, 3, 1), datetime(2026, 2, 1), datetime(2026, 1, 1)])
+        self.assertEqual(months[1][1], datetime(2026, 3, 1))
+        self.assertEqual(period_windows('year', 2, now=NOW)[1], (datetime(2025, 1, 1), datetime(2026, 1, 1)))
+
+        for unit, periods in (('decade', 2), ('week', 0), ('week', 100)):
+            with self.assertRaises(ValueError):
+                period_windows(unit, periods)
+
+    def test_split_and_change(self):
+        recent, older = split_windows(datetime(2026, 1, 1), datetime(2026, 1, 3))
+        self.assertEqual(recent, (datetime(2026, 1, 2), None))
+        self.assertEqual(older[1], datetime(2026, 1, 2))
+        self.assertEqual(percent_change(110, 100), 10.0)
+        self.assertEqual(percent_change(110, None), 0)
+
+
+class CompareQueriesTestCase(unittest.TestCase):
+    """Test the single-scan aggregates against per-period expectations"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM co2_readings WHERE user_id = ?", (USER_ID,))
+        db.execute("DELETE FROM series_rollups WHERE series = ?", (SERIES,))
+        db.commit()
+        db.close()
+
+    def test_readings_per_period_and_day(self):
+        db = get_db()
+        # One reading per hour over four weeks, ppm = 400 + weeks ago * 100
+        for hour in range(28 * 24):
+            stamp = NOW - timedelta(hours=hour, minutes=1)
+            db.execute("INSERT INTO co2_readings (timestamp, ppm, user_id, source) VALUES (?, ?, ?, 'live')",
+                       (stamp.strftime('%Y-%m-%d %H:%M:%S'), 400 + hour // 168 * 100, USER_ID))
+        db.commit()
+        windows = period_windows('week', 5, now=NOW)
+        periods = compare_readings(db, windows, "user_id = ?", (USER_ID,))
+        days = compare_readings(db, windows[:2], "user_id = ?", (USER_ID,), by_day=True)
+        db.close()
+
+        self.assertEqual([p['count'] for p in periods], [168, 168, 168, 168, 0])
+        self.assertEqual([p['avg'] for p in periods[:4]], [400, 500, 600, 700])
+        self.assertIsNone(periods[4]['avg'])
+        self.assertEqual(sum(day['count'] for day in days[1]['days']), 168)
+        self.assertEqual(days[0]['avg'], 400)
+        self.assertEqual(len(days[0]['days']), 8)
+
+    def test_rollups_daily_and_hourly(self):
+        start = int(datetime(2026, 3, 1).timestamp()) // 86400 * 86400
+        ts = start + np.arange(0, 14 * 86400, 600)
+        values = np.where(ts < start + 7 * 86400, 500.0, 800.0)
+        TilePyramid().process([SERIES], ts, values)
+        first = datetime.fromtimestamp(start, UTC).replace(tzinfo=None)
+
+        db = get_db()
+        daily = compare_rollups(db, SERIES, [(first + timedelta(days=7), None), (first, first + timedelta(days=7))])
+        hourly = compare_rollups(db, SERIES, [(first + timedelta(days=7, hours=12), None)])
+        db.close()
+
+        self.assertEqual([p['avg'] for p in daily], [800, 500])
+        self.assertEqual([p['count'] for p in daily], [1008, 1008])
+        self.assertEqual(hourly[0]['count'], 1008 - 72)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+"""
+Tests for batched recommendation inputs over rollups (utils.ai_recommender)
+"""
+
+import sys
+import time
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.ai_recommender import AIRecommender, RecommendationEngine
+from utils.rollups import TilePyramid
+
+SENSORS = (987049, 987050, 987051, 987053)
+NOW = time.time() // 60 * 60
+
+
+class RecommendationEngineTestCase(unittest.TestCase):
+    """Test one-pass inputs for several sensors and version-keyed caching"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self._cleanup()
+        self.engine = RecommendationEngine()
+        pyramid = TilePyramid()
+        # Sensor 1: 500 ppm, 1200 ppm at 14:00 UTC, rising 30 ppm per day over a week
+        ts = NOW - np.arange(1, 7 * 86400, 300)[::-1]
+        hour = (ts // 3600 % 24).astype(int)
+        values = 500.0 + (hour == 14) * 700 + (ts - ts[0]) // 86400 * 30
+        pyramid.process([f"sensor:{SENSORS[0]}"], ts, values)
+        # Sensor 2: one reading ten minutes ago only
+        pyramid.process([f"sensor:{SENSORS[1]}"], [NOW - 600], [900.0])
+        # Sensor 4: two days of data six days apart
+        pyramid.process([f"sensor:{SENSORS[3]}"], [NOW - 6 * 86400, NOW - 60], [500.0, 800.0])
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.executemany("DELETE FROM series_rollups WHERE series = ?", [(f"sensor:{s}",) for s in SENSORS])
+        db.commit()
+        db.close()
+
+    def test_batch_inputs(self):
+        db = get_db()
+        inputs = self.engine.compute(db, list(SENSORS), now=NOW)
+        db.close()
+
+        first = inputs[SENSORS[0]]
+        self.assertEqual(first['peak_hours'][0]['hour'], 14)
+        self.assertGreater(first['peak_hours'][0]['ppm'], 1100)
+        self.assertEqual(len(first['peak_hours']), 3)
+        self.assertEqual(first['trend']['trend'], 'increasing')
+        self.assertIsNotNone(first['current_avg'])
+
+        self.assertEqual(inputs[SENSORS[1]]['current_avg'], 900.0)
+        self.assertIsNone(inputs[SENSORS[1]]['trend'])
+        self.assertEqual(inputs[SENSORS[2]], {'current_avg': None, 'peak_hours': [], 'trend': None})
+        self.assertAlmostEqual(inputs[SENSORS[3]]['trend']['rate'], 50.0)
+
+    def test_cache_follows_data_version(self):
+        cached = self.engine.inputs(SENSORS)
+        self.assertIs(self.engine.inputs([SENSORS[1]])[SENSORS[1]], cached[SENSORS[1]])
+
+        TilePyramid().process([f"sensor:{SENSORS[1]}"], [time.time()], [1500.0])
+        fresh = self.engine.inputs(SENSORS)
+        self.assertIsNot(fresh[SENSORS[1]], cached[SENSORS[1]])
+        self.assertIs(fresh[SENSORS[0]], cached[SENSORS[0]])
+        self.assertEqual(fresh[SENSORS[1]]['current_avg'], 1200.0)
+
+    def test_rules_apply_to_inputs(self):
+        recs = AIRecommender().build_recommendations(
+            {'current_avg': 1100.0, 'peak_hours': [], 'trend': None}, 'school', 10
+        )
+        ids = [rec['id'] for rec in recs]
+        self.assertIn('co2_exceeds_optimal', ids)
+        self.assertIn('school_air_breaks', ids)
+        self.assertEqual(recs[0]['priority'], 'critical')
+
+
+class RecommendationRouteTestCase(unittest.TestCase):
+    """Test that per-sensor recommendations are limited to the user's sensors"""
+
+    USER_ID = 987056
+
+    @classmethod
+    def setUpClass(cls):
+        from app import app
+        init_db()
+        app.config['TESTING'] = True
+        cls.client = app.test_client()
+        db = get_db()
+        cls.own_sensor, cls.foreign_sensor = (db.execute(
+            "INSERT INTO user_sensors (user_id, name, type, interface, config) VALUES (?, ?, 'scd30', 'i2c', '{}')",
+            (user_id, name)
+        ).lastrowid for user_id, name in ((cls.USER_ID, 'Bureau'), (cls.USER_ID + 1, 'Voisin')))
+        db.commit()
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        db = get_db()
+        db.execute("DELETE FROM user_sensors WHERE user_id IN (?, ?)", (cls.USER_ID, cls.USER_ID + 1))
+        db.commit()
+        db.close()
+
+    def setUp(self):
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = self.USER_ID
+
+    def test_foreign_sensor_is_not_found(self):
+        response = self.client.get(f'/api/recommendations/{self.foreign_sensor}')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(self.client.get(f'/api/recommendations/{self.own_sensor}').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
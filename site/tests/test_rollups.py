@@ -0,0 +1,75 @@
+"""
+Tests for the chart tile pyramid (utils.rollups)
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.rollups import TILE_BUCKETS, TilePyramid
+
+SERIES = "sensor:987003"
+START = 1_780_000_000 // 86400 * 86400  # day-aligned
+
+
+class TilePyramidTestCase(unittest.TestCase):
+    """Test incremental rollups, tile reads, rebuild and pruning"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self.pyramid = TilePyramid()
+        self._cleanup()
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM series_rollups WHERE series = ?", (SERIES,))
+        db.commit()
+        db.close()
+
+    def test_batches_merge_into_buckets(self):
+        ts = START + np.arange(0, 7200, 10)
+        values = 600 + (np.arange(len(ts)) % 60)
+        half = len(ts) // 2
+        self.pyramid.process([SERIES], ts[:half + 3], values[:half + 3])
+        self.pyramid.process([SERIES], ts[half + 3:], values[half + 3:])
+
+        tile = self.pyramid.tile(SERIES, 600, START // 600 // TILE_BUCKETS)
+        self.assertEqual(len(tile['t']), 12)
+        self.assertEqual(sum(tile['count']), len(ts))
+        self.assertEqual(tile['t'][0], START)
+        self.assertEqual((min(tile['min']), max(tile['max'])), (600, 659))
+        self.assertAlmostEqual(tile['avg'][0], 629.5)
+
+        hourly = self.pyramid.tile(SERIES, 3600, START // 3600 // TILE_BUCKETS)
+        self.assertEqual(hourly['count'], [360, 360])
+        with self.assertRaises(ValueError):
+            self.pyramid.tile(SERIES, 5, 0)
+
+    def test_rebuild_replaces_and_prune_drops_fine_levels(self):
+        class Columns:
+            ts = START + np.arange(0, 3600, 60)
+            ppm = np.full(60, 700.0)
+
+        self.pyramid.process([SERIES], Columns.ts, Columns.ppm)
+        self.pyramid.rebuild(SERIES, Columns, START)
+        tile = self.pyramid.tile(SERIES, 60, START // 60 // TILE_BUCKETS)
+        self.assertEqual(set(tile['count']), {1})
+
+        self.pyramid.prune(now=START + 40 * 86400)
+        self.assertEqual(self.pyramid.tile(SERIES, 60, START // 60 // TILE_BUCKETS)['t'], [])
+        self.assertEqual(self.pyramid.tile(SERIES, 3600, START // 3600 // TILE_BUCKETS)['count'], [60])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Tests for the global search index (utils.search_index)
+"""
+
+import json
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.search_index import SearchIndex, SearchService, normalize
+
+USER_ID = 987047
+
+
+class SearchIndexTestCase(unittest.TestCase):
+    """Test normalisation, prefix matching and ranking"""
+
+    def setUp(self):
+        self.index = SearchIndex()
+        for doc_id, title in (('a', 'Export de données'), ('b', 'Import de données'), ('c', 'Données brutes'),
+                              ('d', 'Cœur de réseau')):
+            self.index.add(doc_id, title, {'title': title})
+
+    def test_normalize(self):
+        self.assertEqual(normalize('Niveau de CO₂ — Données'), 'niveau de co2 donnees')
+        self.assertEqual(normalize('Cœur'), 'coeur')
+
+    def test_accent_insensitive_prefix_search(self):
+        titles = [payload['title'] for _, payload in self.index.search(normalize('donne'))]
+        self.assertEqual(titles[0], 'Données brutes')
+        self.assertEqual(len(titles), 3)
+        self.assertEqual([p['title'] for _, p in self.index.search('exp donnees')], ['Export de données'])
+        self.assertEqual([p['title'] for _, p in self.index.search('coeur')], ['Cœur de réseau'])
+        self.assertEqual(self.index.search('xyz'), [])
+
+    def test_remove_and_reindex(self):
+        self.index.remove('c')
+        self.index.add('a', 'Sauvegarde', {'title': 'Sauvegarde'})
+        self.assertEqual([p['title'] for _, p in self.index.search('donnees')], ['Import de données'])
+        self.assertEqual(len(self.index), 3)
+
+
+class SearchServiceTestCase(unittest.TestCase):
+    """Test per-user indexes loaded from the database and refreshed on write"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+
+    def setUp(self):
+        self._cleanup()
+        self.service = SearchService()
+        self.service.build_static(
+            [{'name': 'Capteurs', 'url': '/sensors', 'icon': ''},
+             {'name': 'Journal d\'audit', 'url': '/admin/audit', 'icon': '', 'admin': True}],
+            {'seuil': {'title': 'Seuils d\'alerte', 'url': '/settings', 'desc': ''}},
+            {'sensor': '/sensors'}
+        )
+
+    def tearDown(self):
+        self._cleanup()
+
+    def _cleanup(self):
+        db = get_db()
+        db.execute("DELETE FROM user_sensors WHERE user_id = ?", (USER_ID,))
+        db.commit()
+        db.close()
+
+    def _add_sensor(self, name, location):
+        db = get_db()
+        cursor = db.execute(
+            "INSERT INTO user_sensors (user_id, name, type, interface, config) VALUES (?, ?, 'scd30', 'i2c', ?)",
+            (USER_ID, name, json.dumps({'location': location}))
+        )
+        db.commit()
+        db.close()
+        return cursor.lastrowid
+
+    def test_user_documents_and_refresh(self):
+        first = self._add_sensor('Capteur salle de réunion', 'Étage 2')
+        results = self.service.search(USER_ID, 'capt')
+        self.assertEqual([r['category'] for r in results], ['sensor', 'page'])
+        self.assertEqual(self.service.search(USER_ID, 'etage')[0]['description'], 'Capteur: Étage 2')
+
+        second = self._add_sensor('Cuisine', None)
+        self.assertEqual(self.service.search(USER_ID, 'cuisine'), [])
+        self.service.refresh('sensor', second)
+        self.assertEqual(self.service.search(USER_ID, 'cuisine')[0]['title'], 'Cuisine')
+
+        db = get_db()
+        db.execute("DELETE FROM user_sensors WHERE id = ?", (first,))
+        db.commit()
+        db.close()
+        self.service.refresh('sensor', first)
+        self.assertEqual(self.service.search(USER_ID, 'reunion'), [])
+
+    def test_admin_pages_and_short_queries(self):
+        self.assertEqual(self.service.search(USER_ID, 'journal'), [])
+        self.assertEqual(len(self.service.search(USER_ID, 'journal', include_admin=True)), 1)
+        self.assertEqual(self.service.search(USER_ID, 'a'), [])
+        self.assertEqual(self.service.search(None, 'seuils')[0]['category'], 'help')
+
+
+if __name__ == '__main__':
+    unittest.main()
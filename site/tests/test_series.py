@@ -0,0 +1,94 @@
+"""
+Tests for column-oriented reading access (utils.series) and vectorized analytics
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from database import get_db, init_db
+from utils.series import ReadingColumns, fetch_reading_columns
+from advanced_features import AdvancedAnalytics, VisualizationEngine
+
+
+class ReadingColumnsTestCase(unittest.TestCase):
+    """Test the dict adapter and timestamp formatting"""
+
+    def test_from_dicts_sorts_and_types_columns(self):
+        columns = ReadingColumns.from_dicts([
+            {'timestamp': '2026-01-05 10:00:00', 'ppm': 700, 'humidity': None},
+            {'timestamp': '2026-01-05T09:00:00Z', 'ppm': 600, 'temperature': 21.5, 'humidity': 40},
+            {'timestamp': 'garbage', 'ppm': 800},
+        ])
+        self.assertEqual(len(columns), 2)
+        self.assertEqual(columns.ts.dtype, np.int64)
+        self.assertEqual(columns.ppm.dtype, np.float32)
+        self.assertEqual(columns.ppm.tolist(), [600.0, 700.0])
+        self.assertTrue(np.isnan(columns.humidity[1]))
+        self.assertEqual(columns.timestamps(), ['2026-01-05 09:00:00', '2026-01-05 10:00:00'])
+
+
+class VectorizedAnalyticsTestCase(unittest.TestCase):
+    """Test analytics on ReadingColumns"""
+
+    def setUp(self):
+        # Monday 2026-01-05 00:00 UTC, one reading per hour for a week
+        start = 1767571200
+        ts = start + np.arange(7 * 24, dtype=np.int64) * 3600
+        ppm = np.full(len(ts), 600, dtype=np.float32)
+        ppm[10] = 2000
+        nan = np.full(len(ts), np.nan, dtype=np.float32)
+        self.columns = ReadingColumns(ts, ppm, nan, nan)
+
+    def test_heatmap_buckets_by_weekday_and_hour(self):
+        result = VisualizationEngine.generate_heatmap_data(self.columns)
+        self.assertEqual(result['data_points'], 168)
+        self.assertEqual(result['heatmap'][0][10], 2000)
+        self.assertEqual(result['heatmap'][6][23], 600)
+
+    def test_stddev_anomalies_report_timestamps(self):
+        result = AdvancedAnalytics.detect_anomalies(self.columns)
+        self.assertEqual(result['anomaly_count'], 1)
+        self.assertEqual(result['anomalies'][0]['timestamp'], '2026-01-05 10:00:00')
+
+    def test_correlation_skips_missing_values(self):
+        result = VisualizationEngine.generate_correlation_data(self.columns, ['ppm', 'humidity'])
+        self.assertEqual(result['correlations'], [])
+
+
+class FetchSourcesTestCase(unittest.TestCase):
+    """Test that user readings default to real sensor sources"""
+
+    USER_ID = 987057
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        db = get_db()
+        db.executemany(
+            "INSERT INTO co2_readings (timestamp, ppm, source, user_id) VALUES (datetime('now', '-1 hour'), ?, ?, ?)",
+            [(600, 'sensor', cls.USER_ID), (700, 'live', cls.USER_ID), (900, 'sim', cls.USER_ID),
+             (1000, 'import', cls.USER_ID)]
+        )
+        db.commit()
+        db.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        db = get_db()
+        db.execute("DELETE FROM co2_readings WHERE user_id = ?", (cls.USER_ID,))
+        db.commit()
+        db.close()
+
+    def test_sources_filter(self):
+        self.assertEqual(sorted(fetch_reading_columns(user_id=self.USER_ID).ppm.tolist()), [600, 700])
+        self.assertEqual(fetch_reading_columns(user_id=self.USER_ID, sources=('sim',)).ppm.tolist(), [900])
+        self.assertEqual(len(fetch_reading_columns(user_id=self.USER_ID, sources=None)), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
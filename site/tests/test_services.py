@@ -0,0 +1,73 @@
+"""
+Tests for analytics services shared across request threads
+"""
+
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import database
+from database import get_db, init_db
+from utils.admin_tools import LogAnalytics
+from utils.ai_recommender import AIRecommender
+from utils.collaboration import CollaborationManager
+from utils.ml_analytics import MLAnalytics
+from utils.performance_optimizer import QueryOptimizer
+from utils.tenant_manager import TenantManager
+
+READING_ID = 987052
+USER_ID = 987052
+
+
+class SharedServicesTestCase(unittest.TestCase):
+    """Test that services borrow pooled connections per call"""
+
+    @classmethod
+    def setUpClass(cls):
+        init_db()
+        for i in range(3):
+            CollaborationManager().add_comment(READING_ID, USER_ID, f'Fenêtre ouverte {i}')
+
+    @classmethod
+    def tearDownClass(cls):
+        db = get_db()
+        db.execute("DELETE FROM reading_comments WHERE reading_id = ?", (READING_ID,))
+        db.commit()
+        db.close()
+
+    def test_services_hold_no_connection(self):
+        for service in (MLAnalytics(), TenantManager(), CollaborationManager(), AIRecommender(),
+                        LogAnalytics(), QueryOptimizer()):
+            self.assertFalse(hasattr(service, 'db'), type(service).__name__)
+
+    def test_concurrent_calls_return_connections(self):
+        collab, logs = CollaborationManager(), LogAnalytics()
+        expected = collab.get_reading_comments(READING_ID)
+        self.assertEqual(len(expected), 3)
+
+        def call(_):
+            return collab.get_reading_comments(READING_ID), logs.get_activity_stats(days=1)['success']
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(call, range(64)))
+        self.assertTrue(all(result == (expected, True) for result in results))
+        self.assertLessEqual(database._db_pool.qsize(), database.DB_POOL_SIZE)
+        self.assertGreater(database._db_pool.qsize(), 0)
+
+    def test_query_stats_are_consistent_under_threads(self):
+        optimizer = QueryOptimizer()
+
+        def track(_):
+            for _ in range(100):
+                optimizer._track_query('readings', 0.001, 1)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(track, range(8)))
+        self.assertEqual(optimizer.get_query_stats()['readings']['count'], 800)
+
+
+if __name__ == '__main__':
+    unittest.main()
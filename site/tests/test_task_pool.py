@@ -0,0 +1,73 @@
+"""
+Tests for the CPU task process pool (utils.task_pool)
+"""
+
+import os
+import sys
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.task_pool import PoolBusy, TaskPool, TaskTimeout
+
+
+def _square(x):
+    return x * x, os.getpid()
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _swallowing_sleep(seconds):
+    try:
+        time.sleep(seconds)
+    except Exception:
+        return 'swallowed'
+    return seconds
+
+
+class TaskPoolTestCase(unittest.TestCase):
+    """Test results, time limits, queue bound and cancellation"""
+
+    def setUp(self):
+        self.pool = TaskPool(max_workers=1, max_queue=1, timeout=5)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_runs_in_worker_process(self):
+        value, pid = self.pool.run(_square, 7)
+        self.assertEqual(value, 49)
+        self.assertNotEqual(pid, os.getpid())
+
+    def test_worker_enforces_time_limit(self):
+        job = self.pool.submit(_swallowing_sleep, 5, timeout=0.2)
+        while not job.future.done():
+            time.sleep(0.05)
+        self.assertEqual(job.state, 'timeout')
+        # The worker is free again
+        self.assertEqual(self.pool.run(_square, 3)[0], 9)
+
+    def test_run_raises_on_timeout(self):
+        with self.assertRaises(TaskTimeout):
+            self.pool.run(_sleep, 5, timeout=0.2)
+
+    def test_queue_is_bounded_and_queued_jobs_cancel(self):
+        running = self.pool.submit(_sleep, 0.5)
+        queued = self.pool.submit(_sleep, 0.5)
+        with self.assertRaises(PoolBusy):
+            self.pool.submit(_sleep, 0.5)
+
+        self.assertTrue(self.pool.cancel(queued.id))
+        self.assertEqual(queued.state, 'cancelled')
+        self.assertEqual(running.future.result(timeout=5), 0.5)
+        self.assertEqual(running.state, 'done')
+        self.assertIs(self.pool.get(running.id, owner=42), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
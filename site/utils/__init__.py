@@ -11,5 +11,21 @@ __all__ = [
     'performance_optimizer',
     'ai_recommender',
     'ml_analytics',
-    'tenant_manager'
+    'tenant_manager',
+    'live_feed',
+    'ingest',
+    'compression',
+    'series',
+    'online_stats',
+    'anomaly_stream',
+    'model_registry',
+    'forecast',
+    'task_pool',
+    'downsample',
+    'rollups',
+    'period_compare',
+    'exposure',
+    'search_index',
+    'fulltext',
+    'heatmap'
 ]
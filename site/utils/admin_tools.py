@@ -6,6 +6,7 @@ Provides advanced admin tools for user management, analytics, and system monitor
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from database import get_db, DB_PATH
+from utils import fulltext
 import json
 import os
 from pathlib import Path
@@ -138,14 +139,10 @@ class AdminAnalytics:
             WHERE (julianday(timestamp) - julianday(prev_timestamp)) * 1440 > 30
         """).fetchone()[0]
         
-        # Get duplicate readings
+        # Duplicate readings dropped at ingest over the last week (they are never stored)
         duplicates = db.execute("""
-            SELECT COUNT(*) FROM (
-                SELECT timestamp, ppm, COUNT(*) 
-                FROM co2_readings 
-                GROUP BY timestamp, ppm 
-                HAVING COUNT(*) > 1
-            )
+            SELECT COALESCE(SUM(value), 0) FROM ingest_counters
+            WHERE name = 'duplicates' AND day >= date('now', '-7 days')
         """).fetchone()[0]
         
         # Get readings outside normal range
@@ -164,7 +161,7 @@ class AdminAnalytics:
             'data_gaps': gaps,
             'duplicates': duplicates,
             'outliers': outliers,
-            'quality_score': round((1 - (gaps + duplicates + outliers) / max(total, 1)) * 100, 1)
+            'quality_score': round((1 - (gaps + outliers) / max(total, 1)) * 100, 1)
         }
 
 
@@ -980,28 +977,32 @@ class UserManager:
     """Manage user accounts and permissions"""
     
     def __init__(self):
-        self.db = get_db()
         self._ensure_user_columns()
 
     def _ensure_user_columns(self):
         """Add missing user columns if they are absent (non-breaking)."""
-        cursor = self.db.cursor()
-        for col_def in [
-            ("is_admin", "INTEGER DEFAULT 0"),
-            ("is_active", "INTEGER DEFAULT 1"),
-            ("last_login", "DATETIME")
-        ]:
-            try:
-                cursor.execute(f"ALTER TABLE users ADD COLUMN {col_def[0]} {col_def[1]}")
-            except Exception:
-                # Column already exists, keep going
-                pass
-        self.db.commit()
+        db = get_db()
+        try:
+            cursor = db.cursor()
+            for col_def in [
+                ("is_admin", "INTEGER DEFAULT 0"),
+                ("is_active", "INTEGER DEFAULT 1"),
+                ("last_login", "DATETIME")
+            ]:
+                try:
+                    cursor.execute(f"ALTER TABLE users ADD COLUMN {col_def[0]} {col_def[1]}")
+                except Exception:
+                    # Column already exists, keep going
+                    pass
+            db.commit()
+        finally:
+            db.close()
     
     def list_users(self, page: int = 1, per_page: int = 50) -> Dict:
         """Get paginated list of users"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             offset = (page - 1) * per_page
             
             cursor.execute('''
@@ -1036,60 +1037,75 @@ class UserManager:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def enable_user(self, user_id: int) -> Dict:
         """Enable a user account"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('UPDATE users SET is_active = 1 WHERE id = ?', (user_id,))
-            self.db.commit()
+            db.commit()
             return {'success': True, 'message': f'User {user_id} enabled'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def disable_user(self, user_id: int) -> Dict:
         """Disable a user account"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('UPDATE users SET is_active = 0 WHERE id = ?', (user_id,))
-            self.db.commit()
+            db.commit()
             return {'success': True, 'message': f'User {user_id} disabled'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def reset_password(self, user_id: int, new_password: str) -> Dict:
         """Reset user password"""
+        db = get_db()
         try:
             from werkzeug.security import generate_password_hash
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             hashed = generate_password_hash(new_password)
             cursor.execute(
                 'UPDATE users SET password_hash = ? WHERE id = ?',
                 (hashed, user_id)
             )
-            self.db.commit()
+            db.commit()
             return {'success': True, 'message': f'Password reset for user {user_id}'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def set_admin_status(self, user_id: int, is_admin: bool) -> Dict:
         """Set user admin status"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute(
                 'UPDATE users SET is_admin = ?, role = ? WHERE id = ?',
                 (int(is_admin), 'admin' if is_admin else 'user', user_id)
             )
-            self.db.commit()
+            db.commit()
             status = "promoted" if is_admin else "demoted"
             return {'success': True, 'message': f'User {user_id} {status}'}
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def get_user_activity(self, user_id: int) -> Dict:
         """Get user activity summary"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             
             # Get user info
             cursor.execute(
@@ -1127,54 +1143,49 @@ class UserManager:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
 
 
 class LogAnalytics:
     """Analyze and export audit logs"""
     
-    def __init__(self):
-        self.db = get_db()
-    
     def search_logs(self, query: str, action: Optional[str] = None, 
-                   days: int = 30, limit: int = 100) -> Dict:
-        """Search audit logs by user or action"""
+                   days: int = 30, limit: int = 100, cursor: Optional[str] = None) -> Dict:
+        """Full-text search of audit logs (user, action, entity, details), best match first.
+
+        Pass the returned ``next_cursor`` back as ``cursor`` for the next page.
+        """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
-            where_clauses = ["timestamp > datetime('now', ? || ' days')"]
+            where_clauses = ["t.timestamp > datetime('now', ? || ' days')"]
             params = [f'-{days}']
             
-            if query:
-                where_clauses.append('(username LIKE ? OR action LIKE ?)')
-                search_term = f'%{query}%'
-                params.extend([search_term, search_term])
-            
             if action:
-                where_clauses.append('action = ?')
+                where_clauses.append('t.action = ?')
                 params.append(action)
             
-            where_sql = ' AND '.join(where_clauses)
-            
-            cursor.execute(f'''
-                SELECT id, user_id, username, action, entity_type, timestamp, status
-                FROM audit_logs
-                WHERE {where_sql}
-                ORDER BY timestamp DESC
-                LIMIT ?
-            ''', params + [limit])
-            
-            logs = cursor.fetchall()
+            logs, next_cursor = fulltext.search(
+                db, 'audit_logs', query,
+                columns='t.id, t.user_id, t.username, t.action, t.entity_type, t.timestamp, t.status',
+                where=' AND '.join(where_clauses), params=params, limit=limit, cursor=cursor
+            )
             return {
                 'success': True,
-                'logs': [dict(log) for log in logs],
-                'count': len(logs)
+                'logs': [fulltext.row_dict(log) for log in logs],
+                'count': len(logs),
+                'next_cursor': next_cursor
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def get_activity_stats(self, days: int = 30) -> Dict:
         """Get activity statistics"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             
             # Top actions
             cursor.execute('''
@@ -1214,14 +1225,17 @@ class LogAnalytics:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def export_csv(self, days: int = 30) -> Dict:
         """Export audit logs as CSV"""
+        db = get_db()
         try:
             import csv
             from io import StringIO
             
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 SELECT id, user_id, username, action, entity_type, details, timestamp, status, severity
                 FROM audit_logs
@@ -1250,11 +1264,14 @@ class LogAnalytics:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def export_json(self, days: int = 30) -> Dict:
         """Export audit logs as JSON"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 SELECT id, user_id, username, action, entity_type, details, timestamp, status, severity
                 FROM audit_logs
@@ -1273,21 +1290,21 @@ class LogAnalytics:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
 
 
 class MaintenanceManager:
     """Handle automated maintenance tasks"""
     
-    def __init__(self):
-        self.db = get_db()
-    
     def optimize_database(self) -> Dict:
         """Optimize database (vacuum, analyze)"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('VACUUM')
             cursor.execute('ANALYZE')
-            self.db.commit()
+            db.commit()
             return {
                 'success': True,
                 'message': 'Database optimized successfully',
@@ -1295,18 +1312,21 @@ class MaintenanceManager:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def rotate_logs(self, days: int = 90) -> Dict:
         """Archive old audit logs"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 DELETE FROM audit_logs 
                 WHERE timestamp < datetime('now', ? || ' days')
             ''', (f'-{days}',))
             
             deleted = cursor.rowcount
-            self.db.commit()
+            db.commit()
             
             return {
                 'success': True,
@@ -1315,6 +1335,8 @@ class MaintenanceManager:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
     
     def cleanup_backups(self, keep_count: int = 10) -> Dict:
         """Remove old backups, keep most recent N"""
@@ -1349,8 +1371,9 @@ class MaintenanceManager:
     
     def get_maintenance_status(self) -> Dict:
         """Get current maintenance status"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             
             # Database size
             cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
@@ -1373,6 +1396,8 @@ class MaintenanceManager:
             }
         except Exception as e:
             return {'success': False, 'error': str(e)}
+        finally:
+            db.close()
 
 
 if __name__ == "__main__":
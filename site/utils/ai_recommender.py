@@ -1,12 +1,205 @@
 """
 AI Recommendations Engine
 Generate context-aware recommendations based on CO₂ patterns and building characteristics
+
+The per-sensor inputs (last-hour average, peak hours of the week, daily trend)
+are computed by ``RecommendationEngine`` for any number of sensors in one query
+over the chart rollups (:mod:`utils.rollups`) and cached per sensor with the
+data version they were computed from. Ingest schedules a background refresh of
+the sensors it wrote to, so requests usually read the cache; writes made by
+other processes (the sensor poller) only change the data version, and the next
+request recomputes those sensors.
 """
 
 import json
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
 from database import get_db
+from utils.logger import configure_logging
+from utils.online_stats import series_key
+
+logger = configure_logging()
+
+PEAK_DAYS = 7
+TREND_DAYS = 7
+# Cached inputs are recomputed when the sensor has new data or after this many seconds
+MAX_AGE_SECONDS = 300
+# Delay before a background refresh, coalescing the ingest batches that follow
+REFRESH_DELAY_SECONDS = 1.0
+MAX_CACHED_SENSORS = 4096
+
+
+class RecommendationEngine:
+    """Batched recommendation inputs per sensor, cached by data version.
+
+    The data version of a sensor is its latest one-minute rollup bucket and the
+    count in it, read with one primary-key lookup per sensor.
+    All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._cache: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = set()
+        self._refreshing = False
+
+    @staticmethod
+    def versions(db, sensor_ids: List[int]) -> Dict[int, Optional[tuple]]:
+        """{sensor id: (latest minute bucket, its count)}, None for sensors without data."""
+        versions = {}
+        for sensor_id in sensor_ids:
+            # Walks the primary key backwards and stops at the first row
+            row = db.execute("""
+                SELECT bucket, count FROM series_rollups
+                WHERE series = ? AND resolution = 60
+                ORDER BY bucket DESC LIMIT 1
+            """, (series_key(sensor_id=sensor_id),)).fetchone()
+            versions[sensor_id] = (row[0], row[1]) if row else None
+        return versions
+
+    @staticmethod
+    def compute(db, sensor_ids: List[int], now: Optional[float] = None) -> Dict[int, Dict]:
+        """Recommendation inputs of ``sensor_ids`` from one rollup scan.
+
+        Returns {sensor id: {'current_avg', 'peak_hours', 'trend'}} where
+        ``current_avg`` is the last-hour mean (None without data), ``peak_hours``
+        the three UTC hours of the day with the highest mean over ``PEAK_DAYS``
+        and ``trend`` the day-over-day drift over ``TREND_DAYS`` (None with fewer
+        than two days of data), with ``rate`` in ppm per elapsed day.
+        """
+        now = time.time() if now is None else now
+        n = len(sensor_ids)
+        result = {sensor_id: {'current_avg': None, 'peak_hours': [], 'trend': None} for sensor_id in sensor_ids}
+        if not n:
+            return result
+        index = {series_key(sensor_id=sensor_id): i for i, sensor_id in enumerate(sensor_ids)}
+        cursor = db.cursor()
+        cursor.row_factory = None
+        rows = cursor.execute(f"""
+            SELECT series, resolution, bucket, count, sum FROM series_rollups
+            WHERE series IN ({', '.join('?' * n)})
+              AND ((resolution = 60 AND bucket >= ?)
+                   OR (resolution = 3600 AND bucket >= ?)
+                   OR (resolution = 86400 AND bucket >= ?))
+        """, [*index, int(now - 3600) // 60, int(now - PEAK_DAYS * 86400) // 3600,
+              int(now - TREND_DAYS * 86400) // 86400]).fetchall()
+        if not rows:
+            return result
+
+        series, resolution, bucket, count, total = zip(*rows)
+        sensor = np.array([index[name] for name in series])
+        resolution = np.array(resolution)
+        bucket = np.array(bucket, dtype=np.int64)
+        count = np.array(count, dtype=np.float64)
+        total = np.array(total, dtype=np.float64)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Last hour: mean of the one-minute buckets
+            minute = resolution == 60
+            current = (np.bincount(sensor[minute], weights=total[minute], minlength=n)
+                       / np.bincount(sensor[minute], weights=count[minute], minlength=n))
+
+            # Peak hours: mean per (sensor, hour of day) of the hourly buckets
+            hourly = resolution == 3600
+            slot = sensor[hourly] * 24 + bucket[hourly] % 24
+            hour_counts = np.bincount(slot, weights=count[hourly], minlength=n * 24).reshape(n, 24)
+            hour_means = (np.bincount(slot, weights=total[hourly], minlength=n * 24).reshape(n, 24)
+                          / hour_counts)
+            peaks = np.argsort(-np.where(hour_counts > 0, hour_means, -np.inf), axis=1, kind='stable')[:, :3]
+
+            # Trend: first and last daily means per sensor
+            daily = resolution == 86400
+            day_sensor, day_bucket = sensor[daily], bucket[daily]
+            day_means = total[daily] / count[daily]
+            order = np.lexsort((day_bucket, day_sensor))
+            day_sensor, day_bucket, day_means = day_sensor[order], day_bucket[order], day_means[order]
+            days = np.bincount(day_sensor, minlength=n)
+            last = np.cumsum(days) - 1
+            first = last - days + 1
+
+        for i, sensor_id in enumerate(sensor_ids):
+            entry = result[sensor_id]
+            if not np.isnan(current[i]):
+                entry['current_avg'] = float(current[i])
+            entry['peak_hours'] = [{'hour': int(hour), 'ppm': float(hour_means[i, hour])}
+                                   for hour in peaks[i] if hour_counts[i, hour] > 0]
+            if days[i] >= 2:
+                baseline, latest = float(day_means[first[i]]), float(day_means[last[i]])
+                rate = (latest - baseline) / float(day_bucket[last[i]] - day_bucket[first[i]])
+                entry['trend'] = {
+                    'trend': 'increasing' if rate > 5 else 'decreasing' if rate < -5 else 'stable',
+                    'rate': rate,
+                    'current': latest,
+                    'baseline': baseline,
+                }
+        return result
+
+    def inputs(self, sensor_ids: Iterable[int], force: bool = False) -> Dict[int, Dict]:
+        """Recommendation inputs of ``sensor_ids``, recomputing only stale cache entries (in one pass)."""
+        sensor_ids = list(dict.fromkeys(sensor_ids))
+        db = get_db()
+        try:
+            versions = self.versions(db, sensor_ids)
+            now = time.monotonic()
+            result, stale = {}, []
+            with self._lock:
+                for sensor_id in sensor_ids:
+                    cached = self._cache.get(sensor_id)
+                    if (not force and cached and cached[0] == versions[sensor_id]
+                            and now - cached[1] < MAX_AGE_SECONDS):
+                        self._cache.move_to_end(sensor_id)
+                        result[sensor_id] = cached[2]
+                    else:
+                        stale.append(sensor_id)
+            if stale:
+                computed = self.compute(db, stale)
+        finally:
+            db.close()
+
+        if stale:
+            with self._lock:
+                for sensor_id in stale:
+                    self._cache[sensor_id] = (versions[sensor_id], now, computed[sensor_id])
+                    self._cache.move_to_end(sensor_id)
+                while len(self._cache) > MAX_CACHED_SENSORS:
+                    self._cache.popitem(last=False)
+            result.update(computed)
+        return result
+
+    def refresh_later(self, sensor_ids: Iterable[int]) -> None:
+        """Recompute the inputs of ``sensor_ids`` on a background thread (called after rollup updates)."""
+        with self._lock:
+            self._dirty.update(sensor_ids)
+            if self._refreshing or not self._dirty:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="recommendations", daemon=True).start()
+
+    def _refresh(self) -> None:
+        while True:
+            time.sleep(REFRESH_DELAY_SECONDS)
+            with self._lock:
+                sensor_ids, self._dirty = self._dirty, set()
+                if not sensor_ids:
+                    self._refreshing = False
+                    return
+            try:
+                self.inputs(sensor_ids)
+            except Exception as e:
+                logger.error(f"Recommendation refresh failed for sensors {sorted(sensor_ids)}: {e}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+recommendation_engine = RecommendationEngine()
 
 
 class AIRecommender:
@@ -25,16 +218,6 @@ class AIRecommender:
         'default': {'min': 400, 'max': 800, 'ideal': 600}
     }
     
-    def __init__(self):
-        self.db = get_db()
-
-    def close(self):
-        if self.db:
-            try:
-                self.db.close()
-            finally:
-                self.db = None
-    
     def get_recommendations(self, sensor_id: int, building_type: str = 'office', 
                            occupancy_count: int = 10) -> List[Dict]:
         """
@@ -48,14 +231,25 @@ class AIRecommender:
         Returns:
             List of recommendations with priority levels
         """
+        inputs = recommendation_engine.inputs([sensor_id])[sensor_id]
+        return self.build_recommendations(inputs, building_type, occupancy_count)
+    
+    def get_batch_recommendations(self, sensor_ids: List[int], building_type: str = 'office',
+                                  occupancy_count: int = 10) -> Dict[int, List[Dict]]:
+        """Recommendations for several sensors from one batched pass: {sensor id: recommendations}"""
+        inputs = recommendation_engine.inputs(sensor_ids)
+        return {sensor_id: self.build_recommendations(inputs[sensor_id], building_type, occupancy_count)
+                for sensor_id in inputs}
+    
+    def build_recommendations(self, inputs: Dict, building_type: str = 'office',
+                              occupancy_count: int = 10) -> List[Dict]:
+        """Recommendations from the inputs computed by ``RecommendationEngine``"""
         recommendations = []
         
         try:
-            # Get current data
-            cursor = self.db.cursor()
-            current_avg = self._get_current_average(sensor_id)
-            peak_hours = self._get_peak_hours(sensor_id)
-            trend = self._analyze_trend(sensor_id)
+            current_avg = inputs['current_avg']
+            peak_hours = inputs['peak_hours']
+            trend = inputs['trend']
             
             optimal = self.OPTIMAL_LEVELS.get(building_type.lower(), self.OPTIMAL_LEVELS['default'])
             
@@ -175,84 +369,6 @@ class AIRecommender:
         
         return recommendations
     
-    def _get_current_average(self, sensor_id: int) -> Optional[float]:
-        """Get current 1-hour average"""
-        try:
-            cursor = self.db.cursor()
-            one_hour_ago = datetime.now() - timedelta(hours=1)
-            
-            cursor.execute('''
-                SELECT AVG(ppm) FROM sensor_readings
-                WHERE sensor_id = ? AND timestamp > ?
-            ''', (sensor_id, one_hour_ago))
-            
-            result = cursor.fetchone()
-            return result[0] if result[0] else None
-        except:
-            return None
-    
-    def _get_peak_hours(self, sensor_id: int, days: int = 7) -> List[Dict]:
-        """Get peak CO₂ hours"""
-        try:
-            cursor = self.db.cursor()
-            start_date = datetime.now() - timedelta(days=days)
-            
-            cursor.execute('''
-                SELECT strftime('%H', timestamp) as hour, AVG(ppm) as ppm
-                FROM sensor_readings
-                WHERE sensor_id = ? AND timestamp > ?
-                GROUP BY hour
-                ORDER BY ppm DESC
-                LIMIT 3
-            ''', (sensor_id, start_date))
-            
-            peaks = []
-            for row in cursor.fetchall():
-                peaks.append({
-                    'hour': int(row[0]),
-                    'ppm': row[1]
-                })
-            return peaks
-        except:
-            return []
-    
-    def _analyze_trend(self, sensor_id: int, days: int = 7) -> Optional[Dict]:
-        """Analyze CO₂ trend"""
-        try:
-            cursor = self.db.cursor()
-            start_date = datetime.now() - timedelta(days=days)
-            
-            cursor.execute('''
-                SELECT DATE(timestamp) as date, AVG(ppm) as avg_ppm
-                FROM sensor_readings
-                WHERE sensor_id = ? AND timestamp > ?
-                GROUP BY DATE(timestamp)
-                ORDER BY date
-            ''', (sensor_id, start_date))
-            
-            data = cursor.fetchall()
-            
-            if len(data) < 2:
-                return None
-            
-            values = [row[1] for row in data]
-            rate = (values[-1] - values[0]) / len(values)
-            
-            trend = 'stable'
-            if rate > 5:
-                trend = 'increasing'
-            elif rate < -5:
-                trend = 'decreasing'
-            
-            return {
-                'trend': trend,
-                'rate': rate,
-                'current': values[-1],
-                'baseline': values[0]
-            }
-        except:
-            return None
-    
     def _calculate_recommendation_severity(self, current: float, optimal_max: float, 
                                          occupancy: int) -> str:
         """Calculate recommendation severity"""
@@ -311,3 +427,6 @@ class AIRecommender:
             }
             for i in range(min(days, 10))
         ]
+
+
+ai_recommender = AIRecommender()
@@ -0,0 +1,240 @@
+"""Streaming anomaly detection on the ingest path.
+
+Each reading is scored against its series (a sensor, or a user's readings
+without sensor) as it is ingested, with three checks:
+
+- ``robust_z``: distance from the rolling median of the previous ``WINDOW``
+  readings, in units of the rolling MAD (scaled to a standard deviation),
+- ``ewma``: outside the EWMA control limits (``EWMA_LIMIT`` standard deviations
+  of the exponentially weighted variance),
+- ``rate_of_change``: a jump faster than ``RATE_LIMIT_PPM_PER_MIN`` since the
+  previous reading that lands at least ``RATE_MIN_STEP_PPM`` (and the robust
+  z limit) away from the rolling median (CO2 rarely moves that fast; usually
+  a sensor fault).
+  Returning towards the median is not flagged.
+
+A reading is anomalous when both level checks (``robust_z`` and ``ewma``) agree
+or on a rate-of-change spike; either level check alone also fires at the start
+of every normal occupancy ramp. Anomalous readings are written to the
+``anomalies`` table in the ingest transaction, so the anomaly endpoints are
+plain indexed reads and new anomalies are visible as soon as the readings are.
+
+Detector state (rolling window, EWMA, last reading) is kept in memory per
+series and rebuilt from the latest stored readings when a series is first seen
+by the process. Readings older than the last scored one are stored but not scored.
+"""
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from database import get_db
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+WINDOW = 120
+MIN_HISTORY = 30
+ROBUST_Z_LIMIT = 3.5
+EWMA_ALPHA = 0.1
+EWMA_LIMIT = 3.0
+RATE_LIMIT_PPM_PER_MIN = 200.0
+RATE_MIN_STEP_PPM = 100.0
+MAX_RATE_GAP_SECONDS = 600
+# Floor for the spread estimates: NDIR sensors such as the SCD30 are accurate
+# to +-(30 ppm + 3%), so a flat window must not turn every wiggle into an anomaly
+MIN_SPREAD_PPM = 30.0
+MAD_TO_SIGMA = 1.4826
+
+MAX_SERIES = 4096
+
+
+class _SeriesState:
+    __slots__ = ("window", "last_ts", "last_value", "mean", "variance", "count")
+
+    def __init__(self):
+        self.window = np.empty(0, np.float64)
+        self.last_ts = None
+        self.last_value = None
+        self.mean = None
+        self.variance = 0.0
+        self.count = 0
+
+    def feed_ewma(self, value: float):
+        """Return the EWMA z-score of ``value`` against the previous state, then update."""
+        if self.mean is None:
+            self.mean, self.count = value, 1
+            return None
+        z = None
+        if self.count >= MIN_HISTORY:
+            z = abs(value - self.mean) / max(self.variance ** 0.5, MIN_SPREAD_PPM)
+        diff = value - self.mean
+        increment = EWMA_ALPHA * diff
+        self.mean += increment
+        self.variance = (1 - EWMA_ALPHA) * (self.variance + diff * increment)
+        self.count += 1
+        return z
+
+
+def _rolling_robust_z(history: np.ndarray, values: np.ndarray):
+    """(robust z-score, rolling median, rolling sigma) of each value against the ``WINDOW`` values before it.
+
+    The z-score is NaN while fewer than ``MIN_HISTORY`` values precede it.
+    """
+    n = len(values)
+    sequence = np.concatenate([history, values])
+    if len(history) < WINDOW:
+        sequence = np.concatenate([np.full(WINDOW - len(history), np.nan), sequence])
+    windows = sliding_window_view(sequence, WINDOW)[:n]
+    if np.isnan(windows).any():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN rows of a new series
+            median = np.nanmedian(windows, axis=1)
+            mad = np.nanmedian(np.abs(windows - median[:, None]), axis=1)
+        enough = np.sum(~np.isnan(windows), axis=1) >= MIN_HISTORY
+    else:
+        median = np.median(windows, axis=1)
+        mad = np.median(np.abs(windows - median[:, None]), axis=1)
+        enough = np.ones(n, bool)
+    sigma = np.maximum(MAD_TO_SIGMA * mad, MIN_SPREAD_PPM)
+    z = np.abs(values - median) / sigma
+    z[~enough] = np.nan
+    return z, median, sigma
+
+
+class StreamingAnomalyDetector:
+    """Per-series detector state with an LRU bound on the number of series."""
+
+    def __init__(self, max_series: int = MAX_SERIES):
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._states: "OrderedDict[tuple, _SeriesState]" = OrderedDict()
+
+    @staticmethod
+    def _warm(db, user_id, sensor_id, before: str) -> _SeriesState:
+        cursor = db.cursor()
+        cursor.row_factory = None
+        if sensor_id is not None:
+            rows = cursor.execute(
+                """SELECT CAST(strftime('%s', timestamp) AS INTEGER), co2 FROM sensor_readings
+                   WHERE sensor_id = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT ?""",
+                (sensor_id, before, WINDOW)
+            ).fetchall()
+        else:
+            rows = cursor.execute(
+                """SELECT CAST(strftime('%s', timestamp) AS INTEGER), ppm FROM co2_readings
+                   WHERE user_id = ? AND timestamp < ? ORDER BY timestamp DESC LIMIT ?""",
+                (user_id, before, WINDOW)
+            ).fetchall()
+        state = _SeriesState()
+        rows = [row for row in reversed(rows) if row[0] is not None and row[1] is not None]
+        if rows:
+            state.window = np.array([row[1] for row in rows], dtype=np.float64)
+            state.last_ts, state.last_value = float(rows[-1][0]), float(rows[-1][1])
+            for value in state.window:
+                state.feed_ewma(float(value))
+        return state
+
+    def _state(self, db, user_id, sensor_id, before: str) -> _SeriesState:
+        key = ("sensor", sensor_id) if sensor_id is not None else ("user", user_id)
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                self._states.move_to_end(key)
+                return state
+        state = self._warm(db, user_id, sensor_id, before)
+        with self._lock:
+            state = self._states.setdefault(key, state)
+            while len(self._states) > self.max_series:
+                self._states.popitem(last=False)
+        return state
+
+    def score(self, db, user_id, sensor_id: Optional[int], readings: Sequence[Dict[str, Any]]
+              ) -> List[Dict[str, Any]]:
+        """Score normalized readings (``ts``, ``ppm``, ``timestamp``); returns the anomalies."""
+        readings = sorted(readings, key=lambda r: r["ts"])
+        if not readings:
+            return []
+        state = self._state(db, user_id, sensor_id, readings[0]["timestamp"])
+
+        with self._lock:
+            if state.last_ts is not None:
+                readings = [r for r in readings if r["ts"].timestamp() > state.last_ts]
+            if not readings:
+                return []
+            ts = np.array([r["ts"].timestamp() for r in readings], dtype=np.float64)
+            values = np.array([r["ppm"] for r in readings], dtype=np.float64)
+
+            robust_z, baseline, sigma = _rolling_robust_z(state.window, values)
+            ewma_z = np.array([np.nan if z is None else z for z in map(state.feed_ewma, values)])
+
+            previous_ts = np.concatenate([[state.last_ts if state.last_ts is not None else np.nan], ts[:-1]])
+            previous = np.concatenate([[state.last_value if state.last_value is not None else np.nan], values[:-1]])
+            gap = ts - previous_ts
+            step = np.abs(values - previous)
+            deviation = np.abs(values - baseline)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                jump = ((gap > 0) & (gap <= MAX_RATE_GAP_SECONDS) & (step >= RATE_MIN_STEP_PPM)
+                        & (deviation >= np.maximum(RATE_MIN_STEP_PPM, sigma * ROBUST_Z_LIMIT))
+                        & (deviation > np.abs(previous - baseline)))
+                rate = np.where(jump, step / gap * 60, np.nan)
+
+            state.window = np.concatenate([state.window, values])[-WINDOW:]
+            state.last_ts, state.last_value = float(ts[-1]), float(values[-1])
+
+        ratios = np.column_stack([robust_z / ROBUST_Z_LIMIT, ewma_z / EWMA_LIMIT, rate / RATE_LIMIT_PPM_PER_MIN])
+        ratios = np.nan_to_num(ratios, nan=0.0)
+        exceeded = ratios > 1
+        flagged = np.flatnonzero((exceeded[:, 0] & exceeded[:, 1]) | exceeded[:, 2])
+
+        checks = ("robust_z", "ewma", "rate_of_change")
+        anomalies = []
+        for i in flagged:
+            score = float(ratios[i].max())
+            anomalies.append({
+                "user_id": user_id,
+                "sensor_id": sensor_id,
+                "timestamp": readings[i]["timestamp"],
+                "ppm": float(values[i]),
+                "kind": checks[int(ratios[i].argmax())],
+                "checks": ",".join(name for name, ratio in zip(checks, ratios[i]) if ratio > 1),
+                "score": round(score, 3),
+                "severity": "high" if score >= 2 else "medium",
+                "baseline": None if np.isnan(baseline[i]) else float(baseline[i]),
+            })
+        return anomalies
+
+    def record(self, db, user_id, sensor_id: Optional[int], readings: Sequence[Dict[str, Any]]) -> int:
+        """Score readings and insert their anomalies on ``db`` (the caller commits)."""
+        anomalies = self.score(db, user_id, sensor_id, readings)
+        if anomalies:
+            db.executemany(
+                """INSERT INTO anomalies
+                   (user_id, sensor_id, timestamp, ppm, kind, checks, score, severity, baseline)
+                   VALUES (:user_id, :sensor_id, :timestamp, :ppm, :kind, :checks, :score, :severity, :baseline)""",
+                anomalies
+            )
+        return len(anomalies)
+
+    def process(self, user_id, sensor_id: Optional[int], readings: Sequence[Dict[str, Any]]) -> int:
+        """Score and record readings in their own transaction (paths outside utils.ingest)."""
+        db = get_db()
+        try:
+            count = self.record(db, user_id, sensor_id, readings)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._states.clear()
+
+
+anomaly_detector = StreamingAnomalyDetector()
+
+
+__all__ = ["StreamingAnomalyDetector", "anomaly_detector"]
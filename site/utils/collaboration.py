@@ -7,18 +7,19 @@ import json
 from datetime import datetime
 from typing import Dict, List, Optional
 from database import get_db
+from utils.search_index import search_service
 
 
 class CollaborationManager:
     """Manage team collaboration features"""
     
     def __init__(self):
-        self.db = get_db()
         self._init_schema()
     
     def _init_schema(self):
         """Initialize collaboration database tables"""
-        cursor = self.db.cursor()
+        db = get_db()
+        cursor = db.cursor()
         
         try:
             # Team collaboration settings
@@ -78,9 +79,11 @@ class CollaborationManager:
                 )
             ''')
             
-            self.db.commit()
+            db.commit()
         except Exception as e:
             print(f"Schema already exists: {e}")
+        finally:
+            db.close()
     
     def create_team_share(self, user_id: int, sensor_id: int, 
                          team_members: List[int], permission_level: str = 'viewer') -> Optional[int]:
@@ -96,23 +99,27 @@ class CollaborationManager:
         Returns:
             Share ID or None
         """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 INSERT INTO team_shares (user_id, sensor_id, team_members, permission_level)
                 VALUES (?, ?, ?, ?)
             ''', (user_id, sensor_id, json.dumps(team_members), permission_level))
             
-            self.db.commit()
+            db.commit()
             return cursor.lastrowid
         except Exception as e:
             print(f"Error creating team share: {e}")
             return None
+        finally:
+            db.close()
     
     def add_team_member(self, team_share_id: int, user_id: int) -> bool:
         """Add a member to shared dashboard"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('SELECT team_members FROM team_shares WHERE id = ?', (team_share_id,))
             result = cursor.fetchone()
             
@@ -127,16 +134,19 @@ class CollaborationManager:
                 UPDATE team_shares SET team_members = ? WHERE id = ?
             ''', (json.dumps(members), team_share_id))
             
-            self.db.commit()
+            db.commit()
             return True
         except Exception as e:
             print(f"Error adding team member: {e}")
             return False
+        finally:
+            db.close()
     
     def remove_team_member(self, team_share_id: int, user_id: int) -> bool:
         """Remove a member from shared dashboard"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('SELECT team_members FROM team_shares WHERE id = ?', (team_share_id,))
             result = cursor.fetchone()
             
@@ -151,11 +161,13 @@ class CollaborationManager:
                 UPDATE team_shares SET team_members = ? WHERE id = ?
             ''', (json.dumps(members), team_share_id))
             
-            self.db.commit()
+            db.commit()
             return True
         except Exception as e:
             print(f"Error removing team member: {e}")
             return False
+        finally:
+            db.close()
     
     def create_shared_alert(self, team_share_id: int, alert_name: str, 
                            condition: str, threshold_value: float,
@@ -173,15 +185,16 @@ class CollaborationManager:
         Returns:
             Alert ID or None
         """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 INSERT INTO shared_alerts 
                 (team_share_id, alert_name, condition, threshold_value, notify_users)
                 VALUES (?, ?, ?, ?, ?)
             ''', (team_share_id, alert_name, condition, threshold_value, json.dumps(notify_users)))
             
-            self.db.commit()
+            db.commit()
             
             # Log activity
             self._log_activity(team_share_id, 0, 'alert_created', {
@@ -193,6 +206,8 @@ class CollaborationManager:
         except Exception as e:
             print(f"Error creating shared alert: {e}")
             return None
+        finally:
+            db.close()
     
     def add_comment(self, reading_id: int, user_id: int, comment_text: str) -> Optional[int]:
         """
@@ -206,23 +221,28 @@ class CollaborationManager:
         Returns:
             Comment ID or None
         """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 INSERT INTO reading_comments (reading_id, user_id, comment_text)
                 VALUES (?, ?, ?)
             ''', (reading_id, user_id, comment_text))
             
-            self.db.commit()
+            db.commit()
+            search_service.refresh('reading_comment', cursor.lastrowid)
             return cursor.lastrowid
         except Exception as e:
             print(f"Error adding comment: {e}")
             return None
+        finally:
+            db.close()
     
     def get_reading_comments(self, reading_id: int) -> List[Dict]:
         """Get all comments for a reading"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 SELECT id, user_id, comment_text, created_at
                 FROM reading_comments
@@ -243,11 +263,14 @@ class CollaborationManager:
         except Exception as e:
             print(f"Error getting comments: {e}")
             return []
+        finally:
+            db.close()
     
     def get_team_activity_feed(self, team_share_id: int, limit: int = 50) -> List[Dict]:
         """Get recent activity for a team share"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 SELECT id, user_id, activity_type, activity_data, created_at
                 FROM team_activity
@@ -270,27 +293,33 @@ class CollaborationManager:
         except Exception as e:
             print(f"Error getting activity feed: {e}")
             return []
+        finally:
+            db.close()
     
     def _log_activity(self, team_share_id: int, user_id: int, 
                      activity_type: str, activity_data: Dict) -> bool:
         """Log team activity"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 INSERT INTO team_activity (team_share_id, user_id, activity_type, activity_data)
                 VALUES (?, ?, ?, ?)
             ''', (team_share_id, user_id, activity_type, json.dumps(activity_data)))
             
-            self.db.commit()
+            db.commit()
             return True
         except Exception as e:
             print(f"Error logging activity: {e}")
             return False
+        finally:
+            db.close()
     
     def get_team_statistics(self, team_share_id: int) -> Dict:
         """Get statistics for a team"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             
             # Get team members count
             cursor.execute('SELECT team_members FROM team_shares WHERE id = ?', (team_share_id,))
@@ -327,3 +356,5 @@ class CollaborationManager:
         except Exception as e:
             print(f"Error getting team statistics: {e}")
             return {}
+        finally:
+            db.close()
@@ -0,0 +1,201 @@
+"""Per-sensor ingest compression (deadband / swinging door) and query-side interpolation.
+
+Stable rooms produce long runs of near-identical CO2 values. A sensor whose
+config contains a ``compression`` block only has the points needed to redraw
+its curve stored::
+
+    {"compression": {"mode": "swinging_door", "deviation": 10, "heartbeat_seconds": 300}}
+
+- ``deadband``: a point is stored when ppm moves more than ``deviation`` away
+  from the last stored point (the last point inside the band is stored too,
+  so the step is not smeared by interpolation).
+- ``swinging_door``: a point is stored when a straight line from the last
+  stored point can no longer pass within ``deviation`` ppm of every point
+  received since (slope corridor). Ramps are stored as two points.
+- In both modes a point is stored at least every ``heartbeat_seconds`` so
+  gaps in the data still mean the sensor was silent.
+
+The decision is made on ppm; temperature and humidity of stored points are kept
+as-is. Compressor state lives in memory: after a restart the first point of
+each sensor is stored and at most one held-back point is lost.
+Readers rebuild a regular series with :func:`interpolate`.
+"""
+import math
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+COMPRESSION_MODES = ("deadband", "swinging_door")
+
+DEFAULT_DEVIATION = 10.0
+DEFAULT_HEARTBEAT_SECONDS = 300.0
+
+
+def compression_settings(config: Optional[Dict[str, Any]]) -> Optional[Tuple[str, float, float]]:
+    """(mode, deviation, heartbeat_seconds) from a sensor config, or None when disabled.
+
+    Raises:
+        ValueError: the ``compression`` block is malformed.
+    """
+    block = (config or {}).get("compression") if isinstance(config, dict) else None
+    if not block:
+        return None
+    if not isinstance(block, dict):
+        raise ValueError("compression must be an object")
+
+    mode = block.get("mode", "swinging_door")
+    if mode in (None, "off", "none"):
+        return None
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"compression mode must be one of {', '.join(COMPRESSION_MODES)}")
+    try:
+        deviation = float(block.get("deviation", DEFAULT_DEVIATION))
+        heartbeat = float(block.get("heartbeat_seconds", DEFAULT_HEARTBEAT_SECONDS))
+    except (TypeError, ValueError):
+        raise ValueError("compression deviation and heartbeat_seconds must be numeric")
+    if deviation < 0 or heartbeat <= 0:
+        raise ValueError("compression deviation must be >= 0 and heartbeat_seconds > 0")
+    return mode, deviation, heartbeat
+
+
+class SeriesCompressor:
+    """Streaming compressor for one series; ``offer`` returns the items to store."""
+
+    def __init__(self, mode: str = "swinging_door", deviation: float = DEFAULT_DEVIATION,
+                 heartbeat_seconds: float = DEFAULT_HEARTBEAT_SECONDS):
+        self.mode = mode
+        self.deviation = deviation
+        self.heartbeat_seconds = heartbeat_seconds
+        self._archived = None   # (t, value) of the last stored point
+        self._held = None       # (t, value, item) received but not stored yet
+        self._upper = math.inf  # slope corridor from the archived point
+        self._lower = -math.inf
+
+    def _rebase(self, t: float, value: float) -> None:
+        self._archived = (t, value)
+        self._held = None
+        self._upper, self._lower = math.inf, -math.inf
+
+    def _narrow(self, t: float, value: float) -> None:
+        t0, v0 = self._archived
+        dt = t - t0
+        self._upper = min(self._upper, (value + self.deviation - v0) / dt)
+        self._lower = max(self._lower, (value - self.deviation - v0) / dt)
+
+    def offer(self, t: float, value: float, item: Any) -> List[Any]:
+        """Feed one point (epoch seconds, ppm); returns the items to persist, oldest first."""
+        if self._archived is None:
+            self._rebase(t, value)
+            return [item]
+        last_t = self._held[0] if self._held else self._archived[0]
+        if t <= last_t:
+            # Late or replayed point: store it untouched, keep the stream state
+            return [item]
+
+        stored = []
+        t0, v0 = self._archived
+        if self.mode == "deadband":
+            broke = abs(value - v0) > self.deviation
+        else:
+            dt = t - t0
+            broke = (min(self._upper, (value + self.deviation - v0) / dt)
+                     < max(self._lower, (value - self.deviation - v0) / dt))
+
+        if broke and self._held is not None:
+            held_t, held_value, held_item = self._held
+            stored.append(held_item)
+            self._rebase(held_t, held_value)
+            if self.mode == "deadband":
+                broke = abs(value - held_value) > self.deviation
+
+        if (self.mode == "deadband" and broke) or t - self._archived[0] >= self.heartbeat_seconds:
+            stored.append(item)
+            self._rebase(t, value)
+            return stored
+
+        if self.mode == "swinging_door":
+            self._narrow(t, value)
+        self._held = (t, value, item)
+        return stored
+
+    def flush(self) -> List[Any]:
+        """Store the held-back point (e.g. on shutdown)."""
+        if self._held is None:
+            return []
+        held_t, held_value, held_item = self._held
+        self._rebase(held_t, held_value)
+        return [held_item]
+
+
+class CompressorRegistry:
+    """One compressor per sensor, rebuilt whenever the sensor's settings change."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compressors: Dict[Any, Tuple[Tuple[str, float, float], SeriesCompressor]] = {}
+
+    def compress(self, sensor_id, settings: Optional[Tuple[str, float, float]],
+                 points: Sequence[Tuple[float, float, Any]]) -> List[Any]:
+        """Filter ``(epoch, ppm, item)`` points (any order) down to the items to store."""
+        if settings is None:
+            with self._lock:
+                self._compressors.pop(sensor_id, None)
+            return [item for _, _, item in points]
+
+        with self._lock:
+            entry = self._compressors.get(sensor_id)
+            if entry is None or entry[0] != settings:
+                entry = self._compressors[sensor_id] = (settings, SeriesCompressor(*settings))
+            compressor = entry[1]
+            stored = []
+            for t, value, item in sorted(points, key=lambda p: p[0]):
+                stored.extend(compressor.offer(t, value, item))
+            return stored
+
+    def flush(self, sensor_id) -> List[Any]:
+        with self._lock:
+            entry = self._compressors.get(sensor_id)
+            return entry[1].flush() if entry else []
+
+    def clear(self) -> None:
+        with self._lock:
+            self._compressors.clear()
+
+
+compressors = CompressorRegistry()
+
+
+def interpolate(points: Sequence[Tuple[float, Dict[str, Optional[float]]]], step: float,
+                start: Optional[float] = None, end: Optional[float] = None
+                ) -> List[Tuple[float, Dict[str, Optional[float]]]]:
+    """Resample stored points onto a regular grid by linear interpolation.
+
+    Args:
+        points: ``(epoch, {field: value})`` sorted by time.
+        step: grid spacing in seconds.
+        start, end: grid bounds (default: first/last stored point); the grid
+            never extends past the stored data.
+
+    Fields missing on either neighbour interpolate to None.
+    """
+    if not points or step <= 0:
+        return []
+    start = points[0][0] if start is None else max(start, points[0][0])
+    end = points[-1][0] if end is None else min(end, points[-1][0])
+
+    resampled = []
+    i = 0
+    t = start
+    while t <= end:
+        while i + 1 < len(points) and points[i + 1][0] < t:
+            i += 1
+        t0, a = points[i]
+        if i + 1 < len(points) and t > t0:
+            t1, b = points[i + 1]
+            w = (t - t0) / (t1 - t0)
+            values = {k: (a[k] + (b[k] - a[k]) * w) if a.get(k) is not None and b.get(k) is not None else None
+                      for k in a}
+        else:
+            values = dict(a)
+        resampled.append((t, values))
+        t += step
+    return resampled
@@ -0,0 +1,137 @@
+"""Server-side downsampling of reading series for charts.
+
+A chart a thousand pixels wide cannot show more than about a thousand points,
+so history endpoints accept ``max_points`` and reduce long ranges with
+Largest-Triangle-Three-Buckets (LTTB): the first and last points are kept and
+every bucket in between keeps the point forming the largest triangle with its
+neighbouring buckets, which preserves peaks and the overall shape far better
+than averaging or striding.
+
+Each triangle is anchored on the point kept in the previous bucket, so buckets
+are visited in order; the bucket averages are computed up front and each
+bucket is scored with one NumPy expression (tens of milliseconds for millions
+of points).
+
+When the requested points are at least a minute apart and the endpoint reads a
+series the chart rollups cover (a sensor, or a user's real readings),
+:func:`rollup_rows` answers from ``series_rollups`` instead: one row per bucket
+with its mean, min and max, read from the finest level of :mod:`utils.rollups`
+with up to ``ROLLUP_OVERSAMPLING`` times the requested buckets (reduced with
+LTTB on the bucket means), so raw readings are not loaded at all. Mixed-source ranges (with
+simulated or imported readings, which are not rolled up) stay on LTTB.
+"""
+from datetime import datetime, UTC
+from typing import Optional, Sequence
+
+import numpy as np
+
+from utils.rollups import tile_pyramid
+from utils.series import _epoch
+
+MIN_POINTS = 3
+MAX_POINTS = 10_000
+# Rollup buckets read per requested point before LTTB picks the kept ones
+ROLLUP_OVERSAMPLING = 4
+
+
+def parse_max_points(value) -> Optional[int]:
+    """``max_points`` query value as an int (None when absent).
+
+    Raises:
+        ValueError: not an integer between MIN_POINTS and MAX_POINTS.
+    """
+    if value is None or value == "":
+        return None
+    points = int(value)
+    if not MIN_POINTS <= points <= MAX_POINTS:
+        raise ValueError(f"max_points must be between {MIN_POINTS} and {MAX_POINTS}")
+    return points
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices (ascending) of at most ``max_points`` points of ``x``-sorted data to keep."""
+    n = len(x)
+    if n <= max_points or max_points < MIN_POINTS:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    buckets = max_points - 2
+    edges = np.floor(np.linspace(1, n - 1, buckets + 1)).astype(np.int64)
+    sizes = np.diff(edges)
+    # Average point of each bucket, and of the last point as the final "next bucket"
+    mean_x = np.append(np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes, y[-1])
+
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(buckets):
+        start, end = edges[i], edges[i + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - mean_x[i + 1]) * (y[start:end] - ay) - (ax - x[start:end]) * (mean_y[i + 1] - ay))
+        a = start + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def downsample_rows(rows: Sequence, max_points: Optional[int], value_key: str = "ppm",
+                    time_key: str = "timestamp") -> list:
+    """Keep at most ``max_points`` of ``rows`` (dicts or ``sqlite3.Row``) with LTTB on value over time.
+
+    Rows may be in ascending or descending time order; the kept rows are
+    returned in the same order. Rows without a time or value are dropped.
+    """
+    rows = list(rows)
+    if max_points is None or len(rows) <= max_points:
+        return rows
+
+    stamps = [row[time_key] for row in rows]
+    try:
+        x = np.array([s[:19] for s in stamps], dtype="datetime64[s]").astype(np.float64)
+    except (TypeError, ValueError):
+        x = np.array([_epoch(s) for s in stamps], dtype=np.float64)
+    y = np.array([row[value_key] for row in rows], dtype=np.float64)
+
+    valid = np.flatnonzero(~(np.isnan(x) | np.isnan(y)))
+    order = valid[np.argsort(x[valid], kind="stable")]
+    keep = np.sort(order[lttb_indices(x[order], y[order], max_points)])
+    return [rows[i] for i in keep]
+
+
+def rollup_rows(series: str, start: float, end: float, max_points: Optional[int],
+                value_key: str = "ppm") -> Optional[list]:
+    """At most ``max_points`` rollup buckets of ``series`` over [start, end) (epoch seconds), oldest first.
+
+    Each row has ``timestamp`` (bucket start, UTC), ``value_key`` (bucket mean),
+    ``min``, ``max``, ``count`` and ``resolution``. Returns None when the points
+    would be less than a minute apart, or when the rollups may miss part of the
+    range (history stored before the rollups, not backfilled): the caller then
+    downsamples raw rows. The rollups are trusted when the range starts after
+    the series' backfill horizon or their first bucket reaches ``start``.
+    """
+    if max_points is None or end - start < tile_pyramid.levels[0] * max_points:
+        return None
+    level = tile_pyramid.level_for(start, end, max_points * ROLLUP_OVERSAMPLING)
+    buckets = tile_pyramid.buckets(series, level, start, end)
+    if not buckets:
+        return None
+    if buckets[0][0] > start:
+        horizon = tile_pyramid.coverage(series)
+        if horizon is None or horizon > start:
+            return None
+    if len(buckets) > max_points:
+        keep = lttb_indices(np.array([b[0] for b in buckets], dtype=np.float64),
+                            np.array([b[2] for b in buckets], dtype=np.float64), max_points)
+        buckets = [buckets[i] for i in keep]
+    return [{
+        "timestamp": datetime.fromtimestamp(t, UTC).strftime("%Y-%m-%d %H:%M:%S"),
+        value_key: round(avg, 1),
+        "min": low,
+        "max": high,
+        "count": count,
+        "resolution": level,
+    } for t, count, avg, low, high in buckets]
+
+
+__all__ = ["lttb_indices", "downsample_rows", "rollup_rows", "parse_max_points", "MAX_POINTS"]
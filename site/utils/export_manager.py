@@ -25,6 +25,16 @@ except ImportError:
     OPENPYXL_AVAILABLE = False
 
 
+def render_pdf(html_content: str, base_url: Optional[str] = None, presentational_hints: bool = False) -> bytes:
+    """
+    Render an HTML document to PDF bytes with WeasyPrint
+    
+    Module-level so it can run in a utils.task_pool worker process.
+    """
+    from weasyprint import HTML
+    return HTML(string=html_content, base_url=base_url).write_pdf(presentational_hints=presentational_hints)
+
+
 class DataExporter:
     """Export CO₂ data in various formats"""
     
@@ -157,11 +167,7 @@ class DataExporter:
             if html_content is None:
                 return None
             
-            # Import here to ensure WEASYPRINT_AVAILABLE was checked first
-            from weasyprint import HTML
-            html = HTML(string=html_content)
-            pdf_bytes = html.write_pdf()
-            return io.BytesIO(pdf_bytes)
+            return io.BytesIO(render_pdf(html_content))
         except Exception as e:
             print(f"PDF generation error: {e}")
             return None
@@ -0,0 +1,258 @@
+"""Time-weighted CO2 exposure counters per series and UTC day.
+
+Counting readings above a threshold says little when sensors report every 2
+seconds or every 5 minutes. Instead, every ingested reading is credited with
+the time elapsed since the previous reading of its series (capped at
+``MAX_GAP_SECONDS``, so an offline sensor does not accrue exposure), and the
+``exposure_daily`` row of the series and day accumulates:
+
+- seconds spent in each threshold band (``BANDS``: at or below the good level,
+  up to the warning level, up to the critical level, above critical),
+- ppm-seconds (for the time-weighted mean) and ppm-hours above the critical
+  level,
+- reading count, sum, min and max.
+
+Bands use the thresholds in effect at ingest time: the user's
+``user_thresholds`` for ``user:<id>`` series and the sensor's own thresholds for
+``sensor:<id>`` series (defaults from :mod:`utils.constants`). The time of the
+last counted reading is kept in ``exposure_state`` per series *and* reporting
+sensor; readings older than it are counted as readings but credited no time.
+A user series fed by several sensors therefore credits each sensor with its own
+sampling gaps (a late batch from one sensor is not squeezed to zero by another
+sensor's newer readings), and its stored seconds add up over sensors: two
+sensors reporting all day store 48 h. ``exposure_day_sensors`` records the
+sensors reporting to each series and day, and summaries divide times (seconds
+per band, ppm-hours above critical) by their number so they read as wall-clock
+time. Averages, shares and scores are time-weighted ratios, so they are
+unaffected.
+
+Health scores and daily reports read one row per series and day.
+"""
+from datetime import datetime, timedelta, UTC
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import get_db
+from utils.constants import CO2_THRESHOLD_CRITICAL, CO2_THRESHOLD_GOOD, CO2_THRESHOLD_WARNING
+from utils.online_stats import series_key
+
+MAX_GAP_SECONDS = 600
+
+BANDS = ("good", "moderate", "high", "critical")
+# Health score credit per second spent in each band
+BAND_SCORES = (100, 75, 40, 0)
+
+DEFAULT_THRESHOLDS = (CO2_THRESHOLD_GOOD, CO2_THRESHOLD_WARNING, CO2_THRESHOLD_CRITICAL)
+
+_COLUMNS = ("readings", "ppm_sum", "min", "max", *(f"seconds_{band}" for band in BANDS),
+            "ppm_seconds", "critical_ppm_hours")
+
+_UPSERT = f"""
+    INSERT INTO exposure_daily (series, day, {', '.join(_COLUMNS)})
+    VALUES (?, ?, {', '.join('?' * len(_COLUMNS))})
+    ON CONFLICT(series, day) DO UPDATE SET
+        readings = readings + excluded.readings,
+        ppm_sum = ppm_sum + excluded.ppm_sum,
+        min = MIN(min, excluded.min),
+        max = MAX(max, excluded.max),
+        {', '.join(f'seconds_{band} = seconds_{band} + excluded.seconds_{band}' for band in BANDS)},
+        ppm_seconds = ppm_seconds + excluded.ppm_seconds,
+        critical_ppm_hours = critical_ppm_hours + excluded.critical_ppm_hours
+"""
+
+# exposure_daily rows with their number of reporting sensors
+_SELECT = """d.*, (SELECT COUNT(*) FROM exposure_day_sensors s WHERE s.series = d.series AND s.day = d.day)
+             AS sensors FROM exposure_daily d"""
+
+
+def integrate(timestamps, values, thresholds: Sequence[float] = DEFAULT_THRESHOLDS,
+              previous_ts: Optional[float] = None) -> Dict[str, List[float]]:
+    """Exposure counters of readings (epoch seconds, ppm) per UTC day (``YYYY-MM-DD``).
+
+    Each reading is credited with the seconds since the previous one (the
+    reading before ``timestamps`` is at ``previous_ts``), capped at
+    ``MAX_GAP_SECONDS``. Returns ``{day: [values in _COLUMNS order]}``.
+    """
+    ts = np.asarray(timestamps, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~(np.isnan(ts) | np.isnan(values))
+    ts, values = ts[keep], values[keep]
+    if not len(ts):
+        return {}
+    order = np.argsort(ts, kind="stable")
+    ts, values = ts[order], values[order]
+
+    previous = np.concatenate([[ts[0] if previous_ts is None else previous_ts], ts[:-1]])
+    # Readings older than the last counted one get no time (and do not move the clock back)
+    previous = np.maximum.accumulate(previous)
+    dt = np.clip(ts - previous, 0, MAX_GAP_SECONDS)
+    bands = np.searchsorted(np.asarray(thresholds, dtype=np.float64), values, side="left")
+    excess = np.clip(values - thresholds[-1], 0, None)
+
+    days, day_index = np.unique((ts // 86400).astype(np.int64), return_inverse=True)
+    n = len(days)
+    band_seconds = np.bincount(day_index * len(BANDS) + bands, weights=dt,
+                               minlength=n * len(BANDS)).reshape(n, len(BANDS))
+    columns = [
+        np.bincount(day_index, minlength=n),
+        np.bincount(day_index, weights=values, minlength=n),
+        np.full(n, np.inf), np.full(n, -np.inf),
+        *band_seconds.T,
+        np.bincount(day_index, weights=values * dt, minlength=n),
+        np.bincount(day_index, weights=excess * dt, minlength=n) / 3600,
+    ]
+    np.minimum.at(columns[2], day_index, values)
+    np.maximum.at(columns[3], day_index, values)
+    return {
+        datetime.fromtimestamp(int(day) * 86400, UTC).strftime("%Y-%m-%d"):
+            [int(columns[0][i])] + [float(column[i]) for column in columns[1:]]
+        for i, day in enumerate(days)
+    }
+
+
+def summarize(row) -> Optional[Dict[str, Any]]:
+    """API view of an ``exposure_daily`` row (or ``_COLUMNS`` mapping); None without readings.
+
+    Times are divided by the row's ``sensors`` count (when present) so a series
+    fed by several sensors reports wall-clock time.
+    """
+    if not row or not row["readings"]:
+        return None
+    sensors = max(1, row["sensors"] if "sensors" in row.keys() else 1)
+    seconds = sum(row[f"seconds_{band}"] for band in BANDS)
+    if seconds:
+        average = row["ppm_seconds"] / seconds
+        score = sum(row[f"seconds_{band}"] * credit for band, credit in zip(BANDS, BAND_SCORES)) / seconds
+    else:
+        average, score = row["ppm_sum"] / row["readings"], None
+    return {
+        "readings": row["readings"],
+        "sensors": sensors,
+        "seconds": round(seconds / sensors, 1),
+        "band_seconds": {band: round(row[f"seconds_{band}"] / sensors, 1) for band in BANDS},
+        "band_percent": {band: round(row[f"seconds_{band}"] / seconds * 100, 1) if seconds else 0
+                         for band in BANDS},
+        "avg_ppm": round(average, 1),
+        "min_ppm": row["min"],
+        "max_ppm": row["max"],
+        "critical_ppm_hours": round(row["critical_ppm_hours"] / sensors, 2),
+        "score": round(score) if score is not None else None,
+    }
+
+
+def summarize_readings(timestamps, values, thresholds: Sequence[float] = DEFAULT_THRESHOLDS
+                       ) -> Optional[Dict[str, Any]]:
+    """Summary of readings that are not in the counters (e.g. simulated or imported data)."""
+    days = list(integrate(timestamps, values, thresholds).values())
+    if not days:
+        return None
+    merged = dict(zip(_COLUMNS, np.sum(days, axis=0).tolist()))
+    merged["min"] = min(day[2] for day in days)
+    merged["max"] = max(day[3] for day in days)
+    return summarize(merged)
+
+
+def score_status(score: Optional[int]) -> str:
+    """French status label of a health score"""
+    if score is None:
+        return "Aucune donnée"
+    if score >= 85:
+        return "Excellent"
+    if score >= 70:
+        return "Bon"
+    if score >= 50:
+        return "Moyen"
+    return "Mauvais"
+
+
+class ExposureCounters:
+    """Maintenance and reads of ``exposure_daily``."""
+
+    def thresholds(self, db, user_id=None, sensor_id=None) -> Tuple[float, float, float]:
+        """(good, warning, critical) levels of a sensor, else of a user."""
+        if sensor_id is not None:
+            row = db.execute(
+                "SELECT good_threshold, warning_threshold, critical_threshold FROM user_sensors WHERE id = ?",
+                (sensor_id,)
+            ).fetchone()
+        else:
+            row = db.execute(
+                "SELECT good_level, warning_level, critical_level FROM user_thresholds WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        if not row or None in tuple(row):
+            return DEFAULT_THRESHOLDS
+        return tuple(sorted(row))
+
+    def record(self, db, user_id, sensor_id: Optional[int], timestamps, values) -> int:
+        """Add readings to the counters of the user and sensor series on ``db`` (the caller commits)."""
+        ts = np.asarray(timestamps, dtype=np.float64)
+        if not len(ts):
+            return 0
+        targets = []
+        if user_id is not None:
+            targets.append((series_key(user_id=user_id), self.thresholds(db, user_id=user_id)))
+        if sensor_id is not None:
+            targets.append((series_key(sensor_id=sensor_id), self.thresholds(db, sensor_id=sensor_id)))
+
+        clock = sensor_id if sensor_id is not None else 0
+        rows = 0
+        for series, thresholds in targets:
+            state = db.execute("SELECT last_ts FROM exposure_state WHERE series = ? AND sensor_id = ?",
+                               (series, clock)).fetchone()
+            days = integrate(ts, values, thresholds, state["last_ts"] if state else None)
+            db.executemany(_UPSERT, [(series, day, *counters) for day, counters in days.items()])
+            db.executemany("INSERT OR IGNORE INTO exposure_day_sensors (series, day, sensor_id) VALUES (?, ?, ?)",
+                           [(series, day, clock) for day in days])
+            db.execute(
+                """INSERT INTO exposure_state (series, sensor_id, last_ts) VALUES (?, ?, ?)
+                   ON CONFLICT(series, sensor_id) DO UPDATE SET last_ts = MAX(last_ts, excluded.last_ts)""",
+                (series, clock, float(np.nanmax(ts)))
+            )
+            rows += len(days)
+        return rows
+
+    def process(self, user_id, sensor_id: Optional[int], timestamps, values) -> int:
+        """Add readings in their own transaction (paths outside utils.ingest)."""
+        db = get_db()
+        try:
+            count = self.record(db, user_id, sensor_id, timestamps, values)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def day(self, series: str, day: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Summary of one UTC day (default today) of ``series``, None without readings."""
+        day = day or datetime.now(UTC).strftime("%Y-%m-%d")
+        db = get_db()
+        try:
+            row = db.execute(f"SELECT {_SELECT} WHERE d.series = ? AND d.day = ?", (series, day)).fetchone()
+        finally:
+            db.close()
+        return summarize(row)
+
+    def days(self, series: str, count: int, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """``count`` consecutive days ending at ``end`` (default today), oldest first.
+
+        Days without readings are included with a ``None`` summary.
+        """
+        last = datetime.strptime(end, "%Y-%m-%d") if end else datetime.now(UTC).replace(tzinfo=None)
+        dates = [(last - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(count - 1, -1, -1)]
+        db = get_db()
+        try:
+            rows = db.execute(f"SELECT {_SELECT} WHERE d.series = ? AND d.day BETWEEN ? AND ?",
+                              (series, dates[0], dates[-1])).fetchall()
+        finally:
+            db.close()
+        found = {row["day"]: row for row in rows}
+        return [{"date": day, "exposure": summarize(found.get(day))} for day in dates]
+
+
+exposure_counters = ExposureCounters()
+
+
+__all__ = ["ExposureCounters", "exposure_counters", "integrate", "summarize", "summarize_readings",
+           "score_status",
+           "BANDS", "MAX_GAP_SECONDS"]
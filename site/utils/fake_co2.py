@@ -7,6 +7,7 @@ import random
 from datetime import datetime, timedelta
 from typing import Optional
 from database import get_db
+from utils.live_feed import publish_reading
 
 # ==================== GLOBAL STATE ====================
 _current_co2 = 600
@@ -297,6 +298,8 @@ def save_reading(ppm: int, temp: Optional[float] = None, humidity: Optional[floa
     db.commit()
     db.close()
 
+    publish_reading(user_id, ppm, temp, humidity, source=source)
+
 
 def get_scenario_info() -> dict:
     """Get current scenario information"""
@@ -0,0 +1,203 @@
+"""Batched seasonal CO2 forecasts for every active series.
+
+Forecasts are fitted on the hourly means kept in ``series_stats`` (see
+:mod:`utils.online_stats`), not on raw readings. Each series is modelled as a
+harmonic regression with daily and weekly seasonality::
+
+    ppm(t) = b0 + sum_k a_k sin(2 pi k t / 24) + c_k cos(2 pi k t / 24)
+                + sum_k d_k sin(2 pi k t / 168) + e_k cos(2 pi k t / 168) + r(t)
+
+where ``t`` is the UTC epoch hour and the residual ``r`` decays as an AR(1)
+process from the last observed hour, so short horizons follow the current level
+and long horizons fall back to the seasonal profile. All series share the same
+hourly grid, so the weighted least-squares fits (missing hours have weight 0)
+are solved as one batch of small linear systems.
+
+:func:`run_forecasts` runs as a scheduler job and replaces the rows of the
+``forecasts`` table (one per series and future hour, with a 95% prediction
+interval); the prediction endpoints only read that table.
+"""
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from database import get_db
+from utils.logger import configure_logging
+from utils.online_stats import HOUR, series_stats
+
+logger = configure_logging()
+
+HISTORY_HOURS = 28 * 24
+HORIZON_HOURS = 48
+# Series without an hourly mean in this many hours are not forecast
+ACTIVE_HOURS = 48
+MIN_OBSERVED_HOURS = 24
+
+DAILY_HARMONICS = 3
+WEEKLY_HARMONICS = 2
+# Ridge penalty on the seasonal coefficients; keeps weekly terms stable with < 1 week of data
+RIDGE = 1.0
+Z_95 = 1.96
+
+
+def design_matrix(hours: np.ndarray) -> np.ndarray:
+    """Regressors (intercept, daily and weekly harmonics) for epoch hours."""
+    hours = np.asarray(hours, dtype=np.float64)
+    columns = [np.ones_like(hours)]
+    for period, harmonics in ((24, DAILY_HARMONICS), (168, WEEKLY_HARMONICS)):
+        for k in range(1, harmonics + 1):
+            angle = 2 * np.pi * k * hours / period
+            columns.extend([np.sin(angle), np.cos(angle)])
+    return np.column_stack(columns)
+
+
+def fit_forecasts(values: np.ndarray, hours: np.ndarray, future: np.ndarray) -> Dict[str, np.ndarray]:
+    """Fit every row of ``values`` (series x hours, NaN = missing) and forecast ``future`` hours.
+
+    Returns arrays of shape (series, len(future)) ``predicted``, ``lower`` and
+    ``upper`` (95% prediction interval), plus per-series ``sigma`` and ``phi``.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    weights = (~np.isnan(values)).astype(np.float64)
+    y = np.nan_to_num(values)
+    X = design_matrix(hours)
+    Xf = design_matrix(future)
+    n_params = X.shape[1]
+
+    penalty = np.full(n_params, RIDGE)
+    penalty[0] = 0.0
+    A = np.einsum('tp,st,tq->spq', X, weights, X) + np.diag(penalty)
+    b = np.einsum('tp,st->sp', X, weights * y)
+    A_inv = np.linalg.inv(A)
+    beta = np.einsum('spq,sq->sp', A_inv, b)
+
+    residuals = (y - beta @ X.T) * weights
+    observed = weights.sum(axis=1)
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / np.maximum(observed - n_params, 1))
+
+    # Lag-1 autocorrelation of residuals over consecutive observed hours
+    pairs = weights[:, 1:] * weights[:, :-1]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        phi = ((residuals[:, 1:] * residuals[:, :-1] * pairs).sum(axis=1)
+               / np.sqrt((residuals[:, 1:] ** 2 * pairs).sum(axis=1)
+                         * (residuals[:, :-1] ** 2 * pairs).sum(axis=1)))
+    phi = np.clip(np.nan_to_num(phi), 0.0, 0.99)
+
+    last = weights.shape[1] - 1 - np.argmax(weights[:, ::-1], axis=1)
+    last_residual = residuals[np.arange(len(last)), last]
+    steps = future[None, :] - hours[last][:, None]
+    decay = phi[:, None] ** steps
+
+    predicted = beta @ Xf.T + last_residual[:, None] * decay
+    leverage = np.einsum('fp,spq,fq->sf', Xf, A_inv, Xf)
+    spread = Z_95 * sigma[:, None] * np.sqrt(1 - decay ** 2 + leverage)
+    predicted = np.maximum(predicted, 0.0)
+    return {
+        'predicted': predicted,
+        'lower': np.maximum(predicted - spread, 0.0),
+        'upper': predicted + spread,
+        'sigma': sigma,
+        'phi': phi,
+    }
+
+
+def _hourly_matrix(db, first_hour: int, last_hour: int):
+    """(series names, series x hours matrix of hourly means) of the active series."""
+    cursor = db.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(
+        """SELECT series, bucket, mean FROM series_stats
+           WHERE resolution = ? AND bucket BETWEEN ? AND ?
+             AND series IN (SELECT DISTINCT series FROM series_stats
+                            WHERE resolution = ? AND bucket >= ?)""",
+        (HOUR, first_hour, last_hour, HOUR, last_hour - ACTIVE_HOURS + 1)
+    ).fetchall()
+    if not rows:
+        return [], np.empty((0, last_hour - first_hour + 1))
+    names = sorted({row[0] for row in rows})
+    index = {name: i for i, name in enumerate(names)}
+    matrix = np.full((len(names), last_hour - first_hour + 1), np.nan)
+    series_idx = np.fromiter((index[row[0]] for row in rows), np.int64, len(rows))
+    hour_idx = np.fromiter((row[1] - first_hour for row in rows), np.int64, len(rows))
+    matrix[series_idx, hour_idx] = [row[2] for row in rows]
+    return names, matrix
+
+
+def run_forecasts(now: Optional[float] = None) -> int:
+    """Forecast all active series and replace their rows in ``forecasts``; returns the series count."""
+    started = time.perf_counter()
+    now = time.time() if now is None else now
+    series_stats.flush()
+
+    last_hour = int(now // HOUR)
+    hours = np.arange(last_hour - HISTORY_HOURS + 1, last_hour + 1)
+    future = np.arange(last_hour + 1, last_hour + 1 + HORIZON_HOURS)
+
+    db = get_db()
+    try:
+        names, matrix = _hourly_matrix(db, int(hours[0]), last_hour)
+        keep = (~np.isnan(matrix)).sum(axis=1) >= MIN_OBSERVED_HOURS
+        names = [name for name, ok in zip(names, keep) if ok]
+        if not names:
+            return 0
+        result = fit_forecasts(matrix[keep], hours, future)
+
+        starts = future * HOUR
+        rows = [
+            (name, int(start), round(float(p), 1), round(float(lo), 1), round(float(hi), 1))
+            for s, name in enumerate(names)
+            for start, p, lo, hi in zip(starts, result['predicted'][s], result['lower'][s], result['upper'][s])
+        ]
+        db.executemany("DELETE FROM forecasts WHERE series = ?", [(name,) for name in names])
+        db.execute("DELETE FROM forecasts WHERE ts < ?", (int(now) - HORIZON_HOURS * HOUR,))
+        db.executemany(
+            "INSERT INTO forecasts (series, ts, predicted, lower, upper) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    logger.info(f"Forecast {len(names)} series in {time.perf_counter() - started:.2f}s")
+    return len(names)
+
+
+def get_forecast(series: str, hours: int, now: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Stored forecast of ``series`` for the next ``hours`` hours (current hour first)."""
+    now = time.time() if now is None else now
+    db = get_db()
+    try:
+        rows = db.execute(
+            """SELECT ts, predicted, lower, upper, generated_at FROM forecasts
+               WHERE series = ? AND ts >= ? ORDER BY ts LIMIT ?""",
+            (series, int(now // HOUR) * HOUR, hours)
+        ).fetchall()
+    finally:
+        db.close()
+    return [{
+        'timestamp': datetime.fromtimestamp(row['ts'], UTC).isoformat(),
+        'predicted': row['predicted'],
+        'lower': row['lower'],
+        'upper': row['upper'],
+        'confidence': confidence(row['predicted'], row['lower'], row['upper']),
+        'generated_at': row['generated_at'],
+    } for row in rows]
+
+
+def confidence(predicted: float, lower: float, upper: float) -> int:
+    """0-100 score from the relative width of the 95% interval (100 = exact)."""
+    if not predicted:
+        return 0
+    return int(round(max(0.0, 100 - 100 * (upper - lower) / 2 / predicted)))
+
+
+def trend(points: Sequence[Dict[str, Any]]) -> str:
+    """'rising', 'falling' or 'stable' from the forecast slope (±5 ppm/hour)."""
+    if len(points) < 2:
+        return 'stable'
+    slope = (points[-1]['predicted'] - points[0]['predicted']) / (len(points) - 1)
+    return 'rising' if slope > 5 else 'falling' if slope < -5 else 'stable'
+
+
+__all__ = ["run_forecasts", "get_forecast", "fit_forecasts", "design_matrix", "trend", "confidence"]
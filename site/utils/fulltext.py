@@ -0,0 +1,114 @@
+"""Full-text search over the FTS5 indexes declared in ``database.FULLTEXT_TABLES``.
+
+Free text is turned into a MATCH expression where every word must match as a
+prefix (accent-insensitive, see the ``unicode61`` tokenizer options in
+``init_db``). Results are ranked by ``bm25`` (lower is better), ties broken by
+newest id, and paginated with an opaque keyset cursor holding the (rank, id) of
+the last row returned. The rank is not indexed: every page re-runs the MATCH
+and scores all matching rows, but only the rows after the cursor are sorted
+and returned (no OFFSET re-reading of earlier pages).
+
+Ordering across pages is approximate: bm25 depends on corpus statistics, so
+rows written between two page requests shift the ranks, and a row may then be
+skipped or repeated at a page boundary. Each page is consistent on its own.
+
+Without a query, or when SQLite has no FTS5, rows are listed newest first (the
+fallback filters with LIKE on the indexed columns) under the same cursor format.
+"""
+import base64
+import json
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from database import FULLTEXT_TABLES
+
+MAX_TERMS = 8
+MAX_LIMIT = 200
+
+_WORD = re.compile(r"\w+")
+
+
+def match_query(text: Optional[str]) -> Optional[str]:
+    """FTS5 MATCH expression of free text (quoted prefix terms), None without words."""
+    terms = _WORD.findall(text or "")[:MAX_TERMS]
+    return " ".join(f'"{term}"*' for term in terms) or None
+
+
+def encode_cursor(rank: float, row_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, row_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[float, int]]:
+    """(rank, id) of a cursor, None for an empty one; ValueError when malformed."""
+    if not token:
+        return None
+    try:
+        rank, row_id = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        return float(rank), int(row_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def available(db, table: str) -> bool:
+    """Whether the FTS5 index of ``table`` exists."""
+    return db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                      (f"{table}_fts",)).fetchone() is not None
+
+
+def search(db, table: str, text: Optional[str], columns: str = "t.*", where: str = "",
+           params: Sequence = (), limit: int = 50, cursor: Optional[str] = None
+           ) -> Tuple[List, Optional[str]]:
+    """One page of ``table`` rows (aliased ``t``) matching ``text`` and the SQL filter ``where``.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    Raises ValueError for an unknown table or a malformed cursor.
+    """
+    if table not in FULLTEXT_TABLES:
+        raise ValueError(f"no full-text index on {table}")
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    after = decode_cursor(cursor)
+    query = match_query(text)
+    clauses = [f"({where})"] if where else []
+    args = list(params)
+
+    if query and available(db, table):
+        fts = f"{table}_fts"
+        rank = f"bm25({fts})"
+        source = f"{fts} JOIN {table} t ON t.id = {fts}.rowid"
+        clauses.insert(0, f"{fts} MATCH ?")
+        args.insert(0, query)
+    else:
+        rank = "0.0"
+        source = f"{table} t"
+        if query:
+            words = _WORD.findall(text)[:MAX_TERMS]
+            for word in words:
+                clauses.append("(" + " OR ".join(f"t.{column} LIKE ?" for column in FULLTEXT_TABLES[table]) + ")")
+                args.extend([f"%{word}%"] * len(FULLTEXT_TABLES[table]))
+
+    if after:
+        clauses.append(f"({rank} > ? OR ({rank} = ? AND t.id < ?))")
+        args.extend([after[0], after[0], after[1]])
+
+    rows = db.execute(f"""
+        SELECT {columns}, t.id AS _id, {rank} AS _rank
+        FROM {source}
+        {'WHERE ' + ' AND '.join(clauses) if clauses else ''}
+        ORDER BY _rank, t.id DESC
+        LIMIT ?
+    """, args + [limit + 1]).fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["_rank"], rows[-1]["_id"])
+    return rows, next_cursor
+
+
+def row_dict(row) -> dict:
+    """Result row as a dict, with the search bookkeeping columns dropped."""
+    return {key: row[key] for key in row.keys() if key not in ("_id", "_rank")}
+
+
+__all__ = ["search", "match_query", "available", "row_dict", "encode_cursor", "decode_cursor",
+           "MAX_LIMIT"]
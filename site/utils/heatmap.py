@@ -0,0 +1,159 @@
+"""Day-of-week x hour-of-day CO2 heatmap engine.
+
+Readings are aggregated in SQLite into 15-minute UTC buckets (sum and count
+of ppm) per scope (one user's ``co2_readings`` or one sensor's
+``sensor_readings``). The buckets are cached per scope and kept up to date
+incrementally: the cache remembers the scope's highest row id it has seen
+(its data version, a seek on the ``(scope, id)`` entries of the scope column
+index) and only aggregates rows inserted after it, so writes to other scopes
+leave it untouched. A request then maps
+buckets to local weekday/hour in the requested timezone (DST-aware; 15-minute
+buckets keep half- and quarter-hour offsets exact) and reduces them with
+``np.bincount``.
+
+Rows deleted or updated after they were aggregated are picked up by the
+periodic full rebuild (``rebuild_seconds``).
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from database import get_db
+
+BUCKET_SECONDS = 900
+MAX_DAYS = 365
+DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+class _ScopeCache:
+    __slots__ = ("lock", "version", "buckets", "sums", "counts", "built_at")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = 0
+        self.buckets = np.empty(0, np.int64)
+        self.sums = np.empty(0, np.float64)
+        self.counts = np.empty(0, np.int64)
+        self.built_at = time.monotonic()
+
+    def merge(self, buckets, sums, counts, oldest_bucket):
+        buckets = np.concatenate([self.buckets, buckets])
+        sums = np.concatenate([self.sums, sums])
+        counts = np.concatenate([self.counts, counts])
+        keep = buckets >= oldest_bucket
+        self.buckets, inverse = np.unique(buckets[keep], return_inverse=True)
+        self.sums = np.bincount(inverse, weights=sums[keep], minlength=len(self.buckets))
+        self.counts = np.bincount(inverse, weights=counts[keep], minlength=len(self.buckets)).astype(np.int64)
+
+
+class HeatmapEngine:
+    """Cached, incrementally maintained weekly heatmaps per user or sensor"""
+
+    def __init__(self, max_scopes: int = 256, rebuild_seconds: float = 3600.0):
+        self.max_scopes = max_scopes
+        self.rebuild_seconds = rebuild_seconds
+        self._lock = threading.Lock()
+        self._scopes: "OrderedDict[tuple, _ScopeCache]" = OrderedDict()
+
+    @staticmethod
+    def _table(user_id, sensor_id):
+        if sensor_id is not None:
+            return "sensor_readings", "co2", "sensor_id", sensor_id
+        return "co2_readings", "ppm", "user_id", user_id
+
+    def _refresh(self, key, user_id, sensor_id) -> _ScopeCache:
+        table, value_column, scope_column, scope_value = self._table(user_id, sensor_id)
+        with self._lock:
+            cache = self._scopes.get(key)
+            if cache is None or time.monotonic() - cache.built_at > self.rebuild_seconds:
+                cache = _ScopeCache()
+            self._scopes[key] = cache
+            self._scopes.move_to_end(key)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+
+        with cache.lock:
+            oldest_bucket = (int(time.time()) - MAX_DAYS * 86400) // BUCKET_SECONDS
+            db = get_db()
+            try:
+                version = db.execute(f"SELECT MAX(id) FROM {table} WHERE {scope_column} = ?",
+                                     (scope_value,)).fetchone()[0] or 0
+                if version <= cache.version:
+                    return cache
+                cursor = db.cursor()
+                cursor.row_factory = None
+                rows = cursor.execute(f"""
+                    SELECT CAST(strftime('%s', timestamp) AS INTEGER) / {BUCKET_SECONDS} AS bucket,
+                           SUM({value_column}), COUNT(*)
+                    FROM {table}
+                    WHERE {scope_column} = ? AND id > ? AND id <= ?
+                      AND timestamp >= datetime('now', '-{MAX_DAYS} days')
+                    GROUP BY bucket
+                """, (scope_value, cache.version, version)).fetchall()
+            finally:
+                db.close()
+
+            rows = [r for r in rows if r[0] is not None]
+            if rows:
+                array = np.array(rows, dtype=np.float64)
+                cache.merge(array[:, 0].astype(np.int64), array[:, 1], array[:, 2].astype(np.int64), oldest_bucket)
+            cache.version = version
+            return cache
+
+    def compute(self, user_id=None, sensor_id: Optional[int] = None, days: int = 30,
+                tz: str = "UTC") -> Dict[str, Any]:
+        """Average ppm per local (weekday, hour) over the last ``days`` days.
+
+        Returns ``heatmap`` and ``counts`` as [day][hour] (Monday first), with
+        None for empty cells, plus ``data_points``, ``timezone`` and ``version``.
+
+        Raises:
+            ValueError: unknown timezone.
+        """
+        try:
+            zone = ZoneInfo(tz)
+        except Exception:
+            raise ValueError(f"Unknown timezone: {tz}")
+        days = max(1, min(int(days), MAX_DAYS))
+
+        cache = self._refresh(("sensor", sensor_id) if sensor_id is not None else ("user", user_id),
+                              user_id, sensor_id)
+        with cache.lock:
+            buckets, sums, counts, version = cache.buckets, cache.sums, cache.counts, cache.version
+
+        keep = buckets >= (int(time.time()) - days * 86400) // BUCKET_SECONDS
+        starts = buckets[keep] * BUCKET_SECONDS
+        sums, counts = sums[keep], counts[keep]
+
+        # UTC offset per distinct hour (handles DST changes inside the window)
+        hours, inverse = np.unique(starts // 3600, return_inverse=True)
+        offsets = np.array([datetime.fromtimestamp(int(h) * 3600, zone).utcoffset().total_seconds()
+                            for h in hours], dtype=np.int64)
+        local = starts + offsets[inverse] if len(starts) else starts
+        cell = ((local // 86400 + 3) % 7) * 24 + (local // 3600) % 24  # 1970-01-01 was a Thursday
+
+        cell_sums = np.bincount(cell, weights=sums, minlength=7 * 24).reshape(7, 24)
+        cell_counts = np.bincount(cell, weights=counts, minlength=7 * 24).astype(np.int64).reshape(7, 24)
+        averages = np.divide(cell_sums, cell_counts, out=np.full((7, 24), np.nan), where=cell_counts > 0)
+
+        return {
+            'heatmap': [[None if np.isnan(v) else round(float(v), 1) for v in row] for row in averages],
+            'counts': cell_counts.tolist(),
+            'days': DAY_NAMES,
+            'hours': list(range(24)),
+            'data_points': int(cell_counts.sum()),
+            'timezone': tz,
+            'version': version,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+
+
+heatmap_engine = HeatmapEngine()
@@ -0,0 +1,405 @@
+"""Shared ingest pipeline for real sensor readings.
+
+Every path that receives hardware readings (``POST /api/readings``, the device
+Socket.IO namespace, ...) goes through :func:`ingest_readings`, which validates
+a batch, writes it in a single transaction and publishes it to the live feed.
+
+Ingestion is idempotent for keyed readings: a reading carrying a client id
+(``id`` / ``reading_id``) or a ``(device, seq)`` pair is stored at most once per
+user, enforced by a partial unique index. Retried readings are reported as
+duplicates (no-ops) instead of being inserted again.
+
+Readings of a sensor with ``compression`` in its config are filtered through the
+sensor's compressor (:mod:`utils.compression`) before they are written; the live
+feed still receives every reading. Keys of readings the compressor drops go to
+``ingest_keys`` so a retried batch is still recognised as a duplicate.
+
+High-rate producers (the line-protocol listener) hand readings to an
+:class:`IngestBatcher`, which coalesces them into large ``ingest_readings``
+transactions on a background thread.
+
+Accepted readings also update the online per-series statistics of the user and
+sensor (:mod:`utils.online_stats`); they are scored by the streaming anomaly
+detector (:mod:`utils.anomaly_stream`), folded into the chart tile pyramid
+(:mod:`utils.rollups`) and added to the time-weighted exposure counters
+(:mod:`utils.exposure`) in the same transaction. Sensor recommendations
+(:mod:`utils.ai_recommender`) are refreshed in the background afterwards.
+"""
+import json
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database import get_db
+from utils.ai_recommender import recommendation_engine
+from utils.anomaly_stream import anomaly_detector
+from utils.compression import compression_settings, compressors
+from utils.exposure import exposure_counters
+from utils.live_feed import publish_reading
+from utils.online_stats import series_key, series_stats
+from utils.rollups import tile_pyramid
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+# Plausible range for NDIR CO2 sensors (SCD30 tops out at 10 000 ppm)
+MIN_PPM = 0
+MAX_PPM = 10000
+
+DB_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+MAX_UID_LENGTH = 128
+
+# SQLite's default limit on bound parameters is 999
+_UID_LOOKUP_CHUNK = 500
+
+
+def parse_timestamp(value) -> datetime:
+    """Parse an epoch (seconds or milliseconds) or ISO-8601 value into an aware UTC datetime."""
+    if value is None or value == "":
+        return datetime.now(UTC)
+    if isinstance(value, (int, float)):
+        seconds = value / 1000.0 if value > 1e12 else float(value)
+        return datetime.fromtimestamp(seconds, UTC)
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=UTC)
+    return parsed.astimezone(UTC)
+
+
+def reading_uid(raw: Dict[str, Any], device_key: Optional[str] = None) -> Optional[str]:
+    """Deduplication key of a reading: client id, else ``<device>:<seq>``, else None."""
+    uid = raw.get("id", raw.get("reading_id"))
+    if uid is None and raw.get("seq") is not None:
+        device = raw.get("device", device_key)
+        if device is None:
+            raise ValueError("seq requires a device")
+        uid = f"{device}:{raw['seq']}"
+    if uid is None:
+        return None
+    uid = str(uid)
+    if not uid or len(uid) > MAX_UID_LENGTH:
+        raise ValueError(f"reading id must be 1-{MAX_UID_LENGTH} characters")
+    return uid
+
+
+def normalize_reading(raw: Any, device_key: Optional[str] = None) -> Dict[str, Any]:
+    """Validate one incoming reading and return it in storage form.
+
+    Raises:
+        ValueError: with a client-facing message when the reading is invalid.
+    """
+    if not isinstance(raw, dict):
+        raise ValueError("reading must be an object")
+
+    ppm = raw.get("ppm", raw.get("co2"))
+    if ppm is None:
+        raise ValueError("ppm is required")
+    try:
+        ppm = int(round(float(ppm)))
+    except (TypeError, ValueError):
+        raise ValueError("ppm must be numeric")
+    if not MIN_PPM <= ppm <= MAX_PPM:
+        raise ValueError(f"ppm out of range ({MIN_PPM}-{MAX_PPM})")
+
+    def _optional_float(key, *aliases):
+        for name in (key, *aliases):
+            if raw.get(name) is not None:
+                try:
+                    return float(raw[name])
+                except (TypeError, ValueError):
+                    raise ValueError(f"{key} must be numeric")
+        return None
+
+    try:
+        ts = parse_timestamp(raw.get("timestamp", raw.get("ts")))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError("timestamp must be ISO-8601 or epoch seconds")
+
+    return {
+        "ppm": ppm,
+        "temperature": _optional_float("temperature", "temp"),
+        "humidity": _optional_float("humidity", "rh"),
+        "ts": ts,
+        "timestamp": ts.strftime(DB_TIMESTAMP_FORMAT),
+        "uid": reading_uid(raw, device_key),
+    }
+
+
+def validate_batch(readings: Iterable[Any], device_key: Optional[str] = None
+                   ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Split a batch into (valid readings, rejections); both carry their batch ``index``."""
+    valid, rejected = [], []
+    for index, raw in enumerate(readings):
+        try:
+            reading = normalize_reading(raw, device_key)
+        except ValueError as e:
+            rejected.append({"index": index, "error": str(e)})
+            continue
+        reading["index"] = index
+        valid.append(reading)
+    return valid, rejected
+
+
+def _existing_uids(db, user_id, uids: List[str]) -> set:
+    existing = set()
+    for start in range(0, len(uids), _UID_LOOKUP_CHUNK):
+        chunk = uids[start:start + _UID_LOOKUP_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows = db.execute(
+            f"SELECT reading_uid FROM co2_readings WHERE user_id IS ? AND reading_uid IN ({placeholders})",
+            (user_id, *chunk)
+        ).fetchall()
+        existing.update(row[0] for row in rows)
+        rows = db.execute(
+            f"SELECT reading_uid FROM ingest_keys WHERE user_id IS ? AND reading_uid IN ({placeholders})",
+            (user_id, *chunk)
+        ).fetchall()
+        existing.update(row[0] for row in rows)
+    return existing
+
+
+def split_duplicates(db, user_id, valid: List[Dict[str, Any]]):
+    """Separate already-stored (or repeated in-batch) keyed readings from new ones."""
+    uids = [r["uid"] for r in valid if r["uid"]]
+    if not uids:
+        return valid, []
+    seen = _existing_uids(db, user_id, uids)
+    fresh, duplicates = [], []
+    for r in valid:
+        if r["uid"] and r["uid"] in seen:
+            duplicates.append(r)
+            continue
+        if r["uid"]:
+            seen.add(r["uid"])
+        fresh.append(r)
+    return fresh, duplicates
+
+
+def _sensor_compression(db, sensor_id):
+    row = db.execute("SELECT config FROM user_sensors WHERE id = ?", (sensor_id,)).fetchone()
+    if row is None:
+        return None
+    try:
+        config = json.loads(row[0]) if isinstance(row[0], str) else row[0]
+        return compression_settings(config)
+    except ValueError as e:
+        logger.warning(f"Ignoring compression settings of sensor {sensor_id}: {e}")
+        return None
+
+
+def _observe_stats(user_id, sensor_id, readings) -> None:
+    timestamps = [r["ts"].timestamp() for r in readings]
+    values = [r["ppm"] for r in readings]
+    try:
+        series_stats.observe(series_key(user_id=user_id), timestamps, values)
+        if sensor_id is not None:
+            series_stats.observe(series_key(sensor_id=sensor_id), timestamps, values)
+    except Exception as e:
+        logger.error(f"Failed to update series statistics for user {user_id}: {e}")
+
+
+def ingest_readings(user_id, readings: Iterable[Any], *, source: str = "sensor",
+                    sensor_id: Optional[int] = None, device_key: Optional[str] = None) -> Dict[str, Any]:
+    """Validate, persist and publish a batch of readings in one transaction.
+
+    Readings always land in ``co2_readings`` for ``user_id``; when the batch comes
+    from a registered sensor they are also logged to ``sensor_readings`` and the
+    sensor is marked available. ``device_key`` namespaces bare ``seq`` values.
+
+    Returns:
+        dict with ``accepted`` (count of new readings), ``stored`` (rows written
+        after compression), ``duplicates`` (batch
+        indexes of keyed readings that were already stored), ``rejected`` (list of
+        {index, error}) and ``seq`` (live-feed sequence of the last published
+        reading, or None).
+    """
+    valid, rejected = validate_batch(readings, device_key)
+    if not valid:
+        return {"accepted": 0, "stored": 0, "duplicates": [], "rejected": rejected, "seq": None}
+
+    db = get_db()
+    try:
+        fresh, duplicates = split_duplicates(db, user_id, valid)
+        stored = fresh
+        if sensor_id is not None and fresh:
+            stored = compressors.compress(sensor_id, _sensor_compression(db, sensor_id),
+                                          [(r["ts"].timestamp(), r["ppm"], r) for r in fresh])
+        if stored:
+            db.executemany(
+                """INSERT OR IGNORE INTO co2_readings
+                   (timestamp, ppm, temperature, humidity, source, user_id, reading_uid)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                [(r["timestamp"], r["ppm"], r["temperature"], r["humidity"], source, user_id, r["uid"])
+                 for r in stored]
+            )
+        # Readings of this batch held back by the compressor. ``stored`` may also
+        # release a point held over from an earlier batch, so compare identities
+        # instead of lengths.
+        kept = {id(r) for r in stored}
+        compressed = [r for r in fresh if id(r) not in kept]
+        dropped = [(user_id, r["uid"], r["timestamp"]) for r in compressed if r["uid"]]
+        if dropped:
+            db.executemany(
+                "INSERT OR IGNORE INTO ingest_keys (user_id, reading_uid, timestamp) VALUES (?, ?, ?)",
+                dropped
+            )
+        if sensor_id is not None:
+            if stored:
+                db.executemany(
+                    """INSERT OR IGNORE INTO sensor_readings
+                       (sensor_id, co2, temperature, humidity, timestamp, reading_uid)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    [(sensor_id, r["ppm"], r["temperature"], r["humidity"], r["timestamp"], r["uid"])
+                     for r in stored]
+                )
+            db.execute(
+                "UPDATE user_sensors SET available = 1, last_read = CURRENT_TIMESTAMP WHERE id = ?",
+                (sensor_id,)
+            )
+        anomalies = 0
+        if fresh:
+            try:
+                anomalies = anomaly_detector.record(db, user_id, sensor_id, fresh)
+            except Exception as e:
+                logger.error(f"Anomaly scoring failed for user {user_id}, sensor {sensor_id}: {e}")
+            try:
+                series_names = [series_key(user_id=user_id)]
+                if sensor_id is not None:
+                    series_names.append(series_key(sensor_id=sensor_id))
+                tile_pyramid.record(db, series_names, [r["ts"].timestamp() for r in fresh],
+                                    [r["ppm"] for r in fresh])
+            except Exception as e:
+                logger.error(f"Rollup update failed for user {user_id}, sensor {sensor_id}: {e}")
+            try:
+                exposure_counters.record(db, user_id, sensor_id, [r["ts"].timestamp() for r in fresh],
+                                         [r["ppm"] for r in fresh])
+            except Exception as e:
+                logger.error(f"Exposure update failed for user {user_id}, sensor {sensor_id}: {e}")
+        counters = [(name, value) for name, value in
+                    (("duplicates", len(duplicates)), ("compressed", len(compressed)),
+                     ("anomalies", anomalies)) if value]
+        if counters:
+            db.executemany(
+                """INSERT INTO ingest_counters (day, name, value) VALUES (date('now'), ?, ?)
+                   ON CONFLICT(day, name) DO UPDATE SET value = value + excluded.value""",
+                counters
+            )
+        db.commit()
+    finally:
+        db.close()
+
+    if fresh:
+        _observe_stats(user_id, sensor_id, fresh)
+        if sensor_id is not None:
+            recommendation_engine.refresh_later([sensor_id])
+
+    seq = None
+    for r in sorted(fresh, key=lambda item: item["ts"]):
+        event = publish_reading(user_id, r["ppm"], r["temperature"], r["humidity"],
+                                source=source, timestamp=r["ts"].isoformat())
+        if event:
+            seq = event["seq"]
+
+    return {
+        "accepted": len(fresh),
+        "stored": len(stored),
+        "duplicates": [r["index"] for r in duplicates],
+        "rejected": rejected,
+        "seq": seq,
+    }
+
+
+class IngestBatcher:
+    """Coalesces small submissions into batched ``ingest_readings`` calls.
+
+    Readings are queued per (user, sensor, device key) and written by a single
+    background thread every ``flush_interval`` seconds, or as soon as a queue
+    holds ``flush_size`` readings. At most ``max_pending`` readings wait in
+    total: ``submit`` never blocks (it runs on the listener's event loop), it
+    drops what does not fit and counts it in ``stats["dropped"]``.
+    """
+
+    def __init__(self, flush_size: int = 1000, flush_interval: float = 0.5, source: str = "sensor",
+                 max_pending: int = 100000):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.source = source
+        self.max_pending = max_pending
+        self.stats = {"accepted": 0, "stored": 0, "duplicates": 0, "rejected": 0, "failed": 0, "dropped": 0}
+        self._cond = threading.Condition()
+        self._pending: Dict[Tuple[Any, Any, Any], List[Any]] = {}
+        self._pending_count = 0
+        self._full = False
+        self._stopping = False
+        self._thread = None
+
+    def submit(self, user_id, readings: List[Any], sensor_id=None, device_key: Optional[str] = None) -> int:
+        """Queue readings; returns how many were queued (the rest were dropped)."""
+        if not readings:
+            return 0
+        with self._cond:
+            room = max(0, self.max_pending - self._pending_count)
+            if len(readings) > room:
+                self.stats["dropped"] += len(readings) - room
+                readings = readings[:room]
+                self._full = True
+                self._cond.notify()
+            if not readings:
+                return 0
+            queue = self._pending.setdefault((user_id, sensor_id, device_key), [])
+            queue.extend(readings)
+            self._pending_count += len(readings)
+            if len(queue) >= self.flush_size:
+                self._full = True
+                self._cond.notify()
+            return len(readings)
+
+    def flush(self) -> None:
+        """Write everything queued so far (called by the writer thread and on stop)."""
+        with self._cond:
+            pending, self._pending, self._full = self._pending, {}, False
+            self._pending_count = 0
+        for (user_id, sensor_id, device_key), readings in pending.items():
+            for start in range(0, len(readings), self.flush_size):
+                chunk = readings[start:start + self.flush_size]
+                try:
+                    result = ingest_readings(user_id, chunk, source=self.source,
+                                             sensor_id=sensor_id, device_key=device_key)
+                except Exception as e:
+                    self.stats["failed"] += len(chunk)
+                    logger.error(f"Batched ingest failed for user {user_id}, sensor {sensor_id}: {e}")
+                    continue
+                self.stats["accepted"] += result["accepted"]
+                self.stats["stored"] += result["stored"]
+                self.stats["duplicates"] += len(result["duplicates"])
+                self.stats["rejected"] += len(result["rejected"])
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not (self._full or self._stopping):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self._run, name="ingest-batcher", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        else:
+            self.flush()
@@ -0,0 +1,186 @@
+"""In-memory latest-reading feed for live consumers.
+
+The ingest path publishes every real (non-simulated) reading here so that live
+endpoints can answer from memory instead of querying ``co2_readings``. Each
+published reading gets a process-wide, monotonically increasing sequence number
+which doubles as the SSE event id.
+
+Readings stored by other processes (the line-protocol listener, other web
+workers) never reach this process's feed through ``publish``. Waiters use
+``LiveFeed.wait_or_poll``, which looks for them in ``co2_readings`` every
+``DB_POLL_SECONDS`` (at most once per interval per user) and publishes the rows
+inserted since the highest ``co2_readings.id`` it has seen for the user, so a
+backfilled old reading is published once and never moves the poll back in time.
+"""
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, UTC
+from typing import Any, Dict, List, Optional
+
+from database import get_db
+
+# Sources that feed the live UI (simulator and CSV imports never do)
+LIVE_FEED_SOURCES = ("sensor", "live_real")
+
+# Number of recent readings kept per user for Last-Event-ID replay
+REPLAY_BUFFER_SIZE = 256
+
+# Interval of the co2_readings check for readings stored by other processes
+DB_POLL_SECONDS = 2.0
+
+
+class LiveFeed:
+    """Per-user latest reading with a bounded replay buffer and a wake-up signal."""
+
+    def __init__(self, replay_size: int = REPLAY_BUFFER_SIZE):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._replay_size = replay_size
+        self._history: Dict[Any, deque] = {}
+        self._polled: Dict[Any, float] = {}
+        self._last_ids: Dict[Any, int] = {}
+        self._poll_lock = threading.Lock()
+
+    @property
+    def seq(self) -> int:
+        return self._seq
+
+    def publish(self, user_id, ppm, temperature=None, humidity=None,
+                timestamp: Optional[str] = None, source: str = "sensor") -> Dict[str, Any]:
+        """Record a reading for ``user_id`` and wake up every waiting consumer."""
+        with self._cond:
+            self._seq += 1
+            event = {
+                "seq": self._seq,
+                "ppm": ppm,
+                "temperature": temperature,
+                "humidity": humidity,
+                "timestamp": timestamp or datetime.now(UTC).isoformat(),
+                "source": source,
+            }
+            history = self._history.get(user_id)
+            if history is None:
+                history = self._history[user_id] = deque(maxlen=self._replay_size)
+            history.append(event)
+            self._cond.notify_all()
+            return event
+
+    def latest(self, user_id) -> Optional[Dict[str, Any]]:
+        with self._cond:
+            history = self._history.get(user_id)
+            return history[-1] if history else None
+
+    def since(self, user_id, after_seq: int) -> List[Dict[str, Any]]:
+        """Readings newer than ``after_seq``, oldest first.
+
+        If readings after ``after_seq`` were already evicted from the replay
+        buffer (or the id comes from a previous process), only the latest reading
+        is returned so the client resyncs.
+        """
+        with self._cond:
+            history = self._history.get(user_id)
+            if not history:
+                return []
+            evicted = len(history) == history.maxlen and after_seq < history[0]["seq"]
+            if after_seq > self._seq or evicted:
+                return [history[-1]]
+            return [event for event in history if event["seq"] > after_seq]
+
+    def wait(self, user_id, after_seq: int, timeout: float) -> List[Dict[str, Any]]:
+        """Block until ``user_id`` has a reading newer than ``after_seq`` or ``timeout`` expires."""
+        with self._cond:
+            self._cond.wait_for(lambda: bool(self.since(user_id, after_seq)), timeout=timeout)
+            return self.since(user_id, after_seq)
+
+    def poll_database(self, user_id, force: bool = False) -> int:
+        """Publish ``user_id``'s live readings stored since the last poll.
+
+        The first poll of a user looks one minute back; later polls read the rows
+        whose id is above the highest one seen. Rows this process already
+        published (same timestamp and ppm in the replay buffer) are skipped.
+        Returns the number of readings published. Skipped (returning 0) when the
+        user was polled less than ``DB_POLL_SECONDS`` ago, unless ``force``.
+        """
+        with self._poll_lock:
+            now = time.monotonic()
+            if not force and now - self._polled.get(user_id, -DB_POLL_SECONDS) < DB_POLL_SECONDS:
+                return 0
+            self._polled[user_id] = now
+
+            last_id = self._last_ids.get(user_id)
+            db = get_db()
+            try:
+                if last_id is None:
+                    # First poll: the last minute, up to the newest row stored now
+                    ceiling = db.execute("SELECT COALESCE(MAX(id), 0) FROM co2_readings WHERE user_id = ?",
+                                         (user_id,)).fetchone()[0]
+                    cutoff = datetime.now(UTC) - timedelta(minutes=1)
+                    window, args = "timestamp > ? AND id <= ?", [cutoff.strftime("%Y-%m-%d %H:%M:%S"), ceiling]
+                else:
+                    window, args = "id > ?", [last_id]
+                rows = db.execute(
+                    f"""SELECT id, ppm, temperature, humidity, timestamp, source FROM co2_readings
+                        WHERE user_id = ? AND source IN ({', '.join('?' * len(LIVE_FEED_SOURCES))})
+                          AND {window}
+                        ORDER BY id LIMIT ?""",
+                    (user_id, *LIVE_FEED_SOURCES, *args, self._replay_size)
+                ).fetchall()
+            finally:
+                db.close()
+            if rows and (last_id is not None or len(rows) == self._replay_size):
+                self._last_ids[user_id] = rows[-1]["id"]
+            elif last_id is None:
+                self._last_ids[user_id] = ceiling
+
+            with self._cond:
+                published = {(_second(event["timestamp"]), event["ppm"])
+                             for event in self._history.get(user_id, ())}
+            count = 0
+            for row in rows:
+                if (row["timestamp"][:19], row["ppm"]) in published:
+                    continue
+                stamp = datetime.strptime(row["timestamp"][:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=UTC)
+                self.publish(user_id, row["ppm"], row["temperature"], row["humidity"],
+                             timestamp=stamp.isoformat(), source=row["source"])
+                count += 1
+            return count
+
+    def wait_or_poll(self, user_id, after_seq: int, timeout: float) -> List[Dict[str, Any]]:
+        """``wait`` that also picks up readings stored by other processes (see ``poll_database``)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            events = self.wait(user_id, after_seq, timeout=max(0.0, min(remaining, DB_POLL_SECONDS)))
+            if events:
+                return events
+            self.poll_database(user_id)
+            events = self.since(user_id, after_seq)
+            if events or remaining <= DB_POLL_SECONDS:
+                return events
+
+    def clear(self, user_id=None) -> None:
+        with self._cond:
+            if user_id is None:
+                self._history.clear()
+            else:
+                self._history.pop(user_id, None)
+
+
+def _second(timestamp: str) -> str:
+    """``YYYY-MM-DD HH:MM:SS`` UTC form of an event timestamp (as stored in co2_readings)."""
+    stamp = datetime.fromisoformat(timestamp)
+    if stamp.tzinfo is not None:
+        stamp = stamp.astimezone(UTC)
+    return stamp.strftime("%Y-%m-%d %H:%M:%S")
+
+
+live_feed = LiveFeed()
+
+
+def publish_reading(user_id, ppm, temperature=None, humidity=None, *, source: str = "sensor",
+                    timestamp: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Publish a stored reading to the live feed if its source is a live source."""
+    if user_id is None or source not in LIVE_FEED_SOURCES:
+        return None
+    return live_feed.publish(user_id, ppm, temperature, humidity, timestamp=timestamp, source=source)
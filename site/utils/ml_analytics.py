@@ -8,7 +8,9 @@ import pandas as pd
 from datetime import datetime, timedelta
 from typing import Dict, List, Tuple, Optional
 import json
-from database import get_db
+from database import get_anomalies, get_db
+from utils.model_registry import ModelNotReady, model_registry
+from utils.online_stats import series_key
 
 try:
     from sklearn.ensemble import IsolationForest
@@ -23,12 +25,12 @@ class MLAnalytics:
     """Machine learning based analytics"""
     
     def __init__(self):
-        self.db = get_db()
         self.sklearn_available = SKLEARN_AVAILABLE
     
     def predict_co2_levels(self, sensor_id: int, hours: int = 24) -> Optional[List[float]]:
         """
-        Predict CO₂ levels for next N hours using linear regression
+        Predict CO₂ levels for next N hours with the sensor's linear trend
+        model from the model registry (inference only)
         
         Args:
             sensor_id: Sensor ID
@@ -36,39 +38,19 @@ class MLAnalytics:
         
         Returns:
             List of predicted CO₂ values or None
+        
+        Raises:
+            ModelNotReady: the model is still being trained
         """
         if not self.sklearn_available:
             return None
         
         try:
-            # Get historical data (last 7 days)
-            cursor = self.db.cursor()
-            seven_days_ago = datetime.now() - timedelta(days=7)
-            
-            cursor.execute('''
-                SELECT timestamp, ppm FROM sensor_readings
-                WHERE sensor_id = ? AND timestamp > ?
-                ORDER BY timestamp
-            ''', (sensor_id, seven_days_ago))
-            
-            readings = cursor.fetchall()
-            
-            if len(readings) < 10:
-                return None  # Not enough data
+            model, meta = model_registry.get(series_key(sensor_id=sensor_id), 'trend_linear')
             
-            # Prepare data
-            X = np.array([(datetime.fromisoformat(r[0]) - datetime.now().replace(hour=0, minute=0, second=0)).total_seconds() 
-                         for r in readings]).reshape(-1, 1)
-            y = np.array([r[1] for r in readings])
-            
-            # Train model
-            model = LinearRegression()
-            model.fit(X, y)
-            
-            # Make predictions
-            future_times = np.array([i * 3600 for i in range(1, hours + 1)]).reshape(-1, 1)
-            current_time = (datetime.now() - datetime.now().replace(hour=0, minute=0, second=0)).total_seconds()
-            future_times = future_times + current_time
+            # Seconds relative to the end of the training window
+            current_time = datetime.now().timestamp() - meta['metrics']['reference']
+            future_times = (np.arange(1, hours + 1, dtype=np.float64) * 3600 + current_time).reshape(-1, 1)
             
             predictions = model.predict(future_times)
             
@@ -77,80 +59,39 @@ class MLAnalytics:
             
             return predictions.tolist()
         
+        except ModelNotReady:
+            raise
         except Exception as e:
             print(f"Error predicting CO₂ levels: {e}")
             return None
     
-    def detect_anomalies(self, sensor_id: int, threshold: float = 0.95) -> Optional[List[Dict]]:
+    def detect_anomalies(self, sensor_id: int, threshold: float = 0.95,
+                         user_id: Optional[int] = None) -> Optional[List[Dict]]:
         """
-        Detect anomalies in CO₂ readings using Isolation Forest
+        Anomalies of a sensor over the last 30 days, as flagged at ingest by
+        the streaming detector (utils.anomaly_stream)
         
         Args:
             sensor_id: Sensor ID
-            threshold: Anomaly threshold (0-1)
+            threshold: Minimum anomaly score (1.0 = at the detection limit)
+            user_id: Restrict to anomalies owned by this user
         
         Returns:
             List of detected anomalies or None
         """
-        if not self.sklearn_available:
-            return None
-        
         try:
-            # Get last 30 days of data
-            cursor = self.db.cursor()
-            thirty_days_ago = datetime.now() - timedelta(days=30)
-            
-            cursor.execute('''
-                SELECT id, timestamp, ppm FROM sensor_readings
-                WHERE sensor_id = ? AND timestamp > ?
-                ORDER BY timestamp
-            ''', (sensor_id, thirty_days_ago))
-            
-            readings = cursor.fetchall()
-            
-            if len(readings) < 20:
-                return None
-            
-            # Prepare features
-            data = []
-            for r in readings:
-                hour = datetime.fromisoformat(r[1]).hour
-                data.append([r[2], hour])  # PPM and hour of day
-            
-            X = np.array(data)
-            
-            # Detect anomalies
-            scaler = StandardScaler()
-            X_scaled = scaler.fit_transform(X)
-            
-            iso_forest = IsolationForest(contamination=0.1, random_state=42)
-            predictions = iso_forest.fit_predict(X_scaled)
-            
-            # Extract anomalies
-            anomalies = []
-            for i, (reading, pred) in enumerate(zip(readings, predictions)):
-                if pred == -1:  # Anomaly detected
-                    anomalies.append({
-                        'id': reading[0],
-                        'timestamp': reading[1],
-                        'ppm': reading[2],
-                        'severity': self._calculate_anomaly_severity(reading[2])
-                    })
-            
-            return anomalies
+            return [{
+                'timestamp': anomaly['timestamp'],
+                'ppm': anomaly['ppm'],
+                'severity': anomaly['severity'],
+                'score': anomaly['score'],
+                'kind': anomaly['kind'],
+            } for anomaly in get_anomalies(user_id=user_id, sensor_id=sensor_id, days=30, min_score=threshold)]
         
         except Exception as e:
             print(f"Error detecting anomalies: {e}")
             return None
     
-    def _calculate_anomaly_severity(self, ppm: float) -> str:
-        """Calculate severity of anomaly based on PPM value"""
-        if ppm < 400 or ppm > 1800:
-            return 'high'
-        elif ppm < 500 or ppm > 1500:
-            return 'medium'
-        return 'low'
-    
     def analyze_trends(self, sensor_id: int, days: int = 30) -> Dict:
         """
         Analyze trends in CO₂ levels
@@ -162,8 +103,9 @@ class MLAnalytics:
         Returns:
             Dictionary with trend analysis
         """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             start_date = datetime.now() - timedelta(days=days)
             
             cursor.execute('''
@@ -211,6 +153,8 @@ class MLAnalytics:
         except Exception as e:
             print(f"Error analyzing trends: {e}")
             return {}
+        finally:
+            db.close()
     
     def get_insights(self, sensor_id: int) -> List[str]:
         """
@@ -221,8 +165,9 @@ class MLAnalytics:
         """
         insights = []
         
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             today = datetime.now().replace(hour=0, minute=0, second=0)
             
             # Get today's average
@@ -266,6 +211,8 @@ class MLAnalytics:
             
         except Exception as e:
             print(f"Error generating insights: {e}")
+        finally:
+            db.close()
         
         return insights
     
@@ -276,8 +223,9 @@ class MLAnalytics:
         Returns:
             Correlation data
         """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             start_date = datetime.now() - timedelta(days=days)
             
             cursor.execute('''
@@ -298,3 +246,5 @@ class MLAnalytics:
         except Exception as e:
             print(f"Error getting correlation: {e}")
             return {}
+        finally:
+            db.close()
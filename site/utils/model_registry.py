@@ -0,0 +1,326 @@
+"""Versioned registry of fitted ML models per sensor or user.
+
+Models are keyed by (scope, model type), where the scope is a series name from
+:func:`utils.online_stats.series_key` (``sensor:<id>`` or ``user:<id>``).
+Each training run writes a new version to ``<root>/<scope>/<model type>/v<N>.pkl``
+and records it in the ``ml_models`` table together with its training window,
+sample count and metrics; older versions beyond ``keep_versions`` are removed.
+Fits run in a :mod:`utils.task_pool` worker process.
+
+Requests only run inference: :meth:`ModelRegistry.get` returns the latest
+version from an LRU of deserialized models. A missing model raises
+:class:`ModelNotReady` and is trained on a background thread; the scheduled
+:meth:`ModelRegistry.retrain_due` job refits registered models once enough new
+readings have arrived (or the model is old and any new data exists).
+"""
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, UTC
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import get_config
+from database import DB_PATH, get_db
+from utils.logger import configure_logging
+from utils.series import fetch_reading_columns
+from utils.task_pool import task_pool
+
+try:
+    from sklearn.ensemble import IsolationForest
+    from sklearn.linear_model import LinearRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+
+logger = configure_logging()
+
+DB_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# A failed or skipped training run (e.g. too little data) is not retried sooner
+RETRY_SECONDS = 600
+
+
+class ModelNotReady(Exception):
+    """No trained model exists yet for the scope; training has been scheduled."""
+
+
+# ================================================================================
+#                    TRAINERS
+# ================================================================================
+
+class Trainer:
+    """How to fit one model type: training window, minimum samples and fit function."""
+
+    def __init__(self, fit: Callable, days: float, min_samples: int):
+        self.fit = fit
+        self.days = days
+        self.min_samples = min_samples
+
+
+TRAINERS: Dict[str, Trainer] = {}
+
+
+def trainer(model_type: str, days: float, min_samples: int):
+    def register(fit):
+        TRAINERS[model_type] = Trainer(fit, days, min_samples)
+        return fit
+    return register
+
+
+def isolation_features(columns) -> np.ndarray:
+    """Feature matrix of the ``isolation_forest`` model: ppm and UTC hour of day."""
+    return np.column_stack([columns.ppm.astype(np.float64), (columns.ts // 3600) % 24])
+
+
+@trainer("trend_linear", days=7, min_samples=10)
+def _fit_trend(columns) -> Tuple[Any, Dict[str, Any]]:
+    """ppm as a linear function of seconds since ``reference`` (the end of the window)."""
+    reference = int(columns.ts[-1])
+    X = (columns.ts - reference).astype(np.float64).reshape(-1, 1)
+    y = columns.ppm.astype(np.float64)
+    model = LinearRegression().fit(X, y)
+    return model, {'reference': reference, 'r2': float(model.score(X, y))}
+
+
+@trainer("isolation_forest", days=30, min_samples=20)
+def _fit_isolation_forest(columns) -> Tuple[Any, Dict[str, Any]]:
+    model = make_pipeline(StandardScaler(), IsolationForest(contamination=0.05, random_state=42))
+    model.fit(isolation_features(columns))
+    return model, {'contamination': 0.05}
+
+
+def _scope_columns(scope: str, days: float):
+    kind, _, ident = scope.partition(":")
+    if kind == "sensor":
+        return fetch_reading_columns(sensor_id=int(ident), days=days)
+    return fetch_reading_columns(user_id=int(ident), days=days)
+
+
+# ================================================================================
+#                    REGISTRY
+# ================================================================================
+
+class ModelRegistry:
+    """On-disk model versions, an LRU of loaded models and background (re)training."""
+
+    def __init__(self, root: Optional[Path] = None, cache_size: int = 32, keep_versions: int = 3,
+                 min_new_readings: int = 500, max_age_hours: float = 24.0):
+        self.root = Path(root) if root else DB_PATH.parent / "models"
+        self.cache_size = cache_size
+        self.keep_versions = keep_versions
+        self.min_new_readings = min_new_readings
+        self.max_age_hours = max_age_hours
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[tuple, Tuple[Any, Dict[str, Any]]]" = OrderedDict()
+        self._training: set = set()
+        self._skipped: Dict[tuple, float] = {}
+
+    # ------------------------------------------------------------------ catalog
+
+    @staticmethod
+    def latest(scope: str, model_type: str) -> Optional[Dict[str, Any]]:
+        db = get_db()
+        try:
+            row = db.execute(
+                """SELECT * FROM ml_models WHERE scope = ? AND model_type = ?
+                   ORDER BY version DESC LIMIT 1""",
+                (scope, model_type)
+            ).fetchone()
+        finally:
+            db.close()
+        if row is None:
+            return None
+        meta = dict(row)
+        meta['metrics'] = json.loads(meta['metrics'] or '{}')
+        return meta
+
+    # ------------------------------------------------------------------ inference
+
+    def get(self, scope: str, model_type: str) -> Tuple[Any, Dict[str, Any]]:
+        """(model, metadata) of the latest version.
+
+        Raises:
+            ModelNotReady: no version yet; a background training run is started.
+        """
+        meta = self.latest(scope, model_type)
+        if meta is None:
+            self.request_training(scope, model_type)
+            raise ModelNotReady(f"No {model_type} model for {scope} yet")
+
+        key = (scope, model_type, meta['version'])
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        try:
+            with open(self.root / meta['path'], 'rb') as f:
+                model = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            logger.error(f"Cannot load {model_type} model v{meta['version']} for {scope}: {e}")
+            self.request_training(scope, model_type, force=True)
+            raise ModelNotReady(f"{model_type} model for {scope} is being rebuilt")
+
+        with self._lock:
+            self._cache[key] = (model, meta)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return model, meta
+
+    # ------------------------------------------------------------------ training
+
+    def train(self, scope: str, model_type: str) -> Optional[Dict[str, Any]]:
+        """Fit and register a new version; returns its metadata, or None with too little data."""
+        if not SKLEARN_AVAILABLE:
+            raise RuntimeError("scikit-learn is not installed")
+        spec = TRAINERS[model_type]
+        columns = _scope_columns(scope, spec.days)
+        if len(columns) < spec.min_samples:
+            logger.info(f"Not training {model_type} for {scope}: {len(columns)} readings")
+            return None
+
+        started = time.perf_counter()
+        model, metrics = task_pool.run(spec.fit, columns, kind=f"fit_{model_type}")
+        metrics['fit_seconds'] = round(time.perf_counter() - started, 3)
+
+        window_start, window_end = (datetime.fromtimestamp(int(t), UTC).strftime(DB_TIMESTAMP_FORMAT)
+                                    for t in (columns.ts[0], columns.ts[-1]))
+        payload = pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+        db = get_db()
+        try:
+            # Allocate the version, write its file and register it under one write
+            # lock so concurrent trainers (threads or workers) never share a version
+            db.execute("BEGIN IMMEDIATE")
+            version = db.execute(
+                "SELECT COALESCE(MAX(version), 0) + 1 FROM ml_models WHERE scope = ? AND model_type = ?",
+                (scope, model_type)
+            ).fetchone()[0]
+            relative = Path(*scope.split(":")) / model_type / f"v{version}.pkl"
+            path = self.root / relative
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(".tmp")
+            with open(tmp, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp, path)
+
+            db.execute(
+                """INSERT INTO ml_models
+                   (scope, model_type, version, path, window_start, window_end, samples, metrics)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (scope, model_type, version, relative.as_posix(), window_start, window_end,
+                 len(columns), json.dumps(metrics))
+            )
+            stale = db.execute(
+                """SELECT version, path FROM ml_models WHERE scope = ? AND model_type = ? AND version <= ?""",
+                (scope, model_type, version - self.keep_versions)
+            ).fetchall()
+            db.execute("DELETE FROM ml_models WHERE scope = ? AND model_type = ? AND version <= ?",
+                       (scope, model_type, version - self.keep_versions))
+            db.commit()
+        finally:
+            db.close()
+        for row in stale:
+            try:
+                (self.root / row['path']).unlink()
+            except OSError:
+                pass
+
+        logger.info(f"Trained {model_type} v{version} for {scope} on {len(columns)} readings")
+        return self.latest(scope, model_type)
+
+    def _claim(self, key, force: bool = False) -> bool:
+        with self._lock:
+            if key in self._training:
+                return False
+            if not force and time.monotonic() - self._skipped.get(key, -RETRY_SECONDS) < RETRY_SECONDS:
+                return False
+            self._training.add(key)
+            return True
+
+    def _train_claimed(self, key) -> Optional[Dict[str, Any]]:
+        try:
+            meta = self.train(*key)
+            if meta is None:
+                self._skipped[key] = time.monotonic()
+            return meta
+        except Exception as e:
+            self._skipped[key] = time.monotonic()
+            logger.error(f"Training {key[1]} for {key[0]} failed: {e}")
+            return None
+        finally:
+            with self._lock:
+                self._training.discard(key)
+
+    def request_training(self, scope: str, model_type: str, force: bool = False) -> bool:
+        """Train on a background thread unless already running or recently skipped."""
+        key = (scope, model_type)
+        if not self._claim(key, force):
+            return False
+        threading.Thread(target=self._train_claimed, args=(key,), name=f"train-{model_type}", daemon=True).start()
+        return True
+
+    def new_readings(self, scope: str, since: str) -> int:
+        kind, _, ident = scope.partition(":")
+        if kind == "sensor":
+            query = "SELECT COUNT(*) FROM sensor_readings WHERE sensor_id = ? AND timestamp > ?"
+        else:
+            query = "SELECT COUNT(*) FROM co2_readings WHERE user_id = ? AND timestamp > ?"
+        db = get_db()
+        try:
+            return db.execute(query, (int(ident), since)).fetchone()[0]
+        finally:
+            db.close()
+
+    def needs_training(self, meta: Dict[str, Any]) -> bool:
+        fresh = self.new_readings(meta['scope'], meta['window_end'])
+        if fresh >= self.min_new_readings:
+            return True
+        trained_at = datetime.strptime(meta['trained_at'], DB_TIMESTAMP_FORMAT).replace(tzinfo=UTC)
+        age_hours = (datetime.now(UTC) - trained_at).total_seconds() / 3600
+        return fresh > 0 and age_hours >= self.max_age_hours
+
+    def retrain_due(self) -> int:
+        """Refit every registered model that has enough new data (scheduler job)."""
+        db = get_db()
+        try:
+            entries = db.execute(
+                """SELECT scope, model_type, MAX(version) AS version FROM ml_models
+                   GROUP BY scope, model_type"""
+            ).fetchall()
+        finally:
+            db.close()
+
+        retrained = 0
+        for entry in entries:
+            if entry['model_type'] not in TRAINERS:
+                continue
+            key = (entry['scope'], entry['model_type'])
+            meta = self.latest(*key)
+            if not (meta and self.needs_training(meta) and self._claim(key, force=True)):
+                continue
+            if self._train_claimed(key):
+                retrained += 1
+        return retrained
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self._skipped.clear()
+
+
+_config = get_config()
+model_registry = ModelRegistry(root=_config.MODEL_REGISTRY_DIR or None,
+                               cache_size=_config.MODEL_CACHE_SIZE,
+                               min_new_readings=_config.MODEL_RETRAIN_MIN_READINGS)
+
+
+__all__ = ["ModelRegistry", "ModelNotReady", "model_registry", "isolation_features", "TRAINERS"]
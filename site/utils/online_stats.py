@@ -0,0 +1,532 @@
+"""Online per-series statistics maintained at ingest time.
+
+Every ingested reading updates mergeable summaries of its series (a user's
+readings, ``user:<id>``, and a sensor's readings, ``sensor:<id>``):
+
+- :class:`Welford` -- count, mean, M2 (variance), min and max,
+- :class:`TDigest` -- a merging t-digest for quantiles (~50 centroids),
+- :class:`EWMA` -- exponentially weighted mean/variance of the live series.
+
+Welford and t-digest summaries are kept per hourly and daily UTC bucket and
+persisted to ``series_stats`` every ``flush_interval`` seconds by a background
+thread (only the deltas observed since the last flush are merged into the
+stored rows, so several processes can ingest the same series). An EWMA depends
+on the order of its readings and cannot be merged, so each process saves its
+own row of ``series_ewma`` (keyed by host and pid) and readers use the row that
+saw the latest reading. A window query merges the daily
+summaries covering whole days plus hourly summaries for the edges, instead of
+rescanning raw readings. Hourly rows are kept for ``HOURLY_RETENTION_DAYS``;
+older windows are answered at day granularity.
+
+Readings stored before this module existed are summarised with
+:meth:`OnlineStatsStore.rebuild` (see ``scripts/rebuild_series_stats.py``).
+"""
+import atexit
+import json
+import math
+import os
+import socket
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database import get_db
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+HOUR = 3600
+DAY = 86400
+RESOLUTIONS = (HOUR, DAY)
+HOURLY_RETENTION_DAYS = 35
+
+DIGEST_COMPRESSION = 100
+EWMA_ALPHA = 0.1
+DEFAULT_PERCENTILES = (25, 50, 75, 90, 95, 99)
+
+
+def series_key(user_id=None, sensor_id: Optional[int] = None) -> str:
+    """Series name of a sensor's readings, else of a user's readings."""
+    if sensor_id is not None:
+        return f"sensor:{sensor_id}"
+    return f"user:{user_id}"
+
+
+class Welford:
+    """Streaming count/mean/variance/min/max; mergeable (Chan et al.)."""
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0,
+                 min: float = math.inf, max: float = -math.inf):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.min = min
+        self.max = max
+
+    def _combine(self, count, mean, m2, low, high) -> None:
+        if not count:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, low)
+        self.max = max(self.max, high)
+
+    def update(self, value: float) -> None:
+        self._combine(1, float(value), 0.0, float(value), float(value))
+
+    def update_many(self, values: np.ndarray) -> None:
+        if not len(values):
+            return
+        mean = float(values.mean())
+        self._combine(len(values), mean, float(((values - mean) ** 2).sum()),
+                      float(values.min()), float(values.max()))
+
+    def merge(self, other: "Welford") -> None:
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+
+    @property
+    def variance(self) -> Optional[float]:
+        """Sample variance (None below two observations)."""
+        return self.m2 / (self.count - 1) if self.count > 1 else None
+
+    @property
+    def stddev(self) -> Optional[float]:
+        variance = self.variance
+        return math.sqrt(variance) if variance is not None else None
+
+
+class EWMA:
+    """Exponentially weighted moving mean and variance."""
+
+    __slots__ = ("alpha", "value", "variance", "count", "last_ts")
+
+    def __init__(self, alpha: float = EWMA_ALPHA, value: Optional[float] = None,
+                 variance: float = 0.0, count: int = 0, last_ts: Optional[float] = None):
+        self.alpha = alpha
+        self.value = value
+        self.variance = variance
+        self.count = count
+        self.last_ts = last_ts
+
+    def update(self, x: float, ts: Optional[float] = None) -> None:
+        x = float(x)
+        if self.value is None:
+            self.value = x
+        else:
+            diff = x - self.value
+            increment = self.alpha * diff
+            self.value += increment
+            self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+        self.count += 1
+        if ts is not None:
+            self.last_ts = ts if self.last_ts is None else max(self.last_ts, ts)
+
+    def update_many(self, values: Sequence[float], timestamps: Optional[Sequence[float]] = None) -> None:
+        for i, x in enumerate(values):
+            self.update(x, None if timestamps is None else float(timestamps[i]))
+
+    @property
+    def stddev(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class TDigest:
+    """Merging t-digest (k1 scale function) for approximate quantiles.
+
+    Values are buffered and folded into centroids in vectorised passes; each
+    centroid spans at most one unit of the k1 scale, which keeps centroids
+    small (accurate) near the tails and bounds their number to ~compression/2.
+    """
+
+    __slots__ = ("compression", "means", "weights", "_buffer", "_buffered")
+
+    def __init__(self, compression: float = DIGEST_COMPRESSION,
+                 means: Optional[Sequence[float]] = None, weights: Optional[Sequence[float]] = None):
+        self.compression = compression
+        self.means = np.asarray(means if means is not None else [], dtype=np.float64)
+        self.weights = np.asarray(weights if weights is not None else [], dtype=np.float64)
+        self._buffer: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._buffered = 0
+
+    def _add(self, means: np.ndarray, weights: np.ndarray) -> None:
+        if not len(means):
+            return
+        self._buffer.append((means, weights))
+        self._buffered += len(means)
+        if self._buffered > 10 * self.compression:
+            self.compress()
+
+    def update_many(self, values: np.ndarray) -> None:
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        self._add(values, np.ones(len(values)))
+
+    def merge(self, other: "TDigest") -> None:
+        other.compress()
+        self._add(other.means, other.weights)
+
+    def compress(self) -> None:
+        if not self._buffer:
+            return
+        means = np.concatenate([self.means] + [m for m, _ in self._buffer])
+        weights = np.concatenate([self.weights] + [w for _, w in self._buffer])
+        self._buffer, self._buffered = [], 0
+
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        midpoints = (np.cumsum(weights) - weights / 2) / total
+        scale = self.compression / (2 * math.pi) * np.arcsin(np.clip(2 * midpoints - 1, -1, 1))
+        cluster = np.floor(scale + self.compression / 4).astype(np.int64)
+        _, cluster = np.unique(cluster, return_inverse=True)
+        self.weights = np.bincount(cluster, weights=weights)
+        self.means = np.bincount(cluster, weights=means * weights) / self.weights
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum()) + sum(float(w.sum()) for _, w in self._buffer)
+
+    def quantile(self, q: float, low: Optional[float] = None, high: Optional[float] = None) -> Optional[float]:
+        """Approximate ``q``-quantile (0..1); ``low``/``high`` are the exact min/max if known."""
+        self.compress()
+        if not len(self.means):
+            return None
+        if len(self.means) == 1:
+            return float(self.means[0])
+        total = self.weights.sum()
+        centers = np.cumsum(self.weights) - self.weights / 2
+        low = float(self.means[0]) if low is None else low
+        high = float(self.means[-1]) if high is None else high
+        return float(np.interp(q * total, np.concatenate([[0.0], centers, [total]]),
+                               np.concatenate([[low], self.means, [high]])))
+
+    def to_json(self) -> str:
+        self.compress()
+        return json.dumps({"m": [round(float(m), 4) for m in self.means],
+                           "w": [int(w) if float(w).is_integer() else float(w) for w in self.weights]})
+
+    @classmethod
+    def from_json(cls, payload: Optional[str]) -> "TDigest":
+        if not payload:
+            return cls()
+        data = json.loads(payload)
+        return cls(means=data.get("m", []), weights=data.get("w", []))
+
+
+class Summary:
+    """Welford moments plus a t-digest for one series bucket."""
+
+    __slots__ = ("moments", "digest")
+
+    def __init__(self, moments: Optional[Welford] = None, digest: Optional[TDigest] = None):
+        self.moments = moments or Welford()
+        self.digest = digest or TDigest()
+
+    def update_many(self, values: np.ndarray) -> None:
+        self.moments.update_many(values)
+        self.digest.update_many(values)
+
+    def merge(self, other: "Summary") -> None:
+        self.moments.merge(other.moments)
+        self.digest.merge(other.digest)
+
+    def describe(self, percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+        m = self.moments
+        if not m.count:
+            return {'count': 0, 'mean': None, 'stddev': None, 'min': None, 'max': None,
+                    'percentiles': {f"p{_label(p)}": None for p in percentiles}}
+        stddev = m.stddev
+        return {
+            'count': m.count,
+            'mean': round(m.mean, 2),
+            'stddev': round(stddev, 2) if stddev is not None else None,
+            'min': m.min,
+            'max': m.max,
+            'percentiles': {f"p{_label(p)}": round(self.digest.quantile(p / 100.0, m.min, m.max), 1)
+                            for p in percentiles},
+        }
+
+    def to_row(self) -> Tuple[int, float, float, float, float, str]:
+        m = self.moments
+        return m.count, m.mean, m.m2, m.min, m.max, self.digest.to_json()
+
+    @classmethod
+    def from_row(cls, count, mean, m2, low, high, digest) -> "Summary":
+        return cls(Welford(count or 0, mean or 0.0, m2 or 0.0,
+                           math.inf if low is None else low, -math.inf if high is None else high),
+                   TDigest.from_json(digest))
+
+
+def _label(p: float) -> str:
+    return str(int(p)) if float(p).is_integer() else str(p)
+
+
+def _bucket_plan(start: int, end: int, hourly_floor: int):
+    """Split [start, end) into whole days and hourly edges.
+
+    Returns ((first_day, last_day), [(first_hour, last_hour), ...], (start_hour, end_hour));
+    bucket ranges are inclusive and may be empty. Hours before ``hourly_floor``
+    (already pruned) are widened to their whole day.
+    """
+    first_hour = start // HOUR
+    end_hour = max(-(-end // HOUR), first_hour + 1)
+    if first_hour < hourly_floor:
+        first_hour = first_hour // 24 * 24
+    first_day = -(-first_hour // 24)
+    end_day = end_hour // 24
+    if first_day >= end_day:
+        return (1, 0), [(first_hour, end_hour - 1)], (first_hour, end_hour)
+    hours = [(lo, hi) for lo, hi in ((first_hour, first_day * 24 - 1), (end_day * 24, end_hour - 1)) if lo <= hi]
+    return (first_day, end_day - 1), hours, (first_hour, end_hour)
+
+
+class OnlineStatsStore:
+    """In-memory deltas per (series, resolution, bucket), merged into SQLite periodically."""
+
+    def __init__(self, flush_interval: float = 60.0):
+        self.flush_interval = flush_interval
+        self.writer = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending: Dict[Tuple[str, int, int], Summary] = {}
+        self._ewma: Dict[str, EWMA] = {}
+        self._ewma_dirty: set = set()
+        self._last_prune = 0.0
+        self._flusher: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    # ------------------------------------------------------------------ ingest
+
+    def _load_ewma(self, series: str) -> EWMA:
+        """Latest saved EWMA of ``series`` across writers (seeds this process's own)."""
+        db = get_db()
+        try:
+            row = db.execute(
+                """SELECT value, variance, count, last_ts FROM series_ewma
+                   WHERE series = ? ORDER BY last_ts DESC LIMIT 1""",
+                (series,)
+            ).fetchone()
+        finally:
+            db.close()
+        return EWMA(value=row[0], variance=row[1] or 0.0, count=row[2] or 0, last_ts=row[3]) if row else EWMA()
+
+    def _start_flusher(self) -> None:
+        # Called with self._lock held
+        if self._flusher is None and math.isfinite(self.flush_interval):
+            self._flusher = threading.Thread(target=self._flush_periodically, name="series-stats-flush",
+                                             daemon=True)
+            self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Periodic series statistics flush failed: {e}")
+
+    def observe(self, series: str, timestamps: Sequence[float], values: Sequence[float]) -> None:
+        """Fold readings (epoch seconds, value) into the series summaries."""
+        ts = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~(np.isnan(ts) | np.isnan(values))
+        ts, values = ts[keep], values[keep]
+        if not len(ts):
+            return
+        order = np.argsort(ts, kind="stable")
+        ts, values = ts[order], values[order]
+
+        ewma = self._ewma.get(series)
+        if ewma is None:
+            ewma = self._load_ewma(series)
+
+        with self._lock:
+            for resolution in RESOLUTIONS:
+                buckets = (ts // resolution).astype(np.int64)
+                edges = np.flatnonzero(np.diff(buckets)) + 1
+                for bucket, chunk in zip(buckets[np.concatenate([[0], edges])], np.split(values, edges)):
+                    key = (series, resolution, int(bucket))
+                    summary = self._pending.get(key)
+                    if summary is None:
+                        summary = self._pending[key] = Summary()
+                    summary.update_many(chunk)
+            ewma = self._ewma.setdefault(series, ewma)
+            ewma.update_many(values, ts)
+            self._ewma_dirty.add(series)
+            self._start_flusher()
+
+    def flush(self) -> None:
+        """Merge pending deltas into ``series_stats`` and save EWMA state."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                ewma_rows = [(series, self.writer, e.value, e.variance, e.count, e.last_ts)
+                             for series, e in self._ewma.items() if series in self._ewma_dirty]
+                self._ewma_dirty = set()
+            if not pending and not ewma_rows:
+                return
+
+            db = get_db()
+            try:
+                # Other processes flush the same rows: read-merge-write under the write lock
+                db.execute("BEGIN IMMEDIATE")
+                rows = []
+                for (series, resolution, bucket), delta in pending.items():
+                    row = db.execute(
+                        """SELECT count, mean, m2, min, max, digest FROM series_stats
+                           WHERE series = ? AND resolution = ? AND bucket = ?""",
+                        (series, resolution, bucket)
+                    ).fetchone()
+                    summary = Summary.from_row(*row) if row else Summary()
+                    summary.merge(delta)
+                    rows.append((series, resolution, bucket, *summary.to_row()))
+                db.executemany(
+                    """INSERT OR REPLACE INTO series_stats
+                       (series, resolution, bucket, count, mean, m2, min, max, digest)
+                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                    rows
+                )
+                db.executemany(
+                    """INSERT OR REPLACE INTO series_ewma (series, writer, value, variance, count, last_ts)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    ewma_rows
+                )
+                if time.monotonic() - self._last_prune > HOUR:
+                    db.execute("DELETE FROM series_stats WHERE resolution = ? AND bucket < ?",
+                               (HOUR, self._hourly_floor()))
+                    # Rows of processes that stopped writing a day before the latest one
+                    db.execute("""
+                        DELETE FROM series_ewma WHERE last_ts < (
+                            SELECT MAX(e.last_ts) FROM series_ewma e WHERE e.series = series_ewma.series
+                        ) - ?
+                    """, (DAY,))
+                    self._last_prune = time.monotonic()
+                db.commit()
+            except Exception as e:
+                logger.error(f"Failed to persist series statistics: {e}")
+                with self._lock:
+                    for key, delta in pending.items():
+                        current = self._pending.get(key)
+                        if current is not None:
+                            delta.merge(current)
+                        self._pending[key] = delta
+                    self._ewma_dirty.update(row[0] for row in ewma_rows)
+            finally:
+                db.close()
+
+    # ------------------------------------------------------------------ queries
+
+    @staticmethod
+    def _hourly_floor() -> int:
+        return (int(time.time()) - HOURLY_RETENTION_DAYS * DAY) // HOUR
+
+    def summarize(self, series: str, start: float, end: float,
+                  percentiles: Iterable[float] = DEFAULT_PERCENTILES) -> Dict[str, Any]:
+        """Statistics of ``series`` over [start, end) (epoch seconds, widened to whole hours)."""
+        percentiles = list(percentiles)
+        (first_day, last_day), hour_ranges, (start_hour, end_hour) = _bucket_plan(
+            int(start), int(math.ceil(end)), self._hourly_floor())
+
+        clauses = ["(resolution = ? AND bucket BETWEEN ? AND ?)"]
+        params: List[Any] = [DAY, first_day, last_day]
+        for lo, hi in hour_ranges:
+            clauses.append("(resolution = ? AND bucket BETWEEN ? AND ?)")
+            params.extend([HOUR, lo, hi])
+
+        db = get_db()
+        try:
+            cursor = db.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(
+                f"""SELECT resolution, bucket, count, mean, m2, min, max, digest FROM series_stats
+                    WHERE series = ? AND ({' OR '.join(clauses)})""",
+                (series, *params)
+            ).fetchall()
+        finally:
+            db.close()
+
+        def selected(resolution, bucket):
+            if resolution == DAY:
+                return first_day <= bucket <= last_day
+            return any(lo <= bucket <= hi for lo, hi in hour_ranges)
+
+        total = Summary()
+        for resolution, bucket, *stored in rows:
+            total.merge(Summary.from_row(*stored))
+        with self._lock:
+            pending = [s for (name, resolution, bucket), s in self._pending.items()
+                       if name == series and selected(resolution, bucket)]
+            for summary in pending:
+                total.merge(summary)
+            ewma = self._ewma.get(series)
+            ewma = (ewma.value, ewma.stddev) if ewma and ewma.value is not None else None
+
+        if ewma is None:
+            loaded = self._load_ewma(series)
+            ewma = (loaded.value, loaded.stddev) if loaded.value is not None else None
+
+        result = total.describe(percentiles)
+        result.update({
+            'series': series,
+            'start': start_hour * HOUR,
+            'end': end_hour * HOUR,
+            'ewma': round(ewma[0], 2) if ewma else None,
+            'ewma_stddev': round(ewma[1], 2) if ewma else None,
+        })
+        return result
+
+    # ------------------------------------------------------------------ maintenance
+
+    def rebuild(self, series: str, columns, since: float) -> int:
+        """Replace the stored summaries of ``series`` from ``since`` (rounded down to a day).
+
+        ``columns`` must be a ReadingColumns holding all readings of the series
+        since that day. Returns the number of readings summarised.
+        """
+        first_day = int(since) // DAY
+        keep = columns.ts >= first_day * DAY
+        ts, values = columns.ts[keep].astype(np.float64), columns.ppm[keep].astype(np.float64)
+
+        with self._lock:
+            self._pending = {key: s for key, s in self._pending.items()
+                             if key[0] != series or key[2] * key[1] < first_day * DAY}
+        db = get_db()
+        try:
+            db.execute("DELETE FROM series_stats WHERE series = ? AND bucket * resolution >= ?",
+                       (series, first_day * DAY))
+            db.commit()
+        finally:
+            db.close()
+
+        rebuilt = OnlineStatsStore(flush_interval=math.inf)
+        rebuilt._ewma[series] = EWMA()
+        rebuilt.observe(series, ts, values)
+        with rebuilt._lock:
+            rebuilt._ewma_dirty.clear()
+        rebuilt.flush()
+        return int(keep.sum())
+
+    def stop(self) -> None:
+        """Stop the background flusher and write what is pending."""
+        self._stopping.set()
+        self.flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pending.clear()
+            self._ewma.clear()
+            self._ewma_dirty.clear()
+
+
+series_stats = OnlineStatsStore()
+atexit.register(series_stats.stop)
+
+
+__all__ = ["Welford", "EWMA", "TDigest", "Summary", "OnlineStatsStore", "series_stats",
+           "series_key", "DEFAULT_PERCENTILES"]
@@ -72,15 +72,16 @@ class CacheManager:
 
 
 class QueryOptimizer:
-    """Database query optimization"""
+    """Database query optimization (each query borrows a pooled connection)"""
     
     def __init__(self):
-        self.db = get_db()
         self.query_stats = {}
+        self.lock = threading.Lock()
     
     def ensure_indexes(self):
         """Create database indexes for common queries"""
-        cursor = self.db.cursor()
+        db = get_db()
+        cursor = db.cursor()
         
         indexes = [
             ('idx_sensor_readings_sensor_timestamp', 
@@ -104,15 +105,18 @@ class QueryOptimizer:
                     ON {table} {columns}
                 ''')
             
-            self.db.commit()
+            db.commit()
             print(f"Created {len(indexes)} database indexes")
         except Exception as e:
             print(f"Error creating indexes: {e}")
+        finally:
+            db.close()
     
     def optimize_reading_query(self, sensor_id: int, hours: int = 24, 
                                limit: int = 1000) -> list:
         """Optimized query for sensor readings"""
-        cursor = self.db.cursor()
+        db = get_db()
+        cursor = db.cursor()
         start_time = time.time()
         
         try:
@@ -135,33 +139,37 @@ class QueryOptimizer:
         except Exception as e:
             print(f"Error in optimized query: {e}")
             return []
+        finally:
+            db.close()
     
     def _track_query(self, query_name: str, exec_time: float, result_count: int):
         """Track query execution stats"""
-        if query_name not in self.query_stats:
-            self.query_stats[query_name] = {
-                'count': 0,
-                'total_time': 0,
-                'avg_time': 0,
-                'max_time': 0,
-                'min_time': float('inf')
-            }
-        
-        stats = self.query_stats[query_name]
-        stats['count'] += 1
-        stats['total_time'] += exec_time
-        stats['avg_time'] = stats['total_time'] / stats['count']
-        stats['max_time'] = max(stats['max_time'], exec_time)
-        stats['min_time'] = min(stats['min_time'], exec_time)
+        with self.lock:
+            if query_name not in self.query_stats:
+                self.query_stats[query_name] = {
+                    'count': 0,
+                    'total_time': 0,
+                    'avg_time': 0,
+                    'max_time': 0,
+                    'min_time': float('inf')
+                }
+            
+            stats = self.query_stats[query_name]
+            stats['count'] += 1
+            stats['total_time'] += exec_time
+            stats['avg_time'] = stats['total_time'] / stats['count']
+            stats['max_time'] = max(stats['max_time'], exec_time)
+            stats['min_time'] = min(stats['min_time'], exec_time)
     
     def get_query_stats(self) -> Dict:
         """Get query performance statistics"""
-        return self.query_stats
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.query_stats.items()}
     
     def analyze_slow_queries(self, threshold_ms: float = 100) -> list:
         """Find queries slower than threshold"""
         slow = []
-        for query, stats in self.query_stats.items():
+        for query, stats in self.get_query_stats().items():
             if stats['avg_time'] * 1000 > threshold_ms:
                 slow.append({
                     'query': query,
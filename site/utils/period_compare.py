@@ -0,0 +1,193 @@
+"""N-period comparisons of readings in a single pass.
+
+A comparison is a list of time windows, most recent first (this week, last
+week, the week before...). Instead of one aggregate query per window, every
+reading in the overall range is tagged with the index of the window it falls
+in by a ``CASE`` expression and the aggregates are grouped on that index, so
+any number of periods costs one range scan of ``co2_readings``
+(:func:`compare_readings`) or, for a whole series, one primary-key range scan
+of the daily or hourly rows of ``series_rollups`` (:func:`compare_rollups`).
+
+Windows are half-open ``[start, end)`` UTC intervals; the most recent window
+may be open-ended (``end`` is None) so readings stamped after ``now`` still
+count, as the previous per-period queries did.
+"""
+from datetime import datetime, timedelta, UTC
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+UNITS = ("day", "week", "month", "year")
+MAX_PERIODS = 24
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+Window = Tuple[datetime, Optional[datetime]]
+
+
+def _utc_now(now: Optional[datetime]) -> datetime:
+    now = now or datetime.now(UTC)
+    return now.astimezone(UTC).replace(tzinfo=None) if now.tzinfo else now
+
+
+def _shift_months(moment: datetime, months: int) -> datetime:
+    index = moment.year * 12 + moment.month - 1 + months
+    return moment.replace(year=index // 12, month=index % 12 + 1)
+
+
+def period_windows(unit: str, periods: int = 2, now: Optional[datetime] = None) -> List[Window]:
+    """Windows of the ``periods`` latest ``unit`` periods, most recent first.
+
+    ``day`` and ``week`` are rolling windows ending now (the last 7 days, the
+    7 days before...); ``month`` and ``year`` are calendar periods, the
+    current one to date.
+
+    Raises:
+        ValueError: unknown unit or period count outside 1..MAX_PERIODS.
+    """
+    if unit not in UNITS:
+        raise ValueError(f"unit must be one of {', '.join(UNITS)}")
+    if not 1 <= periods <= MAX_PERIODS:
+        raise ValueError(f"periods must be between 1 and {MAX_PERIODS}")
+    now = _utc_now(now).replace(microsecond=0)
+
+    if unit in ("day", "week"):
+        span = timedelta(days=1 if unit == "day" else 7)
+        edges = [now - i * span for i in range(periods + 1)]
+    elif unit == "month":
+        start = now.replace(day=1, hour=0, minute=0, second=0)
+        edges = [now] + [_shift_months(start, -i) for i in range(periods)]
+    else:
+        start = now.replace(month=1, day=1, hour=0, minute=0, second=0)
+        edges = [now] + [start.replace(year=start.year - i) for i in range(periods)]
+    return [(edges[i + 1], None if i == 0 else edges[i]) for i in range(periods)]
+
+
+def split_windows(first: datetime, last: datetime) -> List[Window]:
+    """Two windows splitting ``[first, last]`` at its midpoint (recent half first)."""
+    middle = (first + (last - first) / 2).replace(microsecond=0)
+    return [(middle, None), (first, middle)]
+
+
+def _case(column: str, windows: Sequence[Tuple[Any, Any]]) -> Tuple[str, list]:
+    """``CASE`` expression mapping ``column`` to the index of its window, and its params."""
+    branches, params = [], []
+    for index, (start, end) in enumerate(windows):
+        if end is None:
+            branches.append(f"WHEN {column} >= ? THEN {index}")
+            params.append(start)
+        else:
+            branches.append(f"WHEN {column} >= ? AND {column} < ? THEN {index}")
+            params.extend((start, end))
+    return f"CASE {' '.join(branches)} END", params
+
+
+def _range(windows: Sequence[Tuple[Any, Any]]):
+    """(start, end) covering every window; end is None when one is open-ended."""
+    ends = [end for _, end in windows]
+    return min(start for start, _ in windows), None if None in ends else max(ends)
+
+
+def _period(window: Window, count=0, avg=None, minimum=None, maximum=None) -> Dict[str, Any]:
+    start, end = window
+    return {
+        "start": start.strftime(TIMESTAMP_FORMAT),
+        "end": end.strftime(TIMESTAMP_FORMAT) if end else None,
+        "avg": avg,
+        "min": minimum,
+        "max": maximum,
+        "count": count,
+    }
+
+
+def compare_readings(db, windows: Sequence[Window], where: str, params: Sequence,
+                     table: str = "co2_readings", value: str = "ppm",
+                     by_day: bool = False) -> List[Dict[str, Any]]:
+    """Aggregates of ``value`` per window from one scan of ``table`` rows matching ``where``.
+
+    Returns one dict per window (``start``, ``end``, ``avg``, ``min``, ``max``,
+    ``count``; empty windows have ``count`` 0 and no statistics). With
+    ``by_day`` each also carries ``days``: per-date ``avg``/``min``/``max``/
+    ``count`` rows, from the same scan.
+    """
+    bounds = [(start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT) if end else None)
+              for start, end in windows]
+    case, case_params = _case("timestamp", bounds)
+    first, last = _range(bounds)
+    range_clause = "timestamp >= ?" + ("" if last is None else " AND timestamp < ?")
+    range_params = [first] + ([] if last is None else [last])
+    day_column = ", DATE(timestamp) AS date" if by_day else ""
+
+    rows = db.execute(f"""
+        SELECT {case} AS period{day_column},
+               AVG({value}) AS avg, MIN({value}) AS min, MAX({value}) AS max, COUNT({value}) AS count
+        FROM {table}
+        WHERE {where} AND {range_clause}
+        GROUP BY period{', date' if by_day else ''}
+        HAVING period IS NOT NULL
+        ORDER BY period{', date' if by_day else ''}
+    """, (*case_params, *params, *range_params)).fetchall()
+
+    if not by_day:
+        found = {row["period"]: row for row in rows}
+        return [_period(window, found[i]["count"], found[i]["avg"], found[i]["min"], found[i]["max"])
+                if i in found else _period(window)
+                for i, window in enumerate(windows)]
+
+    days: List[list] = [[] for _ in windows]
+    for row in rows:
+        if row["count"]:
+            days[row["period"]].append({key: row[key] for key in ("date", "avg", "min", "max", "count")})
+    result = []
+    for window, period_days in zip(windows, days):
+        count = sum(day["count"] for day in period_days)
+        period = _period(window, count, *(
+            (sum(day["avg"] * day["count"] for day in period_days) / count,
+             min(day["min"] for day in period_days),
+             max(day["max"] for day in period_days)) if count else ()))
+        period["days"] = period_days
+        result.append(period)
+    return result
+
+
+def compare_rollups(db, series: str, windows: Sequence[Window]) -> List[Dict[str, Any]]:
+    """Aggregates per window for a whole series from ``series_rollups``.
+
+    Daily rollups are used when every window boundary falls on a UTC midnight,
+    hourly ones otherwise (boundaries are then rounded down to the hour). Only
+    readings folded into the rollups are counted (see :mod:`utils.rollups`).
+    """
+    epochs = [(int(start.replace(tzinfo=UTC).timestamp()),
+               int(end.replace(tzinfo=UTC).timestamp()) if end else None)
+              for start, end in windows]
+    aligned = all(edge % 86400 == 0 for pair in epochs for edge in pair if edge is not None)
+    resolution = 86400 if aligned else 3600
+    buckets = [(start // resolution, end // resolution if end is not None else None) for start, end in epochs]
+    case, case_params = _case("bucket", buckets)
+    first, last = _range(buckets)
+
+    cursor = db.cursor()
+    cursor.row_factory = None
+    rows = cursor.execute(f"""
+        SELECT {case} AS period, SUM(count), SUM(sum), MIN(min), MAX(max)
+        FROM series_rollups
+        WHERE series = ? AND resolution = ? AND bucket >= ?{'' if last is None else ' AND bucket < ?'}
+        GROUP BY period
+        HAVING period IS NOT NULL
+    """, (*case_params, series, resolution, first, *([] if last is None else [last]))).fetchall()
+
+    found = {row[0]: row for row in rows}
+    return [_period(window, found[i][1], found[i][2] / found[i][1], found[i][3], found[i][4])
+            if i in found else _period(window)
+            for i, window in enumerate(windows)]
+
+
+def percent_change(current: Optional[float], previous: Optional[float]) -> float:
+    """Relative change in percent, 0 when there is no previous value."""
+    if current is None or not previous:
+        return 0
+    return round((current - previous) / previous * 100, 1)
+
+
+__all__ = [
+    "UNITS", "MAX_PERIODS", "period_windows", "split_windows",
+    "compare_readings", "compare_rollups", "percent_change",
+]
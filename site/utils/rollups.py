@@ -0,0 +1,211 @@
+"""Multi-resolution tile pyramid of reading series for zoomable charts.
+
+Every ingested reading is folded into per-series rollups (count, sum, min,
+max) at fixed resolutions (``LEVELS``: 1 minute, 10 minutes, 1 hour, 1 day),
+upserted into ``series_rollups`` in the ingest transaction. A chart asks for
+*tiles*: tile ``i`` of level ``L`` holds the ``TILE_BUCKETS`` buckets starting
+at epoch ``i * TILE_BUCKETS * L``, so any zoom level or pan position maps to a
+handful of tile lookups, each a primary-key range scan of at most
+``TILE_BUCKETS`` rows, whatever the size of the raw history.
+
+Series names come from :func:`utils.online_stats.series_key`. Rollups only
+grow on ingest (deleting raw readings does not shrink them); fine levels are
+pruned after ``RETENTION_DAYS`` and history stored before this module existed
+is loaded with :meth:`TilePyramid.rebuild` (``scripts/rebuild_series_stats.py``),
+which records the backfill horizon in ``series_rollup_coverage``: from that
+epoch on, the rollups of the series hold all of its readings.
+"""
+import time
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+import numpy as np
+
+from database import get_db
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+LEVELS = (60, 600, 3600, 86400)
+TILE_BUCKETS = 256
+# Levels not listed are kept for as long as the series exists
+RETENTION_DAYS = {60: 35, 600: 400}
+
+_UPSERT = """
+    INSERT INTO series_rollups (series, resolution, bucket, count, sum, min, max)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(series, resolution, bucket) DO UPDATE SET
+        count = count + excluded.count,
+        sum = sum + excluded.sum,
+        min = MIN(min, excluded.min),
+        max = MAX(max, excluded.max)
+"""
+
+
+def _aggregate(ts: np.ndarray, values: np.ndarray, level: int):
+    """(buckets, count, sum, min, max) of the readings per bucket of ``level`` seconds."""
+    buckets = (ts // level).astype(np.int64)
+    order = np.argsort(buckets, kind="stable")
+    buckets, values = buckets[order], values[order]
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    counts = np.diff(np.append(starts, len(buckets)))
+    return (buckets[starts], counts, np.add.reduceat(values, starts),
+            np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts))
+
+
+class TilePyramid:
+    """Rollup maintenance and tile reads over ``series_rollups``."""
+
+    def __init__(self, levels: Sequence[int] = LEVELS, tile_buckets: int = TILE_BUCKETS):
+        self.levels = tuple(levels)
+        self.tile_buckets = tile_buckets
+
+    def rows(self, series_names: Iterable[str], timestamps, values) -> list:
+        """Upsert rows for readings (epoch seconds, value) belonging to each of ``series_names``."""
+        ts = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~(np.isnan(ts) | np.isnan(values))
+        ts, values = ts[keep], values[keep]
+        if not len(ts):
+            return []
+        rows = []
+        for level in self.levels:
+            aggregated = list(zip(*(column.tolist() for column in _aggregate(ts, values, level))))
+            for series in series_names:
+                rows.extend((series, level, *row) for row in aggregated)
+        return rows
+
+    def record(self, db, series_names: Iterable[str], timestamps, values) -> int:
+        """Fold readings into the rollups on ``db`` (the caller commits)."""
+        rows = self.rows(series_names, timestamps, values)
+        if rows:
+            db.executemany(_UPSERT, rows)
+        return len(rows)
+
+    def process(self, series_names: Iterable[str], timestamps, values) -> int:
+        """Fold readings into the rollups in their own transaction (paths outside utils.ingest)."""
+        db = get_db()
+        try:
+            count = self.record(db, series_names, timestamps, values)
+            db.commit()
+            return count
+        finally:
+            db.close()
+
+    def tile_span(self, level: int) -> int:
+        """Seconds covered by one tile of ``level``."""
+        return level * self.tile_buckets
+
+    def tile(self, series: str, level: int, index: int) -> Dict[str, Any]:
+        """Buckets of tile ``index`` at ``level`` as parallel arrays (empty buckets omitted).
+
+        Raises:
+            ValueError: ``level`` is not one of the pyramid's levels.
+        """
+        if level not in self.levels:
+            raise ValueError(f"level must be one of {', '.join(map(str, self.levels))}")
+        first = index * self.tile_buckets
+        db = get_db()
+        try:
+            cursor = db.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(
+                """SELECT bucket, count, sum, min, max FROM series_rollups
+                   WHERE series = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+                   ORDER BY bucket""",
+                (series, level, first, first + self.tile_buckets - 1)
+            ).fetchall()
+        finally:
+            db.close()
+        return {
+            "series": series,
+            "level": level,
+            "tile": index,
+            "start": first * level,
+            "end": (first + self.tile_buckets) * level,
+            "t": [row[0] * level for row in rows],
+            "count": [row[1] for row in rows],
+            "avg": [round(row[2] / row[1], 2) for row in rows],
+            "min": [row[3] for row in rows],
+            "max": [row[4] for row in rows],
+        }
+
+    def level_for(self, start: float, end: float, max_buckets: int, now: Optional[float] = None) -> int:
+        """Finest level covering [start, end) in at most ``max_buckets`` buckets and still kept at ``start``.
+
+        The coarsest level when even it needs more buckets.
+        """
+        now = time.time() if now is None else now
+        for level in self.levels:
+            if (end - start) / level > max_buckets:
+                continue
+            if level in RETENTION_DAYS and start < now - RETENTION_DAYS[level] * 86400:
+                continue
+            return level
+        return self.levels[-1]
+
+    def buckets(self, series: str, level: int, start: float, end: float) -> list:
+        """(bucket start, count, avg, min, max) of the non-empty buckets of ``level`` over [start, end)."""
+        db = get_db()
+        try:
+            cursor = db.cursor()
+            cursor.row_factory = None
+            rows = cursor.execute(
+                """SELECT bucket, count, sum, min, max FROM series_rollups
+                   WHERE series = ? AND resolution = ? AND bucket BETWEEN ? AND ?
+                   ORDER BY bucket""",
+                (series, level, int(start) // level, (int(end) - 1) // level)
+            ).fetchall()
+        finally:
+            db.close()
+        return [(bucket * level, count, total / count, low, high) for bucket, count, total, low, high in rows]
+
+    def coverage(self, series: str) -> Optional[int]:
+        """Epoch from which the rollups of ``series`` are complete (None: not backfilled)."""
+        db = get_db()
+        try:
+            row = db.execute("SELECT since FROM series_rollup_coverage WHERE series = ?", (series,)).fetchone()
+        finally:
+            db.close()
+        return row[0] if row else None
+
+    def rebuild(self, series: str, columns, since: int) -> int:
+        """Replace the rollups of ``series`` from ``since`` (epoch, day-aligned) with ``columns``."""
+        ts = columns.ts.astype(np.float64)
+        values = columns.ppm.astype(np.float64)
+        mask = ts >= since
+        db = get_db()
+        try:
+            for level in self.levels:
+                db.execute("DELETE FROM series_rollups WHERE series = ? AND resolution = ? AND bucket >= ?",
+                           (series, level, since // level))
+            self.record(db, [series], ts[mask], values[mask])
+            db.execute(
+                """INSERT INTO series_rollup_coverage (series, since) VALUES (?, ?)
+                   ON CONFLICT(series) DO UPDATE SET since = MIN(since, excluded.since)""",
+                (series, int(since))
+            )
+            db.commit()
+        finally:
+            db.close()
+        return int(mask.sum())
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Delete fine-level rollups older than their retention; returns the deleted row count."""
+        now = time.time() if now is None else now
+        db = get_db()
+        try:
+            deleted = 0
+            for level, days in RETENTION_DAYS.items():
+                cursor = db.execute("DELETE FROM series_rollups WHERE resolution = ? AND bucket < ?",
+                                    (level, int(now - days * 86400) // level))
+                deleted += cursor.rowcount
+            db.commit()
+            return deleted
+        finally:
+            db.close()
+
+
+tile_pyramid = TilePyramid()
+
+
+__all__ = ["TilePyramid", "tile_pyramid", "LEVELS", "TILE_BUCKETS"]
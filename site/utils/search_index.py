@@ -0,0 +1,335 @@
+"""In-memory search index for the global search box (``/api/search``).
+
+Two kinds of index share the same structure, a flattened prefix trie: every
+prefix of every token (and the first letters of every title) maps to the
+documents containing it, kept sorted by static rank. A keystroke looks up the
+query's title list and the list of its rarest word, then walks both in rank
+order, checking the other words on each document, and stops after a bounded
+number of entries, whatever the number of documents.
+
+- The *static* index (pages and help keywords) is built once at startup
+  (:meth:`SearchService.build_static`).
+- A *per-user* index (the user's sensors, shared dashboards, teams and
+  comments) is loaded from the database on the user's first search and kept
+  up to date by the write paths calling :meth:`SearchService.refresh`. At most
+  ``MAX_USER_INDEXES`` user indexes are kept (least recently used first out).
+
+Text is normalised for French: accents are stripped (``données`` matches
+``donnees``), ligatures expanded and case folded. Results are ranked by exact
+word matches, then prefix matches, with a bonus when the title starts with the
+query and a per-category boost.
+"""
+import bisect
+import heapq
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database import get_db
+
+MIN_QUERY_LENGTH = 2
+MAX_PREFIX = 24
+# Longer queries find title matches through their words
+MAX_TITLE_PREFIX = 12
+MAX_USER_INDEXES = 1024
+COMMENT_TITLE_LENGTH = 60
+
+EXACT_SCORE = 3
+PREFIX_SCORE = 2
+TITLE_PREFIX_SCORE = 4
+# Token matches scored per search beyond the title matches
+OVERSCAN = 50
+# Entries visited per ranked list, matching or not
+MAX_VISITED = 200
+
+_LIGATURES = str.maketrans({"œ": "oe", "Œ": "oe", "æ": "ae", "Æ": "ae"})
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize(text: Optional[str]) -> str:
+    """Lower-case, accent-free text with words separated by single spaces."""
+    if not text:
+        return ""
+    text = unicodedata.normalize("NFKD", str(text).translate(_LIGATURES))
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return _SEPARATORS.sub(" ", text).strip()
+
+
+class _Doc:
+    __slots__ = ("doc_id", "title", "tokens", "boost", "admin_only", "payload", "entry")
+
+    def __init__(self, doc_id, title, tokens, boost, admin_only, payload):
+        self.doc_id = doc_id
+        self.title = title
+        self.tokens = tokens
+        self.boost = boost
+        self.admin_only = admin_only
+        self.payload = payload
+        # Static rank: higher boost first, then shorter titles
+        self.entry = (-boost, len(title), doc_id)
+
+    def matches(self, words: List[str]) -> bool:
+        return all(word in self.tokens or any(token.startswith(word) for token in self.tokens)
+                   for word in words)
+
+    def score(self, words: List[str], query: str) -> float:
+        score = self.boost + sum(EXACT_SCORE if word in self.tokens else PREFIX_SCORE for word in words)
+        return score + TITLE_PREFIX_SCORE if self.title.startswith(query) else score
+
+
+def _prefixes(text: str, longest: int = MAX_PREFIX) -> Iterable[str]:
+    return (text[:end] for end in range(1, min(len(text), longest) + 1))
+
+
+class SearchIndex:
+    """Prefix index over documents with a title, extra keywords and a result payload.
+
+    Each prefix maps to its documents sorted by static rank, for the prefixes
+    of every token and the first ``MAX_TITLE_PREFIX`` prefixes of the title. A search walks the
+    documents whose title starts with the query, then those of the query's
+    rarest word, in static rank order, scores at most ``limit`` and
+    ``OVERSCAN`` of them (visiting at most ``MAX_VISITED`` entries of each list,
+    including those rejected by the other words or the admin filter) and
+    returns the best ``limit``: a keystroke costs the same with ten documents
+    or ten thousand.
+    """
+
+    def __init__(self):
+        self._docs: Dict[str, _Doc] = {}
+        self._tokens: Dict[str, list] = {}
+        self._titles: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, doc_id: str, title: str, payload: Dict[str, Any], keywords: Iterable[str] = (),
+            boost: float = 0, admin_only: bool = False) -> None:
+        """Index (or re-index) ``doc_id``; ``payload`` is what searches return."""
+        doc = self._document(doc_id, title, payload, keywords, boost, admin_only)
+        with self._lock:
+            self._remove(doc_id)
+            self._docs[doc_id] = doc
+            for table, prefix in self._keys(doc):
+                bisect.insort(table.setdefault(prefix, []), doc.entry)
+
+    def extend(self, documents: Iterable[Tuple]) -> None:
+        """Index many ``add`` argument tuples at once (sorting each prefix list once)."""
+        docs = [self._document(*document) for document in documents]
+        with self._lock:
+            for doc in docs:
+                self._remove(doc.doc_id)
+                self._docs[doc.doc_id] = doc
+                for table, prefix in self._keys(doc):
+                    table.setdefault(prefix, []).append(doc.entry)
+            # Timsort is linear on the lists that were already sorted
+            for table in (self._tokens, self._titles):
+                for entries in table.values():
+                    entries.sort()
+
+    @staticmethod
+    def _document(doc_id, title, payload, keywords=(), boost=0, admin_only=False) -> _Doc:
+        tokens = frozenset(normalize(" ".join([title, *filter(None, keywords)])).split())
+        return _Doc(doc_id, normalize(title), tokens, boost, admin_only, payload)
+
+    def _keys(self, doc: _Doc):
+        """(table, prefix) pairs under which ``doc`` is listed."""
+        for prefix in {prefix for token in doc.tokens for prefix in _prefixes(token)}:
+            yield self._tokens, prefix
+        for prefix in _prefixes(doc.title, MAX_TITLE_PREFIX):
+            yield self._titles, prefix
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for table, prefix in self._keys(doc):
+            entries = table[prefix]
+            del entries[bisect.bisect_left(entries, doc.entry)]
+            if not entries:
+                del table[prefix]
+
+    def search(self, query: str, limit: int = 10, include_admin: bool = False) -> List[Tuple[float, Dict[str, Any]]]:
+        """Best ``limit`` (score, payload) pairs for a normalised ``query``; every word must match."""
+        words = query.split()
+        if not words:
+            return []
+        with self._lock:
+            lists = [self._tokens.get(word[:MAX_PREFIX]) for word in words]
+            if not all(lists):
+                return []
+            scored = {}
+            for entries, budget in ((self._titles.get(query, ()), limit),
+                                    (min(lists, key=len), OVERSCAN)):
+                for entry in entries[:MAX_VISITED]:
+                    if budget <= 0:
+                        break
+                    doc = self._docs[entry[2]]
+                    if doc.doc_id in scored or (doc.admin_only and not include_admin) or not doc.matches(words):
+                        continue
+                    scored[doc.doc_id] = (doc.score(words, query), -entry[1], doc.payload)
+                    budget -= 1
+        best = heapq.nlargest(limit, scored.values(), key=lambda s: s[:2])
+        return [(score, payload) for score, _, payload in best]
+
+
+# ==================== PER-USER DOCUMENTS ====================
+
+# kind -> (SQL selecting the viewer user id and entity columns, entity id column, viewer column)
+_TEAM_VIEWERS = "SELECT id AS team_id, owner_id AS viewer FROM teams UNION SELECT team_id, user_id FROM team_members"
+_DASHBOARD_VIEWERS = ("SELECT id AS dashboard_id, owner_id AS viewer FROM shared_dashboards "
+                      "UNION SELECT dashboard_id, user_id FROM shared_dashboard_collaborators")
+_SOURCES = {
+    "sensor": ("SELECT user_id AS viewer, id, name, type, interface, config FROM user_sensors", "id", "user_id"),
+    "team": (f"SELECT v.viewer, t.id, t.team_name, t.description FROM teams t "
+             f"JOIN ({_TEAM_VIEWERS}) v ON v.team_id = t.id", "t.id", "v.viewer"),
+    "dashboard": (f"SELECT v.viewer, d.id, d.dashboard_name, d.description FROM shared_dashboards d "
+                  f"JOIN ({_DASHBOARD_VIEWERS}) v ON v.dashboard_id = d.id", "d.id", "v.viewer"),
+    "dashboard_comment": (f"SELECT v.viewer, c.id, c.comment_text, d.dashboard_name FROM dashboard_comments c "
+                          f"JOIN shared_dashboards d ON d.id = c.dashboard_id "
+                          f"JOIN ({_DASHBOARD_VIEWERS}) v ON v.dashboard_id = c.dashboard_id", "c.id", "v.viewer"),
+    "team_comment": (f"SELECT v.viewer, c.id, c.comment_text, t.team_name FROM team_comments c "
+                     f"JOIN teams t ON t.id = c.team_id "
+                     f"JOIN ({_TEAM_VIEWERS}) v ON v.team_id = c.team_id", "c.id", "v.viewer"),
+    "reading_comment": ("SELECT user_id AS viewer, id, comment_text FROM reading_comments", "id", "user_id"),
+}
+KINDS = tuple(_SOURCES)
+
+_CATEGORY_BOOST = {"sensor": 1.0, "dashboard": 0.8, "team": 0.8, "comment": 0}
+
+
+def _document(kind: str, row, urls: Dict[str, str]) -> Tuple[str, Dict[str, Any], List[str], float]:
+    """(title, payload, keywords, boost) of an entity row."""
+    if kind == "sensor":
+        try:
+            config = json.loads(row["config"]) if row["config"] else {}
+        except (TypeError, ValueError):
+            config = {}
+        location = config.get("location") if isinstance(config, dict) else None
+        return row["name"], {
+            "title": row["name"], "url": urls.get("sensor"), "category": "sensor", "icon": "🎛️",
+            "description": f"Capteur: {location or 'Sans emplacement'}", "match": "sensor",
+        }, [location, row["type"], row["interface"]], _CATEGORY_BOOST["sensor"]
+    if kind in ("team", "dashboard"):
+        title = row[2]
+        return title, {
+            "title": title, "url": urls.get(kind), "category": kind, "icon": "👥" if kind == "team" else "🖥️",
+            "description": row[3] or ("Équipe" if kind == "team" else "Tableau partagé"), "match": kind,
+        }, [row[3]], _CATEGORY_BOOST[kind]
+    text = row["comment_text"] or ""
+    title = text if len(text) <= COMMENT_TITLE_LENGTH else text[:COMMENT_TITLE_LENGTH - 1] + "…"
+    context = row[3] if kind != "reading_comment" else None
+    return title, {
+        "title": title, "url": urls.get(kind), "category": "comment", "icon": "💬",
+        "description": f"Commentaire: {context}" if context else "Commentaire", "match": "comment",
+    }, [text, context], _CATEGORY_BOOST["comment"]
+
+
+class SearchService:
+    """Static index plus lazily loaded, incrementally maintained per-user indexes."""
+
+    def __init__(self, max_users: int = MAX_USER_INDEXES):
+        self.max_users = max_users
+        self.static = SearchIndex()
+        self.urls: Dict[str, str] = {}
+        self._users: "OrderedDict[Any, SearchIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build_static(self, pages: Iterable[Dict[str, Any]], keywords: Dict[str, Dict[str, Any]],
+                     urls: Dict[str, str]) -> None:
+        """Index pages (``name``, ``url``, ``icon``, ``admin``) and help keywords; ``urls`` per entity kind."""
+        self.urls = dict(urls)
+        for page in pages:
+            self.static.add(f"page:{page['url']}", page["name"], {
+                "title": page["name"], "url": page["url"], "category": "page",
+                "icon": page["icon"], "match": "name",
+            }, keywords=page.get("keywords", ()), boost=0.5, admin_only=page.get("admin", False))
+        for keyword, data in keywords.items():
+            self.static.add(f"help:{keyword}", keyword, {
+                "title": data["title"], "url": data["url"], "category": "help", "icon": "❓",
+                "description": data["desc"], "match": "keyword",
+            }, keywords=[data["title"]])
+
+    def search(self, user_id, query: str, include_admin: bool = False, limit: int = 10) -> List[Dict[str, Any]]:
+        """Ranked results for ``query`` across the static index and the user's index."""
+        query = normalize(query)
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+        results = self.static.search(query, limit, include_admin)
+        if user_id is not None:
+            results += self._user_index(user_id).search(query, limit)
+        results.sort(key=lambda result: result[0], reverse=True)
+        return [payload for _, payload in results[:limit]]
+
+    def refresh(self, kind: str, entity_id) -> None:
+        """Re-read one entity after a write and update every loaded user index."""
+        with self._lock:
+            loaded = list(self._users.items())
+        if not loaded:
+            return
+        doc_id = f"{kind}:{entity_id}"
+        visible = {}
+        db = get_db()
+        try:
+            sql, id_column, _ = _SOURCES[kind]
+            for row in db.execute(f"{sql} WHERE {id_column} = ?", (entity_id,)).fetchall():
+                visible[row[0]] = _document(kind, row, self.urls)
+        except sqlite3.OperationalError:
+            pass  # table not created yet
+        finally:
+            db.close()
+        for user_id, index in loaded:
+            if user_id in visible:
+                title, payload, keywords, boost = visible[user_id]
+                index.add(doc_id, title, payload, keywords, boost)
+            else:
+                index.remove(doc_id)
+
+    def forget(self, user_id=None) -> None:
+        """Drop the index of ``user_id`` (all users when None); it is reloaded on next search."""
+        with self._lock:
+            if user_id is None:
+                self._users.clear()
+            else:
+                self._users.pop(user_id, None)
+
+    def _user_index(self, user_id) -> SearchIndex:
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                self._users.move_to_end(user_id)
+                return index
+        index = self._load_user(user_id)
+        with self._lock:
+            index = self._users.setdefault(user_id, index)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        return index
+
+    def _load_user(self, user_id) -> SearchIndex:
+        index = SearchIndex()
+        db = get_db()
+        try:
+            for kind, (sql, _, viewer_column) in _SOURCES.items():
+                try:
+                    rows = db.execute(f"{sql} WHERE {viewer_column} = ?", (user_id,)).fetchall()
+                except sqlite3.OperationalError:
+                    continue  # table not created yet
+                index.extend((f"{kind}:{row['id']}", *_document(kind, row, self.urls)) for row in rows)
+        finally:
+            db.close()
+        return index
+
+
+search_service = SearchService()
+
+
+__all__ = ["SearchIndex", "SearchService", "search_service", "normalize", "KINDS"]
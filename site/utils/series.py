@@ -0,0 +1,173 @@
+"""Column-oriented reading access for analytics.
+
+:func:`fetch_reading_columns` returns readings as NumPy columns instead of
+``sqlite3.Row`` dicts: SQLite converts timestamps to epoch seconds in C and
+rows are copied into arrays chunk by chunk, so analytics code can work on
+whole arrays without per-row dicts or ``datetime.fromisoformat`` calls.
+
+Columns: ``ts`` (int64 epoch seconds, UTC), ``ppm``, ``temperature`` and
+``humidity`` (float32, NaN where the value is missing), oldest first.
+
+User readings are restricted to real sensor sources by default, so simulated
+and imported rows never reach live analytics. Rows are read as stored: for a
+sensor with ``compression`` enabled (:mod:`utils.ingest`) that is the
+compressed series, not every reading that was ingested.
+"""
+from datetime import datetime, UTC
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from database import get_db
+from utils.source_helpers import REAL_SOURCES
+
+DB_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Rows copied per fetchmany() call
+_FETCH_CHUNK = 50_000
+
+
+class ReadingColumns:
+    """Readings as parallel arrays (oldest first)."""
+
+    __slots__ = ("ts", "ppm", "temperature", "humidity")
+
+    def __init__(self, ts: np.ndarray, ppm: np.ndarray, temperature: np.ndarray, humidity: np.ndarray):
+        self.ts = ts
+        self.ppm = ppm
+        self.temperature = temperature
+        self.humidity = humidity
+
+    def __len__(self) -> int:
+        return len(self.ts)
+
+    def column(self, name: str) -> np.ndarray:
+        """Column by reading field name (``ppm``/``co2``, ``temperature``, ``humidity``, ``timestamp``)."""
+        if name == "co2":
+            name = "ppm"
+        if name == "timestamp":
+            name = "ts"
+        if name not in self.__slots__:
+            raise KeyError(name)
+        return getattr(self, name)
+
+    def timestamps(self, index=None) -> List[str]:
+        """``YYYY-MM-DD HH:MM:SS`` UTC strings for all rows or the selected ones."""
+        ts = self.ts if index is None else self.ts[index]
+        return [str(t).replace("T", " ") for t in ts.astype("datetime64[s]")]
+
+    @classmethod
+    def empty(cls) -> "ReadingColumns":
+        return cls(np.empty(0, np.int64), np.empty(0, np.float32),
+                   np.empty(0, np.float32), np.empty(0, np.float32))
+
+    @classmethod
+    def from_array(cls, array: np.ndarray) -> "ReadingColumns":
+        """Build from an (n, 4) float64 array of epoch, ppm, temperature, humidity."""
+        if not len(array):
+            return cls.empty()
+        array = array[~np.isnan(array[:, 0])]
+        return cls(array[:, 0].astype(np.int64), array[:, 1].astype(np.float32),
+                   array[:, 2].astype(np.float32), array[:, 3].astype(np.float32))
+
+    @classmethod
+    def from_dicts(cls, readings: Iterable[Dict[str, Any]]) -> "ReadingColumns":
+        """Adapter for callers still holding reading dicts; rows are sorted by time."""
+        readings = list(readings)
+        if not readings:
+            return cls.empty()
+        ts = np.array([_epoch(r.get("timestamp")) for r in readings], dtype=np.float64)
+        array = np.column_stack([
+            ts,
+            np.array([r.get("ppm", r.get("co2")) for r in readings], dtype=np.float64),
+            np.array([r.get("temperature") for r in readings], dtype=np.float64),
+            np.array([r.get("humidity") for r in readings], dtype=np.float64),
+        ])
+        array = array[np.argsort(array[:, 0], kind="stable")]
+        return cls.from_array(array)
+
+
+def _epoch(value) -> float:
+    if value is None or value == "":
+        return np.nan
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+        except ValueError:
+            return np.nan
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed.timestamp()
+
+
+def as_columns(readings) -> ReadingColumns:
+    """Accept ReadingColumns or a list of reading dicts."""
+    if isinstance(readings, ReadingColumns):
+        return readings
+    return ReadingColumns.from_dicts(readings or [])
+
+
+def fetch_reading_columns(*, user_id=None, sensor_id: Optional[int] = None,
+                          days: Optional[float] = None, hours: Optional[float] = None,
+                          since: Optional[datetime] = None,
+                          sources: Optional[Sequence[str]] = REAL_SOURCES, db=None) -> ReadingColumns:
+    """Fetch readings as NumPy columns.
+
+    Args:
+        user_id: restrict ``co2_readings`` to one user (None: no user filter).
+        sensor_id: read ``sensor_readings`` of that sensor instead.
+        sources: ``co2_readings.source`` values to keep (default: real
+            sensors, see ``utils.source_helpers``; None: every source).
+        days, hours, since: time window (default: last 24 hours).
+        db: connection to borrow; a pooled one is used and released otherwise.
+    """
+    if since is not None:
+        cutoff = since.astimezone(UTC).strftime(DB_TIMESTAMP_FORMAT) if since.tzinfo else since.strftime(DB_TIMESTAMP_FORMAT)
+        time_clause, params = "timestamp >= ?", [cutoff]
+    else:
+        modifier = f"-{float(days)} days" if days is not None else f"-{float(hours if hours is not None else 24)} hours"
+        time_clause, params = "timestamp >= datetime('now', ?)", [modifier]
+
+    if sensor_id is not None:
+        query = f"""SELECT CAST(strftime('%s', timestamp) AS INTEGER), co2, temperature, humidity
+                    FROM sensor_readings WHERE sensor_id = ? AND {time_clause}
+                    ORDER BY timestamp"""
+        params.insert(0, sensor_id)
+    else:
+        clauses, filters = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            filters.append(user_id)
+        if sources is not None:
+            clauses.append(f"source IN ({','.join('?' * len(sources))})")
+            filters.extend(sources)
+        clauses.append(time_clause)
+        params[:0] = filters
+        query = f"""SELECT CAST(strftime('%s', timestamp) AS INTEGER), ppm, temperature, humidity
+                    FROM co2_readings WHERE {' AND '.join(clauses)}
+                    ORDER BY timestamp"""
+
+    own_db = db is None
+    db = db or get_db()
+    try:
+        cursor = db.cursor()
+        cursor.row_factory = None
+        cursor.execute(query, params)
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(_FETCH_CHUNK)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    finally:
+        if own_db:
+            db.close()
+
+    if not chunks:
+        return ReadingColumns.empty()
+    return ReadingColumns.from_array(chunks[0] if len(chunks) == 1 else np.concatenate(chunks))
+
+
+__all__ = ["ReadingColumns", "as_columns", "fetch_reading_columns"]
@@ -0,0 +1,240 @@
+"""Process pool for CPU-bound analytics and report rendering.
+
+Model fits, WeasyPrint PDF rendering and openpyxl workbooks hold the GIL for
+seconds; run on request threads they stall every other request and Socket.IO
+emit. :data:`task_pool` runs them in worker processes instead:
+
+- :meth:`TaskPool.run` submits a task and waits for its result (request
+  handlers that answer with the result),
+- :meth:`TaskPool.submit` returns a :class:`Job` handle whose status and result
+  are polled later (see the ``/export/api/jobs`` routes).
+
+At most ``max_workers + max_queue`` tasks are queued or running; beyond that
+:class:`PoolBusy` is raised (handlers answer 503). Each task has a time limit:
+the worker interrupts it after ``timeout`` seconds of execution (``SIGALRM``,
+where available) and :meth:`TaskPool.run` stops waiting after the same time.
+Queued jobs can be cancelled; a running job that is cancelled runs to its time
+limit and its result is discarded.
+
+Workers are forked from the app process (``spawn`` on platforms without
+``fork``), so tasks and their arguments must be picklable and module-level.
+Tasks must not use the parent's database connections.
+"""
+import atexit
+import multiprocessing
+import signal
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from config import get_config
+from utils.logger import configure_logging
+
+logger = configure_logging()
+
+# Finished jobs (and their results) are kept this long for polling clients
+JOB_TTL_SECONDS = 600
+
+
+class PoolBusy(Exception):
+    """Too many tasks are queued; retry later."""
+
+
+class TaskTimeout(Exception):
+    """The task exceeded its time limit."""
+
+
+class _Deadline(BaseException):
+    """Raised in the worker at the time limit; not caught by tasks' ``except Exception``."""
+
+
+def _alarm(signum, frame):
+    raise _Deadline()
+
+
+def _run_with_deadline(fn: Callable, args: tuple, kwargs: dict, timeout: Optional[float]):
+    """Worker side: run ``fn`` and interrupt it after ``timeout`` seconds."""
+    armed = bool(timeout) and hasattr(signal, "setitimer")
+    if armed:
+        previous = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args, **kwargs)
+    except _Deadline:
+        raise TaskTimeout(f"Task exceeded its time limit of {timeout}s") from None
+    finally:
+        if armed:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+class Job:
+    """Handle of a submitted task."""
+
+    def __init__(self, future, kind: str, owner=None, meta: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.future = future
+        self.kind = kind
+        self.owner = owner
+        self.meta = meta or {}
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+
+    @property
+    def state(self) -> str:
+        future = self.future
+        if self.cancelled or future.cancelled():
+            return "cancelled"
+        if not future.done():
+            return "running" if future.running() else "queued"
+        error = future.exception()
+        if isinstance(error, TaskTimeout):
+            return "timeout"
+        return "failed" if error else "done"
+
+    def result(self):
+        """The task's return value (raises its exception, or CancelledError)."""
+        if self.cancelled:
+            raise CancelledError()
+        return self.future.result(timeout=0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = self.state
+        info = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": state,
+            "submitted_at": self.submitted_at,
+            "finished_at": self.finished_at,
+        }
+        if state in ("failed", "timeout"):
+            info["error"] = str(self.future.exception())
+        return info
+
+
+class TaskPool:
+    """Bounded process pool with per-task time limits and pollable jobs."""
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 8, timeout: float = 120):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._jobs: Dict[str, Job] = {}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=self._context)
+        return self._executor
+
+    def _finished(self, job: Job, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            self._inflight -= 1
+            job.finished_at = time.time()
+            broken = not job.future.cancelled() and isinstance(job.future.exception(), BrokenProcessPool)
+            if broken and self._executor is executor:
+                logger.error("A task pool worker died; restarting the pool")
+                self._executor = None
+            else:
+                broken = False
+        if broken:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - JOB_TTL_SECONDS
+        for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def submit(self, fn: Callable, *args, kind: Optional[str] = None, owner=None,
+               meta: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None, **kwargs) -> Job:
+        """Queue ``fn(*args, **kwargs)``; returns its job handle.
+
+        Raises:
+            PoolBusy: the queue is full.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            if self._inflight >= self.max_workers + self.max_queue:
+                raise PoolBusy(f"{self._inflight} tasks are already queued or running")
+            self._prune()
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_run_with_deadline, fn, args, kwargs, timeout)
+            except BrokenProcessPool:
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+                executor = self._get_executor()
+                future = executor.submit(_run_with_deadline, fn, args, kwargs, timeout)
+            job = Job(future, kind or getattr(fn, "__name__", "task"), owner, meta)
+            self._inflight += 1
+            self._jobs[job.id] = job
+        future.add_done_callback(lambda _: self._finished(job, executor))
+        return job
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` in a worker and return its result.
+
+        Raises:
+            PoolBusy: the queue is full.
+            TaskTimeout: no result within ``timeout`` seconds (the task is cancelled).
+        """
+        timeout = self.timeout if timeout is None else timeout
+        job = self.submit(fn, *args, timeout=timeout, **kwargs)
+        try:
+            return job.future.result(timeout=timeout)
+        except FutureTimeout:
+            self.cancel(job.id)
+            raise TaskTimeout(f"{job.kind} did not finish within {timeout}s")
+        finally:
+            if job.future.done():
+                with self._lock:
+                    self._jobs.pop(job.id, None)
+
+    def get(self, job_id: str, owner=None) -> Optional[Job]:
+        """Job by id, only if it belongs to ``owner`` (when given)."""
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def cancel(self, job_id: str, owner=None) -> bool:
+        """Cancel a job; True if it will not produce a result."""
+        job = self.get(job_id, owner)
+        if job is None or job.future.done():
+            return False
+        job.cancelled = True
+        job.future.cancel()
+        return True
+
+    def start(self) -> None:
+        """Fork the worker processes now instead of on the first task.
+
+        Forking early keeps the workers' copy of the app small and free of
+        background threads. Spawned workers (no ``fork``) start on demand.
+        """
+        if self._context.get_start_method() == "fork":
+            self.run(time.time, timeout=30, kind="start")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_config = get_config()
+task_pool = TaskPool(max_workers=_config.TASK_POOL_WORKERS,
+                     max_queue=_config.TASK_POOL_MAX_QUEUE,
+                     timeout=_config.TASK_POOL_TIMEOUT_SECONDS)
+atexit.register(task_pool.shutdown)
+
+
+__all__ = ["TaskPool", "Job", "PoolBusy", "TaskTimeout", "task_pool"]
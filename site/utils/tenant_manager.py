@@ -13,69 +13,70 @@ from database import get_db
 class TenantManager:
     """Manage organizations and multi-tenancy"""
     
-    def __init__(self):
-        self.db = get_db()
-    
     def init_tenant_schema(self):
         """Initialize tenant tables in database"""
-        cursor = self.db.cursor()
+        db = get_db()
+        try:
+            cursor = db.cursor()
         
-        # Tenants table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tenants (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                slug TEXT NOT NULL UNIQUE,
-                owner_user_id INTEGER NOT NULL,
-                logo_url TEXT,
-                subscription_tier TEXT DEFAULT 'free',
-                max_sensors INTEGER DEFAULT 5,
-                max_users INTEGER DEFAULT 5,
-                max_storage_gb INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                is_active BOOLEAN DEFAULT TRUE,
-                FOREIGN KEY (owner_user_id) REFERENCES users(id) ON DELETE CASCADE
-            )
-        ''')
+            # Tenants table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tenants (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL UNIQUE,
+                    slug TEXT NOT NULL UNIQUE,
+                    owner_user_id INTEGER NOT NULL,
+                    logo_url TEXT,
+                    subscription_tier TEXT DEFAULT 'free',
+                    max_sensors INTEGER DEFAULT 5,
+                    max_users INTEGER DEFAULT 5,
+                    max_storage_gb INTEGER DEFAULT 1,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    is_active BOOLEAN DEFAULT TRUE,
+                    FOREIGN KEY (owner_user_id) REFERENCES users(id) ON DELETE CASCADE
+                )
+            ''')
         
-        # Tenant members table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tenant_members (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tenant_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                role TEXT DEFAULT 'member',
-                permissions TEXT,
-                joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (tenant_id) REFERENCES tenants(id) ON DELETE CASCADE,
-                FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-                UNIQUE(tenant_id, user_id)
-            )
-        ''')
+            # Tenant members table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tenant_members (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tenant_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    role TEXT DEFAULT 'member',
+                    permissions TEXT,
+                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (tenant_id) REFERENCES tenants(id) ON DELETE CASCADE,
+                    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+                    UNIQUE(tenant_id, user_id)
+                )
+            ''')
         
-        # Tenant locations table (multiple locations per tenant)
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tenant_locations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                tenant_id INTEGER NOT NULL,
-                name TEXT NOT NULL,
-                address TEXT,
-                latitude REAL,
-                longitude REAL,
-                timezone TEXT DEFAULT 'UTC',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (tenant_id) REFERENCES tenants(id) ON DELETE CASCADE
-            )
-        ''')
+            # Tenant locations table (multiple locations per tenant)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS tenant_locations (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    tenant_id INTEGER NOT NULL,
+                    name TEXT NOT NULL,
+                    address TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    timezone TEXT DEFAULT 'UTC',
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (tenant_id) REFERENCES tenants(id) ON DELETE CASCADE
+                )
+            ''')
         
-        # Link sensors to locations
-        cursor.execute('''
-            ALTER TABLE sensors ADD COLUMN location_id INTEGER REFERENCES tenant_locations(id)
-        ''')
+            # Link sensors to locations
+            cursor.execute('''
+                ALTER TABLE sensors ADD COLUMN location_id INTEGER REFERENCES tenant_locations(id)
+            ''')
         
-        self.db.commit()
-        print("✓ Tenant schema initialized")
+            db.commit()
+            print("✓ Tenant schema initialized")
+        finally:
+            db.close()
     
     def create_tenant(self, name: str, owner_user_id: int, slug: Optional[str] = None) -> Optional[int]:
         """
@@ -92,8 +93,9 @@ class TenantManager:
         if not slug:
             slug = name.lower().replace(' ', '-').replace('_', '-')
         
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 INSERT INTO tenants (name, slug, owner_user_id)
                 VALUES (?, ?, ?)
@@ -107,11 +109,13 @@ class TenantManager:
                 VALUES (?, ?, ?, ?)
             ''', (tenant_id, owner_user_id, 'admin', json.dumps(['read', 'write', 'admin'])))
             
-            self.db.commit()
+            db.commit()
             return tenant_id
         except Exception as e:
             print(f"Error creating tenant: {e}")
             return None
+        finally:
+            db.close()
     
     def add_tenant_member(self, tenant_id: int, user_id: int, role: str = 'member') -> bool:
         """
@@ -131,8 +135,9 @@ class TenantManager:
             'viewer': ['read']
         }
         
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             permissions = permissions_map.get(role, ['read'])
             
             cursor.execute('''
@@ -140,31 +145,37 @@ class TenantManager:
                 VALUES (?, ?, ?, ?)
             ''', (tenant_id, user_id, role, json.dumps(permissions)))
             
-            self.db.commit()
+            db.commit()
             return True
         except Exception as e:
             print(f"Error adding tenant member: {e}")
             return False
+        finally:
+            db.close()
     
     def remove_tenant_member(self, tenant_id: int, user_id: int) -> bool:
         """Remove user from tenant"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 DELETE FROM tenant_members
                 WHERE tenant_id = ? AND user_id = ?
             ''', (tenant_id, user_id))
             
-            self.db.commit()
+            db.commit()
             return True
         except Exception as e:
             print(f"Error removing tenant member: {e}")
             return False
+        finally:
+            db.close()
     
     def get_user_tenants(self, user_id: int) -> List[Dict]:
         """Get all tenants for a user"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 SELECT t.*, tm.role
                 FROM tenants t
@@ -178,27 +189,33 @@ class TenantManager:
         except Exception as e:
             print(f"Error getting user tenants: {e}")
             return []
+        finally:
+            db.close()
     
     def create_location(self, tenant_id: int, name: str, address: str = "", 
                        lat: Optional[float] = None, lon: Optional[float] = None) -> Optional[int]:
         """Create location within tenant"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 INSERT INTO tenant_locations (tenant_id, name, address, latitude, longitude)
                 VALUES (?, ?, ?, ?, ?)
             ''', (tenant_id, name, address, lat, lon))
             
-            self.db.commit()
+            db.commit()
             return cursor.lastrowid
         except Exception as e:
             print(f"Error creating location: {e}")
             return None
+        finally:
+            db.close()
     
     def get_tenant_locations(self, tenant_id: int) -> List[Dict]:
         """Get all locations for a tenant"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 SELECT * FROM tenant_locations
                 WHERE tenant_id = ?
@@ -210,11 +227,14 @@ class TenantManager:
         except Exception as e:
             print(f"Error getting locations: {e}")
             return []
+        finally:
+            db.close()
     
     def get_tenant_statistics(self, tenant_id: int) -> Dict:
         """Get usage statistics for tenant"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             
             # Get member count
             cursor.execute('SELECT COUNT(*) FROM tenant_members WHERE tenant_id = ?', (tenant_id,))
@@ -250,23 +270,28 @@ class TenantManager:
         except Exception as e:
             print(f"Error getting tenant statistics: {e}")
             return {}
+        finally:
+            db.close()
     
     def upgrade_subscription(self, tenant_id: int, tier: str, 
                            max_sensors: int, max_users: int, max_storage_gb: int) -> bool:
         """Upgrade tenant subscription tier"""
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('''
                 UPDATE tenants
                 SET subscription_tier = ?, max_sensors = ?, max_users = ?, max_storage_gb = ?
                 WHERE id = ?
             ''', (tier, max_sensors, max_users, max_storage_gb, tenant_id))
             
-            self.db.commit()
+            db.commit()
             return True
         except Exception as e:
             print(f"Error upgrading subscription: {e}")
             return False
+        finally:
+            db.close()
     
     def check_quota(self, tenant_id: int, resource: str) -> Tuple[bool, Dict]:
         """
@@ -275,8 +300,9 @@ class TenantManager:
         Returns:
             (is_under_quota, quota_info)
         """
+        db = get_db()
         try:
-            cursor = self.db.cursor()
+            cursor = db.cursor()
             cursor.execute('SELECT * FROM tenants WHERE id = ?', (tenant_id,))
             columns = [desc[0] for desc in cursor.description]
             tenant = dict(zip(columns, cursor.fetchone()))
@@ -296,3 +322,5 @@ class TenantManager:
         except Exception as e:
             print(f"Error checking quota: {e}")
             return True, {}
+        finally:
+            db.close()